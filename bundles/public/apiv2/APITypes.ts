@@ -443,6 +443,13 @@ export type ProcessingEvent =
           action: DonationProcessingEventAction;
           donation: APIDonation;
         }
+      | {
+          action: 'batch';
+          changes: Array<{
+            action: DonationProcessingEventAction;
+            donation: APIDonation;
+          }>;
+        }
     ))
   | {
       type: 'donation_received';
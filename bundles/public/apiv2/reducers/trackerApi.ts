@@ -650,32 +650,35 @@ const socketDonation: TrackerQueryOnCacheEntryAdded<'donations' | 'allDonations'
 
       const data = JSON.parse(ev.data) as ProcessingEvent;
 
-      if ('donation' in data) {
-        const newDonation = processDonation(data.donation);
+      const incoming = 'donation' in data ? [data.donation] : 'changes' in data ? data.changes.map(c => c.donation) : [];
 
+      if (incoming.length > 0) {
         const limit = getLimit(api);
 
         api.updateCachedData(donations => {
-          const matches = donationMatchesQuery(newDonation, args);
-          const page = findModelPage(donations, newDonation, compareDonation, matches);
-          const currentIndex = page.findIndex(d => d.id === newDonation.id);
-          if (currentIndex === -1) {
-            if (matches) {
-              // insert in the proper place, which might be the end
-              const index = page.findIndex(findSlot(newDonation, compareDonation));
-              if (index === -1) {
-                page.push(newDonation);
-              } else {
-                page.splice(index, 0, newDonation);
+          incoming.forEach(raw => {
+            const newDonation = processDonation(raw);
+            const matches = donationMatchesQuery(newDonation, args);
+            const page = findModelPage(donations, newDonation, compareDonation, matches);
+            const currentIndex = page.findIndex(d => d.id === newDonation.id);
+            if (currentIndex === -1) {
+              if (matches) {
+                // insert in the proper place, which might be the end
+                const index = page.findIndex(findSlot(newDonation, compareDonation));
+                if (index === -1) {
+                  page.push(newDonation);
+                } else {
+                  page.splice(index, 0, newDonation);
+                }
               }
+            } else {
+              // replace or delete depending on if it belongs or not
+              page.splice(currentIndex, 1, ...(matches ? [newDonation] : []));
             }
-          } else {
-            // replace or delete depending on if it belongs or not
-            page.splice(currentIndex, 1, ...(matches ? [newDonation] : []));
-          }
+          });
           compressInfinitePages(donations, limit);
         });
-      } else if (data.action === 'group_deleted') {
+      } else if ('action' in data && data.action === 'group_deleted') {
         api.updateCachedData(donations => {
           forcePages(donations).forEach(page => {
             page.results.forEach(donation => {
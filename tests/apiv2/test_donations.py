@@ -1,9 +1,13 @@
 import random
+import urllib.parse
 from datetime import datetime, timedelta
 from typing import Optional
 
 from django.contrib.auth.models import Permission, User
+from django.db import connection
 from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 
 from tracker import models
 from tracker.api.serializers import DonationSerializer
@@ -166,6 +170,37 @@ class TestDonations(APITestCase):
                 ),
             )
 
+    def test_cursor(self):
+        # identical timestamps, so that the id tiebreaker is exercised
+        tied = self.generate_donations(self.event, count=3, state='read')
+        models.Donation.objects.filter(id__in=(d.id for d in tied)).update(
+            timereceived=utcnow()
+        )
+        self.generate_donations(self.event, count=4, state='read')
+        expected = list(
+            models.Donation.objects.filter(event=self.event)
+            .completed()
+            .order_by('-timereceived', '-id')
+            .values_list('id', flat=True)
+        )
+        ids = []
+        cursor = ''
+        while cursor is not None:
+            data = self.get_list(
+                kwargs={'event_pk': self.event.pk},
+                data={'cursor': cursor, 'limit': 3},
+                user=None,
+            )
+            self.assertEqual(data['count'], len(expected))
+            ids += [d['id'] for d in data['results']]
+            cursor = (
+                data['next']
+                and urllib.parse.parse_qs(urllib.parse.urlparse(data['next']).query)[
+                    'cursor'
+                ][0]
+            )
+        self.assertEqual(ids, expected)
+
     def test_patch(self):
         donation = self.generate_donations(self.event, count=1, state='approved')[0]
         user = User.objects.create()
@@ -368,6 +403,100 @@ class TestDonations(APITestCase):
                         status_code=200,
                     )
 
+    def test_batch_process(self):
+        donations = self.generate_donations(self.event, count=3, state='pending')
+        url = reverse('tracker:api_v2:donation-process')
+        user = User.objects.create()
+
+        with self.subTest('error cases'), self.assertLogsChanges(0):
+            self.client.force_authenticate(user=None)
+            response = self.client.patch(
+                url, data=[{'id': donations[0].pk, 'action': 'read'}], format='json'
+            )
+            self.assertEqual(response.status_code, 403)
+            self.client.force_authenticate(user=user)
+            response = self.client.patch(
+                url, data=[{'id': donations[0].pk, 'action': 'read'}], format='json'
+            )
+            self.assertEqual(response.status_code, 403)
+            self.client.force_authenticate(user=self.add_user)
+            response = self.client.patch(url, data=[], format='json')
+            self.assertEqual(response.status_code, 400)
+            response = self.client.patch(
+                url,
+                data=[
+                    {'id': donations[0].pk, 'action': 'approve_comment'},
+                    {'id': 'foo', 'action': 'bogus'},
+                ],
+                format='json',
+            )
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.data[0], {})
+            self.assertEqual(response.data[1]['id'][0].code, 'invalid')
+            self.assertEqual(response.data[1]['action'][0].code, 'invalid_choice')
+            response = self.client.patch(
+                url,
+                data=[{'id': max(d.pk for d in donations) + 1000, 'action': 'read'}],
+                format='json',
+            )
+            self.assertEqual(response.status_code, 400)
+            # lacks the reader permission, so nothing else in the batch is applied either
+            response = self.client.patch(
+                url,
+                data=[
+                    {'id': donations[0].pk, 'action': 'approve_comment'},
+                    {'id': donations[1].pk, 'action': 'send_to_reader'},
+                ],
+                format='json',
+            )
+            self.assertEqual(response.status_code, 403)
+            donations[0].refresh_from_db()
+            self.assertEqual(donations[0].commentstate, 'PENDING')
+
+        self.add_permission(self.add_user, codename='send_to_reader')
+
+        with self.assertLogsChanges(4):
+            response = self.client.patch(
+                url,
+                data=[
+                    {'id': donations[0].pk, 'action': 'approve_comment'},
+                    {'id': donations[1].pk, 'action': 'send_to_reader'},
+                    {'id': donations[1].pk, 'action': 'pin'},
+                    {'id': donations[2].pk, 'action': 'deny_comment'},
+                ],
+                format='json',
+            )
+            self.assertEqual(response.status_code, 200)
+
+        for donation in donations:
+            donation.refresh_from_db()
+        self.assertEqual([d['id'] for d in response.data], [d.pk for d in donations])
+        for donation in donations:
+            self.assertV2ModelPresent(donation, response.data)
+        self.assertEqual(donations[0].commentstate, 'APPROVED')
+        self.assertEqual(donations[0].readstate, 'IGNORED')
+        self.assertEqual(donations[1].commentstate, 'APPROVED')
+        self.assertEqual(donations[1].readstate, 'READY')
+        self.assertTrue(donations[1].pinned)
+        self.assertEqual(donations[2].commentstate, 'DENIED')
+        self.assertEqual(donations[2].readstate, 'IGNORED')
+
+        with self.subTest('query count does not depend on the batch size'):
+            donations = self.generate_donations(self.event, count=4, state='pending')
+            with CaptureQueriesContext(connection) as single:
+                self.client.patch(
+                    url,
+                    data=[{'id': donations[0].pk, 'action': 'read'}],
+                    format='json',
+                )
+            with CaptureQueriesContext(connection) as batch:
+                self.client.patch(
+                    url,
+                    data=[{'id': d.pk, 'action': 'read'} for d in donations[1:]],
+                    format='json',
+                )
+            self.assertEqual(len(batch), len(single))
+
 
 class TestDonationSerializer(TransactionTestCase):
     rand = random.Random()
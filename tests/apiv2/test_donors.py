@@ -1,5 +1,8 @@
+from django.test import override_settings
+
 from tests import randgen
 from tests.util import APITestCase
+from tracker import participationutil
 from tracker.api.serializers import DonorSerializer
 
 
@@ -121,6 +124,31 @@ class TestDonor(APITestCase):
                 self.get_list(user=None, status_code=403)
                 self.get_detail(self.visible_donor, user=None, status_code=403)
 
+    @override_settings(TRACKER_PARTICIPATION_INDEX=True)
+    def test_fetch_with_participation_index(self):
+        participationutil.rebuild()
+        other_donor = randgen.generate_donor(self.rand)
+        other_donor.save()
+        # added after the rebuild, so this one comes from the signals
+        randgen.generate_donation(
+            self.rand, donor=other_donor, event=self.archived_event
+        ).save()
+
+        data = self.get_list(user=self.view_user, kwargs={'event_pk': self.event.id})
+        self.assertExactV2Models([self.visible_donor, self.anonymous_donor], data)
+
+        data = self.get_list(
+            user=self.view_user, kwargs={'event_pk': self.archived_event.id}
+        )
+        self.assertExactV2Models([other_donor], data)
+
+        self.get_detail(
+            self.visible_donor,
+            user=self.view_user,
+            kwargs={'event_pk': self.archived_event.id},
+            status_code=404,
+        )
+
     def test_serializer(self):
         data = self._serialize_models(self.visible_donor, include_totals=True)
         formatted = self._format_donor(self.visible_donor, include_totals=True)
@@ -1,4 +1,5 @@
 import datetime
+import urllib.parse
 from itertools import pairwise
 from typing import Iterable, List, Optional, Union
 
@@ -91,6 +92,49 @@ class TestRunViewSet(TestSpeedRunBase, APITestCase):
         with self.subTest('not a real event'):
             self.get_list(kwargs={'event_pk': self.event.pk + 100}, status_code=404)
 
+    def test_cursor(self):
+        # unordered runs sort last
+        expected = [
+            r.id
+            for r in models.SpeedRun.objects.filter(event=self.event).order_by(
+                F('order').asc(nulls_last=True), 'id'
+            )
+        ]
+        self.assertIn(None, models.SpeedRun.objects.values_list('order', flat=True))
+        ids = []
+        cursor = ''
+        while cursor is not None:
+            data = self.get_list(
+                kwargs={'event_pk': self.event.pk},
+                data={'all': '', 'cursor': cursor, 'limit': 2, 'no_count': ''},
+            )
+            self.assertNotIn('count', data)
+            self.assertLessEqual(len(data['results']), 2)
+            ids += [r['id'] for r in data['results']]
+            cursor = (
+                data['next']
+                and urllib.parse.parse_qs(urllib.parse.urlparse(data['next']).query)[
+                    'cursor'
+                ][0]
+            )
+        self.assertEqual(ids, expected)
+
+        data = self.get_list(
+            kwargs={'event_pk': self.event.pk}, data={'cursor': '', 'limit': 0}
+        )
+        self.assertEqual(
+            data,
+            {
+                'count': models.SpeedRun.objects.filter(event=self.event)
+                .exclude(order=None)
+                .count(),
+                'next': None,
+                'results': [],
+            },
+        )
+
+        self.get_list(data={'cursor': 'garbage'}, status_code=400)
+
     def test_create(self):
         with self.subTest('smoke test'), self.saveSnapshot(), self.assertLogsChanges(1):
             data = self.post_new(
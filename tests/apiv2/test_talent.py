@@ -1,8 +1,9 @@
 from django.db.models import Q
+from django.test import override_settings
 
 from tests import randgen
 from tests.util import APITestCase
-from tracker import models
+from tracker import models, participationutil
 from tracker.api.serializers import TalentSerializer
 
 
@@ -294,6 +295,49 @@ class TestTalent(APITestCase):
                     status_code=404,
                 )
 
+    @override_settings(TRACKER_PARTICIPATION_INDEX=True)
+    def test_fetch_with_participation_index(self):
+        participationutil.rebuild()
+        self.client.force_login(self.view_user)
+
+        data = self.get_list(kwargs={'event_pk': self.event.pk})
+        self.assertExactV2Models(
+            {
+                self.runner,
+                self.host,
+                self.commentator,
+                self.interviewer,
+                self.subject,
+                self.spread_talent,
+            },
+            data,
+        )
+
+        data = self.get_list(kwargs={'event_pk': self.draft_event.pk})
+        self.assertExactV2Models([self.spread_draft_talent], data)
+
+        for noun, talent in [
+            ('runners', self.runner),
+            ('hosts', self.host),
+            ('commentators', self.commentator),
+            ('interviewers', self.interviewer),
+            ('subjects', self.subject),
+        ]:
+            with self.subTest(noun):
+                data = self.get_noun(noun, kwargs={'event_pk': self.event.pk})
+                self.assertExactV2Models({talent, self.spread_talent}, data)
+
+                data = self.get_noun(noun, kwargs={'event_pk': self.draft_event.pk})
+                self.assertExactV2Models({self.spread_draft_talent}, data)
+
+        data = self.get_noun('runners', kwargs={'event_pk': self.other_event.pk})
+        self.assertExactV2Models({self.other_runner}, data)
+
+        # talent that only takes part in another event
+        self.get_detail(
+            self.other_runner, kwargs={'event_pk': self.event.pk}, status_code=404
+        )
+
     def test_create(self):
         self.client.force_login(self.add_user)
 
@@ -0,0 +1,224 @@
+import gzip
+import io
+import json
+import os
+import random
+import tempfile
+from queue import Full, Queue
+from unittest.mock import MagicMock, patch
+
+from django.conf import settings
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from tracker import models
+from tracker.analytics import AnalyticsEventTypes, instrumentation
+from tracker.analytics.client import AnalyticsClient, Consumer
+
+from . import randgen
+
+
+def response(status):
+    return MagicMock(status_code=status)
+
+
+class TestAnalyticsClient(SimpleTestCase):
+    def analytics_client(self, **kwargs):
+        client = AnalyticsClient(AnalyticsClient.Config(no_emit=True, **kwargs))
+        # queue events without starting the consumer
+        client.config.no_emit = False
+        return client
+
+    def track(self, client, *values):
+        for value in values:
+            client.track_generic('test', {'value': value})
+
+    def queued(self, client):
+        return [e['properties']['value'] for e in client.queue.queue]
+
+    def test_drop_oldest(self):
+        client = self.analytics_client(max_queue_size=2)
+        self.track(client, 1, 2, 3)
+        self.assertEqual(self.queued(client), [2, 3])
+        self.assertEqual(client.stats['queued'], 3)
+        self.assertEqual(client.stats['dropped'], 1)
+
+    def test_drop_oldest_refilled(self):
+        client = self.analytics_client(max_queue_size=2)
+        self.track(client, 1, 2)
+        # another thread takes the room that was made before this one can use it
+        with patch.object(client.queue, 'put_nowait', side_effect=Full):
+            self.track(client, 3)
+        self.assertEqual(self.queued(client), [2])
+        self.assertEqual(client.stats['queued'], 2)
+        # both the oldest event and the new one were lost
+        self.assertEqual(client.stats['dropped'], 2)
+
+    def test_drop_newest(self):
+        client = self.analytics_client(max_queue_size=2, overflow_policy='drop_newest')
+        self.track(client, 1, 2, 3)
+        self.assertEqual(self.queued(client), [1, 2])
+        self.assertEqual(client.stats['queued'], 2)
+        self.assertEqual(client.stats['dropped'], 1)
+
+    def test_invalid_policy(self):
+        with self.assertRaises(ValueError):
+            AnalyticsClient.Config(overflow_policy='explode')
+
+
+@patch('tracker.analytics.client.time.sleep')
+class TestConsumer(SimpleTestCase):
+    def setUp(self):
+        self.events = [
+            {'event_name': AnalyticsEventTypes.REQUEST_SERVED.value, 'properties': {}}
+        ]
+        spool_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(spool_dir.cleanup)
+        self.spool_path = os.path.join(spool_dir.name, 'analytics.spool')
+
+    def consumer(self, responses, **kwargs):
+        consumer = Consumer(
+            AnalyticsClient.Config(ingest_host='http://ingest', **kwargs), Queue()
+        )
+        consumer.session = MagicMock()
+        consumer.session.post.side_effect = responses
+        return consumer
+
+    def test_compressed_upload(self, sleep):
+        consumer = self.consumer([response(200)], compress=True, access_key='key')
+        self.assertTrue(consumer._send(self.events))
+        args, kwargs = consumer.session.post.call_args
+        self.assertEqual(args, ('http://ingest/track',))
+        self.assertEqual(kwargs['headers']['Content-Encoding'], 'gzip')
+        self.assertEqual(kwargs['headers']['x-analytics-key'], 'key')
+        self.assertEqual(json.loads(gzip.decompress(kwargs['data'])), self.events)
+        self.assertEqual(consumer.stats['sent'], 1)
+
+    def test_retry(self, sleep):
+        consumer = self.consumer(
+            [ConnectionError(), response(503), response(200)], max_retries=2
+        )
+        self.assertTrue(consumer._send(self.events))
+        self.assertEqual(consumer.session.post.call_count, 3)
+        self.assertEqual(sleep.call_count, 2)
+        self.assertEqual(consumer.stats['retried'], 2)
+        self.assertEqual(consumer.stats['sent'], 1)
+
+    def test_failure_dropped(self, sleep):
+        consumer = self.consumer([response(500), response(500)], max_retries=1)
+        self.assertFalse(consumer._send(self.events))
+        self.assertEqual(consumer.stats['dropped'], 1)
+
+    def test_rejected(self, sleep):
+        consumer = self.consumer(
+            [response(400)], max_retries=2, spool_path=self.spool_path
+        )
+        self.assertFalse(consumer._send(self.events))
+        self.assertEqual(consumer.session.post.call_count, 1)
+        self.assertEqual(consumer.stats['rejected'], 1)
+        self.assertEqual(consumer.stats['sent'], 0)
+        self.assertEqual(consumer.stats['spooled'], 0)
+        self.assertFalse(os.path.exists(self.spool_path))
+
+    def test_spool_and_replay(self, sleep):
+        consumer = self.consumer([response(500)], spool_path=self.spool_path)
+        self.assertFalse(consumer._send(self.events))
+        self.assertEqual(consumer.stats['spooled'], 1)
+        self.assertEqual(consumer.stats['dropped'], 0)
+        with open(self.spool_path) as spool:
+            self.assertEqual([json.loads(line) for line in spool], self.events)
+
+        consumer = self.consumer([response(200)], spool_path=self.spool_path)
+        consumer._replay_spool()
+        self.assertEqual(
+            json.loads(consumer.session.post.call_args.kwargs['data']), self.events
+        )
+        self.assertEqual(consumer.stats['sent'], 1)
+        self.assertFalse(os.path.exists(self.spool_path))
+        self.assertFalse(os.path.exists(f'{self.spool_path}.replay'))
+
+
+@override_settings(
+    MIDDLEWARE=[
+        *settings.MIDDLEWARE,
+        'tracker.analytics.middleware.InstrumentationMiddleware',
+    ],
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+)
+class TestInstrumentation(TestCase):
+    def setUp(self):
+        self.rand = random.Random()
+        self.event = randgen.generate_event(self.rand)
+        self.event.save()
+        instrumentation.reset()
+        self.addCleanup(instrumentation.reset)
+
+    def test_recording(self):
+        with instrumentation.recording() as stats:
+            list(models.Event.objects.all())
+            with instrumentation.timing('serializer_time'):
+                with instrumentation.timing('serializer_time'):
+                    list(models.Event.objects.all())
+            instrumentation.cache_lookup(True)
+            instrumentation.cache_lookup(False)
+        self.assertEqual(stats.queries, 2)
+        self.assertGreater(stats.db_time, 0)
+        self.assertGreater(stats.serializer_time, 0)
+        self.assertEqual(stats.cache_hits, 1)
+        self.assertEqual(stats.cache_misses, 1)
+        self.assertIsNone(instrumentation.current())
+
+    @override_settings(TRACKER_SERVER_TIMING=True)
+    def test_server_timing(self):
+        with patch('tracker.analytics.middleware.analytics.track') as track:
+            response = self.client.get(reverse('tracker:api_v2:event-list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(
+            response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries"'
+        )
+        self.assertIn('serializer;dur=', response['Server-Timing'])
+        event, properties = track.call_args.args
+        self.assertEqual(event, AnalyticsEventTypes.REQUEST_PROFILED)
+        self.assertEqual(properties['view'], 'tracker:api_v2:event-list')
+        self.assertGreater(properties['queries'], 0)
+
+        response = self.client.get(reverse('tracker:api_v2:event-list'))
+        totals = instrumentation.report()['tracker:api_v2:event-list']
+        self.assertEqual(totals['requests'], 2)
+        self.assertGreater(totals['queries'], 0)
+
+    def test_no_server_timing_by_default(self):
+        response = self.client.get(reverse('tracker:api_v2:event-list'))
+        self.assertNotIn('Server-Timing', response)
+
+    def test_budget(self):
+        with (
+            override_settings(
+                TRACKER_QUERY_BUDGETS={'tracker:api_v2:event-list': {'queries': 0}}
+            ),
+            self.assertLogs('tracker.analytics.instrumentation', 'WARNING'),
+        ):
+            self.client.get(reverse('tracker:api_v2:event-list'))
+
+        with (
+            override_settings(
+                TRACKER_QUERY_BUDGETS={'tracker:api_v2:event-list': {'queries': 0}},
+                TRACKER_QUERY_BUDGETS_STRICT=True,
+            ),
+            self.assertRaisesRegex(instrumentation.BudgetExceeded, 'event-list'),
+        ):
+            self.client.get(reverse('tracker:api_v2:event-list'))
+
+        with override_settings(
+            TRACKER_QUERY_BUDGETS={'tracker:api_v2:event-list': {'queries': 100}},
+            TRACKER_QUERY_BUDGETS_STRICT=True,
+        ):
+            self.client.get(reverse('tracker:api_v2:event-list'))
+
+    def test_report_command(self):
+        self.client.get(reverse('tracker:api_v2:event-list'))
+        out = io.StringIO()
+        call_command('report_slow_views', '--reset', stdout=out)
+        self.assertIn('tracker:api_v2:event-list: 1 request(s)', out.getvalue())
+        self.assertEqual(instrumentation.report(), {})
@@ -0,0 +1,61 @@
+import random
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import CommandError
+from django.test import TestCase
+
+from tracker import models
+from tracker.management.commands import tracker_benchmark
+
+
+@mock.patch('tracker.postbackutil._session', return_value=tracker_benchmark._Session())
+@mock.patch('tracker.postbackutil._record')
+class TestBenchmark(TestCase):
+    def test_scenarios(self, record, session):
+        event = tracker_benchmark.seed(
+            random.Random(0), donations=30, donors=5, bids=3, prizes=2, runs=3
+        )
+        self.assertEqual(models.Donation.objects.filter(event=event).count(), 30)
+        self.assertTrue(models.DonorCache.objects.filter(event=event).exists())
+        user = User.objects.create_superuser('benchmark')
+
+        for scenario in tracker_benchmark.scenarios(event, user):
+            with self.subTest(scenario.name):
+                result = tracker_benchmark.measure(scenario, iterations=2)
+                self.assertEqual(result['iterations'], 2)
+                self.assertGreater(result['queries'], 0)
+                self.assertLessEqual(result['p50'], result['p99'])
+
+        # the mutating scenarios leave nothing behind
+        self.assertEqual(models.Donation.objects.filter(event=event).count(), 30)
+        self.assertFalse(models.PrizeClaim.objects.exists())
+        self.assertFalse(models.PostbackURL.objects.exists())
+
+    def test_percentile(self, record, session):
+        values = list(range(1, 101))
+        self.assertEqual(tracker_benchmark.percentile(values, 50), 50)
+        self.assertEqual(tracker_benchmark.percentile(values, 99), 99)
+        self.assertEqual(tracker_benchmark.percentile([5], 99), 5)
+
+    def test_keepdb_scale(self, record, session):
+        command = tracker_benchmark.Command()
+        options = {
+            'seed': 0,
+            'donations': 20,
+            'donors': None,
+            'bids': 2,
+            'prizes': 1,
+            'runs': 2,
+            'scenarios': 'csv_donor_report',
+            'iterations': 1,
+            'warmup': 0,
+        }
+        self.assertEqual(command.benchmark(options)['scale']['donations'], 20)
+        self.assertEqual(command.benchmark(options)['scale']['donations'], 20)
+        self.assertEqual(models.Event.objects.count(), 1)
+
+        options['donations'] = 30
+        with self.assertRaisesRegex(CommandError, 'different scale'):
+            command.benchmark(options)
+        self.assertEqual(models.Event.objects.count(), 1)
@@ -1,4 +1,5 @@
 import random
+from unittest.mock import patch
 
 from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME
 from django.contrib.auth.models import Permission, User
@@ -6,7 +7,7 @@ from django.core.exceptions import ValidationError
 from django.test import TestCase
 from django.urls import reverse
 
-from tracker import models
+from tracker import bidutil, models, viewutil
 from tracker.admin.inlines import BidChainedInline, BidDependentsInline, BidOptionInline
 
 from . import randgen
@@ -408,6 +409,112 @@ class TestBid(TestBidBase):
         self.assertTrue(self.chain_middle.chain)
         self.assertTrue(self.chain_bottom.chain)
 
+    def test_deferred_recompute(self):
+        with self.subTest('completing a donation recomputes every tree in one pass'):
+            donation = models.Donation.objects.create(
+                donor=self.donor, event=self.event, amount=700
+            )
+            for bid, amount in (
+                (self.opened_bid, 25),
+                (self.challenge, 50),
+                (self.chain_top, 625),
+            ):
+                models.DonationBid.objects.create(
+                    donation=donation, bid=bid, amount=amount
+                )
+            with patch(
+                'tracker.bidutil.recompute_trees', wraps=bidutil.recompute_trees
+            ) as recompute:
+                donation.transactionstate = 'COMPLETED'
+                donation.save()
+            self.assertEqual(recompute.call_count, 1)
+            for bid in (
+                self.opened_bid,
+                self.opened_parent_bid,
+                self.challenge,
+                self.chain_top,
+                self.chain_middle,
+            ):
+                bid.refresh_from_db()
+            self.assertEqual(self.opened_bid.total, 25)
+            self.assertEqual(self.opened_parent_bid.total, 25)
+            self.assertEqual(self.opened_parent_bid.count, 1)
+            self.assertEqual(self.challenge.total, 60)
+            self.assertEqual(self.challenge.state, 'CLOSED')
+            self.assertEqual(self.chain_top.total, 625)
+            self.assertEqual(self.chain_middle.total, 125)
+
+        with self.subTest('changes inside the block are collapsed'):
+            with patch(
+                'tracker.bidutil.recompute_trees', wraps=bidutil.recompute_trees
+            ) as recompute:
+                with bidutil.deferred_recompute():
+                    for d in (self.donation, self.donation4):
+                        models.DonationBid.objects.create(
+                            donation=d, bid=self.chain_top, amount=d.amount
+                        )
+                    self.chain_top.refresh_from_db()
+                    self.assertEqual(self.chain_top.total, 625)
+                self.assertEqual(recompute.call_count, 1)
+            for bid in (self.chain_top, self.chain_middle, self.chain_bottom):
+                bid.refresh_from_db()
+                self.assertEqual(bid.state, 'CLOSED')
+            self.assertEqual(self.chain_top.total, 880)
+            self.assertEqual(self.chain_bottom.total, 130)
+
+        with self.subTest('can be deferred until commit'):
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                with bidutil.deferred_recompute(on_commit=True):
+                    models.DonationBid.objects.create(
+                        donation=self.donation3, bid=self.opened_bid, amount=10
+                    )
+                self.opened_bid.refresh_from_db()
+                self.assertEqual(self.opened_bid.total, 25)
+            self.assertEqual(len(callbacks), 1)
+            self.opened_bid.refresh_from_db()
+            self.assertEqual(self.opened_bid.total, 35)
+
+    def test_merge(self):
+        option_a = models.Bid.objects.create(
+            name='Option A',
+            istarget=True,
+            parent=self.opened_parent_bid,
+            state='OPENED',
+        )
+        option_b = models.Bid.objects.create(
+            name='Option B',
+            istarget=True,
+            parent=self.opened_parent_bid,
+            state='OPENED',
+        )
+        models.DonationBid.objects.create(
+            donation=self.donation, bid=option_a, amount=2
+        )
+        models.DonationBid.objects.create(
+            donation=self.donation, bid=option_b, amount=3
+        )
+        models.DonationBid.objects.create(
+            donation=self.donation3, bid=option_b, amount=self.donation3.amount
+        )
+
+        with patch(
+            'tracker.bidutil.recompute_trees', wraps=bidutil.recompute_trees
+        ) as recompute:
+            result = viewutil.merge_bids(option_a, [option_a, option_b])
+
+        recompute.assert_called_once()
+        self.assertEqual(result.moved, {'donation bids': 2, 'suggestions': 0})
+        self.assertEqual(result.deleted, 1)
+        self.assertFalse(models.Bid.objects.filter(pk=option_b.pk).exists())
+        split = models.DonationBid.objects.get(donation=self.donation)
+        self.assertEqual(split.bid, option_a)
+        self.assertEqual(split.amount, 5)
+        self.assertEqual(option_a.total, 630)
+        self.assertEqual(option_a.count, 2)
+        self.opened_parent_bid.refresh_from_db()
+        self.assertEqual(self.opened_parent_bid.total, 630)
+        self.assertEqual(self.opened_parent_bid.count, 2)
+
     def test_bid_option_max_length_require(self):
         # A bid cannot set option_max_length if allowuseroptions is not set
         bid = models.Bid(name='I am a bid', option_max_length=1)
@@ -551,7 +551,7 @@ class TestDonationAdmin(TestCase, AssertionHelpers):
             actions = self.donation_admin.get_actions(request)
             self.assertEqual(len(actions), 0, msg='Actions list was not empty.')
 
-    @patch('tracker.tasks.post_donation_to_postbacks')
+    @patch('tracker.tasks.post_donations_to_postbacks')
     def test_donation_postback(self, task):
         self.client.force_login(self.super_user)
 
@@ -564,7 +564,7 @@ class TestDonationAdmin(TestCase, AssertionHelpers):
                 },
             )
             self.assertRedirects(response, reverse('admin:tracker_donation_changelist'))
-            task.delay.assert_called_with(self.donation.id)
+            task.delay.assert_called_with([self.donation.id])
             task.assert_not_called()
 
         task.delay.reset_mock()
@@ -579,7 +579,7 @@ class TestDonationAdmin(TestCase, AssertionHelpers):
                 },
             )
             self.assertRedirects(response, reverse('admin:tracker_donation_changelist'))
-            task.assert_called_with(self.donation.id)
+            task.assert_called_with([self.donation.id])
             task.delay.assert_not_called()
 
     def test_donation_rescan_ipns(self):
@@ -2,10 +2,13 @@ import logging
 import random
 from decimal import Decimal
 from unittest import skip
+from unittest.mock import patch
 
 from django.contrib.admin import AdminSite
 from django.contrib.auth.models import AnonymousUser, Permission, User
-from django.test import RequestFactory, TestCase
+from django.core.management import call_command
+from django.db.models import Count, Max, Sum
+from django.test import RequestFactory, TestCase, override_settings
 from django.urls import reverse
 
 from tracker import admin, models, viewutil
@@ -291,6 +294,179 @@ class TestDonorTotals(TestCase, AssertionHelpers):
         self.assertFalse(0, models.DonorCache.objects.exists())
 
 
+@override_settings(TRACKER_INCREMENTAL_DONOR_CACHE=True)
+class TestIncrementalDonorCache(TestCase, AssertionHelpers):
+    def setUp(self):
+        self.john = models.Donor.objects.create(
+            firstname='John', lastname='Doe', email='johndoe@example.com'
+        )
+        self.jane = models.Donor.objects.create(
+            firstname='Jane', lastname='Doe', email='janedoe@example.com'
+        )
+        self.ev1 = models.Event.objects.create(
+            short='ev1', name='Event 1', datetime=today_noon, paypalcurrency='USD'
+        )
+        self.ev2 = models.Event.objects.create(
+            short='ev2', name='Event 2', datetime=today_noon, paypalcurrency='USD'
+        )
+
+    def donate(self, donor, event, amount, **kwargs):
+        return models.Donation.objects.create(
+            donor=donor,
+            event=event,
+            amount=amount,
+            domain='PAYPAL',
+            transactionstate='COMPLETED',
+            **kwargs,
+        )
+
+    def assertCacheMatchesFullUpdate(self):
+        for cache in models.DonorCache.objects.all():
+            aggregate = cache.donations.aggregate(
+                total=Sum('amount'), count=Count('amount'), max=Max('amount')
+            )
+            self.assertEqual(cache.donation_total, aggregate['total'], msg=str(cache))
+            self.assertEqual(cache.donation_count, aggregate['count'], msg=str(cache))
+            self.assertEqual(cache.donation_max, aggregate['max'], msg=str(cache))
+            self.assertEqual(
+                cache.donation_avg,
+                (aggregate['total'] / aggregate['count']).quantize(Decimal('0.00')),
+                msg=str(cache),
+            )
+
+    def test_deltas(self):
+        d1 = self.donate(self.john, self.ev1, 5)
+        self.assertEqual(4, models.DonorCache.objects.count())
+        self.assertFalse(models.DonorCache.objects.filter(stale=True).exists())
+        self.donate(self.john, self.ev1, 15)
+        self.donate(self.jane, self.ev1, 20)
+        d4 = self.donate(self.jane, self.ev2, 25)
+        self.assertCacheMatchesFullUpdate()
+        self.assertDictContainsSubset(
+            {
+                'donation_total': 40,
+                'donation_count': 3,
+                'donation_max': 20,
+                'donation_avg': Decimal('13.33'),
+                'stale': True,
+            },
+            models.DonorCache.objects.get(donor=None, event=self.ev1).__dict__,
+        )
+
+        # saves that do not affect the totals do not touch the cache, only the donation update and the bid lookup
+        d1.comment = 'Hello'
+        with self.assertNumQueries(2):
+            d1.save()
+
+        d4.amount = 30
+        d4.save()
+        self.assertCacheMatchesFullUpdate()
+
+        d4.event = self.ev1
+        d4.save()
+        self.assertFalse(
+            models.DonorCache.objects.filter(donor=self.jane, event=self.ev2).exists()
+        )
+        self.assertCacheMatchesFullUpdate()
+
+        d4.transactionstate = 'CANCELLED'
+        d4.save()
+        self.assertCacheMatchesFullUpdate()
+        self.assertEqual(
+            models.DonorCache.objects.get(donor=None, currency='USD').donation_max, 20
+        )
+
+        d1.delete()
+        self.assertCacheMatchesFullUpdate()
+
+    def test_test_donations_are_ignored(self):
+        self.donate(self.john, self.ev1, 5, testdonation=True)
+        self.assertFalse(models.DonorCache.objects.exists())
+
+    def test_donorless_donations(self):
+        donation = self.donate(None, self.ev1, 5)
+        self.assertEqual(2, models.DonorCache.objects.count())
+        self.assertEqual(
+            models.DonorCache.event_total(self.ev1.id), (Decimal('5.00'), 1)
+        )
+        donation.donor = self.john
+        donation.save()
+        self.assertEqual(4, models.DonorCache.objects.count())
+        self.assertEqual(
+            models.DonorCache.event_total(self.ev1.id), (Decimal('5.00'), 1)
+        )
+        self.assertCacheMatchesFullUpdate()
+
+    def test_deferred_fields_fall_back_to_full_update(self):
+        self.donate(self.john, self.ev1, 5)
+        self.donate(self.john, self.ev1, 10)
+        donation = models.Donation.objects.only('id', 'event', 'donor').first()
+        donation.transactionstate = 'PENDING'
+        donation.save()
+        self.assertCacheMatchesFullUpdate()
+
+    def test_reconcile(self):
+        self.donate(self.john, self.ev1, 5)
+        self.donate(self.john, self.ev1, 10)
+        self.donate(self.jane, self.ev1, 30)
+        self.assertEqual(4, models.DonorCache.objects.filter(stale=True).count())
+        self.assertEqual(4, models.DonorCache.reconcile())
+        self.assertFalse(models.DonorCache.objects.filter(stale=True).exists())
+        self.assertEqual(
+            models.DonorCache.objects.get(donor=None, event=self.ev1).donation_med, 10
+        )
+        self.assertEqual(
+            models.DonorCache.objects.get(donor=self.john, event=self.ev1).donation_med,
+            Decimal('7.50'),
+        )
+
+
+class TestRecomputeDonorCache(TestCase):
+    def setUp(self):
+        self.rand = random.Random(None)
+        self.event = randgen.build_random_event(
+            self.rand, num_donors=10, num_donations=50, num_runs=5
+        )
+        self.other_event = randgen.build_random_event(
+            self.rand, num_donors=5, num_donations=20, num_runs=5
+        )
+
+    def snapshot(self):
+        return {
+            (dc.event_id, dc.donor_id, dc.currency): (
+                dc.donation_total,
+                dc.donation_count,
+                dc.donation_max,
+                dc.donation_avg,
+                dc.donation_med,
+            )
+            for dc in models.DonorCache.objects.all()
+        }
+
+    def test_matches_signal_updates(self):
+        expected = self.snapshot()
+        models.DonorCache.objects.all().delete()
+        call_command('recompute_donor_cache', verbosity=0)
+        self.assertEqual(self.snapshot(), expected)
+
+    def test_fixes_bad_rows(self):
+        call_command('recompute_donor_cache', verbosity=0)
+        expected = self.snapshot()
+        models.DonorCache.objects.filter(event=self.event, donor=None).update(
+            donation_total=0, donation_med=0
+        )
+        donor = randgen.generate_donor(self.rand)
+        donor.save()
+        orphan = models.DonorCache.objects.create(event=self.event, donor=donor)
+        # a fixed number of queries per event and currency, no matter how many rows there are
+        with self.assertNumQueries(20):
+            call_command(
+                'recompute_donor_cache', events=str(self.event.id), verbosity=0
+            )
+        self.assertFalse(models.DonorCache.objects.filter(id=orphan.id).exists())
+        self.assertEqual(self.snapshot(), expected)
+
+
 class TestDonorEmailSave(TestCase):
     def testSaveWithExistingDoesNotThrow(self):
         rand = random.Random(None)
@@ -317,6 +493,33 @@ class TestDonorMerge(TestCase):
         for donation in rootDonor.donation_set.all():
             self.assertTrue(donation in donationList)
 
+    def test_merge_recomputes_cache(self):
+        event = randgen.generate_event(random.Random(None))
+        event.save()
+        root = models.Donor.objects.create(email='root@example.com')
+        other = models.Donor.objects.create(email='other@example.com')
+        for donor, amount in ((root, 5), (other, 10), (other, 20)):
+            models.Donation.objects.create(
+                event=event, donor=donor, amount=amount, transactionstate='COMPLETED'
+            )
+
+        result = viewutil.merge_donors(root, [root, other])
+
+        self.assertEqual(result.moved, {'donations': 2, 'prize claims': 0})
+        self.assertEqual(result.deleted, 1)
+        self.assertFalse(models.Donor.objects.filter(pk=other.pk).exists())
+        self.assertFalse(models.DonorCache.objects.filter(donor_id=other.pk).exists())
+        for cache in (
+            models.DonorCache.objects.get(event=event, donor=root),
+            models.DonorCache.objects.get(
+                event=None, donor=root, currency=event.paypalcurrency
+            ),
+        ):
+            self.assertEqual(cache.donation_total, 35)
+            self.assertEqual(cache.donation_count, 3)
+            self.assertEqual(cache.donation_max, 20)
+            self.assertEqual(cache.donation_med, 10)
+
 
 @skip('currently disabled')
 class TestDonorView(TestCase):
@@ -398,6 +601,39 @@ class TestDonorAlias(TestCase):
         self.assertEqual(donor.alias, None, msg='Alias was not cleared')
         self.assertEqual(donor.alias_num, None, msg='Alias was not cleared')
 
+    def test_alias_num_collision(self):
+        models.Donor.objects.create(alias='Raelcun', alias_num=1000)
+        # simulates a concurrent save grabbing the same number first
+        with patch.object(
+            models.Donor.objects.__class__,
+            'pick_alias_num',
+            side_effect=[1000, 1001],
+        ):
+            donor = models.Donor.objects.create(alias='Raelcun')
+        self.assertEqual(donor.alias_num, 1001)
+
+    def test_assign_alias_nums(self):
+        for i in range(1000, 9998):
+            models.Donor.objects.create(alias='Raelcun', alias_num=i)
+        donors = models.Donor.objects.assign_alias_nums(
+            [
+                models.Donor(alias='Raelcun'),
+                models.Donor(alias='Raelcun'),
+                models.Donor(alias='Raelcun'),
+                models.Donor(alias='Other', alias_num=1234),
+                models.Donor(alias='Other'),
+            ]
+        )
+        self.assertEqual(
+            sorted(d.alias_num for d in donors[:2]),
+            [9998, 9999],
+            msg='Remaining numbers were not used',
+        )
+        self.assertEqual(donors[2].alias, None, msg='Alias was not cleared')
+        self.assertEqual(donors[3].alias_num, 1234)
+        self.assertNotIn(donors[4].alias_num, (None, 1234))
+        models.Donor.objects.bulk_create(donors)
+
 
 class TestDonorAliasMigration(MigrationsTestCase):
     migrate_from = [('tracker', '0010_add_alias_num')]
@@ -7,9 +7,9 @@ import zoneinfo
 import post_office.models
 from django.contrib.auth.models import Group, Permission, User
 from django.contrib.sites.models import Site
-from django.test import TestCase, TransactionTestCase, override_settings
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
 
-from tracker import models, settings
+from tracker import models, settings, volunteerutil
 from tracker.compat import reverse
 from tracker.util import make_rand, utcnow
 
@@ -599,6 +599,77 @@ minimal@example.com
             "minimal's email was not tagged as donations",
         )
 
+    def test_import_volunteers_in_bulk(self):
+        template = post_office.models.EmailTemplate.objects.create(
+            name='Test Template', content='{{ user }}'
+        )
+        User.objects.create(username='Taken', email='someone@example.com')
+        request = RequestFactory().post('/admin/')
+        request.user = self.super_user
+
+        def import_volunteers(count):
+            return volunteerutil.import_volunteers(
+                request,
+                self.event,
+                'position,name,username,email\n'
+                + ''.join(
+                    f'Donations,Volunteer {n},volunteer{n},volunteer{n}@example.com\n'
+                    for n in range(count)
+                ),
+                template=template,
+                sender='root@localhost',
+            )
+
+        # warm up, creates the groups and their permissions
+        import_volunteers(1)
+        with self.assertNumQueries(11):
+            import_volunteers(2)
+        group = Group.objects.get(name='Bid Tracker')
+        permissions = set(group.permissions.values_list('id', flat=True))
+        with self.assertNumQueries(11):
+            results = import_volunteers(10)
+        self.assertEqual(len(results), 10)
+        self.assertTrue(all(r.user.pk for r in results))
+        self.assertEqual(
+            set(group.permissions.values_list('id', flat=True)),
+            permissions,
+            'Should not have touched the group permissions',
+        )
+        self.assertEqual(
+            group.user_set.filter(username__startswith='volunteer').count(), 10
+        )
+
+        results = volunteerutil.import_volunteers(
+            request,
+            self.event,
+            """position,name,username,email
+Head Donations,Volunteer Zero,volunteer0,VOLUNTEER0@example.com
+Donations,Other Face,Taken,other@example.com
+Donations,Fresh Face,Fresh,Fresh@example.com
+Donations,Fresh Face,Fresh,fresh@example.com
+""",
+            template=template,
+            sender='root@localhost',
+        )
+        self.assertEqual(
+            [r.message for r in results],
+            [
+                'Found existing user volunteer0 with email VOLUNTEER0@example.com',
+                'Could not process row #3: the username Taken is already taken',
+                'Created user Fresh with email Fresh@example.com',
+                'Could not process row #5: fresh@example.com is already listed on row #4',
+            ],
+        )
+        self.assertEqual(
+            list(
+                User.objects.get(username='volunteer0').groups.values_list(
+                    'name', flat=True
+                )
+            ),
+            ['Bid Admin'],
+            'Should have moved the existing user to the new group',
+        )
+
     def test_event_donor_report(self):
         donor1 = randgen.generate_donor(self.rand, visibility='ANON')
         donor1.save()
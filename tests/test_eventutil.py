@@ -1,14 +1,18 @@
 # coding: utf-8
 
 import datetime
+import http.server
 import json
+import threading
+import time
 from decimal import Decimal
+from unittest.mock import patch
 
 import responses
-from django.test import TransactionTestCase
+from django.test import TransactionTestCase, override_settings
 
-from tracker import eventutil
-from tracker.models import Donation, Donor, Event, PostbackURL
+from tracker import eventutil, postbackutil
+from tracker.models import Donation, Donor, DonorCache, Event, Log, PostbackURL
 
 
 class TestPostDonation(TransactionTestCase):
@@ -41,6 +45,7 @@ class TestPostDonation(TransactionTestCase):
         )
 
         eventutil.post_donation_to_postbacks(donation)
+        postbackutil.flush()
 
         assert len(responses.calls) == 1
         resp = responses.calls[0]
@@ -61,3 +66,240 @@ class TestPostDonation(TransactionTestCase):
             'bids': [],
         }
         assert resp.response.status_code == 200
+
+    @responses.activate
+    def test_total_from_cache(self):
+        responses.post('https://example.com', status=200)
+
+        donation = Donation.objects.create(
+            amount=Decimal(1.5),
+            domain='PAYPAL',
+            event=self.event,
+            currency='USD',
+            transactionstate='COMPLETED',
+        )
+        self.assertEqual(DonorCache.event_total(self.event.id), (Decimal('1.50'), 1))
+        # the running total is read from the cache instead of aggregating every donation
+        DonorCache.objects.filter(event=self.event, donor=None).update(
+            donation_total=10, donation_count=4
+        )
+
+        eventutil.post_donation_to_postbacks(donation)
+        postbackutil.flush()
+
+        self.assertEqual(json.loads(responses.calls[0].request.body)['new_total'], 10)
+
+    @responses.activate
+    def test_total_with_test_donations(self):
+        responses.post('https://example.com', status=200)
+
+        Donation.objects.create(
+            amount=Decimal(1.5),
+            domain='PAYPAL',
+            event=self.event,
+            currency='USD',
+            transactionstate='COMPLETED',
+        )
+        donation = Donation.objects.create(
+            amount=Decimal(2),
+            domain='PAYPAL',
+            event=self.event,
+            currency='USD',
+            transactionstate='COMPLETED',
+            testdonation=True,
+        )
+
+        # same as aggregating `Donation.objects.completed()`, which only includes test donations in test mode
+        with override_settings(PAYPAL_TEST=True):
+            self.assertEqual(
+                DonorCache.event_total(self.event.id), (Decimal('3.50'), 2)
+            )
+            eventutil.post_donation_to_postbacks(donation)
+            postbackutil.flush()
+        with override_settings(PAYPAL_TEST=False):
+            self.assertEqual(
+                DonorCache.event_total(self.event.id), (Decimal('1.50'), 1)
+            )
+            eventutil.post_donation_to_postbacks(donation)
+            postbackutil.flush()
+
+        self.assertEqual(
+            [json.loads(call.request.body)['new_total'] for call in responses.calls],
+            [3.5, 1.5],
+        )
+
+
+class PostbackServer(http.server.ThreadingHTTPServer):
+    """a local stand-in for postback consumers, records every request body by path"""
+
+    def __init__(self):
+        self.received = {}
+        self.attempts = {}
+        self.delays = {}
+        self.failures = {}
+        self.statuses = {}
+
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                time.sleep(server.delays.get(self.path, 0))
+                server.attempts[self.path] = server.attempts.get(self.path, 0) + 1
+                if self.path in server.statuses:
+                    status = server.statuses[self.path]
+                elif server.failures.get(self.path, 0):
+                    server.failures[self.path] -= 1
+                    status = 503
+                else:
+                    server.received.setdefault(self.path, []).append(json.loads(body))
+                    status = 200
+                self.send_response(status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        super().__init__(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    def url(self, path):
+        return f'http://127.0.0.1:{self.server_port}{path}'
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+
+@patch.object(postbackutil, 'RETRY_BACKOFF', 0)
+class TestPostbackDelivery(TransactionTestCase):
+    def setUp(self):
+        self.server = PostbackServer()
+        self.addCleanup(self.server.close)
+        self.event = Event.objects.create(
+            receivername='Test',
+            paypalemail='test@example.com',
+            paypalcurrency='USD',
+            datetime=datetime.datetime(2018, 1, 1, tzinfo=datetime.timezone.utc),
+        )
+        self.donations = [
+            Donation.objects.create(
+                amount=Decimal(5 + i),
+                domain='PAYPAL',
+                event=self.event,
+                currency='USD',
+                transactionstate='COMPLETED',
+            )
+            for i in range(3)
+        ]
+
+    def test_concurrent(self):
+        for path in ('/slow1', '/slow2', '/slow3'):
+            self.server.delays[path] = 0.5
+            PostbackURL.objects.create(event=self.event, url=self.server.url(path))
+        start = time.monotonic()
+        eventutil.post_donation_to_postbacks(self.donations[0])
+        # the caller does not wait for any of them
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertTrue(postbackutil.flush(timeout=5))
+        self.assertLess(time.monotonic() - start, 1.0)
+        for path in ('/slow1', '/slow2', '/slow3'):
+            self.assertEqual(
+                [d['id'] for d in self.server.received[path]], [self.donations[0].id]
+            )
+        for postback in PostbackURL.objects.all():
+            self.assertEqual(postback.success_count, 1)
+            self.assertEqual(postback.failure_count, 0)
+            self.assertGreaterEqual(postback.average_latency, 0.5)
+
+    def test_batching(self):
+        single = PostbackURL.objects.create(
+            event=self.event, url=self.server.url('/single')
+        )
+        batched = PostbackURL.objects.create(
+            event=self.event, url=self.server.url('/batched'), batch=True
+        )
+        eventutil.post_donations_to_postbacks(self.donations)
+        postbackutil.flush()
+        ids = [d.id for d in self.donations]
+        self.assertEqual([d['id'] for d in self.server.received['/single']], ids)
+        self.assertEqual(len(self.server.received['/batched']), 1)
+        self.assertEqual([d['id'] for d in self.server.received['/batched'][0]], ids)
+        single.refresh_from_db()
+        batched.refresh_from_db()
+        self.assertEqual(single.success_count, 3)
+        self.assertEqual(batched.success_count, 1)
+
+    @override_settings(TRACKER_POSTBACK_MAX_QUEUE=2)
+    def test_queue_limit(self):
+        PostbackURL.objects.create(event=self.event, url=self.server.url('/single'))
+        with self.assertLogs('tracker.postbackutil', level='WARNING'):
+            eventutil.post_donations_to_postbacks(self.donations)
+        postbackutil.flush()
+        self.assertEqual(
+            [d['id'] for d in self.server.received['/single']],
+            [d.id for d in self.donations[1:]],
+        )
+
+    @override_settings(TRACKER_POSTBACK_MAX_QUEUE=2)
+    def test_queue_limit_across_calls(self):
+        PostbackURL.objects.create(event=self.event, url=self.server.url('/slow'))
+        self.server.delays['/slow'] = 0.5
+        eventutil.post_donation_to_postbacks(self.donations[0])
+        # give the worker time to pick up the first request, the rest wait in the queue behind it
+        time.sleep(0.2)
+        eventutil.post_donation_to_postbacks(self.donations[1])
+        eventutil.post_donation_to_postbacks(self.donations[2])
+        with self.assertLogs('tracker.postbackutil', level='WARNING'):
+            eventutil.post_donation_to_postbacks(self.donations[0])
+        postbackutil.flush()
+        self.assertEqual(
+            [d['id'] for d in self.server.received['/slow']],
+            [self.donations[0].id, self.donations[2].id, self.donations[0].id],
+        )
+
+    @override_settings(TRACKER_POSTBACK_RETRIES=2)
+    def test_retries(self):
+        flaky = PostbackURL.objects.create(
+            event=self.event, url=self.server.url('/flaky')
+        )
+        broken = PostbackURL.objects.create(
+            event=self.event, url=self.server.url('/broken')
+        )
+        self.server.failures['/flaky'] = 2
+        self.server.failures['/broken'] = 3
+        with self.assertLogs('tracker.postbackutil', level='ERROR'):
+            eventutil.post_donation_to_postbacks(self.donations[0])
+            postbackutil.flush()
+        self.assertEqual(len(self.server.received['/flaky']), 1)
+        self.assertNotIn('/broken', self.server.received)
+        flaky.refresh_from_db()
+        broken.refresh_from_db()
+        self.assertEqual((flaky.success_count, flaky.failure_count), (1, 0))
+        self.assertIsNone(flaky.last_failure)
+        self.assertEqual((broken.success_count, broken.failure_count), (0, 1))
+        self.assertIsNotNone(broken.last_failure)
+        self.assertTrue(
+            Log.objects.filter(
+                category='postback_url', message__startswith=f'{broken.id}\n'
+            ).exists()
+        )
+
+    @override_settings(TRACKER_POSTBACK_RETRIES=2)
+    def test_rejected(self):
+        gone = PostbackURL.objects.create(
+            event=self.event, url=self.server.url('/gone')
+        )
+        self.server.statuses['/gone'] = 410
+        with self.assertLogs('tracker.postbackutil', level='ERROR'):
+            eventutil.post_donation_to_postbacks(self.donations[0])
+            postbackutil.flush()
+        # a client error is not retried
+        self.assertEqual(self.server.attempts['/gone'], 1)
+        gone.refresh_from_db()
+        self.assertEqual((gone.success_count, gone.failure_count), (0, 1))
+        self.assertIsNotNone(gone.last_failure)
@@ -1,8 +1,11 @@
 from decimal import Decimal
+from unittest import mock
 
-from django.test import TransactionTestCase
+from django.db import transaction
+from django.test import SimpleTestCase, TransactionTestCase
 
 from tracker import models
+from tracker.models.mod_filter import MAX_AGE, ModerationFilter, get_moderation_filter
 
 from .util import today_noon
 
@@ -38,6 +41,57 @@ class TestWordFilter(TransactionTestCase):
         self.assertNotEqual(donation.readstate, 'IGNORED')
         self.assertFalse('DENIED due to matching filter word' in donation.modcomment)
 
+    def testMultipleMatches(self):
+        models.WordFilter.objects.create(word='train')
+        donation = models.Donation.objects.create(
+            event=self.event, comment='All aboard the HYPE TRAIN', amount=5
+        )
+        self.assertEqual(
+            donation.modcomment.strip().splitlines(),
+            [
+                'DENIED due to matching filter word: hype',
+                'DENIED due to matching filter word: train',
+            ],
+        )
+
+    def testCompiledFilterIsCached(self):
+        models.Donation.objects.create(event=self.event, comment='first', amount=5)
+        compiled = get_moderation_filter()
+        models.Donation.objects.create(event=self.event, comment='second', amount=5)
+        self.assertIs(get_moderation_filter(), compiled)
+        self.filter.word = 'relaxed'
+        self.filter.save()
+        donation = models.Donation.objects.create(
+            event=self.event, comment='relaxed', amount=5
+        )
+        self.assertIsNot(get_moderation_filter(), compiled)
+        self.assertEqual(donation.commentstate, 'DENIED')
+        self.filter.delete()
+        donation = models.Donation.objects.create(
+            event=self.event, comment='relaxed', amount=5
+        )
+        self.assertNotEqual(donation.commentstate, 'DENIED')
+
+    def testVersionIsBumpedOnCommit(self):
+        with mock.patch('tracker.models.mod_filter.cache') as cache:
+            with transaction.atomic():
+                models.WordFilter.objects.create(word='other')
+                cache.set.assert_not_called()
+            cache.set.assert_called_once()
+
+    def testCompiledFilterExpires(self):
+        compiled = get_moderation_filter()
+        # another process changed the filters, but this one does not share its cache
+        models.WordFilter.objects.filter(pk=self.filter.pk).update(word='relaxed')
+        self.assertIs(get_moderation_filter(), compiled)
+        with mock.patch(
+            'tracker.models.mod_filter.time.monotonic',
+            return_value=compiled.compiled_at + MAX_AGE + 1,
+        ):
+            self.assertEqual(
+                get_moderation_filter().match('relaxed', 5)[0], ['relaxed']
+            )
+
     def testNoRejectionOfExistingDonations(self):
         donation = models.Donation.objects.create(
             event=self.event, comment='relaxed', amount=5
@@ -79,3 +133,36 @@ class TestAmountFilter(TransactionTestCase):
         donation.save()
         self.assertNotEqual(donation.commentstate, 'DENIED')
         self.assertNotEqual(donation.readstate, 'IGNORED')
+
+
+class TestModerationFilter(SimpleTestCase):
+    def test_match(self):
+        compiled = ModerationFilter(
+            ['Foo Bar', 'foo', 'bar baz', 'bar', 'c++', 'a.b', 'hype', 'hyped'],
+            [Decimal('4.20')],
+        )
+        with self.subTest('overlapping and nested words'):
+            self.assertEqual(
+                compiled.match('FOO BAR BAZ', 5),
+                (['foo', 'foo bar', 'bar', 'bar baz'], []),
+            )
+        with self.subTest('every word at the same position'):
+            self.assertEqual(
+                compiled.match('foo bar', 5), (['foo', 'foo bar', 'bar'], [])
+            )
+            self.assertEqual(compiled.match('foo barn', 5), (['foo'], []))
+            self.assertEqual(compiled.match('so hyped', 5), (['hyped'], []))
+            self.assertEqual(compiled.match('so hype', 5), (['hype'], []))
+            self.assertEqual(compiled.match('so hypes', 5), ([], []))
+        with self.subTest('words are matched literally'):
+            self.assertEqual(compiled.match('i like a.b', 5), (['a.b'], []))
+            self.assertEqual(compiled.match('i like axb', 5), ([], []))
+            self.assertEqual(compiled.match('c++ is great', 5), (['c++'], []))
+        with self.subTest('amounts'):
+            self.assertEqual(
+                compiled.match('', Decimal('4.2')), ([], [Decimal('4.20')])
+            )
+            self.assertEqual(compiled.match(None, 5), ([], []))
+
+    def test_empty(self):
+        self.assertEqual(ModerationFilter([], []).match('anything', 5), ([], []))
@@ -0,0 +1,181 @@
+import random
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from tracker import models, participationutil, viewutil
+
+from . import randgen
+from .util import today_noon, tomorrow_noon
+
+
+@override_settings(TRACKER_PARTICIPATION_INDEX=True)
+class TestParticipationIndex(TestCase):
+    def setUp(self):
+        self.rand = random.Random(None)
+        self.event = randgen.generate_event(self.rand, start_time=today_noon)
+        self.event.save()
+        self.other_event = randgen.generate_event(self.rand, start_time=tomorrow_noon)
+        self.other_event.save()
+        self.run = randgen.generate_run(self.rand, self.event, ordered=True)
+        self.run.save()
+        self.interview = randgen.generate_interview(self.rand, event=self.event)
+        self.interview.save()
+        self.talent = randgen.generate_talent(self.rand)
+        self.talent.save()
+        self.other_talent = randgen.generate_talent(self.rand)
+        self.other_talent.save()
+        self.donor = randgen.generate_donor(self.rand)
+        self.donor.save()
+        self.other_donor = randgen.generate_donor(self.rand)
+        self.other_donor.save()
+
+    def assertTalentRows(self, expected):
+        self.assertSetEqual(
+            set(
+                models.TalentParticipation.objects.values_list(
+                    'event_id', 'talent_id', 'role'
+                )
+            ),
+            expected,
+        )
+
+    def assertDonorRows(self, expected):
+        self.assertSetEqual(
+            set(models.DonorParticipation.objects.values_list('event_id', 'donor_id')),
+            expected,
+        )
+
+    def test_talent(self):
+        self.run.runners.add(self.talent)
+        self.run.hosts.add(self.talent, self.other_talent)
+        self.interview.subjects.add(self.other_talent)
+        self.assertTalentRows(
+            {
+                (self.event.id, self.talent.id, 'runner'),
+                (self.event.id, self.talent.id, 'host'),
+                (self.event.id, self.other_talent.id, 'host'),
+                (self.event.id, self.other_talent.id, 'subject'),
+            }
+        )
+
+        with self.subTest('reverse relation'):
+            self.other_talent.hosting.remove(self.run)
+            self.talent.interviewer_for.add(self.interview)
+            self.assertTalentRows(
+                {
+                    (self.event.id, self.talent.id, 'runner'),
+                    (self.event.id, self.talent.id, 'host'),
+                    (self.event.id, self.talent.id, 'interviewer'),
+                    (self.event.id, self.other_talent.id, 'subject'),
+                }
+            )
+
+        with self.subTest('still in another run'):
+            other_run = randgen.generate_run(self.rand, self.event, ordered=True)
+            other_run.save()
+            other_run.runners.add(self.talent)
+            self.run.runners.clear()
+            self.assertIn(
+                (self.event.id, self.talent.id, 'runner'),
+                models.TalentParticipation.objects.values_list(
+                    'event_id', 'talent_id', 'role'
+                ),
+            )
+            other_run.delete()
+            self.assertNotIn(
+                (self.event.id, self.talent.id, 'runner'),
+                models.TalentParticipation.objects.values_list(
+                    'event_id', 'talent_id', 'role'
+                ),
+            )
+
+        with self.subTest('moved to another event'):
+            self.interview.event = self.other_event
+            self.interview.save()
+            self.assertTalentRows(
+                {
+                    (self.event.id, self.talent.id, 'host'),
+                    (self.other_event.id, self.talent.id, 'interviewer'),
+                    (self.other_event.id, self.other_talent.id, 'subject'),
+                }
+            )
+
+        with self.subTest('no extra queries for unrelated saves'):
+            self.run.name = 'Something Else'
+            with self.assertNumQueries(1):
+                # pre_save has to look up the previous event
+                participationutil.remember_event(models.SpeedRun, self.run)
+            with self.assertNumQueries(0):
+                participationutil.event_changed(self.run)
+
+    def test_donors(self):
+        donation = randgen.generate_donation(
+            self.rand, donor=self.donor, event=self.event
+        )
+        donation.save()
+        randgen.generate_donation(
+            self.rand,
+            no_donor=True,
+            event=self.event,
+            domain='PAYPAL',
+            transactionstate='PENDING',
+        ).save()
+        self.assertDonorRows({(self.event.id, self.donor.id)})
+
+        with self.subTest('unrelated changes'):
+            donation = models.Donation.objects.get(pk=donation.pk)
+            donation.readstate = 'IGNORED'
+            with self.assertNumQueries(0):
+                participationutil.donation_changed(donation)
+
+        with self.subTest('moved to another donor'):
+            donation.donor = self.other_donor
+            donation.save()
+            self.assertDonorRows({(self.event.id, self.other_donor.id)})
+
+        with self.subTest('merged'):
+            viewutil.merge_donors(self.donor, [self.other_donor])
+            self.assertDonorRows({(self.event.id, self.donor.id)})
+
+        with self.subTest('deleted'):
+            models.Donation.objects.get(pk=donation.pk).delete()
+            self.assertDonorRows(set())
+
+    def test_rebuild(self):
+        with override_settings(TRACKER_PARTICIPATION_INDEX=False):
+            self.run.runners.add(self.talent)
+            randgen.generate_donation(
+                self.rand, donor=self.donor, event=self.event
+            ).save()
+        models.TalentParticipation.objects.create(
+            event=self.other_event, talent=self.other_talent, role='host'
+        )
+        self.assertTalentRows({(self.other_event.id, self.other_talent.id, 'host')})
+        self.assertDonorRows(set())
+
+        out = StringIO()
+        call_command('rebuild_participation_index', events=self.event.short, stdout=out)
+        self.assertIn('Wrote 2 row(s)', out.getvalue())
+        self.assertTalentRows(
+            {
+                (self.event.id, self.talent.id, 'runner'),
+                (self.other_event.id, self.other_talent.id, 'host'),
+            }
+        )
+        self.assertDonorRows({(self.event.id, self.donor.id)})
+
+        out = StringIO()
+        call_command('rebuild_participation_index', stdout=out)
+        self.assertIn('Wrote 1 row(s)', out.getvalue())
+        self.assertTalentRows({(self.event.id, self.talent.id, 'runner')})
+
+    def test_disabled(self):
+        with override_settings(TRACKER_PARTICIPATION_INDEX=False):
+            self.run.runners.add(self.talent)
+            randgen.generate_donation(
+                self.rand, donor=self.donor, event=self.event
+            ).save()
+        self.assertTalentRows(set())
+        self.assertDonorRows(set())
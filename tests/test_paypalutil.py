@@ -4,7 +4,7 @@ from paypal.standard.ipn.models import PayPalIPN
 
 from tests import util
 from tests.util import APITestCase, create_ipn
-from tracker import models, paypalutil, settings
+from tracker import models, paypalutil, settings, tasks
 
 
 @mock.patch('tracker.tasks.post_donation_to_postbacks')
@@ -148,7 +148,8 @@ class TestIPNProcessing(APITestCase):
 
         with (
             self.settings(TRACKER_PAYPAL_ALLOW_OLD_IPN_FORMAT=True),
-            self.assertTrackerLogs(3, 'paypal'),
+            # once when the IPN is stored (the receivers share that result), and once more for the explicit check
+            self.assertTrackerLogs(2, 'paypal'),
         ):
             self.assertDonation(
                 task,
@@ -272,3 +273,67 @@ class TestIPNProcessing(APITestCase):
         self.event.save()
 
         self.assertDonation(task, 'doe@example.com', {}, matches=True, changes=False)
+
+    def test_resolved_once(self, task):
+        # so that the stored IPN looks the same as the one that was created
+        self.donation.refresh_from_db()
+        with (
+            mock.patch.object(
+                paypalutil, 'get_ipn_donation', wraps=paypalutil.get_ipn_donation
+            ) as get_ipn_donation,
+            self.assertTrackerLogs(1, 'paypal'),
+        ):
+            # linked, processed, and logged, since this pending reason is our fault
+            create_ipn(
+                self.donation,
+                'doe@example.com',
+                payment_status='Pending',
+                pending_reason='unilateral',
+            )
+        get_ipn_donation.assert_called_once()
+        self.donation.refresh_from_db()
+        self.assertEqual(self.donation.transactionstate, 'PENDING')
+
+    def test_async_ipn(self, task):
+        with (
+            self.settings(TRACKER_HAS_CELERY=True, TRACKER_PAYPAL_ASYNC_IPN=True),
+            mock.patch('tracker.tasks.process_paypal_ipn') as process,
+        ):
+            ipn = create_ipn(self.donation, 'doe@example.com')
+        process.delay.assert_called_once_with(ipn.id)
+        self.donation.refresh_from_db()
+        self.assertEqual(self.donation.transactionstate, 'PENDING')
+        self.assertNotIn(ipn, self.donation.ipns.all())
+
+        with self.settings(
+            TRACKER_HAS_CELERY=True,
+            CACHES={
+                'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+            },
+        ):
+            self.assertTrue(tasks.process_paypal_ipn(ipn.id))
+            self.assertFalse(tasks.process_paypal_ipn(ipn.id), 'Should only run once')
+        task.delay.assert_called_once_with(self.donation.id)
+        self.donation.refresh_from_db()
+        self.assertEqual(self.donation.transactionstate, 'COMPLETED')
+        self.assertIn(ipn, self.donation.ipns.all())
+
+    def test_async_ipn_without_shared_cache(self, task):
+        with (
+            self.settings(TRACKER_HAS_CELERY=True, TRACKER_PAYPAL_ASYNC_IPN=True),
+            mock.patch('tracker.tasks.process_paypal_ipn'),
+        ):
+            ipn = create_ipn(self.donation, 'doe@example.com')
+            # a repeat of the same status for the same transaction
+            repeat = create_ipn(self.donation, 'doe@example.com', txn_id=ipn.txn_id)
+
+        # the test cache never remembers anything, like a worker that does not share its cache
+        with self.settings(TRACKER_HAS_CELERY=True):
+            self.assertTrue(tasks.process_paypal_ipn(ipn.id))
+            self.assertFalse(tasks.process_paypal_ipn(ipn.id), 'Should only run once')
+            self.assertFalse(
+                tasks.process_paypal_ipn(repeat.id), 'Should only run once'
+            )
+        task.delay.assert_called_once_with(self.donation.id)
+        self.assertEqual(models.Donor.objects.count(), 1)
+        self.assertSequenceEqual(self.donation.ipns.all(), [ipn])
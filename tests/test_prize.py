@@ -4,6 +4,7 @@ import random
 from collections import defaultdict
 from decimal import Decimal
 from functools import reduce
+from io import StringIO
 from unittest.mock import patch
 
 import post_office.models
@@ -15,12 +16,15 @@ from django.core.exceptions import (
     ObjectDoesNotExist,
     ValidationError,
 )
+from django.core.management import call_command
+from django.db import connection
 from django.db.models import Sum
 from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils.formats import localize
 
-from tracker import models, prizeutil, settings, util
+from tracker import models, prizeutil, scheduleutil, settings, util
 from tracker.util import anywhere_on_earth_tz
 
 from . import randgen
@@ -618,6 +622,143 @@ class TestDonorPrizeEntryDraw(TransactionTestCase):
         self.assertEqual(set(prize.eligible_donors()), set(donors))
 
 
+class TestDrawPrizes(TransactionTestCase):
+    def setUp(self):
+        self.rand = random.Random(None)
+        self.event = randgen.generate_event(self.rand, start_time=long_ago_noon)
+        self.event.save()
+        self.donors = randgen.generate_donors(self.rand, 10)
+        for donor in self.donors:
+            randgen.generate_donation(
+                self.rand, event=self.event, donor=donor, min_amount=10
+            ).save()
+        self.prizes = [
+            models.Prize.objects.create(
+                event=self.event,
+                name=f'Prize {i}',
+                minimumbid=5,
+                maxwinners=2,
+                state='ACCEPTED',
+                acceptemailsent=True,
+            )
+            for i in range(3)
+        ]
+        self.empty_prize = models.Prize.objects.create(
+            event=self.event,
+            name='Unreachable',
+            minimumbid=1000,
+            state='ACCEPTED',
+            acceptemailsent=True,
+        )
+
+    def winners(self):
+        return {
+            prize.id: set(prize.claims.values_list('winner_id', flat=True))
+            for prize in self.prizes
+        }
+
+    def test_batch(self):
+        with CaptureQueriesContext(connection) as queries:
+            results = prizeutil.draw_prizes(models.Prize.objects.all(), seed='test')
+        self.assertEqual(
+            [r.prize.id for r in results],
+            [p.id for p in self.prizes] + [self.empty_prize.id],
+        )
+        self.assertEqual(
+            results[-1].error, 'Prize: Unreachable has no eligible donors.'
+        )
+        for prize, result in zip(self.prizes, results):
+            self.assertIsNone(result.error)
+            self.assertEqual(len(result.winners), 2)
+            self.assertEqual(set(result.winners), self.winners()[prize.id])
+        # every prize has the same window and filters
+        self.assertEqual(len([q for q in queries if 'GROUP BY' in q['sql']]), 1)
+        self.assertEqual(len([q for q in queries if q['sql'].startswith('INSERT')]), 1)
+
+        results = prizeutil.draw_prizes(models.Prize.objects.all(), seed='test')
+        self.assertIn('maximum number of winners', results[0].error)
+
+    def test_deterministic(self):
+        prizeutil.draw_prizes(models.Prize.objects.all(), seed='test')
+        expected = self.winners()
+        models.PrizeClaim.objects.all().delete()
+        # the same seed draws the same winners, even when the batch is different
+        prizeutil.draw_prizes(
+            models.Prize.objects.filter(id=self.prizes[1].id), seed='test'
+        )
+        self.assertEqual(self.winners()[self.prizes[1].id], expected[self.prizes[1].id])
+
+    def test_draw_order(self):
+        prize = self.prizes[0]
+        latest = {
+            donor_id: time
+            for donor_id, time in models.Donation.objects.values_list(
+                'donor_id', 'timereceived'
+            ).order_by('timereceived')
+        }
+        # newest donation first, the same order the drawing has always seen, so that existing seeds still work
+        self.assertEqual(
+            list(prizeutil.eligible_donor_amounts(prize)),
+            sorted(latest, key=lambda d: (latest[d], -d), reverse=True),
+        )
+
+    def test_conflicting_claim(self):
+        pick_winners = prizeutil._pick_winners
+
+        def claim_elsewhere(prize, eligible, rand):
+            winners = pick_winners(prize, eligible, rand)
+            if prize.id == self.prizes[1].id:
+                models.PrizeClaim.objects.create(prize=prize, winner_id=winners[0])
+            return winners
+
+        with patch('tracker.prizeutil._pick_winners', side_effect=claim_elsewhere):
+            results = prizeutil.draw_prizes(models.Prize.objects.all(), seed='test')
+        self.assertIsNone(results[0].error)
+        self.assertIn('Error drawing prize: Prize 1', results[1].error)
+        self.assertEqual(results[1].winners, [])
+        self.assertIsNone(results[2].error)
+        winners = self.winners()
+        self.assertEqual(len(winners[self.prizes[0].id]), 2)
+        self.assertEqual(len(winners[self.prizes[1].id]), 1)
+        self.assertEqual(len(winners[self.prizes[2].id]), 2)
+
+    @override_settings(TRACKER_HAS_CELERY=False)
+    def test_admin_action(self):
+        for donor in self.donors[:2]:
+            models.PrizeClaim.objects.create(
+                prize=self.prizes[0], winner=donor, pendingcount=0, acceptcount=1
+            )
+        self.client.force_login(
+            User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        )
+        response = self.client.post(
+            reverse('admin:tracker_prize_changelist'),
+            {
+                'action': 'batch_draw_prizes_action',
+                ACTION_CHECKBOX_NAME: [p.id for p in self.prizes]
+                + [self.empty_prize.id],
+            },
+        )
+        self.assertRedirects(response, reverse('admin:tracker_prize_changelist'))
+        msgs = [str(m) for m in response.wsgi_request._messages]
+        self.assertEqual(len(msgs), 3)
+        self.assertIn('1 prize(s) skipped', msgs[0])
+        self.assertEqual(msgs[1], 'Prize: Unreachable has no eligible donors.')
+        self.assertTrue(msgs[2].startswith('2 prize(s) drawn'))
+        winners = self.winners()
+        self.assertEqual(winners[self.prizes[0].id], {d.id for d in self.donors[:2]})
+        self.assertEqual(len(winners[self.prizes[1].id]), 2)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('draw_prizes', events=self.event.short, dry_run=True, stdout=out)
+        self.assertIn('Drew 3 of 4 prize(s)', out.getvalue())
+        self.assertIn('has no eligible donors', out.getvalue())
+        self.assertFalse(models.PrizeClaim.objects.exists())
+        call_command('draw_prizes', events=str(self.event.id), stdout=StringIO())
+        self.assertEqual(models.PrizeClaim.objects.count(), 6)
+
+
 class TestPersistentPrizeWinners(TransactionTestCase):
     def setUp(self):
         self.rand = random.Random(None)
@@ -724,6 +865,16 @@ class TestPrizeCountryFilter(TransactionTestCase):
         self.event = randgen.build_random_event(self.rand)
         self.event.save()
 
+    def assertEligibleCount(self, prize, count):
+        self.assertEqual(count, len(prize.eligible_donors()))
+        # the batched version used by the prize report should always agree
+        self.assertEqual(
+            count,
+            prizeutil.eligible_donor_counts(models.Prize.objects.filter(id=prize.id))[
+                prize.id
+            ][0],
+        )
+
     def testCountryFilterEvent(self):
         countries = list(models.Country.objects.all()[0:4])
         self.event.allowed_prize_countries.add(countries[0])
@@ -747,8 +898,7 @@ class TestPrizeCountryFilter(TransactionTestCase):
         self.assertTrue(prize.is_donor_allowed_to_receive(donors[1]))
         self.assertFalse(prize.is_donor_allowed_to_receive(donors[2]))
         self.assertFalse(prize.is_donor_allowed_to_receive(donors[3]))
-        eligible = prize.eligible_donors()
-        self.assertEqual(2, len(eligible))
+        self.assertEligibleCount(prize, 2)
         # Test a different country set
         self.event.allowed_prize_countries.add(countries[3])
         self.event.save()
@@ -756,15 +906,13 @@ class TestPrizeCountryFilter(TransactionTestCase):
         self.assertTrue(prize.is_donor_allowed_to_receive(donors[1]))
         self.assertFalse(prize.is_donor_allowed_to_receive(donors[2]))
         self.assertTrue(prize.is_donor_allowed_to_receive(donors[3]))
-        eligible = prize.eligible_donors()
-        self.assertEqual(3, len(eligible))
+        self.assertEligibleCount(prize, 3)
         # Test a blank country set
         self.event.allowed_prize_countries.clear()
         self.event.save()
         for donor in donors:
             self.assertTrue(prize.is_donor_allowed_to_receive(donor))
-        eligible = prize.eligible_donors()
-        self.assertEqual(4, len(eligible))
+        self.assertEligibleCount(prize, 4)
 
     def testCountryFilterPrize(self):
         # TODO: fix this so either there's less boilerplate, or the boilerplate is shared
@@ -793,8 +941,7 @@ class TestPrizeCountryFilter(TransactionTestCase):
         self.assertTrue(prize.is_donor_allowed_to_receive(donors[2]))
         self.assertFalse(prize.is_donor_allowed_to_receive(donors[3]))
         # by default don't use the prize filter
-        eligible = prize.eligible_donors()
-        self.assertEqual(3, len(eligible))
+        self.assertEligibleCount(prize, 3)
 
         prize.custom_country_filter = True
         prize.save()
@@ -802,8 +949,7 @@ class TestPrizeCountryFilter(TransactionTestCase):
         self.assertTrue(prize.is_donor_allowed_to_receive(donors[1]))
         self.assertFalse(prize.is_donor_allowed_to_receive(donors[2]))
         self.assertFalse(prize.is_donor_allowed_to_receive(donors[3]))
-        eligible = prize.eligible_donors()
-        self.assertEqual(2, len(eligible))
+        self.assertEligibleCount(prize, 2)
         # Test a different country set
         prize.allowed_prize_countries.add(countries[3])
         prize.save()
@@ -811,15 +957,13 @@ class TestPrizeCountryFilter(TransactionTestCase):
         self.assertTrue(prize.is_donor_allowed_to_receive(donors[1]))
         self.assertFalse(prize.is_donor_allowed_to_receive(donors[2]))
         self.assertTrue(prize.is_donor_allowed_to_receive(donors[3]))
-        eligible = prize.eligible_donors()
-        self.assertEqual(3, len(eligible))
+        self.assertEligibleCount(prize, 3)
         # Test a blank country set
         prize.allowed_prize_countries.clear()
         prize.save()
         for donor in donors:
             self.assertTrue(prize.is_donor_allowed_to_receive(donor))
-        eligible = prize.eligible_donors()
-        self.assertEqual(4, len(eligible))
+        self.assertEligibleCount(prize, 4)
 
     def testCountryRegionBlacklistFilterEvent(self):
         # Somewhat ethnocentric testing
@@ -843,8 +987,7 @@ class TestPrizeCountryFilter(TransactionTestCase):
 
         for donor in donors:
             self.assertTrue(prize.is_donor_allowed_to_receive(donor))
-        eligible = prize.eligible_donors()
-        self.assertEqual(2, len(eligible))
+        self.assertEligibleCount(prize, 2)
         # Test a different country set
         countryRegion = models.CountryRegion.objects.create(
             country=country, name=disallowedState
@@ -853,8 +996,7 @@ class TestPrizeCountryFilter(TransactionTestCase):
         self.event.save()
         self.assertTrue(prize.is_donor_allowed_to_receive(donors[0]))
         self.assertFalse(prize.is_donor_allowed_to_receive(donors[1]))
-        eligible = prize.eligible_donors()
-        self.assertEqual(1, len(eligible))
+        self.assertEligibleCount(prize, 1)
 
     def testCountryRegionBlacklistFilterPrize(self):
         # Somewhat ethnocentric testing
@@ -876,8 +1018,7 @@ class TestPrizeCountryFilter(TransactionTestCase):
                 min_amount=Decimal(prize.minimumbid),
             ).save()
 
-        eligible = prize.eligible_donors()
-        self.assertEqual(2, len(eligible))
+        self.assertEligibleCount(prize, 2)
         # Test a different country set
         countryRegion = models.CountryRegion.objects.create(
             country=country, name=disallowedState
@@ -885,8 +1026,30 @@ class TestPrizeCountryFilter(TransactionTestCase):
         prize.disallowed_prize_regions.add(countryRegion)
         prize.custom_country_filter = True
         prize.save()
-        eligible = prize.eligible_donors()
-        self.assertEqual(1, len(eligible))
+        self.assertEligibleCount(prize, 1)
+
+    def testSharedEligibility(self):
+        country = models.Country.objects.all()[0]
+        prizes = [
+            models.Prize.objects.create(event=self.event, name=name, minimumbid=5)
+            for name in ('One', 'Two')
+        ]
+        donor = randgen.generate_donor(self.rand)
+        donor.addresscountry = country
+        donor.save()
+        randgen.generate_donation(
+            self.rand, event=self.event, donor=donor, min_amount=10, max_amount=10
+        ).save()
+        with CaptureQueriesContext(connection) as queries:
+            counts = prizeutil.eligible_donor_counts(
+                models.Prize.objects.filter(id__in=(p.id for p in prizes))
+            )
+        self.assertEqual(counts, {prize.id: (1, 0) for prize in prizes})
+        # both prizes have the same window and filters, so they share one grouped query
+        self.assertEqual(
+            len([q for q in queries if 'GROUP BY' in q['sql']]),
+            1,
+        )
 
 
 class TestPrizeDrawAcceptOffset(TransactionTestCase):
@@ -1104,6 +1267,28 @@ class TestPrizeSignals(TestCase):
         self.assertEqual(self.end_span_prize.prev_run, self.runs[1])
         self.assertEqual(self.end_span_prize.next_run, None)
 
+    def test_deferred_windows(self):
+        with (
+            self.captureOnCommitCallbacks(execute=True) as callbacks,
+            scheduleutil.deferred_prize_windows(on_commit=True),
+        ):
+            self.runs[1].order = None
+            self.runs[1].save()
+            self.runs[0].order = None
+            self.runs[0].save()
+            self.refresh_all()
+            # nothing happens until the transaction commits
+            self.assertEqual(self.middle_prize.prev_run, self.runs[0])
+            self.assertEqual(self.end_span_prize.prev_run, self.runs[1])
+        self.assertEqual(len(callbacks), 1)
+        self.refresh_all()
+        self.assertEqual(self.middle_prize.prev_run, None)
+        self.assertEqual(self.middle_prize.next_run, None)
+        self.assertEqual(self.end_prize.prev_run, self.runs[2])
+        self.assertEqual(self.end_prize.next_run, None)
+        self.assertEqual(self.end_span_prize.prev_run, None)
+        self.assertEqual(self.end_span_prize.next_run, None)
+
     def test_second_run_removed_from_order(self):
         self.runs[1].order = None
         self.runs[1].save()
@@ -1387,6 +1572,30 @@ class TestPrizeKey(TestCase):
         self.assertNotEqual(set(result['winners']), old_winners)
         self.assertNotEqual({w.winner.id for w in self.prize.claims.all()}, old_donors)
 
+    def test_bulk_draw(self):
+        self.prize.save()
+        donors = randgen.generate_donors(self.rand, len(self.prize_keys) + 10)
+        models.Donation.objects.bulk_create(
+            [
+                randgen.generate_donation_for_prize(self.rand, self.prize, donor=d)
+                for d in donors
+            ]
+        )
+        # no per-key queries, no matter how many keys there are
+        with self.assertNumQueries(11):
+            success, result = prizeutil.draw_keys(self.prize, rand=self.rand)
+        self.assertTrue(success, result)
+        self.assertEqual(len(result['winners']), len(self.prize_keys))
+        self.assertFalse(self.prize.prize_keys.filter(prize_claim=None).exists())
+        self.assertSetEqual(
+            set(self.prize.prize_keys.values_list('prize_claim__winner', flat=True)),
+            set(result['winners']),
+        )
+        self.assertEqual(
+            self.prize.claims.filter(**models.PrizeClaim.KEY_CLAIM_DEFAULTS).count(),
+            len(self.prize_keys),
+        )
+
 
 class TestPrizeAdmin(TestCase, AssertionHelpers):
     def setUp(self):
@@ -1581,6 +1790,16 @@ claim_key: {{ claim.prize_key.key }}
             response.context['form'], 'keys', ['At least one key already exists.']
         )
 
+        response = self.client.post(
+            reverse('admin:tracker_prize_key_import', args=(self.prize_with_keys.id,)),
+            {'keys': 'x' * 65},
+        )
+        self.assertFormError(
+            response.context['form'],
+            'keys',
+            ['Keys cannot be longer than 64 characters.'],
+        )
+
     def test_prize_winner_admin(self):
         self.client.login(username='admin', password='password')
         response = self.client.get(reverse('admin:tracker_prizeclaim_changelist'))
@@ -1778,8 +1997,8 @@ claim_key: {{ claim.prize_key.key }}
         self.assertMessages(
             resp,
             {
-                f'Mailed Donor {self.donor.email} for 1 won prize claim(s)',
-                f'Mailed Donor {donor2.email} for 2 won prize claim(s)',
+                f'Mailed donor {self.donor.email} for 1 won prize claim(s)',
+                f'Mailed donor {donor2.email} for 2 won prize claim(s)',
             },
         )
 
@@ -0,0 +1,259 @@
+import datetime
+import random
+from io import StringIO
+from unittest.mock import patch
+
+import post_office.models
+from django.contrib.admin.models import LogEntry
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils.formats import localize
+
+from tracker import mailutil, models, prizemail, util
+
+from . import randgen
+from .util import AssertionHelpers, create_test_template, parse_test_mail, today_noon
+
+
+class TestPrizeMailJob(TestCase, AssertionHelpers):
+    def setUp(self):
+        self.rand = random.Random(None)
+        self.factory = RequestFactory()
+        self.super_user = User.objects.create_superuser('admin')
+        self.event = randgen.generate_event(self.rand, start_time=today_noon)
+        self.event.save()
+        self.donors = randgen.generate_donors(self.rand, 5)
+        self.claims = []
+        for donor in self.donors:
+            for _ in range(2):
+                prize = randgen.generate_prize(self.rand, event=self.event)
+                prize.save()
+                self.claims.append(
+                    models.PrizeClaim.objects.create(winner=donor, prize=prize)
+                )
+        self.template = create_test_template(
+            'Prize Winner',
+            {
+                'event',
+                'winner.id',
+                'requires_shipping',
+                'reply_address',
+                'accept_deadline',
+            },
+            extra='{% for claim in claims %}claim_id: {{ claim.id }}\nclaim_url: {{ claim.claim_url }}\n{% endfor %}',
+        )
+        self.accept_deadline = datetime.datetime.combine(
+            (today_noon + datetime.timedelta(days=7)).date(), datetime.time(0, 0)
+        ).replace(tzinfo=util.anywhere_on_earth_tz())
+
+    def create_job(self, **kwargs):
+        return prizemail.create_job(
+            'WINNER',
+            self.event,
+            models.PrizeClaim.objects.filter(prize__event=self.event),
+            email_template=self.template,
+            from_address='root@localhost',
+            reply_address='reply@localhost',
+            accept_deadline=self.accept_deadline,
+            **kwargs,
+        )
+
+    def test_run_job(self):
+        job = self.create_job()
+        self.assertEqual(job.recipients, len(self.donors))
+        self.assertEqual(job.state, 'QUEUED')
+
+        # one email per donor, sent in chunks of two donors, each of which is a fixed number of queries
+        with self.assertNumQueries(28):
+            mailed = prizemail.run_job(job, chunk_size=2)
+
+        self.assertEqual(len(mailed), len(self.donors))
+        job.refresh_from_db()
+        self.assertEqual(job.state, 'DONE')
+        self.assertEqual(job.groups_done, len(self.donors))
+        self.assertEqual(job.emails_sent, len(self.donors))
+        self.assertIsNotNone(job.finished)
+        self.assertEqual(job.progress, 1)
+        for donor in self.donors:
+            mail = post_office.models.Email.objects.get(to=donor.email)
+            self.assertEqual(mail.status, post_office.models.STATUS.queued)
+            self.assertEqual(mail.headers, {'Reply-to': 'reply@localhost'})
+            parsed = parse_test_mail(mail)
+            self.assertEqual([str(donor.id)], parsed['winner.id'])
+            self.assertSetEqual(
+                {str(c.id) for c in donor.prizeclaims.all()}, set(parsed['claim_id'])
+            )
+        for claim in self.claims:
+            claim.refresh_from_db()
+            self.assertTrue(claim.winneremailsent)
+            self.assertEqual(claim.acceptdeadline, self.accept_deadline)
+
+        # finished jobs are not sent again
+        self.assertEqual(prizemail.run_job(job), [])
+        self.assertEqual(post_office.models.Email.objects.count(), len(self.donors))
+
+    def test_without_accept_deadline(self):
+        self.accept_deadline = None
+        claim = self.claims[0]
+        claim.acceptdeadline = today_noon + datetime.timedelta(days=3)
+        claim.save()
+        job = self.create_job()
+
+        self.assertEqual(
+            prizemail.run_job(job),
+            [
+                f'Mailed donor {donor.email} for 2 won prize claim(s)'
+                for donor in self.donors
+            ],
+        )
+        # a job without a deadline keeps the ones the claims already have
+        parsed = parse_test_mail(
+            post_office.models.Email.objects.get(to=claim.winner.email)
+        )
+        self.assertEqual(
+            parsed['accept_deadline'],
+            [
+                localize(
+                    claim.acceptdeadline.astimezone(util.anywhere_on_earth_tz()).date()
+                )
+            ],
+        )
+        self.assertEqual(
+            parse_test_mail(
+                post_office.models.Email.objects.get(to=self.claims[2].winner.email)
+            )['accept_deadline'],
+            ['None'],
+        )
+        for c in self.claims:
+            old = c.acceptdeadline
+            c.refresh_from_db()
+            self.assertTrue(c.winneremailsent)
+            self.assertEqual(c.acceptdeadline, old)
+
+    def test_resume(self):
+        job = self.create_job()
+        send_chunk = prizemail._send_chunk
+        calls = 0
+
+        def fail_second_chunk(*args):
+            nonlocal calls
+            calls += 1
+            if calls == 2:
+                raise RuntimeError('mail server went away')
+            return send_chunk(*args)
+
+        with (
+            patch('tracker.prizemail._send_chunk', side_effect=fail_second_chunk),
+            self.assertLogs('tracker.prizemail', level='ERROR'),
+            self.assertRaises(RuntimeError),
+        ):
+            prizemail.run_job(job, chunk_size=2)
+
+        job.refresh_from_db()
+        self.assertEqual(job.state, 'FAILED')
+        self.assertEqual(job.error, 'mail server went away')
+        self.assertEqual(job.groups_done, 2)
+        self.assertEqual(post_office.models.Email.objects.count(), 2)
+
+        # a claim that was mailed some other way in the meantime is skipped
+        skipped = models.PrizeClaim.objects.get(pk=job.groups[-1][0])
+        skipped.winneremailsent = True
+        skipped.save()
+
+        out = StringIO()
+        call_command('send_prize_mail', job.pk, stdout=out)
+        self.assertIn(f'Job #{job.pk}: sent 3 email(s).', out.getvalue())
+
+        job.refresh_from_db()
+        self.assertEqual(job.state, 'DONE')
+        self.assertEqual(job.emails_sent, len(self.donors))
+        for donor in self.donors:
+            self.assertEqual(
+                post_office.models.Email.objects.filter(to=donor.email).count(), 1
+            )
+        self.assertEqual(
+            len(parse_test_mail(post_office.models.Email.objects.last())['claim_id']),
+            1,
+        )
+
+    @override_settings(POST_OFFICE={'DEFAULT_PRIORITY': 'now'})
+    def test_send_now_after_commit(self):
+        job = self.create_job()
+        queue_many = mailutil.queue_many
+        calls = 0
+
+        def fail_second_chunk(*args, **kwargs):
+            nonlocal calls
+            calls += 1
+            emails = queue_many(*args, **kwargs)
+            if calls == 2:
+                raise RuntimeError('mail server went away')
+            return emails
+
+        with (
+            patch.object(post_office.models.Email, 'dispatch') as dispatch,
+            patch('tracker.mailutil.queue_many', side_effect=fail_second_chunk),
+            self.assertLogs('tracker.prizemail', level='ERROR'),
+            self.assertRaises(RuntimeError),
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            prizemail.run_job(job, chunk_size=2)
+
+        # only the committed chunk was sent, the rolled back one will be sent when the job is resumed
+        self.assertEqual(dispatch.call_count, 2)
+        self.assertEqual(post_office.models.Email.objects.count(), 2)
+
+    def test_log_entries(self):
+        request = self.factory.get('/admin/')
+        request.user = self.super_user
+        job = self.create_job(request=request)
+        self.assertEqual(job.base_url, 'http://testserver/')
+        prizemail.run_job(job)
+        self.assertEqual(
+            LogEntry.objects.filter(
+                user=self.super_user,
+                change_message='Sent winner notification email.',
+            ).count(),
+            len(self.claims),
+        )
+        claim = self.claims[0]
+        claim.create_claim_url(request)
+        self.assertIn(
+            claim.claim_url,
+            parse_test_mail(
+                post_office.models.Email.objects.get(to=claim.winner.email)
+            )['claim_url'],
+        )
+
+    @patch('tracker.tasks.send_prize_mail')
+    @override_settings(TRACKER_HAS_CELERY=True)
+    def test_admin_with_celery(self, task):
+        self.client.force_login(self.super_user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse(
+                    'admin:tracker_automail_prize_winners', args=(self.event.short,)
+                ),
+                data={
+                    'claims': [c.id for c in self.claims],
+                    'from_address': 'root@localhost',
+                    'email_template': self.template.id,
+                    'accept_deadline': self.accept_deadline.date(),
+                },
+            )
+        job = models.PrizeMailJob.objects.get()
+        self.assertRedirects(
+            response, reverse('admin:tracker_prizemailjob_change', args=(job.pk,))
+        )
+        self.assertMessages(
+            response, [f'{len(self.donors)} email(s) queued for sending.']
+        )
+        task.delay.assert_called_once_with(job.pk)
+        self.assertEqual(post_office.models.Email.objects.count(), 0)
+
+        response = self.client.get(
+            reverse('admin:tracker_prizemailjob_change', args=(job.pk,))
+        )
+        self.assertContains(response, f'0/{len(self.donors)} recipient(s) (0%)')
@@ -1,13 +1,18 @@
 # TODO: really should have populated fixtures for these
 import datetime
 import random
+from unittest import mock
 
 from django.contrib.auth.models import Permission, User
+from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import PermissionDenied
+from django.core.management import call_command
+from django.db import connection
 from django.db.models import Q
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.urls import reverse
 
-from tracker import models
+from tracker import models, searchutil, viewutil
 from tracker.search_feeds import apply_feed_filter
 from tracker.search_filters import run_model_query
 
@@ -305,3 +310,203 @@ class TestDonationFeeds(FiltersFeedsTestCase):
         actual = apply_feed_filter(self.query, 'donation', 'toread')
         expected = self.query.filter(Q(readstate='READY'))
         self.assertSetEqual(set(actual), set(expected))
+
+
+@override_settings(TRACKER_SEARCH_INDEX=True)
+class TestSearchIndex(TestCase):
+    def setUp(self):
+        self.rand = random.Random(None)
+        self.event = randgen.build_random_event(
+            self.rand, num_runs=10, num_prizes=5, num_bids=10, num_donors=5
+        )
+        self.run = self.event.speedrun_set.first()
+        self.run.name = 'Super Mario Bros.'
+        self.run.save()
+        self.talent = models.Talent.objects.create(name='Speedy Runner')
+        self.run.runners.add(self.talent)
+        self.bid = models.Bid.objects.create(
+            name='Warpless', speedrun=self.run, istarget=True, state='OPENED'
+        )
+        self.donation = randgen.generate_donation(self.rand, event=self.event)
+        self.donation.comment = 'Save the Frames!'
+        self.donation.save()
+        self.user = User.objects.create(username='viewer')
+        self.user.user_permissions.add(Permission.objects.get(codename='view_comments'))
+
+    def assertMatchesLegacy(self, model, text, user=None):
+        actual = set(run_model_query(model, {'q': text}, user=user))
+        with self.settings(TRACKER_SEARCH_INDEX=False):
+            expected = set(run_model_query(model, {'q': text}, user=user))
+        self.assertSetEqual(actual, expected, msg=f'{model}: {text}')
+        return actual
+
+    def test_backend(self):
+        if connection.vendor == 'sqlite':
+            self.assertIsInstance(searchutil.get_backend(), searchutil.SQLiteBackend)
+
+    def test_matches_legacy_search(self):
+        self.assertIn(self.run, self.assertMatchesLegacy('run', 'mario'))
+        self.assertIn(self.bid, self.assertMatchesLegacy('allbids', 'warp'))
+        self.assertIn(self.bid, self.assertMatchesLegacy('allbids', 'super mario'))
+        self.assertIn(self.talent, self.assertMatchesLegacy('runner', 'SPEEDY'))
+        # shorter than a trigram
+        self.assertIn(self.run, self.assertMatchesLegacy('run', 'ma'))
+        for model, objects in (
+            ('run', self.event.speedrun_set.all()),
+            ('prize', self.event.prize_set.all()),
+            ('allbids', self.event.bids.all()),
+        ):
+            for obj in objects:
+                self.assertMatchesLegacy(model, obj.name[2:8])
+        self.assertSetEqual(
+            set(run_model_query('donation', {'q': 'the frames'}, user=self.user)),
+            {self.donation},
+        )
+        with self.assertRaises(PermissionDenied):
+            run_model_query('donation', {'q': 'the frames'})
+
+    def test_matches_legacy_related_fields(self):
+        self.event.name = 'Awesome Games Done Quick'
+        self.event.save()
+        self.run.description = 'Any% glitchless'
+        self.run.save()
+        option = models.Bid.objects.create(
+            name='Through the pipes', parent=self.bid, istarget=True, state='OPENED'
+        )
+        for model in ('bid', 'allbids', 'bidtarget'):
+            for text in ('awesome games', 'glitchless', 'warpless', 'pipes'):
+                self.assertMatchesLegacy(model, text)
+        self.assertIn(self.bid, self.assertMatchesLegacy('bid', 'awesome games'))
+        self.assertIn(self.bid, self.assertMatchesLegacy('allbids', 'glitchless'))
+        # the option matches on the name of its parent
+        self.assertIn(option, self.assertMatchesLegacy('allbids', 'warpless'))
+
+        donor = models.Donor.objects.create(alias='Secretive', visibility='ANON')
+        self.donation.donor = donor
+        self.donation.requestedalias = 'Secretive'
+        self.donation.save()
+        # anonymous donors cannot be found through their donations
+        self.assertNotIn(
+            self.donation,
+            self.assertMatchesLegacy('donation', 'secretive', user=self.user),
+        )
+        self.assertIn(
+            self.donation,
+            self.assertMatchesLegacy('donation', 'the frames', user=self.user),
+        )
+
+    def test_unrelated_saves(self):
+        event = models.Event.objects.get(pk=self.event.pk)
+        with mock.patch.object(searchutil, 'index', wraps=searchutil.index) as index:
+            event.hashtag = 'unrelated'
+            event.save()
+            event.name = 'Renamed'
+            event.save(update_fields=['hashtag'])
+            index.assert_not_called()
+
+            # the rename was not saved yet
+            event.save()
+            index.assert_called_once()
+            self.assertEqual(index.call_args.args[0], models.Bid)
+        self.assertIn(self.bid, run_model_query('bid', {'q': 'renamed'}))
+
+    def test_signals(self):
+        self.run.name = 'Zelda'
+        self.run.save()
+        # the bid includes the name of its run
+        self.assertIn(self.bid, run_model_query('allbids', {'q': 'zelda'}))
+        self.assertNotIn(self.bid, run_model_query('allbids', {'q': 'mario'}))
+
+        def runs(text):
+            return set(
+                models.SpeedRun.objects.filter(
+                    pk__in=searchutil.matching(models.SpeedRun, text, ['talent'])
+                )
+            )
+
+        self.assertSetEqual(runs('speedy'), {self.run})
+        self.talent.name = 'Slowpoke'
+        self.talent.save()
+        self.assertSetEqual(runs('speedy'), set())
+        self.assertSetEqual(runs('slowpoke'), {self.run})
+        self.run.runners.remove(self.talent)
+        self.assertSetEqual(runs('slowpoke'), set())
+        self.run.hosts.add(self.talent)
+        self.assertSetEqual(runs('slowpoke'), {self.run})
+        # the delete clears the talent's runs without sending m2m_changed
+        self.talent.delete()
+        self.assertSetEqual(runs('slowpoke'), set())
+
+        self.bid.delete()
+        self.assertFalse(
+            models.SearchDocument.objects.filter(
+                content_type__model='bid', object_id=self.bid.pk
+            ).exists()
+        )
+
+    def test_merge_donors(self):
+        def donations(text):
+            return set(
+                models.Donation.objects.filter(
+                    pk__in=searchutil.matching(models.Donation, text, ['donor'])
+                )
+            )
+
+        def talent(text):
+            return set(
+                models.Talent.objects.filter(
+                    pk__in=searchutil.matching(models.Talent, text, ['donor'])
+                )
+            )
+
+        root = models.Donor.objects.create(alias='Rootbeer', visibility='ALIAS')
+        other = models.Donor.objects.create(alias='Gingerale', visibility='ALIAS')
+        self.donation.donor = other
+        self.donation.save()
+        self.assertSetEqual(donations('gingerale'), {self.donation})
+
+        self.talent.donor = other
+        self.talent.save()
+        self.assertSetEqual(talent('gingerale'), {self.talent})
+
+        viewutil.merge_donors(root, [other])
+        self.assertSetEqual(donations('gingerale'), set())
+        self.assertSetEqual(donations('rootbeer'), {self.donation})
+        # the talent's link to the deleted donor was cleared
+        self.assertSetEqual(talent('gingerale'), set())
+
+    def test_rebuild(self):
+        documents = set(
+            models.SearchDocument.objects.values_list(
+                'content_type', 'object_id', 'group', 'document'
+            )
+        )
+        self.assertTrue(documents)
+        models.SearchDocument.objects.all().delete()
+        models.SearchDocument.objects.create(
+            content_type=ContentType.objects.get_for_model(models.Prize),
+            object_id=0,
+            group='prize',
+            document='orphan',
+        )
+        call_command('rebuild_search_index', verbosity=0)
+        self.assertSetEqual(
+            set(
+                models.SearchDocument.objects.values_list(
+                    'content_type', 'object_id', 'group', 'document'
+                )
+            ),
+            documents,
+        )
+
+    def test_admin(self):
+        self.client.force_login(
+            User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        )
+        response = self.client.get(
+            reverse('admin:tracker_speedrun_changelist'), {'q': 'mario speedy'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertSetEqual(
+            set(response.context['cl'].result_list), {self.run}, msg='Wrong results'
+        )
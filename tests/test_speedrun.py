@@ -5,12 +5,14 @@ import zoneinfo
 from django.contrib.auth.models import User
 from django.core import management
 from django.core.exceptions import ValidationError
+from django.db import connection
 from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 import tracker.models as models
 import tracker.models.tag
-from tracker import settings
+from tracker import scheduleutil, settings
 
 from . import randgen
 from .util import AssertionModelHelpers, MigrationsTestCase, today_noon
@@ -121,6 +123,87 @@ class TestSpeedRun(TestSpeedRunBase):
         self.assertEqual(self.run5.order, old_order)
         self.assertEqual(self.run5.starttime, self.run2.endtime)
 
+    def test_schedule_recompute(self):
+        for n in range(50):
+            models.SpeedRun.objects.create(
+                event=self.event, name=f'Filler {n}', run_time='10:00', order=n + 5
+            )
+        self.run1.run_time = '50:00'
+        with CaptureQueriesContext(connection) as queries:
+            self.run1.save()
+        # the run itself, and then a single write for every run after it, instead of a save per run
+        self.assertEqual(len([q for q in queries if q['sql'].startswith('UPDATE')]), 2)
+        runs = list(self.event.speedrun_set.exclude(order=None).order_by('order'))
+        self.assertEqual([r.order for r in runs], list(range(1, 55)))
+        for prev, run in zip(runs, runs[1:]):
+            self.assertEqual(run.starttime, prev.endtime)
+
+        with self.subTest('insert in the middle'):
+            self.run4.order = 2
+            self.run4.save()
+            self.assertEqual(self.run4.starttime, self.run1.endtime)
+            self.run2.refresh_from_db()
+            self.assertEqual(self.run2.order, 3)
+            self.assertEqual(self.run2.starttime, self.run4.endtime)
+
+        with self.subTest('deferred'):
+            with scheduleutil.deferred_recompute():
+                self.run1.run_time = '40:00'
+                self.run1.save()
+                self.run4.refresh_from_db()
+                self.assertEqual(
+                    self.run4.starttime,
+                    self.event.datetime + datetime.timedelta(minutes=55),
+                )
+            self.run4.refresh_from_db()
+            self.assertEqual(
+                self.run4.starttime,
+                self.event.datetime + datetime.timedelta(minutes=45),
+            )
+
+    def test_save_without_schedule_changes(self):
+        for n in range(10):
+            models.SpeedRun.objects.create(
+                event=self.event, name=f'Filler {n}', run_time='10:00', order=n + 5
+            )
+        run = models.SpeedRun.objects.get(pk=self.run1.pk)
+        stale = models.SpeedRun.objects.get(pk=self.run2.pk)
+        run.name = 'Renamed'
+        with CaptureQueriesContext(connection) as queries:
+            run.save()
+        self.assertFalse(any('FOR UPDATE' in q['sql'] for q in queries))
+        self.assertEqual(len([q for q in queries if q['sql'].startswith('UPDATE')]), 1)
+
+        with self.subTest('update_fields'):
+            run.run_time = '50:00'
+            with CaptureQueriesContext(connection) as queries:
+                run.save(update_fields=['name'])
+            self.assertEqual(
+                len([q for q in queries if q['sql'].startswith('UPDATE')]), 1
+            )
+            run.run_time = '50:00'
+            run.save()
+            stale.refresh_from_db()
+            self.assertEqual(stale.starttime, run.endtime)
+
+        with self.subTest('stale copy does not write back the old schedule'):
+            stale = models.SpeedRun.objects.get(pk=self.run2.pk)
+            run.run_time = '20:00'
+            run.save()
+            stale.name = 'Also Renamed'
+            stale.save()
+            stale.refresh_from_db()
+            self.assertEqual(stale.name, 'Also Renamed')
+            self.assertEqual(stale.starttime, run.endtime)
+
+        with self.subTest('event start still moves the runs'):
+            self.event.datetime += datetime.timedelta(hours=1)
+            self.event.save()
+            run.refresh_from_db()
+            self.assertEqual(run.starttime, self.event.datetime)
+            stale.refresh_from_db()
+            self.assertEqual(stale.starttime, run.endtime)
+
     def test_anchor_time(self):
         self.run3.anchor_time = self.run3.starttime
         self.run3.save()
@@ -163,6 +246,16 @@ class TestSpeedRun(TestSpeedRunBase):
         with self.subTest('bad anchor time'), self.assertRaises(ValidationError):
             self.run3.anchor_time -= datetime.timedelta(days=1)
             self.run3.clean()
+        self.run3.refresh_from_db()
+        with self.subTest('saving without enough drift'):
+            self.run2.refresh_from_db()
+            self.run2.run_time = '1:00:00'
+            with self.assertRaises(ValidationError):
+                self.run2.clean()
+            # only clean complains, the save still writes the setup time
+            self.run2.save()
+            self.run3.refresh_from_db()
+            self.assertEqual(self.run3.starttime, self.run3.anchor_time)
 
     def test_tags(self):
         with self.subTest('priority tag auto adds to list'):
@@ -1,11 +1,14 @@
 import os
 import re
 from collections import defaultdict
+from decimal import Decimal
 from io import StringIO
 
+from django.db import NotSupportedError, connection
 from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 
-from tracker import models, util
+from tracker import median, models, util
 
 from .util import today_noon
 
@@ -72,6 +75,62 @@ class TestUtil(TestCase):
                 util.median(models.Donation.objects.all(), 'amount', count=4), 4
             )
 
+    def test_grouped_median(self):
+        event1 = models.Event.objects.create(short='ev1', datetime=today_noon)
+        event2 = models.Event.objects.create(short='ev2', datetime=today_noon)
+        for event, amounts in ((event1, [2, 3, 5, 8, 13]), (event2, [21, 34, 55, 89])):
+            for i in amounts:
+                models.Donation.objects.create(event=event, amount=i)
+        with self.assertNumQueries(2):
+            self.assertEqual(
+                median.grouped_medians(
+                    models.Donation.objects.all(), ('event_id',), 'amount'
+                ),
+                {(event1.id,): 5, (event2.id,): Decimal('44.5')},
+            )
+        with self.assertNumQueries(1):
+            # honors the counts argument
+            self.assertEqual(
+                median.grouped_medians(
+                    models.Donation.objects.all(),
+                    ('event_id',),
+                    'amount',
+                    counts={(event1.id,): 3, (event2.id,): 4},
+                ),
+                {(event1.id,): 3, (event2.id,): Decimal('44.5')},
+            )
+        self.assertEqual(
+            median.median(models.Donation.objects.filter(event=event2), 'amount'),
+            Decimal('44.5'),
+        )
+        with CaptureQueriesContext(connection) as queries:
+            # honors the count argument
+            self.assertEqual(
+                median.median(
+                    models.Donation.objects.filter(event=event1), 'amount', count=3
+                ),
+                3,
+            )
+            self.assertEqual(
+                median.median(
+                    models.Donation.objects.filter(event=event2), 'amount', count=4
+                ),
+                Decimal('44.5'),
+            )
+        # only the middle row(s) are fetched, not the whole column
+        self.assertEqual(len(queries), 2)
+        self.assertIn('LIMIT 1 OFFSET 1', queries[0]['sql'])
+        self.assertIn('LIMIT 2 OFFSET 1', queries[1]['sql'])
+        self.assertEqual(
+            median.median(models.Donation.objects.filter(event=event1), 'amount'), 5
+        )
+        self.assertEqual(median.median(models.Donation.objects.none(), 'amount'), 0)
+
+    def test_median_aggregate_unsupported(self):
+        self.assertFalse(median.supports_median(models.Donation.objects.all()))
+        with self.assertRaises(NotSupportedError):
+            models.Donation.objects.aggregate(median=median.Median('amount'))
+
     def test_flatten(self):
         self.assertSequenceEqual(
             list(util.flatten(['string', [1, 2, 'also_string', [3, 4, 5]]])),
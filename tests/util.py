@@ -110,7 +110,9 @@ def parse_csv_response(response):
     ), f'expected `text/csv` for content-type, got {response["content-type"]}'
     return [
         line
-        for line in csv.reader(io.StringIO(response.content.decode(response.charset)))
+        for line in csv.reader(
+            io.StringIO(response.getvalue().decode(response.charset))
+        )
     ]
 
 
@@ -6,7 +6,7 @@ from django.shortcuts import render
 from django.urls import path, reverse
 from django.utils.safestring import mark_safe
 
-from tracker import forms, logutil, models, search_filters, util, viewutil
+from tracker import bidutil, forms, logutil, models, search_filters, util, viewutil
 
 from .filters import BidListFilter, BidParentFilter, RunEventListFilter
 from .inlines import BidChainedInline, BidDependentsInline, BidOptionInline
@@ -275,10 +275,11 @@ class BidAdmin(EventArchivedMixin, CustomModelAdmin):
                 )
             queryset = queryset.filter(level=0)
         total = queryset.count()
-        for b in queryset:
-            b.state = value
-            b.save()  # can't use queryset.update because that doesn't send the post_save signals
-            logutil.change(request, b, ['state'])
+        with bidutil.deferred_recompute():
+            for b in queryset:
+                b.state = value
+                b.save()  # can't use queryset.update because that doesn't send the post_save signals
+                logutil.change(request, b, ['state'])
         if total and not recursive:
             messages.success(request, f'{total} bid(s) changed to {value}.')
         return total
@@ -294,7 +295,7 @@ class BidAdmin(EventArchivedMixin, CustomModelAdmin):
                 model=models.Bid, objects=objects, data=request.POST
             )
             if form.is_valid():
-                viewutil.merge_bids(
+                result = viewutil.merge_bids(
                     form.cleaned_data['root'], form.cleaned_data['objects']
                 )
                 logutil.change(
@@ -305,6 +306,7 @@ class BidAdmin(EventArchivedMixin, CustomModelAdmin):
                         ','.join([str(d) for d in form.cleaned_data['objects']]),
                     ),
                 )
+                messages.success(request, f'Merged bids: {result}.')
                 return HttpResponseRedirect(reverse('admin:tracker_bid_changelist'))
         else:
             objects = [int(x) for x in request.GET['objects'].split(',')]
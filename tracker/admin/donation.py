@@ -121,13 +121,15 @@ class DonationAdmin(EventArchivedMixin, CustomModelAdmin):
     def send_donation_postbacks(self, request, queryset):
         from tracker import tasks
 
-        queryset = queryset.filter(transactionstate='COMPLETED')
-        for donation in queryset:
+        donation_ids = list(
+            queryset.filter(transactionstate='COMPLETED').values_list('id', flat=True)
+        )
+        if donation_ids:
             if settings.TRACKER_HAS_CELERY:
-                tasks.post_donation_to_postbacks.delay(donation.id)
+                tasks.post_donations_to_postbacks.delay(donation_ids)
             else:
-                tasks.post_donation_to_postbacks(donation.id)
-        self.message_user(request, 'Sent %d postbacks.' % queryset.count())
+                tasks.post_donations_to_postbacks(donation_ids)
+        self.message_user(request, 'Sent %d postbacks.' % len(donation_ids))
 
     send_donation_postbacks.short_description = 'Send postbacks.'
 
@@ -462,7 +464,7 @@ class DonorAdmin(RelatedUserMixin, CustomModelAdmin):
                 model=models.Donor, objects=objects, data=request.POST
             )
             if form.is_valid():
-                viewutil.merge_donors(
+                result = viewutil.merge_donors(
                     form.cleaned_data['root'], form.cleaned_data['objects']
                 )
                 logutil.change(
@@ -473,6 +475,7 @@ class DonorAdmin(RelatedUserMixin, CustomModelAdmin):
                         ','.join([str(d) for d in form.cleaned_data['objects']]),
                     ),
                 )
+                messages.success(request, f'Merged donors: {result}.')
                 return HttpResponseRedirect(reverse('admin:tracker_donor_changelist'))
         else:
             objects = [int(x) for x in request.GET['objects'].split(',')]
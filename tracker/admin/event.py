@@ -1,13 +1,11 @@
-import csv
 import time
-from collections import defaultdict
 from decimal import Decimal
-from io import BytesIO, StringIO
+from io import BytesIO
 from urllib.parse import urlparse, urlunparse
 
 from django import forms as djforms
 from django.contrib import admin, messages
-from django.contrib.admin import register
+from django.contrib.admin import display, register
 from django.contrib.admin.templatetags.admin_urls import add_preserved_filters
 from django.contrib.admin.utils import display_for_value
 from django.contrib.admin.views.autocomplete import AutocompleteJsonView
@@ -15,9 +13,8 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth import models as auth
 from django.contrib.auth.decorators import permission_required, user_passes_test
 from django.core.files.storage import InvalidStorageError, default_storage, storages
-from django.core.validators import EmailValidator
-from django.db.models import Q, Sum
-from django.http import Http404, HttpResponse, HttpResponseRedirect
+from django.db.models import Count, Q, Sum
+from django.http import Http404, HttpResponseRedirect
 from django.shortcuts import redirect, render
 from django.urls import path, reverse
 from django.utils.html import format_html
@@ -26,13 +23,36 @@ from django.views.decorators.csrf import csrf_protect
 
 import tracker.models.fields
 import tracker.models.tag
-from tracker import forms, logutil, models, search_filters, settings
+from tracker import (
+    forms,
+    logutil,
+    models,
+    prizeutil,
+    search_filters,
+    settings,
+    volunteerutil,
+)
 
-from ..auth import send_registration_mail
 from . import inlines
 from .filters import EventFilter, RunListFilter, RunParticipantFilter
 from .forms import StartRunForm, TestEmailForm
-from .util import CustomModelAdmin, EventArchivedMixin, RelatedUserMixin
+from .util import (
+    CustomModelAdmin,
+    EventArchivedMixin,
+    RelatedUserMixin,
+    streaming_csv_response,
+)
+
+# rows fetched per round trip by the CSV reports
+REPORT_CHUNK_SIZE = 2000
+
+_DONOR_NAME_FIELDS = ('visibility', 'alias', 'alias_num', 'firstname', 'lastname')
+
+
+def _donor(values):
+    # an unsaved stand-in, so that the reports can share the Donor name rules without loading whole rows
+    return models.Donor(**dict(zip(_DONOR_NAME_FIELDS, values)))
+
 
 # need to override the default behavior for this because the `view_user` permission is too broad to grant to everybody
 
@@ -229,170 +249,20 @@ class EventAdmin(RelatedUserMixin, CustomModelAdmin):
         if request.method == 'POST':
             form = forms.SendVolunteerEmailsForm(request.POST, request.FILES)
             if form.is_valid():
-                volunteers = csv.DictReader(
-                    StringIO(request.FILES['volunteers'].read().decode('utf-8'))
+                results = volunteerutil.import_volunteers(
+                    request,
+                    event,
+                    request.FILES['volunteers'].read().decode('utf-8'),
+                    template=form.cleaned_data['template'],
+                    sender=form.cleaned_data['sender'],
                 )
-                tracker_group = auth.Group.objects.get_or_create(name='Bid Tracker')[0]
-                tracker_codenames = [
-                    'change_donation',
-                    'view_bid',
-                    'view_donation',
-                    'view_comments',
-                    # bid assignment
-                    'add_donationbid',
-                    'change_donationbid',
-                    'delete_donationbid',
-                    'view_donationbid',
-                    # milestones
-                    'view_milestone',
-                ]
-                tracker_permissions = auth.Permission.objects.filter(
-                    content_type__app_label='tracker',
-                    codename__in=tracker_codenames,
-                )
-                assert tracker_permissions.count() == len(
-                    tracker_codenames
-                ), 'some permissions were missing, check tracker_codenames or that all migrations have run'
-
-                tracker_group.permissions.set(tracker_permissions)
-                admin_group = auth.Group.objects.get_or_create(name='Bid Admin')[0]
-                admin_codenames = [
-                    # bid assignment
-                    'add_donationbid',
-                    'change_donationbid',
-                    'delete_donationbid',
-                    'view_donationbid',
-                    # bid screening/editing
-                    'add_bid',
-                    'change_bid',
-                    'view_bid',
-                    'top_level_bid',
-                    # donations
-                    'change_donation',
-                    'view_donation',
-                    'view_comments',
-                    'view_pending_donation',
-                    'send_to_reader',
-                    # donors
-                    'add_donor',
-                    'change_donor',
-                    'view_donor',
-                    'view_emails',
-                    'view_full_names',
-                    # needed for 'Start Run'
-                    'change_speedrun',
-                    'view_speedrun',
-                    'view_milestone',
-                ]
-                admin_permissions = auth.Permission.objects.filter(
-                    content_type__app_label='tracker',
-                    codename__in=admin_codenames,
-                )
-                assert admin_permissions.count() == len(
-                    admin_codenames
-                ), 'some permissions were missing, check admin_codenames or that all migrations have run'
-                admin_group.permissions.set(admin_permissions)
-
-                schedule_group = auth.Group.objects.get_or_create(
-                    name='Schedule Viewer'
-                )[0]
-                schedule_codenames = [
-                    'view_ad',
-                    'view_interview',
-                ]
-                schedule_permissions = auth.Permission.objects.filter(
-                    content_type__app_label='tracker',
-                    codename__in=schedule_codenames,
-                )
-                assert schedule_permissions.count() == len(
-                    schedule_codenames
-                ), 'some permissions were missing, check schedule_codenames or that all migrations have run'
-                schedule_group.permissions.set(schedule_permissions)
-
-                successful = 0
-                email_validator = EmailValidator()
-                for row, volunteer in enumerate(volunteers, start=2):
-                    volunteer = defaultdict(str, volunteer)
-                    try:
-                        firstname, space, lastname = (
-                            volunteer['name'].strip().partition(' ')
-                        )
-                        is_head = 'head' in volunteer['position'].strip().lower()
-                        is_host = 'host' in volunteer['position'].strip().lower()
-                        is_schedule = (
-                            'schedule' in volunteer['position'].strip().lower()
-                        )
-                        email = volunteer['email'].strip()
-                        email_validator(email)
-                        username = volunteer['username'].strip()
-                        if not username:
-                            username = email
-                        user, created = auth.User.objects.get_or_create(
-                            email__iexact=volunteer['email'],
-                            defaults=dict(
-                                username=username,
-                                first_name=firstname.strip(),
-                                last_name=lastname.strip(),
-                                email=email,
-                                is_active=False,
-                            ),
-                        )
-                        user.is_staff = True
-                        if is_head:
-                            user.groups.add(admin_group)
-                            user.groups.remove(tracker_group)
-                            user.groups.remove(schedule_group)
-                        elif is_schedule:
-                            user.groups.remove(admin_group)
-                            user.groups.remove(tracker_group)
-                            user.groups.add(schedule_group)
-                        else:
-                            user.groups.remove(admin_group)
-                            user.groups.add(tracker_group)
-                            user.groups.remove(schedule_group)
-                        user.save()
-
-                        if created:
-                            messages.add_message(
-                                request,
-                                messages.INFO,
-                                f'Created user {volunteer["username"]} with email {volunteer["email"]}',
-                            )
-                        else:
-                            messages.add_message(
-                                request,
-                                messages.INFO,
-                                f'Found existing user {user.username} with email {volunteer["email"]}',
-                            )
-
-                        context = dict(
-                            event=event,
-                            is_head=is_head,
-                            is_host=is_host,
-                            is_schedule=is_schedule,
-                            password_reset_url=request.build_absolute_uri(
-                                reverse('tracker:password_reset')
-                            ),
-                            admin_url=request.build_absolute_uri(
-                                reverse('admin:index')
-                            ),
-                        )
-
-                        send_registration_mail(
-                            request,
-                            user,
-                            template=form.cleaned_data['template'],
-                            sender=form.cleaned_data['sender'],
-                            extra_context=context,
-                        )
-                        successful += 1
-                    except Exception as e:
-                        messages.add_message(
-                            request,
-                            messages.ERROR,
-                            f'Could not process row #{row}: {repr(e)}',
-                        )
-                if successful:
+                for result in results:
+                    messages.add_message(
+                        request,
+                        messages.ERROR if result.error else messages.INFO,
+                        result.message,
+                    )
+                if successful := sum(1 for r in results if not r.error):
                     messages.add_message(
                         request, messages.INFO, f'Sent {successful} email(s)'
                     )
@@ -536,32 +406,34 @@ class EventAdmin(RelatedUserMixin, CustomModelAdmin):
             )
             return
         event = queryset.first()
-        response = HttpResponse(content_type='text/csv; charset=utf-8')
-        response['Content-Disposition'] = (
-            'attachment; filename="donor-report-%s.csv"' % event.short
-        )
-        writer = csv.writer(response)
-        writer.writerow(['Name', 'Donation Sum', 'Donation Count'])
         anon = tracker.models.Donation.objects.filter(
             donor__visibility='ANON', transactionstate='COMPLETED', event=event
-        )
-        writer.writerow(
-            [
-                'All Anonymous Donations',
-                anon.aggregate(Sum('amount'))['amount__sum'].quantize(Decimal('1.00')),
-                anon.count(),
-            ]
-        )
+        ).aggregate(total=Sum('amount'), count=Count('id'))
         donors = (
             tracker.models.DonorCache.objects.filter(event=event)
             .exclude(donor__visibility='ANON')
             .exclude(donor=None)
-            .select_related('donor')
-            .iterator()
+            .values_list(
+                *(f'donor__{f}' for f in _DONOR_NAME_FIELDS),
+                'donation_total',
+                'donation_count',
+            )
+        )
+
+        def rows():
+            yield [
+                'All Anonymous Donations',
+                (anon['total'] or Decimal('0')).quantize(Decimal('1.00')),
+                anon['count'],
+            ]
+            for *name, total, count in donors.iterator(chunk_size=REPORT_CHUNK_SIZE):
+                yield [_donor(name).visible_name, total, count]
+
+        return streaming_csv_response(
+            f'donor-report-{event.short}.csv',
+            ['Name', 'Donation Sum', 'Donation Count'],
+            rows(),
         )
-        for d in donors:
-            writer.writerow([d.visible_name, d.donation_total, d.donation_count])
-        return response
 
     donor_report.short_description = 'Export donor CSV'
 
@@ -574,22 +446,16 @@ class EventAdmin(RelatedUserMixin, CustomModelAdmin):
             )
             return
         event = queryset.first()
-        response = HttpResponse(content_type='text/csv; charset=utf-8')
-        response['Content-Disposition'] = (
-            'attachment; filename="run-report-%s.csv"' % event.short
-        )
-        writer = csv.writer(response)
-        writer.writerow(
-            ['Run', 'Event', 'Start Time', 'End Time', 'Runners', 'Runner Twitters']
-        )
         runs = (
             tracker.models.SpeedRun.objects.filter(event=event)
             .exclude(order=None)
             .select_related('event')
             .prefetch_related('runners')
         )
-        for r in runs:
-            writer.writerow(
+        return streaming_csv_response(
+            f'run-report-{event.short}.csv',
+            ['Run', 'Event', 'Start Time', 'End Time', 'Runners', 'Runner Twitters'],
+            (
                 [
                     str(r),
                     r.event.short,
@@ -598,8 +464,9 @@ class EventAdmin(RelatedUserMixin, CustomModelAdmin):
                     ','.join(str(ru) for ru in r.runners.all()),
                     ','.join(ru.twitter for ru in r.runners.all() if ru.twitter),
                 ]
-            )
-        return response
+                for r in runs
+            ),
+        )
 
     run_report.short_description = 'Export run CSV'
 
@@ -612,33 +479,35 @@ class EventAdmin(RelatedUserMixin, CustomModelAdmin):
             )
             return
         event = queryset.first()
-        response = HttpResponse(content_type='text/csv; charset=utf-8')
-        response['Content-Disposition'] = (
-            'attachment; filename="donation-report-%s.csv"' % event.short
-        )
-        writer = csv.writer(response)
-        writer.writerow(
-            ['Donor', 'Name', 'Event', 'Amount', 'Time Received', 'Transaction ID']
-        )
+        timezone = event.timezone
         donations = (
             tracker.models.Donation.objects.filter(
                 transactionstate='COMPLETED', event=event
             )
-            .select_related('donor', 'event')
-            .iterator()
+            .values_list(
+                *(f'donor__{f}' for f in _DONOR_NAME_FIELDS),
+                'amount',
+                'timereceived',
+                'domain',
+                'domainId',
+            )
+            .iterator(chunk_size=REPORT_CHUNK_SIZE)
         )
-        for d in donations:
-            writer.writerow(
+        return streaming_csv_response(
+            f'donation-report-{event.short}.csv',
+            ['Donor', 'Name', 'Event', 'Amount', 'Time Received', 'Transaction ID'],
+            (
                 [
-                    d.donor.visible_name,
-                    d.donor.full_name,
-                    d.event.short,
-                    d.amount,
-                    d.timereceived.astimezone(d.event.timezone).isoformat(),
-                    d.domainId if d.domain == 'PAYPAL' else '',
+                    (donor := _donor(name)).visible_name,
+                    donor.full_name,
+                    event.short,
+                    amount,
+                    timereceived.astimezone(timezone).isoformat(),
+                    domain_id if domain == 'PAYPAL' else '',
                 ]
-            )
-        return response
+                for *name, amount, timereceived, domain, domain_id in donations
+            ),
+        )
 
     donation_report.short_description = 'Export donation CSV'
 
@@ -651,25 +520,57 @@ class EventAdmin(RelatedUserMixin, CustomModelAdmin):
             )
             return
         event = queryset.first()
-        response = HttpResponse(content_type='text/csv; charset=utf-8')
-        response['Content-Disposition'] = (
-            'attachment; filename="bid-report-%s.csv"' % event.short
-        )
-        writer = csv.writer(response)
-        writer.writerow(['Id', 'Bid', 'Event', 'Target', 'Goal', 'Amount', 'Count'])
+        event_name = str(event)
+        runs = {
+            run.id: run.name_with_category
+            for run in tracker.models.SpeedRun.objects.filter(event=event).only(
+                'name', 'category'
+            )
+        }
         bids = (
             tracker.models.Bid.objects.filter(
                 state__in=['CLOSED', 'OPENED'], event=event
             )
             .order_by('event__datetime', 'speedrun__order', 'parent__name', '-total')
-            .select_related('event', 'speedrun', 'parent')
-            .iterator()
-        )
-        for b in bids:
-            writer.writerow(
-                [b.id, str(b), b.event.short, b.istarget, b.goal, b.total, b.count]
+            .values_list(
+                'id',
+                'speedrun_id',
+                'parent__name',
+                'name',
+                'istarget',
+                'goal',
+                'total',
+                'count',
             )
-        return response
+            .iterator(chunk_size=REPORT_CHUNK_SIZE)
+        )
+
+        def bid_name(run_id, parent_name, name):
+            # matches Bid.__str__
+            parts = [f'{event_name} (Event)']
+            if run_id:
+                parts.append(f'{runs[run_id]} (Run)')
+            if parent_name is not None:
+                parts.append(f'{parent_name} (Parent)')
+            parts.append(name)
+            return ' -- '.join(parts)
+
+        return streaming_csv_response(
+            f'bid-report-{event.short}.csv',
+            ['Id', 'Bid', 'Event', 'Target', 'Goal', 'Amount', 'Count'],
+            (
+                [
+                    bid_id,
+                    bid_name(run_id, parent_name, name),
+                    event.short,
+                    istarget,
+                    goal,
+                    total,
+                    count,
+                ]
+                for bid_id, run_id, parent_name, name, istarget, goal, total, count in bids
+            ),
+        )
 
     bid_report.short_description = 'Export bid CSV'
 
@@ -682,12 +583,6 @@ class EventAdmin(RelatedUserMixin, CustomModelAdmin):
             )
             return
         event = queryset.first()
-        response = HttpResponse(content_type='text/csv; charset=utf-8')
-        response['Content-Disposition'] = (
-            'attachment; filename="donationbid-report-%s.csv"' % event.short
-        )
-        writer = csv.writer(response)
-        writer.writerow(['Bid', 'Amount', 'Time'])
         donation_bids = (
             tracker.models.DonationBid.objects.filter(
                 bid__state__in=['CLOSED', 'OPENED'],
@@ -695,12 +590,14 @@ class EventAdmin(RelatedUserMixin, CustomModelAdmin):
                 donation__transactionstate='COMPLETED',
             )
             .order_by('donation__timereceived')
-            .select_related('donation')
-            .iterator()
+            .values_list('bid_id', 'amount', 'donation__timereceived')
+            .iterator(chunk_size=REPORT_CHUNK_SIZE)
+        )
+        return streaming_csv_response(
+            f'donationbid-report-{event.short}.csv',
+            ['Bid', 'Amount', 'Time'],
+            donation_bids,
         )
-        for b in donation_bids:
-            writer.writerow([b.bid_id, b.amount, b.donation.timereceived])
-        return response
 
     donationbid_report.short_description = 'Export donation bid CSV'
 
@@ -713,12 +610,10 @@ class EventAdmin(RelatedUserMixin, CustomModelAdmin):
             )
             return
         event = queryset.first()
-        response = HttpResponse(content_type='text/csv; charset=utf-8')
-        response['Content-Disposition'] = (
-            'attachment; filename="prize-report-%s.csv"' % event.short
-        )
-        writer = csv.writer(response)
-        writer.writerow(
+        prizes = tracker.models.Prize.objects.filter(state='ACCEPTED', event=event)
+        counts = prizeutil.eligible_donor_counts(prizes)
+        return streaming_csv_response(
+            f'prize-report-{event.short}.csv',
             [
                 'Event',
                 'Name',
@@ -726,24 +621,20 @@ class EventAdmin(RelatedUserMixin, CustomModelAdmin):
                 'Exact Donors',
                 'Start Time',
                 'End Time',
-            ]
-        )
-        prizes = tracker.models.Prize.objects.filter(
-            state='ACCEPTED', event=event
-        ).iterator()
-        for p in prizes:
-            eligible = p.eligible_donors()
-            writer.writerow(
+            ],
+            (
                 [
-                    p.event.short,
+                    event.short,
                     p.name,
-                    len(eligible),
-                    len([d for d, a in eligible.items() if a == p.minimumbid]),
+                    *counts[p.id],
                     p.start_draw_time(),
                     p.end_draw_time(),
                 ]
-            )
-        return response
+                for p in prizes.select_related(
+                    'startrun', 'endrun', 'prev_run', 'next_run'
+                )
+            ),
+        )
 
     prize_report.short_description = 'Export prize CSV'
 
@@ -756,31 +647,37 @@ class EventAdmin(RelatedUserMixin, CustomModelAdmin):
             )
             return
         event = queryset.first()
-        response = HttpResponse(content_type='text/csv; charset=utf-8')
-        response['Content-Disposition'] = (
-            'attachment; filename="email-report-%s.csv"' % event.short
-        )
-        writer = csv.writer(response)
-        writer.writerow(['Email', 'Name', 'Anonymous', 'Donation Sum', 'Country'])
         donors = (
             tracker.models.DonorCache.objects.filter(
                 event=event,
                 donor__solicitemail='OPTIN',
             )
-            .select_related('donor')
-            .iterator()
+            .values_list(
+                'donor__email',
+                'donor__firstname',
+                'donor__lastname',
+                'donor__visibility',
+                'donation_total',
+                'donor__addresscountry__name',
+            )
+            .iterator(chunk_size=REPORT_CHUNK_SIZE)
         )
-        for d in donors:
-            writer.writerow(
+        return streaming_csv_response(
+            f'email-report-{event.short}.csv',
+            ['Email', 'Name', 'Anonymous', 'Donation Sum', 'Country'],
+            (
                 [
-                    d.email,
-                    d.full_name,
-                    d.visibility == 'ANON',
-                    d.donation_total,
-                    d.addresscountry,
+                    email,
+                    tracker.models.Donor(
+                        firstname=firstname, lastname=lastname
+                    ).full_name,
+                    visibility == 'ANON',
+                    total,
+                    country,
                 ]
-            )
-        return response
+                for email, firstname, lastname, visibility, total, country in donors
+            ),
+        )
 
     email_report.short_description = 'Export email opt-in CSV'
 
@@ -801,12 +698,46 @@ class PostbackURLAdmin(EventArchivedMixin, CustomModelAdmin):
     autocomplete_fields = ('event',)
     search_fields = ('url',)
     list_filter = ('event',)
-    list_display = ('url', 'event')
-    fieldsets = [(None, {'fields': ['event', 'url']})]
+    list_display = (
+        'url',
+        'event',
+        'batch',
+        'success_count',
+        'failure_count',
+        'average_latency',
+        'last_failure',
+    )
+    fieldsets = [
+        (None, {'fields': ['event', 'url', 'batch']}),
+        (
+            'Delivery',
+            {
+                'fields': [
+                    'success_count',
+                    'failure_count',
+                    'average_latency',
+                    'last_failure',
+                ]
+            },
+        ),
+    ]
+
+    readonly_fields = (
+        'success_count',
+        'failure_count',
+        'average_latency',
+        'last_failure',
+    )
 
     def get_readonly_fields(self, request, obj=None):
         return super().get_readonly_fields(request, obj)
 
+    @display(description='Average Latency')
+    def average_latency(self, obj):
+        if obj.average_latency is None:
+            return None
+        return f'{obj.average_latency * 1000:.0f}ms'
+
 
 @register(models.Talent)
 class TalentAdmin(CustomModelAdmin):
@@ -5,7 +5,7 @@ from django import forms as djforms
 from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
 from django.utils.translation import gettext_lazy as _
 
-from tracker import models
+from tracker import models, prizeutil, scheduleutil
 
 
 class DateTimeLocalInput(djforms.DateTimeInput):
@@ -100,9 +100,11 @@ class StartRunForm(djforms.Form):
 
     def save(self):
         if self.is_valid():
-            if self._run.anchor_time is not None:
-                self._run.save()
-            self._prev.save()
+            # both runs are in the same event, so only recompute its schedule once
+            with scheduleutil.deferred_recompute():
+                if self._run.anchor_time is not None:
+                    self._run.save()
+                self._prev.save()
 
 
 class TestEmailForm(djforms.Form):
@@ -114,6 +116,11 @@ class PrizeKeyImportForm(djforms.Form):
 
     def clean_keys(self):
         keys = {k.strip() for k in self.cleaned_data['keys'].split('\n') if k.strip()}
-        if models.PrizeKey.objects.filter(key__in=keys).exists():
+        max_length = models.PrizeKey._meta.get_field('key').max_length
+        if any(len(k) > max_length for k in keys):
+            raise ValidationError(
+                f'Keys cannot be longer than {max_length} characters.'
+            )
+        if prizeutil.existing_keys(keys):
             raise ValidationError('At least one key already exists.')
         return keys
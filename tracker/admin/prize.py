@@ -1,22 +1,20 @@
 import datetime
-from itertools import groupby
-from typing import Any, Collection, Iterable, Mapping, Optional, Sequence
+from typing import Any, Iterable, Mapping, Optional
 
 import post_office.mail
 import post_office.models
 from django.contrib import admin, messages
 from django.contrib.auth.decorators import permission_required
-from django.contrib.auth.models import AbstractUser
 from django.core.exceptions import ObjectDoesNotExist
-from django.http import Http404, HttpRequest, HttpResponse, HttpResponseRedirect
+from django.db import IntegrityError, transaction
+from django.http import Http404, HttpResponse, HttpResponseRedirect
 from django.shortcuts import render
 from django.template import Context, Engine, Template
 from django.urls import path, reverse
 from django.utils.decorators import method_decorator
 
-from tracker import forms, models, settings, util, viewutil
+from tracker import forms, models, prizemail, prizeutil, settings, util, viewutil
 
-from ..util import build_public_url
 from .filters import PrizeLifecycleFilter, PrizeListFilter
 from .forms import PrizeKeyImportForm
 from .inlines import PrizeWinnerInline
@@ -94,6 +92,62 @@ class DonorPrizeEntryAdmin(EventArchivedMixin, CustomModelAdmin):
     ]
 
 
+@admin.register(models.PrizeMailJob)
+class PrizeMailJobAdmin(EventArchivedMixin, CustomModelAdmin):
+    list_display = (
+        '__str__',
+        'event',
+        'kind',
+        'state',
+        'progress_',
+        'emails_sent',
+        'created',
+        'finished',
+    )
+    list_filter = ('event', 'kind', 'state')
+    fields = (
+        'event',
+        'kind',
+        'state',
+        'progress_',
+        'emails_sent',
+        'error',
+        'email_template',
+        'from_address',
+        'reply_address',
+        'accept_deadline',
+        'user',
+        'created',
+        'finished',
+    )
+    readonly_fields = fields
+
+    @admin.display(description='Progress')
+    def progress_(self, obj):
+        return f'{obj.groups_done}/{obj.recipients} recipient(s) ({obj.progress:.0%})'
+
+    def has_add_permission(self, request):
+        return False
+
+    def resume_jobs_action(self, request, queryset):
+        from ..tasks import send_prize_mail
+
+        jobs = list(queryset.exclude(state='DONE'))
+        for job in jobs:
+            if settings.TRACKER_HAS_CELERY:
+                send_prize_mail.delay(job.pk)
+            else:
+                prizemail.run_job(job)
+        if settings.TRACKER_HAS_CELERY:
+            self.message_user(request, f'{len(jobs)} job(s) queued.')
+        else:
+            self.message_user(request, f'{len(jobs)} job(s) finished.')
+
+    resume_jobs_action.short_description = 'Resume the selected jobs'
+    resume_jobs_action.allowed_permissions = ('change',)
+    actions = [resume_jobs_action]
+
+
 def _validate_template(
     template: post_office.models.EmailTemplate,
     template_context: Mapping[str, Any],
@@ -315,20 +369,21 @@ class PrizeAdmin(EventArchivedMixin, RelatedUserMixin, CustomModelAdmin):
             return ' <--> '.join(parts)
 
     def draw_prize_action(self, request, queryset):
+        from ..tasks import draw_prize
+
         total_num_drawn = 0
         total_queued = 0
-        for prize in queryset:
-            from ..tasks import draw_prize
-
-            if settings.TRACKER_HAS_CELERY:
-                draw_prize.delay(prize.pk)
-                total_queued += 1
-            else:
-                result, msg = draw_prize(prize)
-                if not result:
-                    self.message_user(request, msg['error'], level=messages.ERROR)
+        with prizeutil.shared_eligibility():
+            for prize in queryset:
+                if settings.TRACKER_HAS_CELERY:
+                    draw_prize.delay(prize.pk)
+                    total_queued += 1
                 else:
-                    total_num_drawn += 1
+                    result, msg = draw_prize(prize)
+                    if not result:
+                        self.message_user(request, msg['error'], level=messages.ERROR)
+                    else:
+                        total_num_drawn += 1
         if total_num_drawn > 0:
             self.message_user(request, f'{total_num_drawn} prize(s) drawn.')
         if total_queued > 0:
@@ -336,6 +391,54 @@ class PrizeAdmin(EventArchivedMixin, RelatedUserMixin, CustomModelAdmin):
 
     draw_prize_action.short_description = 'Draw winner(s) for the selected prizes'
 
+    def batch_draw_prizes_action(self, request, queryset):
+        from ..tasks import draw_prizes
+
+        # same feed as the draw_prizes command, anything else would only come back as an error
+        ids = list(
+            models.Prize.objects.to_draw()
+            .filter(pk__in=queryset.values('pk'))
+            .values_list('pk', flat=True)
+            .distinct()
+        )
+        skipped = queryset.count() - len(ids)
+        if skipped:
+            self.message_user(
+                request,
+                f'{skipped} prize(s) skipped, they are not ready to draw or already have all of their winners.',
+                level=messages.WARNING,
+            )
+        if not ids:
+            return
+        if settings.TRACKER_HAS_CELERY:
+            draw_prizes.delay(ids)
+            self.message_user(
+                request, f'{len(ids)} prize(s) queued for drawing as a batch.'
+            )
+            return
+        try:
+            results = prizeutil.draw_prizes(models.Prize.objects.filter(pk__in=ids))
+        except IntegrityError as e:
+            self.message_user(
+                request,
+                f'Error drawing prizes, nothing was drawn: {e}',
+                level=messages.ERROR,
+            )
+            return
+        for result in results:
+            if result.error:
+                self.message_user(request, result.error, level=messages.ERROR)
+        drawn = [r for r in results if not r.error]
+        if drawn:
+            self.message_user(
+                request,
+                f'{len(drawn)} prize(s) drawn in {sum(r.elapsed for r in results):.2f}s.',
+            )
+
+    batch_draw_prizes_action.short_description = (
+        'Draw winner(s) for the selected prizes as one batch'
+    )
+
     def import_keys_action(self, request, queryset):
         queryset = queryset.filter(event__archived=False)
         if queryset.count() != 1 or not queryset[0].key_code:
@@ -367,6 +470,7 @@ class PrizeAdmin(EventArchivedMixin, RelatedUserMixin, CustomModelAdmin):
     set_state_denied.short_description = 'Set state to Denied'
     actions = [
         draw_prize_action,
+        batch_draw_prizes_action,
         import_keys_action,
         set_state_accepted,
         set_state_pending,
@@ -467,14 +571,7 @@ class PrizeAdmin(EventArchivedMixin, RelatedUserMixin, CustomModelAdmin):
             data=request.POST if request.method == 'POST' else None
         )
         if form.is_valid():
-            models.PrizeKey.objects.bulk_create(
-                [
-                    models.PrizeKey(prize=prize, key=key)
-                    for key in form.cleaned_data['keys']
-                ]
-            )
-            prize.save()
-            count = len(form.cleaned_data['keys'])
+            count = prizeutil.import_keys(prize, form.cleaned_data['keys'])
             self.log_change(request, prize, 'Added %d key(s).' % count)
             messages.info(request, '%d key(s) added to prize.' % count)
             return HttpResponseRedirect(reverse('admin:tracker_prize_changelist'))
@@ -516,23 +613,30 @@ class PrizeAdmin(EventArchivedMixin, RelatedUserMixin, CustomModelAdmin):
             'action': request.path,
         }
 
-    @staticmethod
-    def _prize_contributor_context(
-        request: HttpRequest,
-        event: models.Event,
-        handler: AbstractUser,
-        prizes: Iterable[models.Prize],
-        reply_address: str,
-        /,
-    ):
-        return {
-            'user_index_url': build_public_url(reverse('tracker:user_index'), request),
-            'event': event,
-            'handler': handler,
-            'accepted_prizes': [prize for prize in prizes if prize.state == 'ACCEPTED'],
-            'denied_prizes': [prize for prize in prizes if prize.state == 'DENIED'],
-            'reply_address': reply_address,
-        }
+    _prize_contributor_context = staticmethod(prizemail.contributor_context)
+
+    def _send_prize_mail(self, request, kind, event, objects, form, **kwargs):
+        from ..tasks import send_prize_mail
+
+        job = prizemail.create_job(
+            kind,
+            event,
+            objects,
+            email_template=form.cleaned_data['email_template'],
+            from_address=form.cleaned_data['from_address'],
+            reply_address=form.cleaned_data['reply_address'],
+            request=request,
+            **kwargs,
+        )
+        if settings.TRACKER_HAS_CELERY:
+            transaction.on_commit(lambda: send_prize_mail.delay(job.pk))
+            self.message_user(request, f'{job.recipients} email(s) queued for sending.')
+            return HttpResponseRedirect(
+                reverse('admin:tracker_prizemailjob_change', args=(job.pk,))
+            )
+        for message in prizemail.run_job(job):
+            self.message_user(request, message)
+        return HttpResponseRedirect(reverse('admin:index'))
 
     @method_decorator(permission_required('tracker.change_prize', raise_exception=True))
     def automail_prize_contributors(self, request, event=None):
@@ -572,33 +676,9 @@ class PrizeAdmin(EventArchivedMixin, RelatedUserMixin, CustomModelAdmin):
             ):
                 return resp
 
-            for handler, handler_prizes in groupby(
-                form.cleaned_data['prizes'].order_by('handler'),
-                key=lambda p: p.handler,
-            ):
-                handler_prizes = list(handler_prizes)
-                context = PrizeAdmin._prize_contributor_context(
-                    request, event, handler, handler_prizes, reply_address
-                )
-
-                post_office.mail.send(
-                    recipients=[handler.email],
-                    sender=form.cleaned_data['from_address'],
-                    template=form.cleaned_data['email_template'],
-                    context=context,
-                    headers={'Reply-to': form.cleaned_data['reply_address']},
-                )
-
-                self.message_user(
-                    request,
-                    f'Mailed prize handler {handler} for {len(handler_prizes)} prize(s)',
-                )
-
-                for prize in handler_prizes:
-                    self.log_change(request, prize, 'Sent Accept/Deny email.')
-                    prize.acceptemailsent = True
-                    prize.save()
-            return HttpResponseRedirect(reverse('admin:index'))
+            return self._send_prize_mail(
+                request, 'CONTRIBUTOR', event, form.cleaned_data['prizes'], form
+            )
         return render(
             request,
             'admin/tracker/generic_form.html',
@@ -641,29 +721,7 @@ class PrizeAdmin(EventArchivedMixin, RelatedUserMixin, CustomModelAdmin):
             content_type='text/plain; charset=UTF-8',
         )
 
-    @staticmethod
-    def _prize_winner_context(
-        event: models.Event,
-        winner: AbstractUser,
-        claims: Collection[models.PrizeClaim],
-        reply_address: str,
-        accept_deadline: str | datetime.date | datetime.datetime,
-        /,
-    ):
-        if isinstance(accept_deadline, datetime.datetime):
-            accept_deadline = accept_deadline.date()
-        return {
-            'event': event,
-            'winner': winner,
-            'claims': claims,
-            'requires_shipping': any(c for c in claims if c.requiresshipping),
-            'reply_address': reply_address,
-            'accept_deadline': accept_deadline,
-            # deprecated
-            'prize_wins': claims,
-            'multi': len(claims) > 1,
-            'prize_count': len(claims),
-        }
+    _prize_winner_context = staticmethod(prizemail.winner_context)
 
     @method_decorator(
         permission_required(
@@ -721,41 +779,15 @@ class PrizeAdmin(EventArchivedMixin, RelatedUserMixin, CustomModelAdmin):
                 ):
                     return resp
 
-            for winner, winner_claims in groupby(
-                form.cleaned_data['claims'].order_by('winner_id'),
-                lambda p: p.winner,
-            ):
-                winner_claims = list(winner_claims)
-
-                for claim in winner_claims:
-                    claim.create_claim_url(request)
-
-                post_office.mail.send(
-                    recipients=[claim.winner.email],
-                    sender=form.cleaned_data['from_address'],
-                    template=form.cleaned_data['email_template'],
-                    context=PrizeAdmin._prize_winner_context(
-                        event,
-                        winner,
-                        winner_claims,
-                        form.cleaned_data['reply_address'],
-                        accept_deadline,
-                    ),
-                    headers={'Reply-to': form.cleaned_data['reply_address']},
-                )
-
-                self.message_user(
-                    request,
-                    f'Mailed Donor {claim.winner.email} for {len(winner_claims)} won prize claim(s)',
-                )
-
-                for claim in winner_claims:
-                    self.log_change(request, claim, 'Sent winner notification email.')
-                    claim.winneremailsent = True
-                    # "anywhere on earth" Time Zone is GMT-12
-                    claim.acceptdeadline = accept_deadline
-                    claim.save()
-            return HttpResponseRedirect(reverse('admin:index'))
+            return self._send_prize_mail(
+                request,
+                'WINNER',
+                event,
+                form.cleaned_data['claims'],
+                form,
+                # "anywhere on earth" Time Zone is GMT-12
+                accept_deadline=accept_deadline,
+            )
         return render(
             request,
             'admin/tracker/generic_form.html',
@@ -813,25 +845,7 @@ class PrizeAdmin(EventArchivedMixin, RelatedUserMixin, CustomModelAdmin):
             content_type='text/plain; charset=UTF-8',
         )
 
-    @staticmethod
-    def _prize_accept_context(
-        request: HttpRequest,
-        event: models.Event,
-        handler: AbstractUser,
-        claims: Sequence[models.PrizeClaim],
-        reply_address: str,
-        /,
-    ):
-        return {
-            'event': event,
-            'user_index_url': build_public_url(reverse('tracker:user_index'), request),
-            'claims': claims,
-            'handler': handler,
-            'reply_address': reply_address,
-            # deprecated
-            'prize_wins': claims,
-            'prize_count': len(claims),
-        }
+    _prize_accept_context = staticmethod(prizemail.accept_context)
 
     @method_decorator(
         permission_required(
@@ -880,38 +894,9 @@ class PrizeAdmin(EventArchivedMixin, RelatedUserMixin, CustomModelAdmin):
                 ):
                     return resp
 
-            for handler, handler_claims in groupby(
-                form.cleaned_data['claims'].order_by('prize__handler'),
-                lambda c: c.prize.handler,
-            ):
-                handler_claims = list(handler_claims)
-
-                context = PrizeAdmin._prize_accept_context(
-                    request,
-                    event,
-                    handler,
-                    handler_claims,
-                    form.cleaned_data['reply_address'],
-                )
-
-                post_office.mail.send(
-                    recipients=[handler.email],
-                    sender=form.cleaned_data['from_address'],
-                    template=form.cleaned_data['email_template'],
-                    context=context,
-                    headers={'Reply-to': form.cleaned_data['reply_address']},
-                )
-
-                self.message_user(
-                    request,
-                    f'Mailed handler {handler} for {len(handler_claims)} accepted prize claim(s)',
-                )
-
-                for claim in handler_claims:
-                    self.log_change(request, claim, 'Sent accepted claim email.')
-                    claim.acceptemailsentcount = claim.acceptcount
-                    claim.save()
-            return HttpResponseRedirect(reverse('admin:index'))
+            return self._send_prize_mail(
+                request, 'ACCEPT', event, form.cleaned_data['claims'], form
+            )
         return render(
             request,
             'admin/tracker/generic_form.html',
@@ -970,25 +955,7 @@ class PrizeAdmin(EventArchivedMixin, RelatedUserMixin, CustomModelAdmin):
             content_type='text/plain; charset=UTF-8',
         )
 
-    @staticmethod
-    def _prize_shipped_context(
-        event: models.Event,
-        winner: models.Donor,
-        claims: Sequence[models.PrizeClaim],
-        reply_address: str,
-        /,
-    ):
-        return {
-            'event': event,
-            'claims': claims,
-            'winner': winner,
-            'reply_address': reply_address,
-            'shipped': any(c.requiresshipping for c in claims),
-            'awarded': any(not c.requiresshipping for c in claims),
-            # deprecated
-            'prize_wins': claims,
-            'prize_count': len(claims),
-        }
+    _prize_shipped_context = staticmethod(prizemail.shipped_context)
 
     @method_decorator(
         permission_required(
@@ -1038,30 +1005,9 @@ class PrizeAdmin(EventArchivedMixin, RelatedUserMixin, CustomModelAdmin):
             ):
                 return resp
 
-            for winner, winner_claims in groupby(
-                form.cleaned_data['claims'].order_by('winner_id'), lambda c: c.winner
-            ):
-                winner_claims = list(winner_claims)
-                for c in winner_claims:
-                    c.create_claim_url(request)
-                post_office.mail.send(
-                    recipients=[winner.email],
-                    sender=form.cleaned_data['from_address'],
-                    template=form.cleaned_data['email_template'],
-                    context=PrizeAdmin._prize_shipped_context(
-                        event, winner, winner_claims, form.cleaned_data['reply_address']
-                    ),
-                    headers={'Reply-to': form.cleaned_data['reply_address']},
-                )
-                self.message_user(
-                    request,
-                    f'Mailed donor {winner.email} for {len(winner_claims)} shipped prize(s)',
-                )
-                for claim in winner_claims:
-                    self.log_change(request, claim, 'Shipping email sent.')
-                    claim.shippingemailsent = True
-                    claim.save()
-            return HttpResponseRedirect(reverse('admin:index'))
+            return self._send_prize_mail(
+                request, 'SHIPPING', event, form.cleaned_data['claims'], form
+            )
         return render(
             request,
             'admin/tracker/generic_form.html',
@@ -1,4 +1,6 @@
 import contextlib
+import csv
+import itertools
 import re
 import urllib.parse
 
@@ -7,8 +9,11 @@ from django.contrib import admin
 from django.core.exceptions import PermissionDenied
 from django.db.models import QuerySet
 from django.forms import ModelForm
-from django.http import Http404
+from django.http import Http404, StreamingHttpResponse
 from django.urls import resolve, reverse
+from django.utils.text import smart_split, unescape_string_literal
+
+from tracker import settings
 
 
 def reverse_lazy(url):
@@ -77,6 +82,30 @@ class CustomModelAdmin(admin.ModelAdmin):
             and request.user.is_staff
         ) or super().has_view_permission(request, obj)
 
+    def get_search_results(self, request, queryset, search_term):
+        """
+        matches against the search index instead of joining every search field, when it is turned on and it covers
+        exactly the fields this user can search, each term still has to match somewhere, like the default search
+        """
+        from tracker import searchutil
+
+        groups = (
+            settings.TRACKER_SEARCH_INDEX
+            and search_term
+            and searchutil.groups_for_fields(
+                self.model, self.get_search_fields(request)
+            )
+        )
+        if not groups:
+            return super().get_search_results(request, queryset, search_term)
+        for term in smart_split(search_term):
+            if term.startswith(('"', "'")) and term[0] == term[-1]:
+                term = unescape_string_literal(term)
+            queryset = queryset.filter(
+                pk__in=searchutil.matching(self.model, term, groups)
+            )
+        return queryset, False
+
 
 def ReadOffsetTokenPair(value):
     toks = value.split('-')
@@ -87,6 +116,23 @@ def ReadOffsetTokenPair(value):
     return feed, params
 
 
+class _Echo:
+    # csv.writer needs a file, this hands each formatted row straight back instead of buffering it
+    def write(self, value):
+        return value
+
+
+def streaming_csv_response(filename, header, rows):
+    """streams `rows` as a CSV attachment, so that large reports never have to be held in memory"""
+    writer = csv.writer(_Echo())
+    response = StreamingHttpResponse(
+        (writer.writerow(row) for row in itertools.chain([header], rows)),
+        content_type='text/csv; charset=utf-8',
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
 def mass_assign_action(self, request, queryset, field, value):
     if not self.has_change_permission(request):
         raise PermissionDenied
@@ -10,6 +10,14 @@ analytics = AnalyticsClient(
         ingest_host=getattr(settings, 'TRACKER_ANALYTICS_INGEST_HOST', ''),
         test_mode=getattr(settings, 'TRACKER_ANALYTICS_TEST_MODE', False),
         no_emit=getattr(settings, 'TRACKER_ANALYTICS_NO_EMIT', True),
+        max_queue_size=getattr(settings, 'TRACKER_ANALYTICS_MAX_QUEUE_SIZE', 0),
+        overflow_policy=getattr(
+            settings, 'TRACKER_ANALYTICS_OVERFLOW_POLICY', 'drop_oldest'
+        ),
+        compress=getattr(settings, 'TRACKER_ANALYTICS_COMPRESS', False),
+        max_retries=getattr(settings, 'TRACKER_ANALYTICS_MAX_RETRIES', 0),
+        timeout=getattr(settings, 'TRACKER_ANALYTICS_TIMEOUT', 10.0),
+        spool_path=getattr(settings, 'TRACKER_ANALYTICS_SPOOL_PATH', None),
     )
 )
 
@@ -1,14 +1,17 @@
 # Adapted from https://github.com/GamesDoneQuick/analytics-packages/blob/0.1.0/analytics.py
 # until that package stabilizes
 import atexit
+import gzip
 import json
 import logging
+import os
+import random
 import time
 import typing as t
 from datetime import date, datetime, timedelta
 from decimal import Decimal
-from queue import Empty, Queue
-from threading import Thread
+from queue import Empty, Full, Queue
+from threading import Lock, Thread
 
 import requests
 
@@ -39,7 +42,25 @@ class AnalyticsClient:
             test_mode: bool = False,
             path: str = '/track',
             test_path: str = '/test',
+            # Maximum number of events waiting to be sent, 0 means unbounded.
+            max_queue_size: int = 0,
+            # What to do with new events when the queue is full, one of
+            # `drop_newest`, `drop_oldest`, or `block` (wait for room).
+            overflow_policy: str = 'drop_oldest',
+            # Compress request bodies with gzip.
+            compress: bool = False,
+            # Number of times a failed batch is retried, with exponential backoff
+            # (plus jitter) starting at `retry_backoff` seconds.
+            max_retries: int = 0,
+            retry_backoff: float = 0.5,
+            timeout: float = 10.0,
+            # When set, batches that could not be sent (and anything still queued
+            # at shutdown) are appended to this file as JSON lines, and re-sent
+            # the next time the consumer starts.
+            spool_path: str = None,
         ):
+            if overflow_policy not in ('drop_newest', 'drop_oldest', 'block'):
+                raise ValueError(f'Unknown overflow policy: {overflow_policy}')
             self.access_key = access_key
             self.ingest_host = ingest_host
             self.max_buffer_size = max_buffer_size
@@ -48,14 +69,22 @@ class AnalyticsClient:
             self.path = path
             self.test_path = test_path
             self.test_mode = test_mode
+            self.max_queue_size = max_queue_size
+            self.overflow_policy = overflow_policy
+            self.compress = compress
+            self.max_retries = max_retries
+            self.retry_backoff = retry_backoff
+            self.timeout = timeout
+            self.spool_path = spool_path
 
             resolved_path = test_path if test_mode else path
             self.ingest_url = f'{ingest_host}{resolved_path}'
 
     def __init__(self, config: Config):
         self.config = config
-        self.queue = Queue(maxsize=0)
-        self.consumer = Consumer(self.config, self.queue)
+        self.queue = Queue(maxsize=config.max_queue_size)
+        self.stats = AnalyticsStats()
+        self.consumer = Consumer(self.config, self.queue, self.stats)
         atexit.register(self.join)
         # Only start the Consumer if we are going to be emitting events.
         if not self.config.no_emit:
@@ -69,7 +98,7 @@ class AnalyticsClient:
         event_content = {'event_name': event_name.value, 'properties': data}
         logger.debug(f'[Analytics Client] Tracked event: {event_content}')
         if not self.config.no_emit:
-            self.queue.put(event_content)
+            self._enqueue(event_content)
 
     def track_generic(self, event_name: str, data: t.Dict[str, t.Any]):
         """
@@ -79,7 +108,35 @@ class AnalyticsClient:
         event_content = {'event_name': event_name, 'properties': data}
         logger.debug(f'[Analytics Client] Tracked event: {event_content}')
         if not self.config.no_emit:
-            self.queue.put(event_content)
+            self._enqueue(event_content)
+
+    def _enqueue(self, event_content):
+        policy = self.config.overflow_policy
+        try:
+            self.queue.put(event_content, block=policy == 'block')
+            self.stats.increment('queued')
+            return
+        except Full:
+            pass
+        if policy == 'drop_oldest':
+            try:
+                self.queue.get_nowait()
+                self.queue.task_done()
+                self.stats.increment('dropped')
+                logger.warning(
+                    '[Analytics Client] Queue is full, dropped the oldest event'
+                )
+            except Empty:
+                pass
+            try:
+                self.queue.put_nowait(event_content)
+                self.stats.increment('queued')
+                return
+            except Full:
+                # another thread refilled the queue in the meantime, so this one is lost too
+                pass
+        self.stats.increment('dropped')
+        logger.warning('[Analytics Client] Queue is full, dropped an event')
 
     def join(self):
         """Allow the consumer thread to gracefully finish before returning."""
@@ -89,6 +146,16 @@ class AnalyticsClient:
         # This can raise if the consumer thread was never started
         except RuntimeError:
             pass
+        # anything that never made it out would otherwise be lost
+        if self.config.spool_path:
+            remaining = []
+            while True:
+                try:
+                    remaining.append(self.queue.get_nowait())
+                    self.queue.task_done()
+                except Empty:
+                    break
+            self.consumer.spool(remaining)
 
     def flush(self):
         """
@@ -100,31 +167,141 @@ class AnalyticsClient:
         logger.debug(f'[Analytics Client] Forcefully flushed {size} events')
 
 
+class AnalyticsStats:
+    """Running counts of what happened to tracked events, safe to read from any thread."""
+
+    FIELDS = ('queued', 'sent', 'rejected', 'dropped', 'spooled', 'retried')
+
+    def __init__(self):
+        self._lock = Lock()
+        self._counts = dict.fromkeys(self.FIELDS, 0)
+
+    def increment(self, field: str, amount: int = 1):
+        with self._lock:
+            self._counts[field] += amount
+
+    def snapshot(self) -> t.Dict[str, int]:
+        with self._lock:
+            return dict(self._counts)
+
+    def __getitem__(self, field: str) -> int:
+        return self.snapshot()[field]
+
+
 class Consumer(Thread):
     logger = logging.getLogger('analytics')
 
-    def __init__(self, config: AnalyticsClient.Config, queue: Queue):
+    def __init__(
+        self,
+        config: AnalyticsClient.Config,
+        queue: Queue,
+        stats: AnalyticsStats = None,
+    ):
         Thread.__init__(self)
         self.config = config
         self.queue = queue
+        self.stats = stats or AnalyticsStats()
         self.daemon = True
         self.running = True
+        # keeps connections to the ingest host alive between batches
+        self.session = requests.Session()
+        self.spool_lock = Lock()
 
     def pause(self):
         self.running = False
 
     def run(self):
+        self._replay_spool()
         while self.running:
             batch = self._get_batch()
 
             try:
-                self.upload(batch)
-            except Exception as e:
-                logger.error(f'[Analytics Consumer] Failed to process events: {e}')
+                self._send(batch)
             finally:
                 for _ in batch:
                     self.queue.task_done()
 
+    def _send(self, batch):
+        """
+        Upload a batch, retrying on failures, and spool or drop it if it still doesn't go through. A batch that is
+        rejected with a 4xx response is neither retried nor spooled.
+        """
+        if not batch:
+            return True
+        for attempt in range(self.config.max_retries + 1):
+            if attempt:
+                self.stats.increment('retried')
+                # full jitter, so that several processes that failed together don't all retry together
+                time.sleep(
+                    random.uniform(0, self.config.retry_backoff * 2 ** (attempt - 1))
+                )
+            try:
+                response = self.upload(batch)
+                if response is None or response.status_code < 400:
+                    self.stats.increment('sent', len(batch))
+                    return True
+                if response.status_code < 500:
+                    # the ingest server refused the batch, sending it again will not change that
+                    logger.error(
+                        f'[Analytics Consumer] Events were rejected: {response.status_code}'
+                    )
+                    self.stats.increment('rejected', len(batch))
+                    return False
+                response.raise_for_status()
+            except Exception as e:
+                logger.error(f'[Analytics Consumer] Failed to process events: {e}')
+        if self.config.spool_path:
+            self.spool(batch)
+        else:
+            self.stats.increment('dropped', len(batch))
+        return False
+
+    def spool(self, events):
+        """Append events to the spool file, so they can be re-sent later."""
+        if not events:
+            return
+        try:
+            with (
+                self.spool_lock,
+                open(self.config.spool_path, 'a', encoding='utf-8') as spool,
+            ):
+                spool.writelines(
+                    json.dumps(event, cls=AnalyticsJSONEncoder) + '\n'
+                    for event in events
+                )
+            self.stats.increment('spooled', len(events))
+        except OSError as e:
+            logger.error(f'[Analytics Consumer] Failed to spool events: {e}')
+            self.stats.increment('dropped', len(events))
+
+    def _replay_spool(self):
+        path = self.config.spool_path
+        if not path:
+            return
+        # moving the file first means that a failed replay appends to a fresh spool
+        # instead of the one being read, and that only one process picks it up
+        replay_path = f'{path}.replay'
+        try:
+            with self.spool_lock:
+                os.replace(path, replay_path)
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            logger.error(f'[Analytics Consumer] Failed to replay spool: {e}')
+            return
+        with open(replay_path, encoding='utf-8') as spool:
+            events = []
+            for line in spool:
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    # most likely a partial write from a crash
+                    continue
+        size = self.config.max_buffer_size
+        for i in range(0, len(events), size):
+            self._send(events[i : i + size])
+        os.remove(replay_path)
+
     def _get_batch(self):
         start = time.monotonic()
         events = []
@@ -152,10 +329,16 @@ class Consumer(Thread):
         if self.config.access_key is not None:
             headers['x-analytics-key'] = self.config.access_key
 
-        return requests.post(
+        data = json.dumps(events, cls=AnalyticsJSONEncoder).encode('utf-8')
+        if self.config.compress:
+            data = gzip.compress(data)
+            headers['Content-Encoding'] = 'gzip'
+
+        return self.session.post(
             self.config.ingest_url,
-            data=json.dumps(events, cls=AnalyticsJSONEncoder),
+            data=data,
             headers=headers,
+            timeout=self.config.timeout,
         )
 
 
@@ -24,3 +24,4 @@ class AnalyticsEventTypes(str, enum.Enum):
     DONATION_GROUP_CREATED = 'donation_group_created'
     DONATION_GROUP_DELETED = 'donation_group_deleted'
     REQUEST_SERVED = 'request_served'
+    REQUEST_PROFILED = 'request_profiled'
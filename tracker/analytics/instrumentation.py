@@ -0,0 +1,230 @@
+"""
+Per-request cost accounting: how many SQL queries a request made, how long they took, how long was spent serializing
+API responses, and how the tracker's own cache lookups went. Queries are counted with an execute wrapper on every
+database connection, so the ones made by signal cascades (e.g. `Donation.save`) are included too.
+
+`InstrumentationMiddleware` (see `tracker.analytics.middleware`) records every request, reports it through the
+analytics client, optionally adds a `Server-Timing` header, checks the view's budget, and keeps running totals per
+view for the `report_slow_views` command. `recording` can also be used directly, e.g. in tests or benchmarks.
+"""
+
+import contextlib
+import contextvars
+import dataclasses
+import logging
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import connections
+
+from tracker import settings
+
+logger = logging.getLogger(__name__)
+
+BUDGET_FIELDS = ('queries', 'db_time')
+
+_current = contextvars.ContextVar('tracker_request_stats', default=None)
+
+
+class BudgetExceeded(AssertionError):
+    pass
+
+
+@dataclasses.dataclass
+class RequestStats:
+    queries: int = 0
+    # all times are in seconds
+    db_time: float = 0
+    serializer_time: float = 0
+    cache_hits: int = 0
+    cache_misses: int = 0
+    _timing: set = dataclasses.field(default_factory=set, repr=False)
+
+    def as_dict(self):
+        return {
+            f.name: getattr(self, f.name)
+            for f in dataclasses.fields(self)
+            if not f.name.startswith('_')
+        }
+
+
+class _QueryTimer:
+    def __init__(self, stats):
+        self.stats = stats
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.stats.db_time += time.perf_counter() - start
+            self.stats.queries += 1
+
+
+def current():
+    """the stats being recorded for the current request, or None"""
+    return _current.get()
+
+
+@contextlib.contextmanager
+def recording():
+    """records every query made on any database connection in this thread while inside the block"""
+    stats = RequestStats()
+    token = _current.set(stats)
+    try:
+        with contextlib.ExitStack() as stack:
+            timer = _QueryTimer(stats)
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(timer))
+            yield stats
+    finally:
+        _current.reset(token)
+
+
+@contextlib.contextmanager
+def timing(field):
+    """adds the time spent in the block to `field`, nested blocks for the same field are only counted once"""
+    stats = _current.get()
+    if stats is None or field in stats._timing:
+        yield
+        return
+    stats._timing.add(field)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        setattr(stats, field, getattr(stats, field) + time.perf_counter() - start)
+        stats._timing.discard(field)
+
+
+def cache_lookup(hit):
+    """counts a lookup in the tracker's cache against the current request, if any"""
+    stats = _current.get()
+    if stats is not None:
+        if hit:
+            stats.cache_hits += 1
+        else:
+            stats.cache_misses += 1
+
+
+def server_timing(stats, duration):
+    """formats the stats as a `Server-Timing` header value, durations are in milliseconds"""
+    return ', '.join(
+        [
+            f'db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} queries"',
+            f'serializer;dur={stats.serializer_time * 1000:.1f}',
+            f'cache;desc="{stats.cache_hits} hits, {stats.cache_misses} misses"',
+            f'total;dur={duration * 1000:.1f}',
+        ]
+    )
+
+
+def query_budget(*, queries=None, db_time=None):
+    """
+    declares the most queries, and/or seconds of database time, that a view should need for a single request, works
+    on view functions and on view classes (including viewsets)
+
+    `TRACKER_QUERY_BUDGETS` takes precedence, so that budgets can be tuned per deployment
+    """
+    budget = {
+        k: v for k, v in (('queries', queries), ('db_time', db_time)) if v is not None
+    }
+
+    def decorator(view):
+        view.query_budget = budget
+        return view
+
+    return decorator
+
+
+def get_budget(view_name, view_func=None):
+    budget = settings.TRACKER_QUERY_BUDGETS.get(view_name, None)
+    if budget is None and view_func is not None:
+        budget = getattr(view_func, 'query_budget', None) or getattr(
+            getattr(view_func, 'cls', None), 'query_budget', None
+        )
+    return budget
+
+
+def check_budget(view_name, stats, budget):
+    """logs a warning if the stats go over the budget, or raises `BudgetExceeded` if budgets are strict"""
+    over = [
+        f'{field} {getattr(stats, field):g} > {budget[field]:g}'
+        for field in BUDGET_FIELDS
+        if field in budget and getattr(stats, field) > budget[field]
+    ]
+    if over:
+        message = f'{view_name} went over its query budget: {", ".join(over)}'
+        if settings.TRACKER_QUERY_BUDGETS_STRICT:
+            raise BudgetExceeded(message)
+        logger.warning(message)
+
+
+# running totals per view, kept in the cache so that every worker process contributes, the read-modify-write means
+#  that concurrent flushes can drop a few samples, which is fine for finding the worst offenders
+REPORT_KEY = 'tracker:instrumentation:views'
+FLUSH_INTERVAL = 10
+
+_pending = {}
+_lock = threading.Lock()
+_last_flush = time.monotonic()
+
+
+def _merge(totals, sample):
+    if totals is None:
+        return dict(sample)
+    merged = {}
+    for key, value in sample.items():
+        if key.startswith('max_'):
+            merged[key] = max(totals.get(key, 0), value)
+        else:
+            merged[key] = totals.get(key, 0) + value
+    return merged
+
+
+def collect(view_name, stats, duration):
+    """adds the request to the running totals for the view, and flushes them to the cache every so often"""
+    global _last_flush
+    sample = {
+        'requests': 1,
+        'queries': stats.queries,
+        'max_queries': stats.queries,
+        'db_time': stats.db_time,
+        'max_db_time': stats.db_time,
+        'serializer_time': stats.serializer_time,
+        'duration': duration,
+        'max_duration': duration,
+        'cache_hits': stats.cache_hits,
+        'cache_misses': stats.cache_misses,
+    }
+    with _lock:
+        _pending[view_name] = _merge(_pending.get(view_name), sample)
+        due = time.monotonic() - _last_flush >= FLUSH_INTERVAL
+        if due:
+            _last_flush = time.monotonic()
+    if due:
+        flush()
+
+
+def flush():
+    with _lock:
+        pending = dict(_pending)
+        _pending.clear()
+    if pending:
+        totals = cache.get(REPORT_KEY) or {}
+        for view_name, sample in pending.items():
+            totals[view_name] = _merge(totals.get(view_name), sample)
+        cache.set(REPORT_KEY, totals, None)
+
+
+def report():
+    """the running totals for every view, including anything this process has not flushed yet"""
+    flush()
+    return cache.get(REPORT_KEY) or {}
+
+
+def reset():
+    with _lock:
+        _pending.clear()
+    cache.delete(REPORT_KEY)
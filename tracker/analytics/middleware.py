@@ -1,7 +1,9 @@
 import asyncio
+import time
 from datetime import datetime
 
-from tracker.analytics import AnalyticsEventTypes, analytics
+from tracker import settings
+from tracker.analytics import AnalyticsEventTypes, analytics, instrumentation
 
 
 def AnalyticsMiddleware(get_response):
@@ -45,3 +47,50 @@ def AnalyticsMiddleware(get_response):
 # to use the decorator once Django 2.2 support is dropped.
 AnalyticsMiddleware.async_capable = True
 AnalyticsMiddleware.sync_capable = True
+
+
+class InstrumentationMiddleware:
+    """
+    records the query count, database time, serializer time, and cache lookups of every request, and reports them
+    through the analytics client, see `tracker.analytics.instrumentation`
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._tracker_view_func = view_func
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        with instrumentation.recording() as stats:
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else None
+        if view_name:
+            budget = instrumentation.get_budget(
+                view_name, getattr(request, '_tracker_view_func', None)
+            )
+            if budget:
+                instrumentation.check_budget(view_name, stats, budget)
+            instrumentation.collect(view_name, stats, duration)
+
+        analytics.track(
+            AnalyticsEventTypes.REQUEST_PROFILED,
+            {
+                'timestamp': datetime.utcnow(),
+                'view': view_name,
+                'path': request.path,
+                'method': request.method,
+                'status_code': response.status_code,
+                'duration': duration,
+                **stats.as_dict(),
+            },
+        )
+
+        if settings.TRACKER_SERVER_TIMING:
+            response['Server-Timing'] = instrumentation.server_timing(stats, duration)
+
+        return response
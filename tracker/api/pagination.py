@@ -1,12 +1,33 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
 from rest_framework.exceptions import ParseError
 from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 from tracker import settings
 
 
 class TrackerPagination(LimitOffsetPagination):
+    """
+    limit/offset pagination by default, but views that define `cursor_ordering` (a tuple of field names, optionally
+    prefixed with `-`, that ends in a unique field) also support keyset pagination, opted into by passing a `cursor`
+    parameter (empty for the first page), and then following the `next` links
+
+    with a cursor, each page is a single indexed range scan no matter how deep it is, and passing `no_count` skips the
+    `COUNT(*)` as well, which is usually the most expensive part of a deep crawl
+    """
+
     default_limit = settings.TRACKER_PAGINATION_LIMIT
     max_limit = settings.TRACKER_PAGINATION_LIMIT
+    cursor_query_param = 'cursor'
+    no_count_query_param = 'no_count'
+
+    cursor_ordering = None
 
     def get_limit(self, request):
         # TIP: if you ONLY need a count, pass limit=0 as a query parameter
@@ -30,3 +51,118 @@ class TrackerPagination(LimitOffsetPagination):
         if offset < 0:
             raise ParseError('Malformed offset parameter')
         return offset
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param not in request.query_params:
+            self.cursor_ordering = None
+            return super().paginate_queryset(queryset, request, view)
+
+        self.cursor_ordering = getattr(view, 'cursor_ordering', None)
+        if not self.cursor_ordering:
+            raise ParseError('Cursor pagination is not supported for this endpoint')
+        self.request = request
+        self.limit = self.get_limit(request)
+        if self.limit == 0 or self.no_count_query_param not in request.query_params:
+            self.count = self.get_count(queryset)
+        else:
+            self.count = None
+        if self.limit == 0:
+            self.next_position = None
+            return []
+
+        queryset = queryset.order_by(*self._order_by())
+        position = self._decode_cursor(
+            request.query_params[self.cursor_query_param], queryset.model
+        )
+        if position is not None:
+            queryset = queryset.filter(self._after(position))
+        # one extra row tells us whether there is another page, without counting
+        results = list(queryset[: self.limit + 1])
+        if len(results) > self.limit:
+            results = results[: self.limit]
+            self.next_position = [
+                getattr(results[-1], field.lstrip('-'))
+                for field in self.cursor_ordering
+            ]
+        else:
+            self.next_position = None
+        return results
+
+    def get_paginated_response(self, data):
+        if not self.cursor_ordering:
+            return super().get_paginated_response(data)
+        response = {}
+        if self.count is not None:
+            response['count'] = self.count
+        response['next'] = self.get_next_link()
+        response['results'] = data
+        return Response(response)
+
+    def get_next_link(self):
+        if not self.cursor_ordering:
+            return super().get_next_link()
+        if self.next_position is None:
+            return None
+        url = remove_query_param(
+            self.request.build_absolute_uri(), self.offset_query_param
+        )
+        return replace_query_param(
+            url, self.cursor_query_param, self._encode_cursor(self.next_position)
+        )
+
+    def _order_by(self):
+        # nulls sort as the largest value in either direction, so that the comparisons in `_after` are well-defined
+        return [
+            (
+                F(field[1:]).desc(nulls_first=True)
+                if field.startswith('-')
+                else F(field).asc(nulls_last=True)
+            )
+            for field in self.cursor_ordering
+        ]
+
+    def _after(self, position):
+        """builds the filter for every row that sorts strictly after `position`"""
+        condition = Q(pk__in=[])
+        equal = Q()
+        for field, value in zip(self.cursor_ordering, position):
+            descending = field.startswith('-')
+            name = field.lstrip('-')
+            if value is None:
+                after = Q(**{f'{name}__isnull': False}) if descending else Q(pk__in=[])
+                same = Q(**{f'{name}__isnull': True})
+            else:
+                after = Q(**{f'{name}__lt' if descending else f'{name}__gt': value})
+                if not descending:
+                    after |= Q(**{f'{name}__isnull': True})
+                same = Q(**{name: value})
+            condition |= equal & after
+            equal &= same
+        return condition
+
+    def _encode_cursor(self, position):
+        return (
+            base64.urlsafe_b64encode(json.dumps(position, default=str).encode())
+            .decode()
+            .rstrip('=')
+        )
+
+    def _decode_cursor(self, cursor, model):
+        if not cursor:
+            return None
+        try:
+            position = json.loads(
+                base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            )
+            if not isinstance(position, list) or len(position) != len(
+                self.cursor_ordering
+            ):
+                raise ValueError
+            return [
+                None if value is None else model._meta.get_field(field).to_python(value)
+                for field, value in zip(
+                    (f.lstrip('-') for f in self.cursor_ordering), position
+                )
+            ]
+        except (binascii.Error, ValueError, TypeError, ValidationError):
+            raise ParseError('Malformed cursor parameter')
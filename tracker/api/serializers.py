@@ -23,6 +23,7 @@ from rest_framework.utils import model_meta
 from rest_framework.utils.model_meta import FieldInfo
 from rest_framework.validators import UniqueTogetherValidator
 
+from tracker.analytics import instrumentation
 from tracker.api import messages
 from tracker.models import Prize, Tag
 from tracker.models.bid import Bid, DonationBid
@@ -138,7 +139,8 @@ class EnsureSerializableMixin:
             return data
 
     def to_representation(self, instance):
-        return self._ensure_serializable(super().to_representation(instance))
+        with instrumentation.timing('serializer_time'):
+            return self._ensure_serializable(super().to_representation(instance))
 
 
 class TrackerModelSerializer(EnsureSerializableMixin, serializers.ModelSerializer):
@@ -39,6 +39,7 @@ class BidViewSet(
     queryset = Bid.objects.all()
     serializer_class = BidSerializer
     pagination_class = TrackerPagination
+    cursor_ordering = ('id',)
     permission_classes = [BidFeedPermission, BidStatePermission]
     filter_backends = [BidFilter]
 
@@ -31,7 +31,7 @@ from rest_framework.response import Response
 from rest_framework.serializers import Serializer, as_serializer_error
 from rest_framework.viewsets import GenericViewSet
 
-from tracker import settings
+from tracker import bidutil, settings
 from tracker.api.serializers import DonationSerializer, EnsureSerializableMixin
 from tracker.compat import reverse
 from tracker.models import Bid, Donation, Event
@@ -346,27 +346,28 @@ class DonateViewSet(GenericViewSet):
                 Bid.objects.filter(
                     id__in=(b['parent'] for b in data['bids'] if 'parent' in b)
                 ).select_for_update()
-                for bid_data in data['bids']:
-                    if 'id' in bid_data:
-                        bid = Bid.objects.get(id=bid_data['id'])
-                    else:
-                        try:
-                            bid = Bid.objects.get(
-                                parent_id=bid_data['parent'],
-                                name__iexact=bid_data['name'],
-                            )
-                        except Bid.DoesNotExist:
-                            bid = Bid.objects.create(
-                                parent_id=bid_data['parent'],
-                                name=bid_data['name'],
-                                state='PENDING',
-                                istarget=True,
-                            )
-                            bid.full_clean()
-                    donation.bids.create(
-                        bid=bid,
-                        amount=_trim(bid_data['amount']),
-                    )
+                with bidutil.deferred_recompute():
+                    for bid_data in data['bids']:
+                        if 'id' in bid_data:
+                            bid = Bid.objects.get(id=bid_data['id'])
+                        else:
+                            try:
+                                bid = Bid.objects.get(
+                                    parent_id=bid_data['parent'],
+                                    name__iexact=bid_data['name'],
+                                )
+                            except Bid.DoesNotExist:
+                                bid = Bid.objects.create(
+                                    parent_id=bid_data['parent'],
+                                    name=bid_data['name'],
+                                    state='PENDING',
+                                    istarget=True,
+                                )
+                                bid.full_clean()
+                        donation.bids.create(
+                            bid=bid,
+                            amount=_trim(bid_data['amount']),
+                        )
                 donation.full_clean()
                 donation.refresh_from_db()  # ensure all values are as they'd be when fetched fresh
             return donation
@@ -1,11 +1,13 @@
 import enum
 from contextlib import contextmanager
 
+from django.db import transaction
+from django.db.models import Count
 from rest_framework.decorators import action
 from rest_framework.exceptions import ErrorDetail, ValidationError
 from rest_framework.response import Response
 
-from tracker import logutil
+from tracker import logutil, settings
 from tracker.analytics import AnalyticsEventTypes, analytics
 from tracker.api.filters import DonationFilter
 from tracker.api.pagination import TrackerPagination
@@ -21,7 +23,10 @@ from tracker.api.views import (
     WithSerializerPermissionsMixin,
 )
 from tracker.api.views.donation_bids import DonationBidViewSet
-from tracker.consumers.processing import broadcast_donation_processing_action
+from tracker.consumers.processing import (
+    broadcast_donation_processing_action,
+    broadcast_donation_processing_actions,
+)
 from tracker.models import Donation, DonationGroup
 
 CanViewComments = tracker_permission('tracker.view_comments')
@@ -71,13 +76,65 @@ DONATION_ACTION_ANALYTICS_EVENTS = {
 }
 
 
+DONATION_ACTION_STATES = {
+    DonationProcessingActionTypes.UNPROCESSED: {
+        'commentstate': 'PENDING',
+        'readstate': 'PENDING',
+    },
+    DonationProcessingActionTypes.APPROVED: {
+        'commentstate': 'APPROVED',
+        'readstate': 'IGNORED',
+    },
+    DonationProcessingActionTypes.DENIED: {
+        'commentstate': 'DENIED',
+        'readstate': 'IGNORED',
+    },
+    DonationProcessingActionTypes.FLAGGED: {
+        'commentstate': 'APPROVED',
+        'readstate': 'FLAGGED',
+    },
+    DonationProcessingActionTypes.SENT_TO_READER: {
+        'commentstate': 'APPROVED',
+        'readstate': 'READY',
+    },
+    DonationProcessingActionTypes.PINNED: {'pinned': True},
+    DonationProcessingActionTypes.UNPINNED: {'pinned': False},
+    DonationProcessingActionTypes.READ: {
+        'commentstate': 'APPROVED',
+        'readstate': 'READ',
+    },
+    DonationProcessingActionTypes.IGNORED: {
+        'commentstate': 'APPROVED',
+        'readstate': 'IGNORED',
+    },
+}
+
+# the names of the single donation endpoints, which are also what the batch endpoint accepts
+DONATION_BATCH_ACTIONS = {
+    'unprocess': DonationProcessingActionTypes.UNPROCESSED,
+    'approve_comment': DonationProcessingActionTypes.APPROVED,
+    'deny_comment': DonationProcessingActionTypes.DENIED,
+    'flag': DonationProcessingActionTypes.FLAGGED,
+    'send_to_reader': DonationProcessingActionTypes.SENT_TO_READER,
+    'pin': DonationProcessingActionTypes.PINNED,
+    'unpin': DonationProcessingActionTypes.UNPINNED,
+    'read': DonationProcessingActionTypes.READ,
+    'ignore': DonationProcessingActionTypes.IGNORED,
+}
+
+
 def _get_donation_analytics_fields(donation: Donation):
     return {
         'event_id': donation.event.id,
         'donation_id': donation.id,
         'amount': donation.amount,
         'is_anonymous': donation.anonymous(),
-        'num_bids': donation.bids.count(),
+        # batches annotate the count up front, rather than counting for every donation
+        'num_bids': (
+            donation.num_bids
+            if hasattr(donation, 'num_bids')
+            else donation.bids.count()
+        ),
         'currency': donation.currency,
         'comment': donation.comment,
         'comment_language': donation.commentlanguage,
@@ -123,12 +180,15 @@ class DonationViewSet(
     filter_backends = [DonationFilter]
     permission_classes = [DonationQueryPermission]
     pagination_class = TrackerPagination
+    cursor_ordering = ('-timereceived', '-id')
 
     # TODO: draft events shouldn't ever really HAVE donations, but not sure if this is worth enforcing or testing
 
     @contextmanager
     def change_donation(self, action):
         donation = self.get_object()
+        for field, value in DONATION_ACTION_STATES.get(action, {}).items():
+            setattr(donation, field, value)
         yield donation
         donation.save()
         _track_donation_processing_event(
@@ -236,8 +296,6 @@ class DonationViewSet(
         with self.change_donation(
             action=DonationProcessingActionTypes.UNPROCESSED
         ) as donation:
-            donation.commentstate = 'PENDING'
-            donation.readstate = 'PENDING'
             data = self.get_serializer(
                 donation, all_comments=True, mod_comments=True, groups=True
             ).data
@@ -253,8 +311,6 @@ class DonationViewSet(
         with self.change_donation(
             action=DonationProcessingActionTypes.APPROVED
         ) as donation:
-            donation.commentstate = 'APPROVED'
-            donation.readstate = 'IGNORED'
             data = self.get_serializer(donation, mod_comments=True, groups=True).data
 
         return Response(data)
@@ -267,8 +323,6 @@ class DonationViewSet(
         with self.change_donation(
             action=DonationProcessingActionTypes.DENIED
         ) as donation:
-            donation.commentstate = 'DENIED'
-            donation.readstate = 'IGNORED'
             data = self.get_serializer(
                 donation, all_comments=True, mod_comments=True, groups=True
             ).data
@@ -289,8 +343,6 @@ class DonationViewSet(
         with self.change_donation(
             action=DonationProcessingActionTypes.FLAGGED
         ) as donation:
-            donation.commentstate = 'APPROVED'
-            donation.readstate = 'FLAGGED'
             data = self.get_serializer(donation, mod_comments=True, groups=True).data
 
         return Response(data)
@@ -307,8 +359,6 @@ class DonationViewSet(
         with self.change_donation(
             action=DonationProcessingActionTypes.SENT_TO_READER
         ) as donation:
-            donation.commentstate = 'APPROVED'
-            donation.readstate = 'READY'
             data = self.get_serializer(donation, mod_comments=True, groups=True).data
 
         return Response(data)
@@ -321,7 +371,6 @@ class DonationViewSet(
         with self.change_donation(
             action=DonationProcessingActionTypes.PINNED
         ) as donation:
-            donation.pinned = True
             data = self.get_serializer(donation, mod_comments=True, groups=True).data
 
         return Response(data)
@@ -334,7 +383,6 @@ class DonationViewSet(
         with self.change_donation(
             action=DonationProcessingActionTypes.UNPINNED
         ) as donation:
-            donation.pinned = False
             data = self.get_serializer(donation, mod_comments=True, groups=True).data
 
         return Response(data)
@@ -347,8 +395,6 @@ class DonationViewSet(
         with self.change_donation(
             action=DonationProcessingActionTypes.READ
         ) as donation:
-            donation.readstate = 'READ'
-            donation.commentstate = 'APPROVED'
             data = self.get_serializer(donation, mod_comments=True, groups=True).data
 
         return Response(data)
@@ -361,12 +407,134 @@ class DonationViewSet(
         with self.change_donation(
             action=DonationProcessingActionTypes.IGNORED
         ) as donation:
-            donation.readstate = 'IGNORED'
-            donation.commentstate = 'APPROVED'
             data = self.get_serializer(donation, mod_comments=True, groups=True).data
 
         return Response(data)
 
+    @action(detail=False, methods=['patch'])
+    def process(self, request, *args, **kwargs):
+        """
+        Apply several processing actions at once, e.g. when clearing out a backlog. Takes a list of
+        `{"id": <donation id>, "action": <action>}` objects, where each action is the name of one of the single
+        donation endpoints above (`approve_comment`, `deny_comment`, `flag`, `send_to_reader`, `pin`, `unpin`, `read`,
+        `ignore`, or `unprocess`). The actions are applied in order, in a single transaction, so either all of them
+        succeed or none of them do. Returns the changed donations.
+        """
+        changes = self._parse_batch(request.data)
+        donations = (
+            self.get_queryset()
+            .select_related('event')
+            .annotate(num_bids=Count('bids', distinct=True))
+            .in_bulk({pk for pk, action_type in changes})
+        )
+        errors = []
+        for pk, action_type in changes:
+            donation = donations.get(pk, None)
+            if donation is None:
+                errors.append({'id': [ErrorDetail('Donation not found.', 'not_found')]})
+                continue
+            self.check_object_permissions(request, donation)
+            if action_type == DonationProcessingActionTypes.SENT_TO_READER and not (
+                CanSendToReader().has_object_permission(request, self, donation)
+            ):
+                self.permission_denied(
+                    request, CanSendToReader.message, CanSendToReader.code
+                )
+            if (
+                action_type == DonationProcessingActionTypes.FLAGGED
+                and donation.event.screening_mode != 'two_pass'
+            ):
+                errors.append(
+                    {
+                        'action': [
+                            ErrorDetail(
+                                'Event is not using two pass screening, this action should not be used',
+                                'invalid',
+                            )
+                        ]
+                    }
+                )
+                continue
+            errors.append({})
+        if any(errors):
+            raise ValidationError(errors)
+
+        changed = []
+        for pk, action_type in changes:
+            donation = donations[pk]
+            for field, value in DONATION_ACTION_STATES[action_type].items():
+                setattr(donation, field, value)
+            donation.normalize_states()
+            changed.append((donation, action_type))
+        donations = list({donation.pk: donation for donation, _ in changed}.values())
+
+        with transaction.atomic():
+            Donation.objects.bulk_update(
+                donations, ['commentstate', 'readstate', 'pinned']
+            )
+            logutil.change_many(
+                request,
+                [
+                    (donation, DONATION_CHANGE_LOG_MESSAGES[action_type])
+                    for donation, action_type in changed
+                ],
+            )
+
+        for donation, action_type in changed:
+            analytics.track(
+                DONATION_ACTION_ANALYTICS_EVENTS[action_type],
+                {
+                    **_get_donation_analytics_fields(donation),
+                    'user_id': request.user.pk,
+                },
+            )
+        broadcast_donation_processing_actions(request.user, changed)
+
+        return Response(
+            self.get_serializer(
+                donations, many=True, all_comments=True, mod_comments=True, groups=True
+            ).data
+        )
+
+    def _parse_batch(self, data):
+        if not isinstance(data, list) or not data:
+            raise ValidationError(
+                'Expected a non-empty list of `{"id": ..., "action": ...}` objects'
+            )
+        if len(data) > settings.TRACKER_PAGINATION_LIMIT:
+            raise ValidationError(
+                f'Too many actions, limit is {settings.TRACKER_PAGINATION_LIMIT}'
+            )
+        changes = []
+        errors = []
+        for item in data:
+            error = {}
+            if not isinstance(item, dict):
+                errors.append(
+                    {
+                        'non_field_errors': [
+                            ErrorDetail('Expected an object.', 'invalid')
+                        ]
+                    }
+                )
+                continue
+            pk = item.get('id', None)
+            if isinstance(pk, bool) or not isinstance(pk, int):
+                error['id'] = [ErrorDetail('A valid integer is required.', 'invalid')]
+            action_type = DONATION_BATCH_ACTIONS.get(item.get('action', None), None)
+            if action_type is None:
+                error['action'] = [
+                    ErrorDetail(
+                        f'Expected one of: {", ".join(DONATION_BATCH_ACTIONS)}',
+                        'invalid_choice',
+                    )
+                ]
+            errors.append(error)
+            changes.append((pk, action_type))
+        if any(errors):
+            raise ValidationError(errors)
+        return changes
+
     @action(detail=True, methods=['patch'])
     def comment(self, request, pk):
         """
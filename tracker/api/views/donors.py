@@ -1,5 +1,6 @@
 from django.db.models import Prefetch
 
+from tracker import participationutil, settings
 from tracker.api.pagination import TrackerPagination
 from tracker.api.permissions import tracker_permission
 from tracker.api.serializers import DonorSerializer
@@ -10,6 +11,7 @@ from tracker.models import Donor, DonorCache
 class DonorViewSet(EventNestedMixin, TrackerReadViewSet):
     queryset = Donor.objects.all()
     pagination_class = TrackerPagination
+    cursor_ordering = ('id',)
     permission_classes = [tracker_permission('tracker.view_donor')]
     serializer_class = DonorSerializer
 
@@ -45,7 +47,9 @@ class DonorViewSet(EventNestedMixin, TrackerReadViewSet):
         return super().get_serializer(*args, **kwargs)
 
     def get_event_filter(self, queryset, event):
-        if event:
+        if event and settings.TRACKER_PARTICIPATION_INDEX:
+            queryset = queryset.filter(id__in=participationutil.donors_in_event(event))
+        elif event:
             queryset = queryset.filter(
                 id__in=(
                     d['id']
@@ -30,6 +30,7 @@ class PrizeViewSet(
     ]
     filter_backends = [PrizeFilter]
     pagination_class = TrackerPagination
+    cursor_ordering = ('id',)
 
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -1,4 +1,3 @@
-import datetime
 import math
 
 from django.core.exceptions import ValidationError as DjangoValidationError
@@ -8,7 +7,7 @@ from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
 from rest_framework.serializers import as_serializer_error
 
-from tracker import logutil
+from tracker import logutil, scheduleutil
 from tracker.api import messages
 from tracker.api.pagination import TrackerPagination
 from tracker.api.permissions import PrivateGenericPermissions, TechNotesPermission
@@ -35,6 +34,7 @@ class SpeedRunViewSet(
     )
     serializer_class = SpeedRunSerializer
     pagination_class = TrackerPagination
+    cursor_ordering = ('event_id', 'order', 'id')
     permission_classes = [
         TechNotesPermission,
         *PrivateGenericPermissions('speedrun', lambda r: r.order is not None),
@@ -155,184 +155,41 @@ class SpeedRunViewSet(
             )
 
         try:
-            with transaction.atomic():
+            # the prize windows are brought up to date after the commit, so that the runs are not locked for it
+            with (
+                transaction.atomic(),
+                scheduleutil.deferred_prize_windows(on_commit=True),
+            ):
                 # pessimistic, but this endpoint should not get hit very often, so it's probably ok
-                # need to actually evaluate it, or it won't lock the rows
-                if not queryset.select_for_update().count():
-                    raise ValidationError('nonsense')
-
-                # - every run within the range will have its order field changed
-                # - if we cross an anchor boundary, every run between the new position and the next anchor
-                #   (or the end of the event) will adjust its time, and any flex blocks need to be
-                #   recalculated
-                # - if we cross an anchor boundary going forwards, and every run between the old position
-                #   and the crossed anchor will also adjust
-                # - if we cross an anchor boundary going backwards, every run between the old end point
-                #   and the next anchor (or the end of the event) will also adjust its time
-                # - edge case: moving a flex block needs to ensure the new flex blocks get adjusted
-                checkpoints = set()
-
-                time_diff = datetime.timedelta(milliseconds=moving.total_time_ms)
-
-                if moving.order is None:  # adding an unordered run
-                    reordered_runs = forward_runs = queryset.filter(order__gte=order)
-                    order_diff = 1
-                    if first_anchor := next(
-                        (r for r in reordered_runs if r.anchor_time is not None), None
-                    ):
-                        forward_runs = queryset.filter(
-                            order__gte=order, order__lt=first_anchor.order
-                        )
-                        checkpoints.add(forward_runs.last())
-                    if slot := reordered_runs.first():
-                        moving.starttime = slot.starttime
-                    elif slot := queryset.last():  # end of the event
-                        moving.starttime = slot.endtime
-                    else:
-                        moving.starttime = moving.event.datetime
-                    backward_runs = queryset.none()
-                elif order is None:  # removing an ordered run
-                    reordered_runs = backward_runs = queryset.filter(
-                        order__gt=moving.order
-                    )
-                    order_diff = -1
-                    if first_anchor := next(
-                        (r for r in reordered_runs if r.anchor_time is not None), None
-                    ):
-                        # see edge case comment above
-                        if first_anchor.order == moving.order + 1:
-                            checkpoints.add(
-                                queryset.filter(order=moving.order - 1).first()
-                            )
-                        else:
-                            backward_runs = queryset.filter(
-                                order__gt=moving.order, order__lt=first_anchor.order
-                            )
-                            checkpoints.add(backward_runs.last())
-                    forward_runs = queryset.none()
-                elif moving.order < order:  # moving a run forward
-                    reordered_runs = queryset.filter(
-                        order__gt=moving.order, order__lte=order
-                    )
-                    order_diff = -1
-                    if first_anchor := next(
-                        (r for r in reordered_runs if r.anchor_time is not None), None
-                    ):
-                        # see edge case comment above
-                        if first_anchor.order == moving.order + 1:
-                            backward_runs = queryset.none()
-                            checkpoints.add(
-                                queryset.filter(order=moving.order - 1).first()
-                            )
-                        else:
-                            backward_runs = queryset.filter(
-                                order__gt=moving.order, order__lt=first_anchor.order
-                            )
-                            checkpoints.add(backward_runs.last())
-                        forward_runs = queryset.filter(order__gt=order)
-                        if next_anchor := forward_runs.exclude(
-                            anchor_time=None
-                        ).first():
-                            forward_runs = forward_runs.filter(
-                                order__lt=next_anchor.order
-                            )
-                            checkpoints.add(forward_runs.last())
-                    else:
-                        backward_runs = reordered_runs
-                        forward_runs = queryset.none()
-                    moving.starttime = reordered_runs.last().endtime
-                    # if we didn't cross an anchor boundary the moving run needs to be offset by the hole
-                    #  it's leaving behind
-                    if first_anchor is None:
-                        moving.starttime -= time_diff
-                else:  # moving.order > order, moving a run backward
-                    reordered_runs = queryset.filter(
-                        order__gte=order, order__lt=moving.order
-                    )
-                    order_diff = 1
-                    forward_runs = reordered_runs
-                    # different edge case here: if a flex block is moved backward, need to explicitly mark the
-                    #  preceding run as a flex block, even though the anchor doesn't otherwise change
-                    if (
-                        queryset.filter(order=moving.order + 1)
-                        .exclude(anchor_time=None)
-                        .exists()
-                    ):
-                        checkpoints.add(forward_runs.last())
-                    if first_anchor := next(
-                        (r for r in reordered_runs if r.anchor_time is not None), None
-                    ):
-                        forward_runs = reordered_runs.filter(
-                            order__lt=first_anchor.order, anchor_time=None
-                        )
-                        checkpoints.add(forward_runs.last())
-                        backward_runs = queryset.filter(order__gt=moving.order)
-                        if next_anchor := backward_runs.exclude(
-                            anchor_time=None
-                        ).first():
-                            backward_runs = backward_runs.filter(
-                                order__lt=next_anchor.order
-                            )
-                            checkpoints.add(backward_runs.last())
-                    else:
-                        backward_runs = queryset.none()
-                    moving.starttime = reordered_runs.first().starttime
-                changed = (
-                    set(reordered_runs)
-                    | set(forward_runs)
-                    | set(backward_runs)
-                    | set((c for c in checkpoints if c is not None))
-                )
-                changed.add(moving)
-                # ensure we're working with the object from the set and not a copy
-                moving = next(r for r in changed if r.id == moving.id)
-                reordered_runs = {r for r in changed if r in reordered_runs}
-                forward_runs = {r for r in changed if r in forward_runs}
-                backward_runs = {r for r in changed if r in backward_runs}
-                checkpoints = {r for r in changed if r in checkpoints}
-
-                for run in reordered_runs:
-                    run.order += order_diff
-                for run in backward_runs:
-                    run.starttime -= time_diff
-                    run.endtime = run.starttime + datetime.timedelta(
-                        milliseconds=run.total_time_ms
-                    )
-                for run in forward_runs:
-                    run.starttime += time_diff
-                    run.endtime = run.starttime + datetime.timedelta(
-                        milliseconds=run.total_time_ms
-                    )
-                moving.order = order
+                runs = scheduleutil.ordered_runs(moving.event, exclude=moving)
                 if order:
-                    moving.endtime = moving.starttime + datetime.timedelta(
-                        milliseconds=moving.total_time_ms
-                    )
+                    if key == 'order':
+                        position = order - 1
+                    else:
+                        # go by position rather than the stored order, in case there are holes in it
+                        position = next(
+                            i for i, r in enumerate(runs) if r.id == other.id
+                        ) + (key == 'after')
+                    runs.insert(position, moving)
                 else:
-                    moving.starttime = moving.endtime = None
-
-                # clear out the order field in the DB before rewriting them all, else we get conflicts
-                queryset.filter(id__in=(c.id for c in changed)).update(order=None)
-                queryset.bulk_update(changed, ['order', 'starttime', 'endtime'])
+                    moving.order = moving.starttime = moving.endtime = None
 
-                for run in checkpoints:
-                    # update setup time
-                    run.full_clean()
-                    run.save()
+                # every run between the old and new positions is renumbered, and every run up to the next
+                #  anchor (or the end of the event) on either side has its times shifted, with the runs just
+                #  before those anchors absorbing the difference in their setup times
+                changed, reordered = scheduleutil.compute(moving.event, runs)
+                changed = set(changed)
+                changed.add(moving)
 
-                for run in changed:
-                    run.full_clean()
+                # clear out the order field in the DB before rewriting them all, else we get conflicts
+                scheduleutil.clear_order(changed)
+                scheduleutil.persist(runs, list(changed), reordered + [moving])
 
-                # deal with the degenerate case where order gaps occur
-                for correct_order, run in enumerate(
-                    queryset.exclude(order=None), start=1
+                # in schedule order, so that a run without enough drift is reported before the anchor it runs into
+                for run in sorted(
+                    changed, key=lambda r: (r.order is None, r.order or 0)
                 ):
-                    if run.order != correct_order:
-                        # ensure we have the copy from the set if it exists
-                        run = next((r for r in changed if r == run), run)
-                        run.order = correct_order
-                        run.save()
-                        changed.add(run)
+                    run.full_clean()
 
                 interstitials = Interstitial.objects.filter(
                     anchor__in=changed
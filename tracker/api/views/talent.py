@@ -1,6 +1,7 @@
 from django.db.models import Q
 from rest_framework.decorators import action
 
+from tracker import participationutil, settings
 from tracker.api.filters import TalentFilter
 from tracker.api.pagination import TrackerPagination
 from tracker.api.serializers import TalentSerializer
@@ -36,6 +37,9 @@ class TalentViewSet(FlatteningViewSetMixin, EventNestedMixin, TrackerFullViewSet
         #  for consistency but I'm not sure how much of a problem it is in practice
         # using joined Q | queries here caused horrible seq scans, but this seems to work a lot better and it's unlikely
         #  that the id list will get terribly long for a single event
+        # the participation index, when turned on, turns this into a single lookup on one indexed table instead
+        if settings.TRACKER_PARTICIPATION_INDEX:
+            return queryset.filter(id__in=participationutil.talent_in_event(event))
         return queryset.filter(
             id__in=(
                 m.id
@@ -60,11 +64,15 @@ class TalentViewSet(FlatteningViewSetMixin, EventNestedMixin, TrackerFullViewSet
         return self.get_paginated_response(serializer.data)
 
     def _sublist_event_filter(self, key):
-        return (
-            Q(**{f'{key}__event': event})
-            if (event := self.get_event_from_request())
-            else (~Q(**{key: None}) & Q(**{f'{key}__event__draft': False}))
-        )
+        if (event := self.get_event_from_request()) is None:
+            return ~Q(**{key: None}) & Q(**{f'{key}__event__draft': False})
+        if settings.TRACKER_PARTICIPATION_INDEX:
+            return Q(
+                id__in=participationutil.talent_in_event(
+                    event, participationutil.RELATED_ROLES[key]
+                )
+            )
+        return Q(**{f'{key}__event': event})
 
     @action(detail=False)
     def runners(self, *args, **kwargs):
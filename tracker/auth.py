@@ -139,19 +139,9 @@ Once you're finished with that, you may <a href="{{ admin_url }}">log in to the
     )[0]
 
 
-def send_registration_mail(
-    request,
-    user,
-    template=None,
-    sender=None,
-    token_generator=default_token_generator,
-    extra_context=None,
+def registration_context(
+    request, user, token_generator=default_token_generator, extra_context=None
 ):
-    template = template or mailutil.get_email_template(
-        default_registration_template_name(), default_registration_template()
-    )
-    sender = sender or settings.DEFAULT_FROM_EMAIL
-    extra_context = extra_context or {}
     confirmation_url = request.build_absolute_uri(
         reverse(
             'tracker:confirm_registration',
@@ -168,16 +158,32 @@ def send_registration_mail(
     def reset_url():
         raise AssertionError('reset_url is deprecated, use confirmation_url instead')
 
+    return {
+        **(extra_context or {}),
+        'user': user,
+        'domain': get_current_site(request).domain,
+        'confirmation_url': confirmation_url,
+        'reset_url': reset_url,
+        'password_reset_url': password_reset_url,
+    }
+
+
+def send_registration_mail(
+    request,
+    user,
+    template=None,
+    sender=None,
+    token_generator=default_token_generator,
+    extra_context=None,
+):
+    template = template or mailutil.get_email_template(
+        default_registration_template_name(), default_registration_template()
+    )
+    sender = sender or settings.DEFAULT_FROM_EMAIL
+
     return post_office.mail.send(
         recipients=[user.email],
         sender=sender,
         template=template,
-        context={
-            **extra_context,
-            'user': user,
-            'domain': get_current_site(request).domain,
-            'confirmation_url': confirmation_url,
-            'reset_url': reset_url,
-            'password_reset_url': password_reset_url,
-        },
+        context=registration_context(request, user, token_generator, extra_context),
     )
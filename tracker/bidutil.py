@@ -0,0 +1,194 @@
+"""
+Tree-wide recomputation of the denormalized Bid fields (totals, counts, chain goals, state propagation, and auto
+closing). Every affected tree is loaded with one query, the donation totals for every target in those trees come from
+one grouped aggregate, and only the rows that actually changed are written back with one `bulk_update`.
+
+Inside of `deferred_recompute`, requests are collected instead, so that several bid changes (e.g. every bid attached
+to a donation) collapse into a single pass when the block exits, or when the transaction commits.
+"""
+
+import contextlib
+import threading
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from tracker import searchutil, settings, util
+from tracker.models import Bid, DonationBid
+
+COMPUTED_FIELDS = (
+    'event_id',
+    'speedrun_id',
+    'state',
+    'chain',
+    'chain_goal',
+    'chain_remaining',
+    'total',
+    'count',
+    'revealedtime',
+)
+
+_local = threading.local()
+
+
+def _tree_queryset(bids):
+    # in-memory tree ids can go stale when other trees are inserted, so always look them up
+    ids = {b.pk if isinstance(b, Bid) else b for b in bids}
+    return Bid.objects.filter(
+        tree_id__in=Bid.objects.filter(pk__in=ids).values('tree_id')
+    )
+
+
+def _target_totals(tree_ids):
+    return {
+        row['bid_id']: (row['total'], row['count'])
+        for row in DonationBid.objects.completed()
+        .filter(bid__tree_id__in=tree_ids, bid__istarget=True)
+        .order_by()
+        .values('bid_id')
+        .annotate(total=Sum('amount'), count=Count('amount'))
+    }
+
+
+def _compute(nodes, targets):
+    """
+    `nodes` are in tree order (parents before children), updates them in place, and returns the ones whose
+    computed fields changed, along with any analytics that need to be sent once the changes are written
+    """
+    by_id = {node.pk: node for node in nodes}
+    original = {node.pk: [getattr(node, f) for f in COMPUTED_FIELDS] for node in nodes}
+    children = {node.pk: [] for node in nodes}
+    for node in nodes:
+        if node.parent_id in children:
+            children[node.parent_id].append(node)
+    remaining = {}
+    tracked = []
+
+    # children first, totals for targets and options, and the goals of everything below each node
+    for node in reversed(nodes):
+        remaining[node.pk] = sum(
+            (remaining[child.pk] + (child.goal or 0) for child in children[node.pk]),
+            Decimal(0),
+        )
+        if node.istarget:
+            node.total, node.count = targets.get(node.pk, (Decimal(0), 0))
+        elif not node.chain:
+            options = [
+                child
+                for child in children[node.pk]
+                if child.state not in ('DENIED', 'PENDING')
+            ]
+            node.total = sum((child.total for child in options), Decimal(0))
+            node.count = sum(child.count for child in options)
+
+    # parents first, everything that flows down the tree
+    for node in nodes:
+        parent = by_id.get(node.parent_id)
+        if parent:
+            node.speedrun_id = parent.speedrun_id
+            node.event_id = parent.event_id
+            if node.state not in ('PENDING', 'DENIED'):
+                node.state = parent.state
+            node.chain = parent.chain
+        if node.chain:
+            node.chain_goal = (parent.chain_goal if parent else 0) + node.goal
+            node.chain_remaining = remaining[node.pk]
+            if not node.istarget and parent:
+                node.total = max(Decimal(0), parent.total - parent.goal)
+        else:
+            node.chain_goal = node.chain_remaining = None
+        if (
+            node.istarget
+            and node.goal
+            and node.state == 'OPENED'
+            and node.total
+            >= (node.chain_goal + node.chain_remaining if node.chain else node.goal)
+        ):
+            node.state = 'CLOSED'
+            tracked.append(node.track_met)
+        if node.state in Bid.PUBLIC_STATES and not node.revealedtime:
+            node.revealedtime = util.utcnow()
+            tracked.append(node.track_opened)
+
+    changed = [
+        node
+        for node in nodes
+        if original[node.pk] != [getattr(node, f) for f in COMPUTED_FIELDS]
+    ]
+    return changed, tracked
+
+
+def recompute_trees(bids):
+    """
+    recomputes every tree containing the given bids (either instances or primary keys), returns the number of rows
+    written
+
+    any instances that were passed in have their computed fields updated to match
+    """
+    bids = list(bids)
+    if not bids:
+        return 0
+    with transaction.atomic():
+        nodes = list(
+            _tree_queryset(bids).select_for_update().order_by('tree_id', 'lft')
+        )
+        if not nodes:
+            return 0
+        placed = {node.pk: (node.event_id, node.speedrun_id) for node in nodes}
+        changed, tracked = _compute(
+            nodes, _target_totals({node.tree_id for node in nodes})
+        )
+        Bid.objects.bulk_update(
+            changed, [f.removesuffix('_id') for f in COMPUTED_FIELDS]
+        )
+        if settings.TRACKER_SEARCH_INDEX:
+            # the bulk update does not send any signals, and the documents include the event and the run
+            searchutil.index(
+                Bid,
+                [
+                    node.pk
+                    for node in changed
+                    if placed[node.pk] != (node.event_id, node.speedrun_id)
+                ],
+            )
+    for track in tracked:
+        track()
+    computed = {node.pk: node for node in nodes}
+    for bid in bids:
+        if isinstance(bid, Bid) and bid.pk in computed:
+            for field in COMPUTED_FIELDS:
+                setattr(bid, field, getattr(computed[bid.pk], field))
+    return len(changed)
+
+
+def schedule_recompute(bids):
+    """recomputes the trees immediately, unless inside of `deferred_recompute`, in which case they're collected"""
+    pending = getattr(_local, 'pending', None)
+    if pending is None:
+        recompute_trees(bids)
+    else:
+        pending.update(b.pk if isinstance(b, Bid) else b for b in bids)
+
+
+@contextlib.contextmanager
+def deferred_recompute(*, on_commit=False):
+    """
+    collects every recompute request made inside the block and runs them as one pass when it exits, or when the
+    current transaction commits if `on_commit` is set, nested blocks are folded into the outermost one
+
+    instances saved inside the block will not have their computed fields refreshed
+    """
+    if getattr(_local, 'pending', None) is not None:
+        yield
+        return
+    pending = _local.pending = set()
+    try:
+        yield
+    finally:
+        _local.pending = None
+    if pending:
+        if on_commit:
+            transaction.on_commit(lambda: recompute_trees(pending))
+        else:
+            recompute_trees(pending)
@@ -0,0 +1,193 @@
+"""
+Set-based recomputation of DonorCache rows, used by the `recompute_donor_cache` command and donor merges. Every scope
+(event, event+donor, currency, currency+donor) is computed with grouped aggregate queries (including the
+median on PostgreSQL, see `tracker.median`), and only the rows that actually changed are written back.
+"""
+
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+
+from django.db import connections, transaction
+from django.db.models import Avg, Count, Max, Sum
+
+from tracker.median import Median, grouped_medians, supports_median
+from tracker.models import Donation, DonorCache
+
+CACHE_FIELDS = (
+    'donation_total',
+    'donation_count',
+    'donation_max',
+    'donation_avg',
+    'donation_med',
+)
+
+
+def _quantize(value):
+    return Decimal(str(value or 0)).quantize(Decimal('0.00'))
+
+
+def _completed():
+    return Donation.objects.completed().filter(testdonation=False)
+
+
+def aggregate_groups(donations, group_fields):
+    """returns a dictionary of group key -> cache field values for every group in the queryset"""
+    annotations = {
+        'total': Sum('amount'),
+        'count': Count('amount'),
+        'max': Max('amount'),
+        'avg': Avg('amount'),
+    }
+    in_aggregate = supports_median(donations)
+    if in_aggregate:
+        annotations['med'] = Median('amount')
+    results = {}
+    for row in donations.order_by().values(*group_fields).annotate(**annotations):
+        results[tuple(row[f] for f in group_fields)] = {
+            'donation_total': _quantize(row['total']),
+            'donation_count': row['count'],
+            'donation_max': _quantize(row['max']),
+            'donation_avg': _quantize(row['avg']),
+            'donation_med': _quantize(row.get('med')),
+        }
+    if not in_aggregate:
+        medians = grouped_medians(
+            donations,
+            group_fields,
+            'amount',
+            counts={k: v['donation_count'] for k, v in results.items()},
+        )
+        for key, med in medians.items():
+            results[key]['donation_med'] = _quantize(med)
+    return results
+
+
+def write_groups(existing, computed, key_fields, *, batch_size):
+    """
+    synchronizes the existing cache rows for a scope with the computed values, creating, updating, or deleting
+    rows as needed and leaving the rest alone, returns the number of rows written
+    """
+    existing = {
+        tuple(getattr(dc, f) for f in key_fields): dc for dc in existing.order_by()
+    }
+    to_create = []
+    to_update = []
+    for key, values in computed.items():
+        dc = existing.pop(key, None)
+        if dc is None:
+            to_create.append(DonorCache(**dict(zip(key_fields, key)), **values))
+        elif dc.stale or any(getattr(dc, f) != v for f, v in values.items()):
+            for f, v in values.items():
+                setattr(dc, f, v)
+            dc.stale = False
+            to_update.append(dc)
+    DonorCache.objects.bulk_create(to_create, batch_size=batch_size)
+    DonorCache.objects.bulk_update(
+        to_update, (*CACHE_FIELDS, 'stale'), batch_size=batch_size
+    )
+    if existing:
+        DonorCache.objects.filter(pk__in=[dc.pk for dc in existing.values()]).delete()
+    return len(to_create) + len(to_update) + len(existing)
+
+
+def recompute_event(event_id, *, batch_size=1000):
+    """recomputes the event-wide row and every donor row for a single event"""
+    donations = _completed().filter(event_id=event_id)
+    with transaction.atomic():
+        return write_groups(
+            DonorCache.objects.filter(event_id=event_id).exclude(donor=None),
+            aggregate_groups(donations.exclude(donor=None), ('event_id', 'donor_id')),
+            ('event_id', 'donor_id'),
+            batch_size=batch_size,
+        ) + write_groups(
+            DonorCache.objects.filter(event_id=event_id, donor=None),
+            aggregate_groups(donations, ('event_id',)),
+            ('event_id',),
+            batch_size=batch_size,
+        )
+
+
+def recompute_currency(currency, *, batch_size=1000):
+    """recomputes the currency-wide row and every donor row for a single currency"""
+    donations = _completed().filter(event__paypalcurrency=currency)
+    with transaction.atomic():
+        return write_groups(
+            DonorCache.objects.filter(event=None, currency=currency).exclude(
+                donor=None
+            ),
+            aggregate_groups(
+                donations.exclude(donor=None), ('event__paypalcurrency', 'donor_id')
+            ),
+            ('currency', 'donor_id'),
+            batch_size=batch_size,
+        ) + write_groups(
+            DonorCache.objects.filter(event=None, currency=currency, donor=None),
+            aggregate_groups(donations, ('event__paypalcurrency',)),
+            ('currency',),
+            batch_size=batch_size,
+        )
+
+
+def recompute_donors(donor_ids, *, batch_size=1000):
+    """
+    recomputes the per-event and per-currency rows for the given donors, e.g. after their donations were moved
+    around with a bulk update, the donor-less rows are left alone
+    """
+    donor_ids = list(donor_ids)
+    donations = _completed().filter(donor_id__in=donor_ids)
+    with transaction.atomic():
+        return write_groups(
+            DonorCache.objects.filter(donor_id__in=donor_ids).exclude(event=None),
+            aggregate_groups(donations, ('event_id', 'donor_id')),
+            ('event_id', 'donor_id'),
+            batch_size=batch_size,
+        ) + write_groups(
+            DonorCache.objects.filter(event=None, donor_id__in=donor_ids),
+            aggregate_groups(donations, ('event__paypalcurrency', 'donor_id')),
+            ('currency', 'donor_id'),
+            batch_size=batch_size,
+        )
+
+
+def _run_shard(func, keys, batch_size):
+    return sum(func(key, batch_size=batch_size) for key in keys)
+
+
+def recompute_donor_cache(
+    event_ids, currencies, *, workers=1, batch_size=1000, progress=None
+):
+    """
+    recomputes every cache row for the given events and currencies, returns a tuple of (rows written, elapsed seconds)
+
+    if `workers` is greater than 1, the events (and then the currencies) are sharded across that many forked
+    processes, each with their own database connection
+
+    `progress` is an optional wrapper around an iterable, e.g. `tqdm`
+    """
+    progress = progress or (lambda iterable, **kwargs: iterable)
+    start = time.monotonic()
+    written = 0
+    for func, keys, desc in (
+        (recompute_event, list(event_ids), 'Event'),
+        (recompute_currency, list(currencies), 'Currency'),
+    ):
+        if workers > 1 and len(keys) > 1:
+            # forked children cannot share the parent's connection
+            connections.close_all()
+            shards = [keys[i::workers] for i in range(workers)]
+            with ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context('fork')
+            ) as pool:
+                futures = [
+                    pool.submit(_run_shard, func, shard, batch_size)
+                    for shard in shards
+                    if shard
+                ]
+                for future in progress(futures, desc=desc, unit='shard'):
+                    written += future.result()
+        else:
+            for key in progress(keys, desc=desc, unit=desc.lower()):
+                written += func(key, batch_size=batch_size)
+    return written, time.monotonic() - start
@@ -79,6 +79,46 @@ def broadcast_donation_processing_action(user: User, donation: Donation, action:
     )
 
 
+def broadcast_donation_processing_actions(user: User, changes):
+    """
+    announces a batch of `(donation, action)` pairs as a single `processing_action` message, with an action of `batch`,
+    each donation is only serialized once, even if it was changed more than once
+    """
+    donations = {donation.pk: donation for donation, action in changes}
+    serialized = dict(
+        zip(
+            donations.keys(),
+            DonationSerializer(
+                list(donations.values()),
+                many=True,
+                with_all_comments=True,
+                with_mod_comments=True,
+                with_groups=True,
+                with_permissions=(
+                    'tracker.view_comments',
+                    'tracker.view_donation',
+                    'tracker.view_bid',
+                ),
+            ).data,
+        )
+    )
+    async_to_sync(get_channel_layer().group_send)(
+        PROCESSING_GROUP_NAME,
+        {
+            'type': 'processing_action',
+            'payload': {
+                'actor_name': user.get_username(),
+                'actor_id': user.pk,
+                'action': 'batch',
+                'changes': [
+                    {'donation': serialized[donation.pk], 'action': action}
+                    for donation, action in changes
+                ],
+            },
+        },
+    )
+
+
 def broadcast_group_processing_action(user: User, group: DonationGroup, action: str):
     async_to_sync(get_channel_layer().group_send)(
         PROCESSING_GROUP_NAME,
@@ -1,27 +1,17 @@
-import json
 import logging
-import traceback
 
-import requests
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
-from django.core import serializers
-from django.db.models import Count, Sum
 
 import tracker.models as models
-import tracker.viewutil as viewutil
+from tracker import postbackutil
 from tracker.consumers.processing import broadcast_new_donation_to_processors
 
 logger = logging.getLogger(__name__)
 
 
-def post_donation_to_postbacks(donation):
-    event_donations = models.Donation.objects.filter(event=donation.event).completed()
-    agg = event_donations.aggregate(total=Sum('amount'), count=Count('amount'))
-    total = agg['total']
-    donation_count = agg['count']
-
-    data = {
+def _donation_data(donation, total):
+    return {
         'id': donation.id,
         'event': donation.event_id,
         'timereceived': donation.timereceived.astimezone(
@@ -49,29 +39,32 @@ def post_donation_to_postbacks(donation):
         ],
     }
 
-    async_to_sync(get_channel_layer().group_send)(
-        'donations', {'type': 'donation', **data}
-    )
 
-    broadcast_new_donation_to_processors(donation, float(total), donation_count)
+def post_donation_to_postbacks(donation):
+    post_donations_to_postbacks([donation])
 
-    data_json = json.dumps(
-        data, ensure_ascii=False, cls=serializers.json.DjangoJSONEncoder
-    ).encode('utf-8')
 
-    postbacks = models.PostbackURL.objects.filter(event=donation.event)
-    for postback in postbacks:
-        try:
-            requests.post(
-                postback.url,
-                data=data_json,
-                headers={'Content-Type': 'application/json; charset=utf-8'},
-                timeout=5,
-            )
-        except Exception:
-            logger.exception('Error sending postback')
-            viewutil.tracker_log(
-                'postback_url',
-                f'{postback.id}\n{traceback.format_exc()}',
-                event=donation.event,
+def post_donations_to_postbacks(donations):
+    """
+    broadcasts the donations to the websocket listeners, and then sends them to the Postback URLs for their events,
+    URLs that accept batches will receive every donation for their event in one request
+    """
+    by_event = {}
+    for donation in donations:
+        by_event.setdefault(donation.event, []).append(donation)
+
+    for event, event_donations in by_event.items():
+        total, donation_count = models.DonorCache.event_total(event.id)
+
+        payloads = []
+        for donation in event_donations:
+            data = _donation_data(donation, total)
+            payloads.append(data)
+
+            async_to_sync(get_channel_layer().group_send)(
+                'donations', {'type': 'donation', **data}
             )
+
+            broadcast_new_donation_to_processors(donation, float(total), donation_count)
+
+        postbackutil.deliver(models.PostbackURL.objects.filter(event=event), payloads)
@@ -1,4 +1,5 @@
 from django.contrib.admin import models
+from django.contrib.contenttypes.models import ContentType
 from django.utils.text import get_text_list
 from django.utils.translation import gettext as _
 
@@ -31,6 +32,35 @@ def change(request, obj, message_or_fields):
     models.LogEntry.objects.log_actions(request.user.id, [obj], models.CHANGE, message)
 
 
+def change_many(request, changed):
+    """
+    Log several changes at once, with a single query.
+
+    *changed* must be a sequence of tuples *(instance, message_or_fields)*,
+    where *message_or_fields* is a sequence of modified field names
+    or a custom change message.
+    """
+    models.LogEntry.objects.bulk_create(
+        [
+            models.LogEntry(
+                user_id=request.user.id,
+                content_type_id=ContentType.objects.get_for_model(
+                    obj, for_concrete_model=False
+                ).id,
+                object_id=str(obj.pk),
+                object_repr=str(obj)[:200],
+                action_flag=models.CHANGE,
+                change_message=(
+                    message_or_fields
+                    if isinstance(message_or_fields, str)
+                    else get_change_message(message_or_fields)
+                ),
+            )
+            for obj, message_or_fields in changed
+        ]
+    )
+
+
 def deletion(request, obj, object_repr=None):
     """
     Log that an object will be deleted.
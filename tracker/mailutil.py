@@ -1,4 +1,12 @@
+from email.utils import make_msgid
+
 import post_office
+from django.db import transaction
+from django.template import Context, Template
+from post_office.models import PRIORITY, STATUS, Email
+from post_office.settings import get_message_id_enabled, get_message_id_fqdn
+from post_office.signals import email_queued
+from post_office.utils import parse_priority
 
 
 def get_email_template(name, default=None):
@@ -25,3 +33,58 @@ def get_or_create_email_template(name, default):
     finally:
         default.pk = oldPk
         default.id = oldId
+
+
+def compile_template(template):
+    """parses the subject and both bodies of an `EmailTemplate`, for reuse across several `queue_many` calls"""
+    return tuple(
+        Template(t) for t in (template.subject, template.content, template.html_content)
+    )
+
+
+def queue_many(template, sender, messages, *, headers=None, compiled=None):
+    """
+    Queue one email per `(recipients, context)` pair in `messages`, like calling `post_office.mail.send` for each, except
+    that the template is only parsed once and the emails are inserted together. Returns the emails.
+
+    `compiled` is the result of `compile_template`, so a caller that queues several batches from the same template
+    only has to parse it once.
+
+    The emails are sent (with the `now` priority) or announced with `email_queued` once the current transaction commits.
+    """
+    subject, content, html_content = compiled or compile_template(template)
+    priority = parse_priority(None)
+    emails = []
+    for recipients, context in messages:
+        context = Context(context)
+        emails.append(
+            Email(
+                from_email=sender,
+                to=recipients,
+                subject=subject.render(context),
+                message=content.render(context),
+                html_message=html_content.render(context),
+                headers=headers,
+                priority=priority,
+                status=None if priority == PRIORITY.now else STATUS.queued,
+                message_id=(
+                    make_msgid(domain=get_message_id_fqdn())
+                    if get_message_id_enabled()
+                    else None
+                ),
+                template=template,
+            )
+        )
+    Email.objects.bulk_create(emails)
+
+    def dispatch():
+        for email in emails:
+            email.dispatch()
+
+    # nothing goes out until the emails are committed, otherwise a caller that rolls back afterwards would have sent
+    #  mail that it no longer knows about, and would send it again when retried
+    if priority == PRIORITY.now:
+        transaction.on_commit(dispatch)
+    elif emails:
+        transaction.on_commit(lambda: email_queued.send(sender=Email, emails=emails))
+    return emails
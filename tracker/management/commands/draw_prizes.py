@@ -0,0 +1,73 @@
+import re
+import time
+
+from django.db import transaction
+from django.db.models import Q
+
+from tracker import commandutil, prizeutil
+from tracker.models import Prize
+
+
+class Command(commandutil.TrackerCommand):
+    help = """Draws winners for every prize that is ready to be drawn, optionally for certain events. The prizes are
+drawn as one batch, so prizes with the same draw window share their eligibility query, and every claim is written at
+once. Passing a seed makes the drawing reproducible."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-e',
+            '--events',
+            help='Comma separated list of either event PKs, or short names',
+        )
+        parser.add_argument(
+            '-s',
+            '--seed',
+            help='Seed for the drawing, each prize derives its own generator from it',
+        )
+        parser.add_argument(
+            '-t',
+            '--time',
+            help='Draw prizes as if it were this time (ISO 8601), defaults to now',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report who would win, but do not save any claims',
+        )
+
+    def handle(self, *args, **options):
+        super().handle(*args, **options)
+
+        prizes = Prize.objects.to_draw(options['time'])
+
+        if options['events']:
+            q = Q()
+            for i in options['events'].split(','):
+                i = i.strip()
+                if re.match(r'\d+', i):
+                    q |= Q(event_id=i)
+                else:
+                    q |= Q(event__short__iexact=i)
+            prizes = prizes.filter(q)
+
+        start = time.perf_counter()
+        with transaction.atomic():
+            results = prizeutil.draw_prizes(prizes, seed=options['seed'])
+            if options['dry_run']:
+                transaction.set_rollback(True)
+        elapsed = time.perf_counter() - start
+
+        for result in results:
+            name = f'{result.prize.name} (#{result.prize.id})'
+            if result.error:
+                self.message(f'{name}: {result.error}', 0)
+            else:
+                self.message(
+                    f'{name}: drew {len(result.winners)} winner(s) in {result.elapsed:.3f}s'
+                )
+                self.message(f'  winners: {result.winners}', 2)
+        drawn = sum(1 for r in results if not r.error)
+        self.message(
+            f'Drew {drawn} of {len(results)} prize(s) in {elapsed:.2f}s'
+            + (' (dry run, nothing was saved)' if options['dry_run'] else '')
+        )
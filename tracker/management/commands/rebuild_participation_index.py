@@ -0,0 +1,64 @@
+import os
+import re
+import time
+
+from django.db.models import Q
+
+from tracker import commandutil, participationutil
+from tracker.models import Event
+
+
+class Command(commandutil.TrackerCommand):
+    help = """Rebuilds the event participation index used when TRACKER_PARTICIPATION_INDEX is turned on, optionally for
+certain events. Every event is rebuilt separately, and only the rows that changed are written. Will use tqdm for a
+progress bar if installed and verbosity is not 0, and the environment variable TRACKER_DISABLE_TQDM is set to any
+non-blank value."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-e',
+            '--events',
+            help='Comma separated list of either event PKs, or short names',
+        )
+        parser.add_argument(
+            '-b',
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of rows to write per query',
+        )
+
+    def handle(self, *args, **options):
+        super().handle(*args, **options)
+        try:
+            from tqdm import tqdm
+        except ImportError:
+
+            def tqdm(iterable, *_, **__):
+                return iterable
+
+        disable = options['verbosity'] == 0 or os.environ.get(
+            'TRACKER_DISABLE_TQDM', ''
+        )
+
+        events = Event.objects.order_by('pk')
+        if options['events']:
+            q = Q()
+            for i in options['events'].split(','):
+                i = i.strip()
+                if re.match(r'\d+', i):
+                    q |= Q(id=i)
+                else:
+                    q |= Q(short__iexact=i)
+            events = events.filter(q)
+
+        start = time.monotonic()
+        written = participationutil.rebuild(
+            event_ids=list(events.values_list('pk', flat=True)),
+            batch_size=max(options['batch_size'], 1),
+            progress=lambda iterable, **kwargs: tqdm(
+                iterable, disable=disable, **kwargs
+            ),
+        )
+        elapsed = time.monotonic() - start
+        self.message(f'Wrote {written} row(s) in {elapsed:.2f}s')
@@ -0,0 +1,64 @@
+import os
+import time
+
+from django.core.management import CommandError
+
+from tracker import commandutil, searchutil
+
+
+class Command(commandutil.TrackerCommand):
+    help = """Rebuilds the search index used when TRACKER_SEARCH_INDEX is turned on, optionally for certain models.
+Every object is reindexed in batches, only the documents that changed are written, and documents left behind by
+deleted objects are removed. Will use tqdm for a progress bar if installed and verbosity is not 0, and the environment
+variable TRACKER_DISABLE_TQDM is set to any non-blank value."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-m',
+            '--models',
+            help='Comma separated list of model names to rebuild, defaults to all of them: '
+            + ', '.join(m._meta.model_name for m in searchutil.INDEXES),
+        )
+        parser.add_argument(
+            '-b',
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of objects to index per batch',
+        )
+
+    def handle(self, *args, **options):
+        super().handle(*args, **options)
+        try:
+            from tqdm import tqdm
+        except ImportError:
+
+            def tqdm(iterable, *_, **__):
+                return iterable
+
+        disable = options['verbosity'] == 0 or os.environ.get(
+            'TRACKER_DISABLE_TQDM', ''
+        )
+
+        models = {m._meta.model_name: m for m in searchutil.INDEXES}
+        if options['models']:
+            names = [n.strip().lower() for n in options['models'].split(',')]
+            unknown = [n for n in names if n not in models]
+            if unknown:
+                raise CommandError(f'Unknown model(s): {", ".join(unknown)}')
+            models = {n: models[n] for n in names}
+
+        start = time.monotonic()
+        written = 0
+        for name, model in models.items():
+            count = searchutil.rebuild(
+                model,
+                batch_size=max(options['batch_size'], 1),
+                progress=lambda iterable, **kwargs: tqdm(
+                    iterable, disable=disable, **kwargs
+                ),
+            )
+            self.message(f'{name}: wrote {count} row(s)', 2)
+            written += count
+        elapsed = time.monotonic() - start
+        self.message(f'Wrote {written} row(s) in {elapsed:.2f}s')
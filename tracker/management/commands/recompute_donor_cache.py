@@ -3,15 +3,15 @@ import re
 
 from django.db.models import Q
 
-from tracker import commandutil
-from tracker.models import Donation, DonorCache, Event
-from tracker.util import tqdm_groupby
+from tracker import cacheutil, commandutil
+from tracker.models import DonorCache, Event
 
 
 class Command(commandutil.TrackerCommand):
-    help = """Recomputes all DonorCache entries, optionally for certain events. Not particularly efficient. Will use
-tqdm for a progress bar if installed and verbosity is not 0, and the environment variable TRACKER_DISABLE_TQDM is set
-to any non-blank value."""
+    help = """Recomputes all DonorCache entries, optionally for certain events. Every event and currency is computed
+with grouped aggregate queries, and only the rows that changed are written. Will use tqdm for a progress bar if
+installed and verbosity is not 0, and the environment variable TRACKER_DISABLE_TQDM is set to any non-blank value.
+With --stale, only rows left behind by incremental updates are recomputed."""
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -19,6 +19,25 @@ to any non-blank value."""
             '--events',
             help='Comma separated list of either event PKs, or short names',
         )
+        parser.add_argument(
+            '--stale',
+            action='store_true',
+            help='Only recompute rows that were marked stale by incremental updates',
+        )
+        parser.add_argument(
+            '-w',
+            '--workers',
+            type=int,
+            default=1,
+            help='Number of processes to shard the events across',
+        )
+        parser.add_argument(
+            '-b',
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of rows to write per query',
+        )
 
     def handle(self, *args, **options):
         super().handle(*args, **options)
@@ -29,13 +48,7 @@ to any non-blank value."""
             def tqdm(iterable, *_, **__):
                 return iterable
 
-        donations = (
-            Donation.objects.completed()
-            .filter(testdonation=False)
-            .select_related('donor', 'event')
-        )
         events = Event.objects.all()
-        ids = set()
 
         disable = options['verbosity'] == 0 or os.environ.get(
             'TRACKER_DISABLE_TQDM', ''
@@ -53,52 +66,32 @@ to any non-blank value."""
                 else:
                     q |= Q(event__short__iexact=i)
                     eq |= Q(short__iexact=i)
-            donations = donations.filter(q)
             events = events.filter(eq)
 
-        for k, g in tqdm_groupby(
-            donations.order_by('event', 'donor'),
-            key=lambda d: (d.event, d.donor),
-            desc='Event-Donor',
-            disable=disable,
-            unit='row',
-        ):
-            event, donor = k
-            dc = DonorCache.objects.get_or_create(donor=donor, event=event)[0]
-            ids.add(dc.id)
-            dc.update()
-
-        for k, g in tqdm_groupby(
-            donations.order_by('event__paypalcurrency', 'donor'),
-            key=lambda d: (d.event.paypalcurrency, d.donor),
-            desc='Currency-Donor',
-            disable=disable,
-            unit='row',
-        ):
-            currency, donor = k
-            dc = DonorCache.objects.get_or_create(donor=donor, currency=currency)[0]
-            ids.add(dc.id)
-            dc.update()
-
-        for e in tqdm(events, desc='Event', disable=disable, unit='row'):
-            dc = DonorCache.objects.get_or_create(donor=None, event=e)[0]
-            ids.add(dc.id)
-            dc.update()
-
-        for c in tqdm(
-            list(c[0] for c in events.values_list('paypalcurrency')),
-            desc='Currency',
-            disable=disable,
-            unit='row',
-        ):
-            dc = DonorCache.objects.get_or_create(donor=None, currency=c)[0]
-            ids.add(dc.id)
-            dc.update()
-
-        for dc in tqdm(
-            DonorCache.objects.filter(q).exclude(id__in=ids),
-            desc='Stale',
-            disable=disable,
-            unit='row',
-        ):
-            dc.update()
+        if options['stale']:
+            count = DonorCache.reconcile(DonorCache.objects.filter(q))
+            self.message(f'Reconciled {count} stale row(s)')
+            return
+
+        event_ids = list(events.values_list('id', flat=True))
+        currencies = set(events.values_list('paypalcurrency', flat=True))
+        if not options['events']:
+            # also clean up rows for currencies that no longer have any events
+            currencies |= set(
+                DonorCache.objects.filter(event=None)
+                .exclude(currency=None)
+                .values_list('currency', flat=True)
+            )
+
+        written, elapsed = cacheutil.recompute_donor_cache(
+            event_ids,
+            sorted(currencies),
+            workers=max(options['workers'], 1),
+            batch_size=options['batch_size'],
+            progress=lambda iterable, **kwargs: tqdm(
+                iterable, disable=disable, **kwargs
+            ),
+        )
+        self.message(
+            f'Wrote {written} row(s) in {elapsed:.2f}s ({written / (elapsed or 1):.0f} rows/sec)'
+        )
@@ -0,0 +1,58 @@
+from tracker import commandutil
+from tracker.analytics import instrumentation
+
+SORTS = {
+    'queries': lambda t: t['queries'] / t['requests'],
+    'db_time': lambda t: t['db_time'] / t['requests'],
+    'duration': lambda t: t['duration'] / t['requests'],
+    'total_db_time': lambda t: t['db_time'],
+}
+
+
+class Command(commandutil.TrackerCommand):
+    help = """Lists the views that cost the most per request, as recorded by InstrumentationMiddleware. The totals are
+kept in the Django cache, so they include every process that shares it, but are approximate under heavy load."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-l',
+            '--limit',
+            type=int,
+            default=20,
+            help='Number of views to list',
+        )
+        parser.add_argument(
+            '-s',
+            '--sort',
+            choices=list(SORTS),
+            default='queries',
+            help='What to rank the views by, averages per request unless prefixed with `total_`',
+        )
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Clear the recorded totals after listing them',
+        )
+
+    def handle(self, *args, **options):
+        super().handle(*args, **options)
+
+        totals = instrumentation.report()
+        if not totals:
+            self.message('No requests recorded.')
+        ranked = sorted(totals.items(), key=lambda v: SORTS[options['sort']](v[1]))
+        for view_name, t in reversed(ranked[-max(options['limit'], 1) :]):
+            requests = t['requests']
+            self.message(
+                f'{view_name}: {requests} request(s), '
+                f'{t["queries"] / requests:.1f} queries (max {t["max_queries"]}), '
+                f'db {t["db_time"] / requests * 1000:.1f}ms (max {t["max_db_time"] * 1000:.1f}ms), '
+                f'serializer {t["serializer_time"] / requests * 1000:.1f}ms, '
+                f'total {t["duration"] / requests * 1000:.1f}ms (max {t["max_duration"] * 1000:.1f}ms), '
+                f'cache {t["cache_hits"]} hit(s) {t["cache_misses"]} miss(es)',
+                0,
+            )
+
+        if options['reset']:
+            instrumentation.reset()
+            self.message('Cleared the recorded totals.', 2)
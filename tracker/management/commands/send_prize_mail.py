@@ -0,0 +1,61 @@
+from django.core.management import CommandError
+
+from tracker import commandutil, models, prizemail
+
+
+class Command(commandutil.TrackerCommand):
+    help = """Sends the emails for queued prize mail jobs, or resumes ones that were interrupted. Jobs are created by the
+prize mail pages in the admin, and are normally sent by a Celery worker, or by the page itself if Celery is not in use."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'jobs',
+            nargs='*',
+            type=int,
+            help='The ids of the jobs to send, defaults to every job that has not finished',
+        )
+        parser.add_argument(
+            '-c',
+            '--chunk-size',
+            type=int,
+            default=prizemail.CHUNK_SIZE,
+            help='Number of recipients to mail per transaction',
+        )
+        parser.add_argument(
+            '-l',
+            '--list',
+            action='store_true',
+            help='List the jobs that have not finished instead of sending them',
+        )
+
+    def handle(self, *args, **options):
+        super().handle(*args, **options)
+
+        jobs = models.PrizeMailJob.objects.select_related('event')
+        if options['jobs']:
+            jobs = jobs.filter(pk__in=options['jobs'])
+            missing = set(options['jobs']) - {job.pk for job in jobs}
+            if missing:
+                raise CommandError(
+                    f'Unknown job(s): {", ".join(str(m) for m in sorted(missing))}'
+                )
+        else:
+            jobs = jobs.exclude(state='DONE')
+        jobs = jobs.order_by('created')
+
+        if options['list']:
+            for job in jobs:
+                self.message(
+                    f'#{job.pk} {job}: {job.groups_done}/{job.recipients} recipient(s)',
+                    0,
+                )
+            return
+
+        for job in jobs:
+            if job.state == 'DONE':
+                self.message(f'#{job.pk} {job} has already finished, skipping.', 1)
+                continue
+            mailed = prizemail.run_job(job, chunk_size=max(options['chunk_size'], 1))
+            for message in mailed:
+                self.message(message, 2)
+            self.message(f'Job #{job.pk}: sent {len(mailed)} email(s).', 1)
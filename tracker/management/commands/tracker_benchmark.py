@@ -0,0 +1,426 @@
+import dataclasses
+import datetime
+import json
+import math
+import random
+import sys
+import time
+from decimal import Decimal
+from typing import Callable, Optional
+from unittest import mock
+
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError
+from django.db import connection, transaction
+from django.test import Client, RequestFactory, override_settings
+from django.test.utils import (
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+from django.urls import reverse
+
+import tracker
+from tracker import (
+    bidutil,
+    cacheutil,
+    commandutil,
+    eventutil,
+    models,
+    postbackutil,
+    prizeutil,
+)
+from tracker.analytics import instrumentation
+from tracker.api.serializers import BidSerializer
+
+START_TIME = datetime.datetime(2024, 1, 14, 16, 30, tzinfo=datetime.timezone.utc)
+
+API_ENDPOINTS = ['event', 'donation', 'donor', 'bid', 'speedrun', 'prize', 'talent']
+
+REPORTS = [
+    'donor_report',
+    'run_report',
+    'donation_report',
+    'bid_report',
+    'donationbid_report',
+    'prize_report',
+    'email_report',
+]
+
+
+@dataclasses.dataclass
+class Scenario:
+    name: str
+    # returns the number of operations it performed, for the throughput
+    run: Callable[[object], int]
+    # untimed, runs in the same transaction as `run`, and what it returns is passed to `run`
+    prepare: Optional[Callable[[int], object]] = None
+    # if set, every change made by the iteration is rolled back, so that each one starts from the same state
+    rollback: bool = False
+
+
+class _Response:
+    status_code = 200
+
+
+class _Session:
+    # postbacks are timed up to the point of sending them, not including the network
+    def post(self, *args, **kwargs):
+        return _Response()
+
+
+def seed(rand, *, donations, donors, bids, prizes, runs, batch_size=1000):
+    """
+    builds an event with `tests.randgen`, donations are created in batches without their save side effects, and then
+    the bid totals and donor caches are computed in bulk, exactly as they would be by the regular recompute paths
+    """
+    from tests import randgen
+
+    event = randgen.generate_event(rand, START_TIME)
+    event.save()
+    list_of_runs = randgen.generate_runs(rand, event, max(runs, 1), ordered=True)
+    list_of_donors = randgen.generate_donors(rand, max(donors, 1))
+    _, targets = randgen.generate_bids(rand, event, bids, list_of_runs=list_of_runs)
+    randgen.generate_prizes(rand, event, prizes, list_of_runs=list_of_runs)
+
+    end_time = list_of_runs[-1].endtime
+    for start in range(0, donations, batch_size):
+        batch = []
+        for _ in range(min(batch_size, donations - start)):
+            donation = randgen.generate_donation(
+                rand,
+                event=event,
+                min_time=START_TIME,
+                max_time=end_time,
+                donors=list_of_donors,
+                domain='PAYPAL',
+            )
+            donation.normalize_states()
+            donation.cleared_at = donation.timereceived
+            batch.append(donation)
+        models.Donation.objects.bulk_create(batch)
+        donation_bids = []
+        for donation in batch:
+            # weights hinted from SGDQ2020, same as `randgen.generate_donations`
+            num = rand.choices([0, 1, 2, 3], [102, 229, 6, 1])[0]
+            for bid in rand.sample(targets, min(num, len(targets))):
+                donation_bids.append(
+                    models.DonationBid(
+                        donation=donation,
+                        bid=bid,
+                        amount=(donation.amount / num).quantize(Decimal('0.01')),
+                    )
+                )
+        models.DonationBid.objects.bulk_create(donation_bids)
+
+    bidutil.recompute_trees(targets)
+    cacheutil.recompute_donor_cache([event.id], ['USD'])
+    return event
+
+
+def scenarios(event, user):
+    """every scenario to time against the seeded event, in the order they are run"""
+    from tests.util import create_ipn
+
+    client = Client()
+    client.force_login(user)
+    request = RequestFactory().get('/')
+    request.user = user
+    event_admin = admin.site._registry[models.Event]
+    events = models.Event.objects.filter(pk=event.pk)
+    permissions = user.get_all_permissions()
+
+    def prepare_ipn(i):
+        return models.Donation.objects.create(
+            event=event,
+            amount=Decimal('25.00'),
+            domain='PAYPAL',
+            transactionstate='PENDING',
+            requestedalias=f'Benchmark {i}',
+            requestedvisibility='ALIAS',
+        )
+
+    def ipn(donation):
+        create_ipn(
+            donation,
+            f'benchmark{donation.id}@example.com',
+            txn_id=f'benchmark{donation.id}',
+            receiver_email=event.paypalemail,
+        )
+        return 1
+
+    def prepare_postback(i):
+        models.PostbackURL.objects.create(
+            event=event, url='https://example.com/postback'
+        )
+        return (
+            models.Donation.objects.filter(event=event)
+            .order_by('-pk')
+            .prefetch_related('bids', 'bids__bid')
+            .first()
+        )
+
+    def postback(donation):
+        eventutil.post_donation_to_postbacks(donation)
+        # the postbacks are sent in the background, the benchmark times the delivery too
+        postbackutil.flush()
+        return 1
+
+    def api(basename):
+        if basename == 'event':
+            url = reverse('tracker:api_v2:event-list')
+        else:
+            url = reverse(
+                f'tracker:api_v2:event-{basename}-list', kwargs={'event_pk': event.pk}
+            )
+
+        def get(_):
+            response = client.get(url)
+            assert response.status_code == 200, f'{url} {response.status_code}'
+            return len(response.json()['results'])
+
+        return get
+
+    def bid_tree(count):
+        top = models.Bid.objects.filter(event=event, level=0)
+        BidSerializer(
+            top,
+            many=True,
+            tree=True,
+            include_hidden=True,
+            with_permissions=permissions,
+        ).data
+        return count
+
+    def donor_cache(_):
+        return cacheutil.recompute_donor_cache([event.id], ['USD'])[0]
+
+    def draw(i):
+        results = prizeutil.draw_prizes(
+            models.Prize.objects.filter(event=event), seed=i
+        )
+        return len(results)
+
+    def report(name):
+        def export(_):
+            response = getattr(event_admin, name)(request, events)
+            return sum(chunk.count(b'\n') for chunk in response.streaming_content)
+
+        return export
+
+    return [
+        Scenario('ipn', ipn, prepare=prepare_ipn, rollback=True),
+        Scenario('postback', postback, prepare=prepare_postback, rollback=True),
+        *(
+            Scenario(f'api_{basename}_list', api(basename))
+            for basename in API_ENDPOINTS
+        ),
+        Scenario(
+            'bid_tree',
+            bid_tree,
+            prepare=lambda i: models.Bid.objects.filter(event=event).count(),
+        ),
+        Scenario('recompute_donor_cache', donor_cache, rollback=True),
+        Scenario('draw_prizes', draw, prepare=lambda i: i, rollback=True),
+        *(Scenario(f'csv_{name}', report(name)) for name in REPORTS),
+    ]
+
+
+def percentile(values, p):
+    """nearest-rank percentile of an already sorted list"""
+    return values[max(math.ceil(p / 100 * len(values)) - 1, 0)]
+
+
+def measure(scenario, *, iterations, warmup=1):
+    """runs the scenario, returns a dictionary of its timings (in milliseconds), throughput, and query counts"""
+    latencies = []
+    queries = []
+    db_times = []
+    ops = 0
+    for i in range(warmup + iterations):
+        with transaction.atomic():
+            prepared = scenario.prepare(i) if scenario.prepare else None
+            with instrumentation.recording() as stats:
+                start = time.perf_counter()
+                count = scenario.run(prepared)
+                elapsed = time.perf_counter() - start
+            if scenario.rollback:
+                transaction.set_rollback(True)
+        if i >= warmup:
+            latencies.append(elapsed)
+            queries.append(stats.queries)
+            db_times.append(stats.db_time)
+            ops += count
+    latencies.sort()
+    total = sum(latencies)
+    return {
+        'iterations': iterations,
+        'operations': ops,
+        'throughput': ops / total if total else None,
+        'mean': total / iterations * 1000,
+        'p50': percentile(latencies, 50) * 1000,
+        'p99': percentile(latencies, 99) * 1000,
+        'queries': sum(queries) / iterations,
+        'max_queries': max(queries),
+        'db_time': sum(db_times) / iterations * 1000,
+    }
+
+
+class Command(commandutil.TrackerCommand):
+    help = """Seeds a throwaway test database with a randomly generated event, times the tracker's hot paths against it,
+and prints the results as JSON, so that they can be compared between versions. Latencies are in milliseconds, and
+throughput is in operations (e.g. donations, rows, or prizes) per second. Postbacks are not actually sent.
+
+Needs the `tests` package from a source checkout, e.g.:
+DJANGO_SETTINGS_MODULE=tests.test_settings python -m django tracker_benchmark"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--donations', type=int, default=10000)
+        parser.add_argument(
+            '--donors',
+            type=int,
+            help='Defaults to a tenth of the number of donations',
+        )
+        parser.add_argument('--bids', type=int, default=200)
+        parser.add_argument('--prizes', type=int, default=50)
+        parser.add_argument('--runs', type=int, default=150)
+        parser.add_argument(
+            '-i',
+            '--iterations',
+            type=int,
+            default=20,
+            help='Number of timed iterations of each scenario',
+        )
+        parser.add_argument(
+            '--warmup',
+            type=int,
+            default=1,
+            help='Number of untimed iterations of each scenario',
+        )
+        parser.add_argument(
+            '-s',
+            '--scenarios',
+            help='Comma separated list of scenarios to run, defaults to all of them',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '-o', '--output', help='File to write the JSON to, defaults to stdout'
+        )
+        parser.add_argument(
+            '--keepdb',
+            action='store_true',
+            help='Keep the test database afterwards, and reuse it if it already exists',
+        )
+
+    def handle(self, *args, **options):
+        super().handle(*args, **options)
+        try:
+            import tests.randgen  # noqa: F401
+        except ImportError:
+            raise CommandError(
+                'tracker_benchmark needs the `tests` package from a source checkout'
+            )
+
+        setup_test_environment()
+        old_config = setup_databases(
+            max(self.verbosity - 1, 0), interactive=False, keepdb=options['keepdb']
+        )
+        try:
+            with (
+                override_settings(
+                    CHANNEL_LAYERS={
+                        'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}
+                    }
+                ),
+                mock.patch('tracker.postbackutil._session', return_value=_Session()),
+                # the results are written from the worker threads, which cannot see the scenario's rolled back rows
+                mock.patch('tracker.postbackutil._record'),
+            ):
+                results = self.benchmark(options)
+        finally:
+            teardown_databases(
+                old_config,
+                max(self.verbosity - 1, 0),
+                keepdb=options['keepdb'],
+            )
+            teardown_test_environment()
+
+        output = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+    def benchmark(self, options):
+        scale = {
+            'donations': options['donations'],
+            'donors': (
+                options['donors']
+                if options['donors'] is not None
+                else options['donations'] // 10
+            ),
+            'bids': options['bids'],
+            'prizes': options['prizes'],
+            'runs': options['runs'],
+        }
+        # the scale is part of the key, so that a kept database is only reused for the same event
+        prefix = f'benchmark{options["seed"]}-'
+        short = prefix + '-'.join(str(v) for v in scale.values())
+        event = (
+            models.Event.objects.filter(short__startswith=prefix).order_by('pk').first()
+        )
+        if event and event.short != short:
+            # the same seed would generate colliding donations, so they cannot live side by side
+            raise CommandError(
+                f'The kept database was seeded at a different scale ({event.short}), '
+                'run once without --keepdb or pick another --seed'
+            )
+        start = time.monotonic()
+        if event is None:
+            self.message('Seeding...', 2)
+            event = seed(random.Random(options['seed']), **scale)
+            event.short = short
+            event.save()
+        seed_time = time.monotonic() - start
+
+        user, _ = get_user_model().objects.get_or_create(
+            username='benchmark', defaults={'is_staff': True, 'is_superuser': True}
+        )
+        selected = scenarios(event, user)
+        if options['scenarios']:
+            names = [n.strip() for n in options['scenarios'].split(',')]
+            known = {s.name for s in selected}
+            unknown = [n for n in names if n not in known]
+            if unknown:
+                raise CommandError(
+                    f'Unknown scenario(s): {", ".join(unknown)}, choose from: {", ".join(known)}'
+                )
+            selected = [s for s in selected if s.name in names]
+
+        results = {}
+        for scenario in selected:
+            self.message(f'Running {scenario.name}...', 2)
+            results[scenario.name] = measure(
+                scenario,
+                iterations=max(options['iterations'], 1),
+                warmup=max(options['warmup'], 0),
+            )
+
+        return {
+            'version': tracker.__version__,
+            'python': sys.version.split()[0],
+            'database': connection.vendor,
+            'seed': options['seed'],
+            'seed_time': seed_time,
+            'scale': {
+                'donations': models.Donation.objects.filter(event=event).count(),
+                'donors': models.Donor.objects.count(),
+                'bids': models.Bid.objects.filter(event=event).count(),
+                'prizes': models.Prize.objects.filter(event=event).count(),
+                'runs': models.SpeedRun.objects.filter(event=event).count(),
+            },
+            'scenarios': results,
+        }
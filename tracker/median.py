@@ -0,0 +1,74 @@
+"""
+Median computation that pushes the work to the database where possible.
+
+PostgreSQL has an ordered-set aggregate (`PERCENTILE_CONT`), so both single and grouped medians are a single
+aggregate query there. Other backends (SQLite, MySQL) fall back to the portable implementations in `tracker.util`,
+an OFFSET query that only fetches the middle row(s) for single medians, and one ordered pass for grouped medians, no
+matter how many groups there are.
+"""
+
+from django.db import NotSupportedError, connections
+from django.db.models import Aggregate, Count, FloatField
+
+from tracker import util
+
+
+class Median(Aggregate):
+    """continuous median of an expression, only available on PostgreSQL, see `supports_median`"""
+
+    function = 'PERCENTILE_CONT'
+    name = 'Median'
+    template = '%(function)s(0.5) WITHIN GROUP (ORDER BY %(expressions)s)'
+
+    def __init__(self, expression, **extra):
+        extra.setdefault('output_field', FloatField())
+        super().__init__(expression, **extra)
+
+    def as_sql(self, compiler, connection, **extra_context):
+        if connection.vendor != 'postgresql':
+            raise NotSupportedError(
+                f'Median is not supported on {connection.display_name}'
+            )
+        return super().as_sql(compiler, connection, **extra_context)
+
+
+def supports_median(queryset):
+    return connections[queryset.db].vendor == 'postgresql'
+
+
+def median(queryset, column, *, count=None):
+    """
+    the median of a single column over the whole queryset, 0 if the queryset is empty
+
+    `count` is only used by the fallback path, which only fetches the middle row(s), so that it does not have to
+    count them again
+    """
+    if supports_median(queryset):
+        return queryset.order_by().aggregate(median=Median(column))['median'] or 0
+    return util.median(queryset, column, count=count)
+
+
+def grouped_medians(queryset, group_fields, column, *, counts=None):
+    """
+    the median of a column for every group in the queryset, keyed by a tuple of the `group_fields` values
+
+    `counts` is only used by the fallback path, if it's not provided, it will be computed with one extra grouped
+    query
+    """
+    if supports_median(queryset):
+        return {
+            row[:-1]: row[-1]
+            for row in queryset.order_by()
+            .values(*group_fields)
+            .annotate(median=Median(column))
+            .values_list(*group_fields, 'median')
+        }
+    if counts is None:
+        counts = {
+            row[:-1]: row[-1]
+            for row in queryset.order_by()
+            .values(*group_fields)
+            .annotate(count=Count(column))
+            .values_list(*group_fields, 'count')
+        }
+    return util.grouped_median(queryset, group_fields, column, counts=counts)
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0082_add_bid_tags'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='donorcache',
+            name='stale',
+            field=models.BooleanField(
+                db_index=True,
+                default=False,
+                editable=False,
+                help_text='Set when the median has not been recomputed since the last incremental update',
+            ),
+        ),
+    ]
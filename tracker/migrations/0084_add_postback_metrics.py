@@ -0,0 +1,47 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0083_add_donor_cache_stale'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='postbackurl',
+            name='batch',
+            field=models.BooleanField(
+                default=False,
+                help_text='If set, donations that are sent together will be delivered as a single JSON list instead of one request each',
+            ),
+        ),
+        migrations.AddField(
+            model_name='postbackurl',
+            name='success_count',
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name='Successful Deliveries'
+            ),
+        ),
+        migrations.AddField(
+            model_name='postbackurl',
+            name='failure_count',
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name='Failed Deliveries'
+            ),
+        ),
+        migrations.AddField(
+            model_name='postbackurl',
+            name='total_latency',
+            field=models.FloatField(
+                default=0,
+                editable=False,
+                help_text='Total time in seconds spent on successful deliveries',
+            ),
+        ),
+        migrations.AddField(
+            model_name='postbackurl',
+            name='last_failure',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,107 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:04
+
+import django.db.models.deletion
+from django.db import DatabaseError, migrations, models, transaction
+
+FTS_TABLE = 'tracker_searchdocument_fts'
+
+
+def create_text_indexes(apps, schema_editor):
+    # the parts of the index that the ORM cannot express, each backend falls back to plain substring matching on
+    #  the document table if they are not available
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX tracker_searchdocument_tsv ON tracker_searchdocument '
+            "USING GIN (to_tsvector('simple', document))"
+        )
+        try:
+            with transaction.atomic(using=connection.alias):
+                schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        except DatabaseError:
+            # creating the extension usually needs a superuser
+            return
+        schema_editor.execute(
+            'CREATE INDEX tracker_searchdocument_trgm ON tracker_searchdocument '
+            'USING GIN (document gin_trgm_ops)'
+        )
+    elif connection.vendor == 'sqlite':
+        try:
+            with transaction.atomic(using=connection.alias):
+                schema_editor.execute(
+                    f'CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(document, '
+                    "content='tracker_searchdocument', content_rowid='id', tokenize='trigram')"
+                )
+        except DatabaseError:
+            # SQLite was built without FTS5, or is older than 3.34
+            return
+        schema_editor.execute(
+            f'CREATE TRIGGER {FTS_TABLE}_insert AFTER INSERT ON tracker_searchdocument BEGIN '
+            f'INSERT INTO {FTS_TABLE}(rowid, document) VALUES (new.id, new.document); END'
+        )
+        schema_editor.execute(
+            f'CREATE TRIGGER {FTS_TABLE}_delete AFTER DELETE ON tracker_searchdocument BEGIN '
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, document) VALUES ('delete', old.id, old.document); END"
+        )
+        schema_editor.execute(
+            f'CREATE TRIGGER {FTS_TABLE}_update AFTER UPDATE ON tracker_searchdocument BEGIN '
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, document) VALUES ('delete', old.id, old.document); "
+            f'INSERT INTO {FTS_TABLE}(rowid, document) VALUES (new.id, new.document); END'
+        )
+
+
+def drop_text_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS tracker_searchdocument_tsv')
+        schema_editor.execute('DROP INDEX IF EXISTS tracker_searchdocument_trgm')
+    elif connection.vendor == 'sqlite':
+        for trigger in ('insert', 'delete', 'update'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS {FTS_TABLE}_{trigger}')
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('tracker', '0084_add_postback_metrics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                (
+                    'id',
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                ('object_id', models.IntegerField()),
+                ('group', models.CharField(max_length=32)),
+                ('document', models.TextField()),
+                (
+                    'content_type',
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to='contenttypes.contenttype',
+                    ),
+                ),
+            ],
+            options={
+                'verbose_name': 'Search Document',
+                'indexes': [
+                    models.Index(
+                        fields=['content_type', 'group', 'object_id'],
+                        name='tracker_sea_content_2481a5_idx',
+                    )
+                ],
+                'unique_together': {('content_type', 'object_id', 'group')},
+            },
+        ),
+        migrations.RunPython(create_text_indexes, drop_text_indexes),
+    ]
@@ -0,0 +1,107 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:48
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('post_office', '__first__'),
+        ('tracker', '0085_add_search_document'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrizeMailJob',
+            fields=[
+                (
+                    'id',
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                (
+                    'kind',
+                    models.CharField(
+                        choices=[
+                            ('CONTRIBUTOR', 'Prize Contributors'),
+                            ('WINNER', 'Prize Winners'),
+                            ('ACCEPT', 'Accept Notifications'),
+                            ('SHIPPING', 'Shipping Notifications'),
+                        ],
+                        max_length=16,
+                    ),
+                ),
+                (
+                    'state',
+                    models.CharField(
+                        choices=[
+                            ('QUEUED', 'Queued'),
+                            ('RUNNING', 'Running'),
+                            ('DONE', 'Done'),
+                            ('FAILED', 'Failed'),
+                        ],
+                        default='QUEUED',
+                        max_length=16,
+                    ),
+                ),
+                ('from_address', models.EmailField(max_length=256)),
+                ('reply_address', models.EmailField(max_length=256)),
+                ('accept_deadline', models.DateTimeField(blank=True, null=True)),
+                (
+                    'base_url',
+                    models.CharField(
+                        blank=True,
+                        help_text='The root URL of the request that queued the job, used for links in the emails',
+                        max_length=256,
+                    ),
+                ),
+                ('groups', models.JSONField(default=list, editable=False)),
+                ('groups_done', models.PositiveIntegerField(default=0, editable=False)),
+                ('emails_sent', models.PositiveIntegerField(default=0, editable=False)),
+                ('error', models.TextField(blank=True, editable=False)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                (
+                    'finished',
+                    models.DateTimeField(blank=True, editable=False, null=True),
+                ),
+                (
+                    'email_template',
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name='+',
+                        to='post_office.emailtemplate',
+                    ),
+                ),
+                (
+                    'event',
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name='prize_mail_jobs',
+                        to='tracker.event',
+                    ),
+                ),
+                (
+                    'user',
+                    models.ForeignKey(
+                        blank=True,
+                        help_text='Changes to the prizes and claims are logged as this user',
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name='+',
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                'verbose_name': 'Prize Mail Job',
+                'ordering': ('-created',),
+            },
+        ),
+    ]
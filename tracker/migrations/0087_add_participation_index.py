@@ -0,0 +1,97 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0086_add_prize_mail_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DonorParticipation',
+            fields=[
+                (
+                    'id',
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                (
+                    'donor',
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name='participation',
+                        to='tracker.donor',
+                    ),
+                ),
+                (
+                    'event',
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to='tracker.event'
+                    ),
+                ),
+            ],
+            options={
+                'verbose_name': 'Donor Participation',
+                'unique_together': {('event', 'donor')},
+            },
+        ),
+        migrations.CreateModel(
+            name='TalentParticipation',
+            fields=[
+                (
+                    'id',
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                (
+                    'role',
+                    models.CharField(
+                        choices=[
+                            ('runner', 'Runner'),
+                            ('host', 'Host'),
+                            ('commentator', 'Commentator'),
+                            ('interviewer', 'Interviewer'),
+                            ('subject', 'Interview Subject'),
+                        ],
+                        max_length=16,
+                    ),
+                ),
+                (
+                    'event',
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to='tracker.event'
+                    ),
+                ),
+                (
+                    'talent',
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name='participation',
+                        to='tracker.talent',
+                    ),
+                ),
+            ],
+            options={
+                'verbose_name': 'Talent Participation',
+                'indexes': [
+                    models.Index(
+                        fields=['event', 'role', 'talent'],
+                        name='tracker_tal_event_i_e69a82_idx',
+                    )
+                ],
+                'unique_together': {('event', 'talent', 'role')},
+            },
+        ),
+    ]
@@ -21,8 +21,16 @@ from tracker.models.event import (
 from tracker.models.interstitial import Ad, Interstitial, Interview
 from tracker.models.log import Log
 from tracker.models.mod_filter import AmountFilter, WordFilter
-from tracker.models.prize import DonorPrizeEntry, Prize, PrizeClaim, PrizeKey
+from tracker.models.participation import DonorParticipation, TalentParticipation
+from tracker.models.prize import (
+    DonorPrizeEntry,
+    Prize,
+    PrizeClaim,
+    PrizeKey,
+    PrizeMailJob,
+)
 from tracker.models.profile import UserProfile
+from tracker.models.search import SearchDocument
 from tracker.models.tag import AbstractTag, Tag
 
 __all__ = [
@@ -41,6 +49,7 @@ __all__ = [
     'PrizeKey',
     'PrizeClaim',
     'DonorPrizeEntry',
+    'PrizeMailJob',
     'SpeedRun',
     'Talent',
     'Submission',
@@ -52,6 +61,9 @@ __all__ = [
     'AmountFilter',
     'Log',
     'UserProfile',
+    'SearchDocument',
+    'TalentParticipation',
+    'DonorParticipation',
     'Interview',
     'Ad',
     'Interstitial',
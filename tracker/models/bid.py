@@ -9,8 +9,7 @@ import mptt.models
 from django.core.exceptions import ValidationError
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
-from django.db.models import Count, F, Q, Sum, signals
-from django.db.models.functions import Coalesce
+from django.db.models import F, Q, signals
 from django.dispatch import receiver
 from django.urls import reverse
 
@@ -483,9 +482,7 @@ class Bid(mptt.models.MPTTModel):
         if errors:
             raise ValidationError(errors)
 
-    def save(self, *args, skip_parent=False, **kwargs):
-        if self.parent and not skip_parent:
-            self.check_parent()
+    def save(self, *args, **kwargs):
         if self.speedrun:
             self.event = self.speedrun.event
         if self.parent is None and not self.istarget:
@@ -493,122 +490,60 @@ class Bid(mptt.models.MPTTModel):
                 self.accepted_number = 1
         else:
             self.accepted_number = None
-        if self.state in ['OPENED', 'CLOSED'] and not self.revealedtime:
-            self.revealedtime = util.utcnow()
-            analytics.track(
-                AnalyticsEventTypes.INCENTIVE_OPENED,
-                {
-                    'timestamp': self.revealedtime,
-                    'bid_id': self.id,
-                    'event_id': self.event_id,
-                    'run_id': self.speedrun_id,
-                    'parent_id': self.parent_id,
-                    'name': self.name,
-                    'goal': self.goal,
-                    'is_target': self.istarget,
-                    'allow_user_options': self.allowuseroptions,
-                    'max_option_length': self.option_max_length,
-                    'dependent_on_id': self.biddependency,
-                },
-            )
         if self.biddependency:
             self.event = self.biddependency.event
             # TODO: is this correct?
             if not self.speedrun:
                 self.speedrun = self.biddependency.speedrun
-        if self.chain:
-            if self.parent_id is None:
-                self.chain_goal = self.goal
-            self.chain_remaining = 0
-            if self.pk:
-                for descendant in self.get_descendants():
-                    self.chain_remaining += descendant.goal
-        else:
-            self.chain_goal = self.chain_remaining = None
-        self.update_total()
-        super(Bid, self).save(*args, **kwargs)
-        for option in self.get_children():
-            changed = False
-            if self.chain:
-                old_total = option.total
-                option.update_total()
-                if old_total != option.total:
-                    changed = True
-            if option.check_parent() or changed:
-                option.save(skip_parent=True)
-        if self.parent and not skip_parent:
-            self.parent.save()
-
-    def check_parent(self):
-        self.parent.refresh_from_db()
-        changed = False
-        if self.speedrun != self.parent.speedrun:
-            self.speedrun = self.parent.speedrun
-            changed = True
-        # if speedrun is set, event propagates from it
-        if not self.speedrun and self.event != self.parent.event:
-            self.event = self.parent.event
-            changed = True
-        if self.state not in ['PENDING', 'DENIED'] and self.state != self.parent.state:
-            self.state = self.parent.state
-            changed = True
-        if self.chain != self.parent.chain:
-            self.chain = self.parent.chain
-            changed = True
-        if self.chain:
-            expected = self.parent.chain_goal + self.goal
-            if self.chain_goal != expected:
-                self.chain_goal = expected
-                changed = True
-
-        return changed
-
-    def update_total(self):
-        if not self.pk:
-            self.total = 0
+        if self.count is None:
             self.count = 0
-        elif self.istarget:
-            bids = self.bids.completed().aggregate(
-                total=Coalesce(Sum('amount'), Decimal(0)), count=Count('amount')
-            )
-            self.total = bids['total']
-            self.count = bids['count']
-            # auto close and unpin this if it's a challenge with no children and the goal's been met
-            if (
-                self.goal
-                and self.state == 'OPENED'
-                and self.total
-                >= (self.chain_goal + self.chain_remaining if self.chain else self.goal)
-                and self.istarget
-            ):
-                self.state = 'CLOSED'
-                analytics.track(
-                    AnalyticsEventTypes.INCENTIVE_MET,
-                    {
-                        'timestamp': util.utcnow(),
-                        'bid_id': self.pk,
-                        'event_id': self.event_id,
-                        'run_id': self.speedrun_id,
-                        'parent_id': self.parent_id,
-                        'name': self.name,
-                        'goal': self.goal,
-                        'is_target': self.istarget,
-                        'total_raised': self.total,
-                        'unique_donations': self.count,
-                        'allow_user_options': self.allowuseroptions,
-                        'max_option_length': self.option_max_length,
-                        'dependent_on_id': self.biddependency,
-                    },
-                )
-        elif self.chain:
-            self.total = max(0, self.parent.total - self.parent.goal)
-        else:
-            options = self.options.exclude(state__in=('DENIED', 'PENDING')).aggregate(
-                total=Coalesce(Sum('total'), Decimal(0)),
-                count=Coalesce(Sum('count'), 0),
-            )
-            self.total = options['total']
-            self.count = options['count']
+        super(Bid, self).save(*args, **kwargs)
+        # everything that depends on the rest of the tree (totals, chain goals, state propagation, etc), any
+        # ancestors that are already loaded get refreshed along with this one
+        from .. import bidutil
+
+        bids = [self]
+        while Bid.parent.is_cached(bids[-1]) and bids[-1].parent:
+            bids.append(bids[-1].parent)
+        bidutil.schedule_recompute(bids)
+
+    def track_opened(self):
+        analytics.track(
+            AnalyticsEventTypes.INCENTIVE_OPENED,
+            {
+                'timestamp': self.revealedtime,
+                'bid_id': self.id,
+                'event_id': self.event_id,
+                'run_id': self.speedrun_id,
+                'parent_id': self.parent_id,
+                'name': self.name,
+                'goal': self.goal,
+                'is_target': self.istarget,
+                'allow_user_options': self.allowuseroptions,
+                'max_option_length': self.option_max_length,
+                'dependent_on_id': self.biddependency_id,
+            },
+        )
+
+    def track_met(self):
+        analytics.track(
+            AnalyticsEventTypes.INCENTIVE_MET,
+            {
+                'timestamp': util.utcnow(),
+                'bid_id': self.pk,
+                'event_id': self.event_id,
+                'run_id': self.speedrun_id,
+                'parent_id': self.parent_id,
+                'name': self.name,
+                'goal': self.goal,
+                'is_target': self.istarget,
+                'total_raised': self.total,
+                'unique_donations': self.count,
+                'allow_user_options': self.allowuseroptions,
+                'max_option_length': self.option_max_length,
+                'dependent_on_id': self.biddependency_id,
+            },
+        )
 
     def __str__(self):
         parts = [f'{self.event} (Event)']
@@ -690,22 +625,6 @@ class DonationBid(models.Model):
                 else:
                     tasks.post_donation_to_postbacks(self.donation_id)
 
-        from .. import viewutil
-
-        bidsTree = (
-            viewutil.get_tree_queryset_all(Bid, [self.bid])
-            .select_related('parent')
-            .prefetch_related('options', 'tags')
-        )
-        for bid in bidsTree:
-            if bid.state == 'OPENED' and bid.goal is not None and bid.goal <= bid.total:
-                bid.state = 'CLOSED'
-                if hasattr(bid, 'dependent_bids_set'):
-                    for dependentBid in bid.dependent_bids_set():
-                        if dependentBid.state == 'HIDDEN':
-                            dependentBid.state = 'OPENED'
-                            dependentBid.save()
-
     @property
     def speedrun(self):
         return self.bid.speedrun
@@ -739,7 +658,9 @@ def DonationBidParentUpdate(sender, instance, created, raw, **kwargs):
     if raw:
         return
     if instance.donation.transactionstate == 'COMPLETED':
-        instance.bid.save()
+        from .. import bidutil
+
+        bidutil.schedule_recompute([instance.bid])
 
 
 # FIXME: this appears to be unused, see #154548040
@@ -9,7 +9,7 @@ from functools import reduce
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.core.signing import Signer
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.db.models import (
     Avg,
     Count,
@@ -27,7 +27,7 @@ from django.urls import reverse
 from django.utils import timezone
 
 from .. import settings, util
-from ..util import median
+from ..median import median
 from ..validators import nonzero, positive
 from .fields import OneToOneOrNoneField
 from .tag import AbstractTag
@@ -65,6 +65,17 @@ LanguageChoices = (
 
 logger = logging.getLogger(__name__)
 
+# sentinel for when the previous state of a donation is not known, e.g. if it was loaded with deferred fields
+_UNKNOWN_STATE = object()
+
+_DONOR_CACHE_FIELDS = (
+    'donor_id',
+    'event_id',
+    'amount',
+    'transactionstate',
+    'testdonation',
+)
+
 
 class DonationQuerySet(models.QuerySet):
     def completed(self):
@@ -287,6 +298,28 @@ class Donation(models.Model):
             ),
         )
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # only snapshot if everything is loaded, otherwise we'd trigger extra queries for deferred fields
+        if all(f in field_names for f in _DONOR_CACHE_FIELDS):
+            instance._donor_cache_state = instance.donor_cache_state
+        if 'event_id' in field_names and 'donor_id' in field_names:
+            instance._participation_key = (instance.event_id, instance.donor_id)
+        return instance
+
+    @property
+    def donor_cache_state(self):
+        """the parts of the donation that contribute to the DonorCache, or None if it does not count
+        towards any totals, used for incremental updates"""
+        if self.transactionstate == 'COMPLETED' and not self.testdonation:
+            return (
+                self.donor_id,
+                self.event_id,
+                Decimal(self.amount).quantize(Decimal('0.00')),
+            )
+        return None
+
     def user_can_send_to_reader(self, user):
         """returns True if
         a) the event is set
@@ -376,7 +409,8 @@ class Donation(models.Model):
         if errors:
             raise ValidationError(errors)
 
-    def save(self, *args, **kwargs):
+    def normalize_states(self):
+        """applies the event's screening rules to the read state, and marks donations without a comment as such"""
         if self.readstate == 'PENDING':
             if self.event.screening_mode == 'host_only':
                 self.readstate = 'READY'
@@ -394,6 +428,16 @@ class Donation(models.Model):
         elif self.readstate == 'FLAGGED' and self.event.screening_mode != 'two_pass':
             # this is one side of an edge case involving this flag, see the event model for the other
             self.readstate = 'READY'
+        if self.comment == '':
+            self.commentstate = 'ABSENT'
+        elif self.commentstate == 'ABSENT':
+            self.commentstate = 'PENDING'
+
+    def save(self, *args, **kwargs):
+        self.requestedalias = self.requestedalias.strip()
+        self.requestedemail = self.requestedemail.strip()
+        self.comment = self.comment.strip()
+        self.normalize_states()
         if not self.timereceived:
             self.timereceived = util.utcnow()
         if self.domain == 'LOCAL':  # local donations are always complete, duh
@@ -402,13 +446,6 @@ class Donation(models.Model):
         # reminder that this does not run during migrations tests, so you have to provide the domainId yourself
         if not self.domainId:
             self.domainId = f'{int(time.time())}-{random.getrandbits(128)}'
-        self.requestedalias = self.requestedalias.strip()
-        self.requestedemail = self.requestedemail.strip()
-        self.comment = self.comment.strip()
-        if self.comment == '':
-            self.commentstate = 'ABSENT'
-        elif self.commentstate == 'ABSENT':
-            self.commentstate = 'PENDING'
         # TODO: language detection again?
         self.commentlanguage = 'un'
 
@@ -434,14 +471,77 @@ def donation_bids_update(sender, instance, created, raw, **kwargs):
     if raw:
         return
     if instance.transactionstate == 'COMPLETED':
-        for b in instance.bids.all():
-            b.save()
+        from .. import bidutil
+
+        bidutil.schedule_recompute(instance.bids.values_list('bid_id', flat=True))
+
+
+ALIAS_NUM_RANGE = range(1000, 10000)
+# how many random candidates to check with a single query before falling back to scanning the whole namespace
+_ALIAS_NUM_PROBES = 8
+# how many times to retry a save when a concurrent save (e.g. another IPN) grabbed the same number first
+_ALIAS_NUM_ATTEMPTS = 3
+
+
+def _choose_alias_num(taken):
+    """
+    `taken` is called with a handful of random candidates, and returns the ones that are already in use, only if every
+    one of them is in use, which should only happen when the namespace is nearly full, is it called again with None,
+    and should return every number in use, returns None if the namespace is full
+    """
+    candidates = random.sample(ALIAS_NUM_RANGE, _ALIAS_NUM_PROBES)
+    used = taken(candidates)
+    if free := next((c for c in candidates if c not in used), None):
+        return free
+    used = taken(None)
+    available = [i for i in ALIAS_NUM_RANGE if i not in used]
+    return random.choice(available) if available else None
 
 
 class DonorManager(models.Manager):
     def get_by_natural_key(self, email):
         return self.get(email=email)
 
+    def pick_alias_num(self, alias):
+        """returns a free number for the alias, or None if the namespace is full"""
+
+        def taken(candidates):
+            queryset = self.filter(alias=alias)
+            if candidates is not None:
+                queryset = queryset.filter(alias_num__in=candidates)
+            return set(queryset.values_list('alias_num', flat=True))
+
+        return _choose_alias_num(taken)
+
+    def assign_alias_nums(self, donors):
+        """
+        fills in the alias number of every donor that has an alias but no number, without saving them (e.g. before a
+        `bulk_create` when importing), using a single query for the whole batch, donors whose namespace is full have
+        their alias cleared instead
+        """
+        pending = [d for d in donors if d.alias and not d.alias_num]
+        if not pending:
+            return donors
+        used = defaultdict(set)
+        for alias, alias_num in self.filter(
+            alias__in={d.alias for d in pending}
+        ).values_list('alias', 'alias_num'):
+            used[alias].add(alias_num)
+        for donor in donors:
+            if donor.alias and donor.alias_num:
+                used[donor.alias].add(donor.alias_num)
+        for donor in pending:
+            nums = used[donor.alias]
+            donor.alias_num = _choose_alias_num(lambda candidates: nums)
+            if donor.alias_num is None:
+                logger.warning(
+                    f'Could not set alias `{donor.alias}` because the namespace was full'
+                )
+                donor.alias = None
+            else:
+                nums.add(donor.alias_num)
+        return donors
+
 
 class Donor(models.Model):
     objects = DonorManager()
@@ -518,21 +618,36 @@ class Donor(models.Model):
         if not self.alias:
             self.alias = None
             self.alias_num = None
-        elif not self.alias_num:
-            existing = set(d.alias_num for d in Donor.objects.filter(alias=self.alias))
-            available = [i for i in range(1000, 10000) if i not in existing]
-            if not available:
+        if not self.paypalemail:
+            self.paypalemail = None
+        if self.alias_num or not self.alias:
+            self._save(*args, **kwargs)
+            return
+
+        using = kwargs.get('using', None)
+        for attempt in range(1, _ALIAS_NUM_ATTEMPTS + 1):
+            self.alias_num = Donor.objects.db_manager(using).pick_alias_num(self.alias)
+            if self.alias_num is None:
                 logger.warning(
                     f'Could not set alias `{self.alias}` because the namespace was full'
                 )
                 self.alias = None
+                self._save(*args, **kwargs)
+                return
+            try:
+                with transaction.atomic(using=using):
+                    self._save(*args, **kwargs)
+                return
+            except IntegrityError:
+                # most likely somebody else took the same number in the meantime, if not, the last attempt will
+                #  raise the real problem
                 self.alias_num = None
-            else:
-                self.alias_num = random.choice(available)
+                if attempt == _ALIAS_NUM_ATTEMPTS:
+                    raise
+
+    def _save(self, *args, **kwargs):
         if self.visibility == 'ALIAS' and not self.alias:
             self.visibility = 'ANON'
-        if not self.paypalemail:
-            self.paypalemail = None
         super(Donor, self).save(*args, **kwargs)
 
     def contact_name(self):
@@ -656,34 +771,171 @@ class DonorCache(models.Model):
         default=0,
         db_index=True,
     )
+    stale = models.BooleanField(
+        editable=False,
+        default=False,
+        db_index=True,
+        help_text='Set when the median has not been recomputed since the last incremental update',
+    )
 
     @staticmethod
     @receiver(signals.post_save, sender=Donation)
     @receiver(signals.post_delete, sender=Donation)
-    def donation_update(sender, instance, **args):
-        if not instance.donor:
-            return
-
-        DonorCache.objects.get_or_create(event=instance.event, donor=instance.donor)[
-            0
-        ].update()
-        DonorCache.objects.get_or_create(
-            event=None, donor=instance.donor, currency=instance.event.paypalcurrency
-        )[0].update()
+    def donation_update(sender, instance, signal, created=False, **args):
+        if settings.TRACKER_INCREMENTAL_DONOR_CACHE:
+            old_state = getattr(
+                instance, '_donor_cache_state', None if created else _UNKNOWN_STATE
+            )
+            new_state = (
+                None if signal is signals.post_delete else instance.donor_cache_state
+            )
+            instance._donor_cache_state = new_state
+            if old_state is not _UNKNOWN_STATE:
+                DonorCache.apply_delta(instance, old_state, new_state)
+                return
+
+        if instance.donor:
+            DonorCache.objects.get_or_create(
+                event=instance.event, donor=instance.donor
+            )[0].update()
+            DonorCache.objects.get_or_create(
+                event=None, donor=instance.donor, currency=instance.event.paypalcurrency
+            )[0].update()
         DonorCache.objects.get_or_create(event=instance.event, donor=None)[0].update()
         DonorCache.objects.get_or_create(
             event=None, donor=None, currency=instance.event.paypalcurrency
         )[0].update()
 
-    def update(self):
+    @staticmethod
+    def _scopes(donation, state):
+        donor_id, event_id, _ = state
+        if event_id == donation.event_id:
+            currency = donation.event.paypalcurrency
+        else:
+            from .event import Event
+
+            currency = Event.objects.values_list('paypalcurrency', flat=True).get(
+                pk=event_id
+            )
+        # always the same order, so that concurrent updates lock the rows in the same order
+        scopes = [
+            {'event_id': event_id, 'donor_id': None},
+            {'event_id': None, 'donor_id': None, 'currency': currency},
+        ]
+        if donor_id:
+            scopes = [
+                {'event_id': event_id, 'donor_id': donor_id},
+                {'event_id': None, 'donor_id': donor_id, 'currency': currency},
+                *scopes,
+            ]
+        return scopes
+
+    @staticmethod
+    def apply_delta(donation, old_state, new_state):
+        """
+        applies the change in a donation's contribution directly to the affected cache rows, instead of
+        re-aggregating every donation in each scope
+
+        total, count, max, and average are kept exact, but the median is marked stale and left for
+        `DonorCache.reconcile`, except for the trivial single-donation case
+        """
+        if old_state == new_state:
+            return
+        with transaction.atomic():
+            if old_state:
+                for scope in DonorCache._scopes(donation, old_state):
+                    DonorCache._remove_amount(scope, old_state[2])
+            if new_state:
+                for scope in DonorCache._scopes(donation, new_state):
+                    DonorCache._add_amount(scope, new_state[2])
+
+    @staticmethod
+    def _add_amount(scope, amount):
+        cache = DonorCache.objects.select_for_update().get_or_create(**scope)[0]
+        cache.donation_total += amount
+        cache.donation_count += 1
+        cache.donation_max = max(cache.donation_max, amount)
+        cache.donation_avg = (
+            Decimal(cache.donation_total) / cache.donation_count
+        ).quantize(Decimal('0.00'))
+        if cache.donation_count == 1:
+            cache.donation_med = amount
+            cache.stale = False
+        else:
+            cache.stale = True
+        cache.save()
+
+    @staticmethod
+    def _remove_amount(scope, amount):
+        cache = DonorCache.objects.select_for_update().filter(**scope).first()
+        if cache is None:
+            return
+        if cache.donation_count <= 1:
+            cache.delete()
+            return
+        cache.donation_total -= amount
+        cache.donation_count -= 1
+        cache.donation_avg = (
+            Decimal(cache.donation_total) / cache.donation_count
+        ).quantize(Decimal('0.00'))
+        if amount >= cache.donation_max:
+            # the maximum can't be decremented, but this is an indexed lookup, and if the donation
+            #  was only moved within this scope, the new amount is already included
+            cache.donation_max = cache.donations.aggregate(
+                max=Coalesce(Max('amount'), Decimal('0.00'))
+            )['max']
+        cache.stale = True
+        cache.save()
+
+    @classmethod
+    def event_total(cls, event_id):
+        """
+        the running (total, count) of completed donations for an event, read from its all-donors row, which is kept
+        up to date whenever a donation is saved
+
+        the cache never includes test donations, but `Donation.objects.completed()` does when `PAYPAL_TEST` is on, so
+        in that case the event's completed test donations are added on top, to match what it would return
+        """
+        total, count = cls.objects.filter(event_id=event_id, donor=None).values_list(
+            'donation_total', 'donation_count'
+        ).first() or (Decimal('0.00'), 0)
+        if settings.PAYPAL_TEST:
+            test = (
+                Donation.objects.completed()
+                .filter(event_id=event_id, testdonation=True)
+                .aggregate(
+                    total=Coalesce(Sum('amount'), Decimal('0.00')), count=Count('id')
+                )
+            )
+            total += test['total']
+            count += test['count']
+        return total, count
+
+    @classmethod
+    def reconcile(cls, queryset=None):
+        """recomputes every stale row, returns the number of rows that were updated"""
+        if queryset is None:
+            queryset = cls.objects.all()
+        count = 0
+        for cache in queryset.filter(stale=True).select_related('donor', 'event'):
+            cache.update()
+            count += 1
+        return count
+
+    @property
+    def donations(self):
         # TODO: separate caches for test donations?
         donations = Donation.objects.completed().filter(testdonation=False)
-        if self.donor:
-            donations = donations.filter(donor=self.donor)
-        if self.event:
-            donations = donations.filter(event=self.event)
+        if self.donor_id:
+            donations = donations.filter(donor_id=self.donor_id)
+        if self.event_id:
+            donations = donations.filter(event_id=self.event_id)
         else:
             donations = donations.filter(event__paypalcurrency=self.currency)
+        return donations
+
+    def update(self):
+        donations = self.donations
         aggregate = donations.aggregate(
             total=Cast(Coalesce(Sum('amount'), 0.0), output_field=FloatField()),
             count=Coalesce(Count('amount'), 0),
@@ -695,9 +947,10 @@ class DonorCache(models.Model):
         self.donation_max = aggregate['max']
         self.donation_avg = aggregate['avg']
         self.donation_med = median(donations, 'amount', count=aggregate['count'])
+        self.stale = False
         if self.donation_count:
             self.save()
-        else:
+        elif self.pk:
             self.delete()
 
     def __str__(self):
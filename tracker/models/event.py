@@ -8,7 +8,7 @@ import post_office.models
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.core.validators import validate_slug
-from django.db import models
+from django.db import models, transaction
 from django.db.models import Prefetch
 from django.urls import reverse
 from timezone_field import TimeZoneField
@@ -339,9 +339,14 @@ class Event(models.Model):
             ).update(readstate='READY')
         elif self.screening_mode == 'one_pass':
             self.donation_set.completed().to_approve().update(readstate='READY')
-        first_run = self.speedrun_set.all().first()
+        # unordered runs sort first on some databases
+        first_run = self.speedrun_set.exclude(order=None).first()
         if first_run and first_run.starttime and first_run.starttime != self.datetime:
-            first_run.save()
+            from .. import scheduleutil
+
+            # none of the run's own fields changed, so saving it would skip the schedule pass
+            if not scheduleutil.is_deferred(self):
+                scheduleutil.recompute_schedule(self)
 
     def clean(self):
         if self.id and self.id < 1:
@@ -391,15 +396,40 @@ class PostbackURL(models.Model):
         related_name='postbacks',
     )
     url = models.URLField(blank=False, null=False, verbose_name='URL')
+    batch = models.BooleanField(
+        default=False,
+        help_text='If set, donations that are sent together will be delivered as a single JSON list instead of one request each',
+    )
+    success_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Successful Deliveries'
+    )
+    failure_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Failed Deliveries'
+    )
+    total_latency = models.FloatField(
+        default=0,
+        editable=False,
+        help_text='Total time in seconds spent on successful deliveries',
+    )
+    last_failure = models.DateTimeField(null=True, blank=True, editable=False)
 
     class Meta:
         app_label = 'tracker'
 
+    @property
+    def average_latency(self):
+        if self.success_count:
+            return self.total_latency / self.success_count
+        return None
+
 
 _DEFAULT_RUN_MIN = 3
 _DEFAULT_RUN_MAX = 7
 _DEFAULT_RUN_DELTA = datetime.timedelta(hours=6)
 
+# the fields that the schedule is computed from, see `SpeedRun.save`
+_SCHEDULE_STATE_FIELDS = ('event_id', 'order', 'run_time', 'setup_time', 'anchor_time')
+
 
 class SpeedRunQueryset(models.QuerySet):
     def public(self, include_draft=False):
@@ -688,89 +718,107 @@ class SpeedRun(models.Model):
         if errors:
             raise ValidationError(errors)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # only snapshot if everything is loaded, otherwise we'd trigger extra queries for deferred fields
+        if all(f in field_names for f in _SCHEDULE_STATE_FIELDS):
+            instance._schedule_state = instance.schedule_state
+        return instance
+
+    @property
+    def schedule_state(self):
+        """the fields that decide where this run, and every run after it, lands in the schedule"""
+        return (
+            self.event_id,
+            self.order,
+            self.run_time_ms,
+            self.setup_time_ms,
+            self.anchor_time,
+        )
+
+    def _schedule_changed(self, update_fields):
+        if update_fields is not None and not {
+            f.removesuffix('_id') for f in _SCHEDULE_STATE_FIELDS
+        } & set(update_fields):
+            return False
+        old = getattr(self, '_schedule_state', None)
+        return old is None or old != self.schedule_state
+
     def save(self, *args, **kwargs):
+        from .. import scheduleutil
+
         # FIXME: better way to force normalization?
 
         self.run_time = self._meta.get_field('run_time').to_python(self.run_time)
         self.setup_time = self._meta.get_field('setup_time').to_python(self.setup_time)
 
-        if self.order:
-            prev_run = (
-                SpeedRun.objects.filter(event=self.event, order__lt=self.order)
-                .exclude(pk=self.pk)
-                .last()
-            )
-            next_run = (
-                SpeedRun.objects.filter(event=self.event, order__gt=self.order)
-                .exclude(pk=self.pk)
-                .first()
-            )
-            if prev_run:
-                self.order = prev_run.order + 1
-            else:
-                self.order = 1
-            next_order = self.order + 1
-            if self.anchor_time:
-                self.starttime = self.anchor_time
-            elif prev_run:
-                self.starttime = prev_run.endtime
-            else:
-                self.starttime = self.event.datetime
-            if next_run and next_run.anchor_time:
-                self.setup_time = (
-                    next_run.anchor_time
-                    - self.starttime
-                    - datetime.timedelta(milliseconds=self.run_time_ms)
+        using = kwargs.get('using', None)
+        existing = self.pk is not None
+
+        if not self._schedule_changed(kwargs.get('update_fields', None)):
+            # nothing the schedule depends on changed, so neither this run nor any other one moves
+            if existing and kwargs.get('update_fields', None) is None:
+                # another run's save may have moved this one since it was loaded, so leave the computed
+                #  schedule columns as they are instead of writing back stale copies
+                kwargs['update_fields'] = [
+                    f.name
+                    for f in self._meta.concrete_fields
+                    if not f.primary_key and f.name not in scheduleutil.SCHEDULE_FIELDS
+                ]
+            super(SpeedRun, self).save(*args, **kwargs)
+            if self.priority_tag:
+                self.tags.add(self.priority_tag)
+            return
+
+        # the run itself and every run it pushes around would each update the prize windows otherwise
+        with transaction.atomic(using=using), scheduleutil.deferred_prize_windows():
+            if self.order and not scheduleutil.is_deferred(self.event_id, using=using):
+                runs = scheduleutil.insert(
+                    scheduleutil.ordered_runs(self.event, exclude=self, using=using),
+                    self,
                 )
-            self.endtime = self.starttime + datetime.timedelta(
-                milliseconds=self.total_time_ms
-            )
-        else:
-            prev_run = None
-            next_run = None
-            next_order = None
-            if self.pk:
-                old_self = SpeedRun.objects.get(pk=self.pk)
-                if old_self.order:
-                    next_run = SpeedRun.objects.filter(
-                        event=self.event, order__gt=old_self.order
-                    ).first()
-                    next_order = old_self.order
-                else:
-                    next_run = (
-                        SpeedRun.objects.filter(event=self.event)
-                        .exclude(order=None)
-                        .first()
-                    )
-                    next_order = 1
-            self.starttime = None
-            self.endtime = None
-
-        # TODO: strip out force_insert and force_delete? causes issues if you try to insert a run in the middle
-        # with #create with an order parameter, but nobody should be doing that outside of tests anyway?
-        # maybe the admin lets you do it...
-        super(SpeedRun, self).save(*args, **kwargs)
+                changed, reordered = scheduleutil.compute(self.event, runs)
+                others = [r for r in changed if r is not self]
+                reordered = [r for r in reordered if r is not self]
+                # clear the way first, in case this run is taking one of their slots
+                scheduleutil.clear_order(reordered, using=using)
+                # TODO: strip out force_insert and force_delete? causes issues if you try to insert a run in the middle
+                # with #create with an order parameter, but nobody should be doing that outside of tests anyway?
+                # maybe the admin lets you do it...
+                super(SpeedRun, self).save(*args, **kwargs)
+                scheduleutil.persist(runs, others, reordered + [self], using=using)
+            else:
+                if not self.order:
+                    self.starttime = None
+                    self.endtime = None
+                super(SpeedRun, self).save(*args, **kwargs)
+                # close the gap this run might have left behind
+                if (
+                    existing
+                    and not self.order
+                    and not scheduleutil.is_deferred(self.event_id, using=using)
+                ):
+                    scheduleutil.recompute_schedule(self.event, using=using)
 
+        if kwargs.get('update_fields', None) is None and not (
+            set(_SCHEDULE_STATE_FIELDS) & self.get_deferred_fields()
+        ):
+            self._schedule_state = self.schedule_state
+        else:
+            # some of them might not have been saved
+            self.__dict__.pop('_schedule_state', None)
         if self.priority_tag:
             self.tags.add(self.priority_tag)
 
-        # fix up all the others
-        if prev_run and self.anchor_time:
-            prev_kwargs = {k: v for k, v in kwargs.items() if not k.startswith('force')}
-            prev_run.save(*args, **prev_kwargs)
-        if next_run and (
-            next_run.starttime != self.endtime or next_run.order != next_order
-        ):
-            next_run.save(*args, **kwargs)
-
     def delete(self, *args, **kwargs):
-        value = super().delete(*args, **kwargs)
-        if self.order and (
-            next_run := SpeedRun.objects.filter(
-                event=self.event, order__gt=self.order
-            ).first()
-        ):
-            next_run.save()
+        from .. import scheduleutil
+
+        using = kwargs.get('using', None)
+        with scheduleutil.deferred_prize_windows():
+            value = super().delete(*args, **kwargs)
+            if self.order and not scheduleutil.is_deferred(self.event_id, using=using):
+                scheduleutil.recompute_schedule(self.event, using=using)
         return value
 
     @property
@@ -1,7 +1,11 @@
 import re
+import threading
+import time
+import uuid
 
-from django.db import models
-from django.db.models.signals import pre_save
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_save
 from django.dispatch import receiver
 
 from tracker.analytics import AnalyticsEventTypes, analytics
@@ -13,6 +17,15 @@ __all__ = [
     'AmountFilter',
 ]
 
+# bumped whenever the filters change, so that other processes sharing the cache know to recompile
+_VERSION_KEY = 'tracker:moderation_filter_version'
+# how long, in seconds, a compiled filter is trusted without a version bump, so that processes that do not share a
+#  cache (e.g. with `LocMemCache`) still pick up changes made elsewhere eventually
+MAX_AGE = 60
+_filters = {}
+_lock = threading.Lock()
+_WORD_CHAR = re.compile(r'\w')
+
 
 class WordFilter(models.Model):
     word = models.CharField(max_length=32)
@@ -28,42 +41,134 @@ class AmountFilter(models.Model):
         return f'AmountFilter: {self.amount}'
 
 
+def _trie_pattern(node):
+    # factors out common prefixes, so the regex does not have to try every word separately at each position
+    alternatives = [
+        re.escape(char) + _trie_pattern(child)
+        for char, child in sorted(node.items())
+        if char
+    ]
+    if not alternatives:
+        return ''
+    if len(alternatives) == 1 and '' not in node:
+        return alternatives[0]
+    pattern = f'(?:{"|".join(alternatives)})'
+    return f'{pattern}?' if '' in node else pattern
+
+
+class ModerationFilter:
+    """every word and amount filter, compiled once so that a donation can be checked against all of them in one pass"""
+
+    def __init__(self, words, amounts, version=None):
+        self.words = {word.lower() for word in words if word}
+        self.lengths = sorted({len(word) for word in self.words})
+        trie = {}
+        for word in self.words:
+            node = trie
+            for char in word:
+                node = node.setdefault(char, {})
+            node[''] = {}
+        # the lookahead allows overlapping matches, e.g. `foo bar` and `bar baz`, and unlike `\b`, these
+        # boundaries also work for words that start or end with punctuation
+        self.pattern = (
+            re.compile(rf'(?=(?<!\w)({_trie_pattern(trie)})(?!\w))') if trie else None
+        )
+        # keyed by itself so that the filter's own value gets reported
+        self.amounts = {amount: amount for amount in amounts}
+        self.version = version
+        self.compiled_at = time.monotonic()
+
+    def match(self, comment, amount):
+        """
+        returns a tuple of (matched words, matched amounts), in the order they were found, every word that matches is
+        reported, even when a longer one matches at the same position, e.g. both `foo` and `foo bar`
+        """
+        words = []
+        if self.pattern and comment:
+            comment = comment.lower()
+            for m in self.pattern.finditer(comment):
+                longest = m.group(1)
+                # the pattern only captures the longest word at each position, any shorter ones that match there too
+                # are prefixes of it that also end on a boundary
+                words += [
+                    longest[:length]
+                    for length in self.lengths
+                    if length < len(longest)
+                    and longest[:length] in self.words
+                    and not _WORD_CHAR.match(comment, m.start(1) + length)
+                ]
+                words.append(longest)
+            words = list(dict.fromkeys(words))
+        return words, [self.amounts[amount]] if amount in self.amounts else []
+
+
+def get_moderation_filter(using='default'):
+    version = cache.get(_VERSION_KEY)
+    with _lock:
+        compiled = _filters.get(using)
+        if (
+            compiled is None
+            or compiled.version != version
+            or time.monotonic() - compiled.compiled_at > MAX_AGE
+        ):
+            compiled = _filters[using] = ModerationFilter(
+                WordFilter.objects.using(using).values_list('word', flat=True),
+                AmountFilter.objects.using(using).values_list('amount', flat=True),
+                version=version,
+            )
+        return compiled
+
+
+@receiver(post_save, sender=WordFilter)
+@receiver(post_delete, sender=WordFilter)
+@receiver(post_save, sender=AmountFilter)
+@receiver(post_delete, sender=AmountFilter)
+@receiver(post_migrate)
+def invalidate_moderation_filter(using='default', **kwargs):
+    with _lock:
+        _filters.clear()
+    # other processes only see the change once it commits, if the version were bumped before that, one of them could
+    # recompile the old filters in the meantime and keep them under the new version
+    transaction.on_commit(_bump_version, using=using)
+
+
+def _bump_version():
+    with _lock:
+        _filters.clear()
+    cache.set(_VERSION_KEY, uuid.uuid4().hex, None)
+
+
 @receiver(pre_save, sender=Donation)
 def moderation_filter(sender, instance, raw, using, update_fields, **kwargs):
     if instance.id:
         return
-    words = WordFilter.objects.using(using).all()
+    words, amounts = get_moderation_filter(using).match(
+        instance.comment, instance.amount
+    )
     for word in words:
-        if re.search(r'\b%s\b' % word.word.lower(), instance.comment.lower()):
-            instance.modcomment += (
-                '\nDENIED due to matching filter word: %s' % word.word.lower()
-            )
-            instance.commentstate = 'DENIED'
-            instance.readstate = 'IGNORED'
-            analytics.track(
-                AnalyticsEventTypes.DONATION_COMMENT_AUTOMOD_DENIED,
-                {
-                    'donation_id': instance.id,
-                    'event_id': instance.event_id,
-                    'filter_kind': 'word',
-                    'filter_value': word.word.lower(),
-                },
-            )
+        instance.modcomment += '\nDENIED due to matching filter word: %s' % word
+        instance.commentstate = 'DENIED'
+        instance.readstate = 'IGNORED'
+        analytics.track(
+            AnalyticsEventTypes.DONATION_COMMENT_AUTOMOD_DENIED,
+            {
+                'donation_id': instance.id,
+                'event_id': instance.event_id,
+                'filter_kind': 'word',
+                'filter_value': word,
+            },
+        )
 
-    amounts = AmountFilter.objects.using(using).all()
     for amount in amounts:
-        if amount.amount == instance.amount:
-            instance.modcomment += (
-                '\nDENIED due to matching filter amount: %s' % amount.amount
-            )
-            instance.commentstate = 'DENIED'
-            instance.readstate = 'IGNORED'
-            analytics.track(
-                AnalyticsEventTypes.DONATION_COMMENT_AUTOMOD_DENIED,
-                {
-                    'donation_id': instance.id,
-                    'event_id': instance.event_id,
-                    'filter_kind': 'amount',
-                    'filter_value': amount.amount,
-                },
-            )
+        instance.modcomment += '\nDENIED due to matching filter amount: %s' % amount
+        instance.commentstate = 'DENIED'
+        instance.readstate = 'IGNORED'
+        analytics.track(
+            AnalyticsEventTypes.DONATION_COMMENT_AUTOMOD_DENIED,
+            {
+                'donation_id': instance.id,
+                'event_id': instance.event_id,
+                'filter_kind': 'amount',
+                'filter_value': amount,
+            },
+        )
@@ -0,0 +1,123 @@
+from django.db import models
+from django.db.models import signals
+from django.dispatch import receiver
+
+from .. import settings
+from .donation import Donation
+from .event import SpeedRun
+from .interstitial import Interview
+
+
+class TalentParticipation(models.Model):
+    """
+    one row for every role a talent has in an event, maintained by `tracker.participationutil` when
+    `TRACKER_PARTICIPATION_INDEX` is turned on
+    """
+
+    ROLES = (
+        ('runner', 'Runner'),
+        ('host', 'Host'),
+        ('commentator', 'Commentator'),
+        ('interviewer', 'Interviewer'),
+        ('subject', 'Interview Subject'),
+    )
+
+    event = models.ForeignKey('tracker.Event', on_delete=models.CASCADE)
+    talent = models.ForeignKey(
+        'tracker.Talent', on_delete=models.CASCADE, related_name='participation'
+    )
+    role = models.CharField(max_length=16, choices=ROLES)
+
+    class Meta:
+        app_label = 'tracker'
+        verbose_name = 'Talent Participation'
+        unique_together = ('event', 'talent', 'role')
+        indexes = [
+            models.Index(fields=['event', 'role', 'talent']),
+        ]
+
+    def __str__(self):
+        return f'{self.talent_id} ({self.role}) in {self.event_id}'
+
+
+class DonorParticipation(models.Model):
+    """
+    one row for every event a donor has at least one donation in, maintained by `tracker.participationutil` when
+    `TRACKER_PARTICIPATION_INDEX` is turned on
+    """
+
+    event = models.ForeignKey('tracker.Event', on_delete=models.CASCADE)
+    donor = models.ForeignKey(
+        'tracker.Donor', on_delete=models.CASCADE, related_name='participation'
+    )
+
+    class Meta:
+        app_label = 'tracker'
+        verbose_name = 'Donor Participation'
+        unique_together = ('event', 'donor')
+
+    def __str__(self):
+        return f'{self.donor_id} in {self.event_id}'
+
+
+@receiver(signals.post_save, sender=Donation)
+def participation_donation_save(sender, instance, created, raw=False, **kwargs):
+    if raw or not settings.TRACKER_PARTICIPATION_INDEX:
+        return
+    from .. import participationutil
+
+    participationutil.donation_changed(instance, created=created)
+
+
+@receiver(signals.post_delete, sender=Donation)
+def participation_donation_delete(sender, instance, **kwargs):
+    if not settings.TRACKER_PARTICIPATION_INDEX:
+        return
+    from .. import participationutil
+
+    participationutil.donation_deleted(instance)
+
+
+@receiver(signals.pre_save, sender=SpeedRun)
+@receiver(signals.pre_save, sender=Interview)
+def participation_event_pre_save(
+    sender, instance, raw=False, update_fields=None, **kwargs
+):
+    if raw or not settings.TRACKER_PARTICIPATION_INDEX:
+        return
+    from .. import participationutil
+
+    participationutil.remember_event(sender, instance, update_fields)
+
+
+@receiver(signals.post_save, sender=SpeedRun)
+@receiver(signals.post_save, sender=Interview)
+def participation_event_save(sender, instance, raw=False, **kwargs):
+    if raw or not settings.TRACKER_PARTICIPATION_INDEX:
+        return
+    from .. import participationutil
+
+    participationutil.event_changed(instance)
+
+
+@receiver(signals.post_delete, sender=SpeedRun)
+@receiver(signals.post_delete, sender=Interview)
+def participation_event_delete(sender, instance, **kwargs):
+    if not settings.TRACKER_PARTICIPATION_INDEX:
+        return
+    from .. import participationutil
+
+    participationutil.event_deleted(instance)
+
+
+@receiver(signals.m2m_changed)
+def participation_relation(sender, instance, action, pk_set, **kwargs):
+    if not settings.TRACKER_PARTICIPATION_INDEX or action not in (
+        'post_add',
+        'post_remove',
+        'post_clear',
+    ):
+        return
+    from .. import participationutil
+
+    participationutil.relation_changed(sender, instance, pk_set)
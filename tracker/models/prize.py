@@ -1,6 +1,7 @@
 import datetime
 import logging
 import operator
+import urllib.parse
 from collections import defaultdict
 from decimal import Decimal
 from functools import reduce
@@ -19,7 +20,7 @@ from django.dispatch import receiver
 from django.urls import reverse
 
 from tracker import settings, util
-from tracker.models import Donation, Event, SpeedRun
+from tracker.models import Donor, Event, SpeedRun
 from tracker.validators import nonzero, positive
 
 from .util import LatestEvent
@@ -29,6 +30,7 @@ __all__ = [
     'PrizeKey',
     'PrizeClaim',
     'DonorPrizeEntry',
+    'PrizeMailJob',
 ]
 
 logger = logging.getLogger(__name__)
@@ -591,61 +593,11 @@ class Prize(models.Model):
         super(Prize, self).save(*args, **kwargs)
 
     def eligible_donors(self) -> dict[models.Model, Decimal]:
-        donations = Donation.objects.filter(
-            event=self.event, transactionstate='COMPLETED'
-        ).select_related('donor')
-
-        # Apply the country/region filter to the drawing
-        if self.custom_country_filter:
-            country_filter = self.allowed_prize_countries.all()
-            region_filter = self.disallowed_prize_regions.all()
-        else:
-            country_filter = self.event.allowed_prize_countries.all()
-            region_filter = self.event.disallowed_prize_regions.all()
-
-        if country_filter.exists():
-            donations = donations.filter(donor__addresscountry__in=country_filter)
-        if region_filter.exists():
-            donations = donations.filter(
-                *(
-                    ~Q(
-                        donor__addresscountry=region.country,
-                        donor__addressstate__iexact=region.name,
-                    )
-                    for region in region_filter
-                )
-            )
+        from .. import prizeutil
 
-        donations = donations.exclude(donor__in=[w.winner for w in self.claims.all()])
-        if self.has_draw_time():
-            donations = donations.filter(
-                timereceived__gte=self.start_draw_time(),
-                timereceived__lte=self.end_draw_time(),
-            )
-        donors = defaultdict(lambda: Decimal('0.0'))
-        for donation in donations:
-            if self.sumdonations:
-                donors[donation.donor] += donation.amount
-            else:
-                donors[donation.donor] = max(donation.amount, donors[donation.donor])
-        direct_entries = DonorPrizeEntry.objects.filter(prize=self).exclude(
-            donor__in=[w.winner for w in self.claims.all()]
-        )
-        for entry in direct_entries:
-            donors[entry.donor] = max(self.minimumbid, donors[entry.donor])
-        if not donors:
-            return {}
-        elif self.randomdraw:
-
-            return {
-                donor: amount
-                for donor, amount in donors.items()
-                if self.minimumbid <= amount
-            }
-        else:
-
-            donor, amount = max(donors.items(), key=lambda i: i[1])
-            return {donor: amount}
+        amounts = prizeutil.eligible_donor_amounts(self)
+        donors = Donor.objects.in_bulk(amounts)
+        return {donors[donor_id]: amount for donor_id, amount in amounts.items()}
 
     def is_donor_allowed_to_receive(self, donor):
         return self.is_country_region_allowed(donor.addresscountry, donor.addressstate)
@@ -764,30 +716,9 @@ def fix_prev_and_next_run_delete(sender, instance, using, **kwargs):
 
 
 def fix_prev_and_next_run(instance, using):
-    prev_run = instance.order and (
-        SpeedRun.objects.filter(event=instance.event_id, order__lt=instance.order)
-        .using(using)
-        .order_by('order')
-        .last()
-    )
-    next_run = instance.order and (
-        SpeedRun.objects.filter(event=instance.event_id, order__gt=instance.order)
-        .using(using)
-        .order_by('order')
-        .first()
-    )
-    prizes = Prize.objects.using(using).filter(
-        Q(prev_run=instance)
-        | Q(next_run=instance)
-        | Q(startrun=instance)
-        | Q(endrun=instance)
-    )
-    if prev_run:
-        prizes = prizes | Prize.objects.using(using).filter(
-            Q(startrun=next_run) | Q(endrun=prev_run)
-        )
-    for prize in prizes:
-        prize.save(using=using)
+    from .. import scheduleutil
+
+    scheduleutil.update_prize_windows(instance.event_id, using=using)
 
 
 class PrizeKey(models.Model):
@@ -1035,6 +966,17 @@ class PrizeClaim(models.Model):
         help_text='The URL of an image of the shipping receipt',
     )
 
+    # what `save` sets on every claim for a key prize, also used when the claims are created in bulk, since the
+    #  coordinator is always considered notified (the accept count is already 1), it does not depend on the prize
+    KEY_CLAIM_DEFAULTS = dict(
+        acceptcount=1,
+        pendingcount=0,
+        declinecount=0,
+        winneremailsent=True,
+        acceptemailsentcount=1,
+        shippingstate='AWARDED',
+    )
+
     class Meta:
         app_label = 'tracker'
         verbose_name = 'Prize Claim'
@@ -1102,12 +1044,19 @@ class PrizeClaim(models.Model):
             and self.acceptdeadline < time
         )
 
-    def create_claim_url(self, request):
-        self._claim_url = util.build_public_url(
+    def create_claim_url(self, request, *, prefix=None):
+        """
+        `prefix` is the result of `util.build_public_url('/', request)`, when building the URLs for a lot of claims at
+        once, passing it saves looking up the public site again for each of them
+        """
+        path = (
             reverse('tracker:prize_winner', args=(self.pk,))
-            + f'?auth_code={self.auth_code}',
-            request,
+            + f'?auth_code={self.auth_code}'
         )
+        if prefix is None:
+            self._claim_url = util.build_public_url(path, request)
+        else:
+            self._claim_url = urllib.parse.urljoin(prefix, path)
 
     @property
     def claim_url(self):
@@ -1170,19 +1119,16 @@ class PrizeClaim(models.Model):
     def save(self, *args, **kwargs):
         if self.prize.key_code:
             # skip a bunch of stuff that's not relevant for key codes
-            self.acceptcount = 1
-            self.pendingcount = 0
-            self.declinecount = 0
-            self.winneremailsent = True
-            self.acceptemailsentcount = 1
-            self.shippingstate = 'AWARDED'
-        elif not self.requiresshipping:
-            # digital prizes can skip the shipping step entirely
-            self.shippingstate = 'N/A'
-            self.shippingemailsent = True
-        if self.prize.handler == self.prize.event.prizecoordinator:
-            # don't need to notify the coordinator if they're the same as the handler
-            self.acceptemailsentcount = self.acceptcount
+            for field, value in self.KEY_CLAIM_DEFAULTS.items():
+                setattr(self, field, value)
+        else:
+            if not self.requiresshipping:
+                # digital prizes can skip the shipping step entirely
+                self.shippingstate = 'N/A'
+                self.shippingemailsent = True
+            if self.prize.handler_id == self.prize.event.prizecoordinator_id:
+                # don't need to notify the coordinator if they're the same as the handler
+                self.acceptemailsentcount = self.acceptcount
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -1242,3 +1188,82 @@ class DonorPrizeEntry(models.Model):
 
     def __str__(self):
         return f'{self.donor} entered to win {self.prize}'
+
+
+class PrizeMailJob(models.Model):
+    """
+    a batch of prize notification emails, sent in chunks by `prizemail.run_job`, see that module for details
+    """
+
+    event = models.ForeignKey(
+        'Event', on_delete=models.PROTECT, related_name='prize_mail_jobs'
+    )
+    kind = models.CharField(
+        max_length=16,
+        choices=(
+            ('CONTRIBUTOR', 'Prize Contributors'),
+            ('WINNER', 'Prize Winners'),
+            ('ACCEPT', 'Accept Notifications'),
+            ('SHIPPING', 'Shipping Notifications'),
+        ),
+    )
+    state = models.CharField(
+        max_length=16,
+        choices=(
+            ('QUEUED', 'Queued'),
+            ('RUNNING', 'Running'),
+            ('DONE', 'Done'),
+            ('FAILED', 'Failed'),
+        ),
+        default='QUEUED',
+    )
+    email_template = models.ForeignKey(
+        'post_office.EmailTemplate', on_delete=models.PROTECT, related_name='+'
+    )
+    from_address = models.EmailField(max_length=256)
+    reply_address = models.EmailField(max_length=256)
+    accept_deadline = models.DateTimeField(null=True, blank=True)
+    base_url = models.CharField(
+        max_length=256,
+        blank=True,
+        help_text='The root URL of the request that queued the job, used for links in the emails',
+    )
+    user = models.ForeignKey(
+        USER_MODEL_NAME,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name='+',
+        help_text='Changes to the prizes and claims are logged as this user',
+    )
+    # one list of object ids per recipient, in the order they are sent
+    groups = models.JSONField(default=list, editable=False)
+    groups_done = models.PositiveIntegerField(default=0, editable=False)
+    emails_sent = models.PositiveIntegerField(default=0, editable=False)
+    error = models.TextField(blank=True, editable=False)
+    created = models.DateTimeField(auto_now_add=True)
+    finished = models.DateTimeField(null=True, blank=True, editable=False)
+
+    class Meta:
+        app_label = 'tracker'
+        verbose_name = 'Prize Mail Job'
+        ordering = ('-created',)
+
+    @property
+    def recipients(self):
+        return len(self.groups)
+
+    @property
+    def progress(self):
+        if not self.groups:
+            return 1.0
+        return self.groups_done / len(self.groups)
+
+    @property
+    def finished_sending(self):
+        return self.groups_done >= len(self.groups)
+
+    def __str__(self):
+        return (
+            f'{self.get_kind_display()} for {self.event} ({self.get_state_display()})'
+        )
@@ -0,0 +1,103 @@
+from django.contrib.contenttypes.models import ContentType
+from django.db import models
+from django.db.models import signals
+from django.dispatch import receiver
+
+from .. import settings
+from .bid import Bid
+from .donation import Donation, Donor
+from .event import Event, SpeedRun, Talent
+from .prize import Prize
+from .tag import Tag
+
+
+class SearchDocument(models.Model):
+    """
+    the flattened, lowercased text of one group of searchable fields for a single object, maintained by
+    `tracker.searchutil` when `TRACKER_SEARCH_INDEX` is turned on
+    """
+
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.IntegerField()
+    group = models.CharField(max_length=32)
+    document = models.TextField()
+
+    class Meta:
+        app_label = 'tracker'
+        verbose_name = 'Search Document'
+        unique_together = ('content_type', 'object_id', 'group')
+        indexes = [
+            models.Index(fields=['content_type', 'group', 'object_id']),
+        ]
+
+    def __str__(self):
+        return f'{self.content_type.model} #{self.object_id} ({self.group})'
+
+
+# only the models whose fields are included by other models' documents, see `searchutil.DEPENDENT_FIELDS`
+@receiver(signals.post_init, sender=Bid)
+@receiver(signals.post_init, sender=Donor)
+@receiver(signals.post_init, sender=Event)
+@receiver(signals.post_init, sender=SpeedRun)
+@receiver(signals.post_init, sender=Tag)
+@receiver(signals.post_init, sender=Talent)
+def search_document_init(sender, instance, **kwargs):
+    if not settings.TRACKER_SEARCH_INDEX:
+        return
+    from .. import searchutil
+
+    searchutil.remember(sender, instance)
+
+
+@receiver(signals.post_save)
+def search_document_save(
+    sender, instance, created, raw=False, update_fields=None, **kwargs
+):
+    if raw or not settings.TRACKER_SEARCH_INDEX:
+        return
+    from .. import searchutil
+
+    searchutil.object_changed(
+        sender, instance, created=created, update_fields=update_fields
+    )
+
+
+# only the models in `searchutil.INDEXES`, a receiver for every model would make Django fetch the rows of every bulk
+#  delete just to send the signal, instead of deleting them with a single query
+@receiver(signals.pre_delete, sender=Bid)
+@receiver(signals.pre_delete, sender=Donation)
+@receiver(signals.pre_delete, sender=Prize)
+@receiver(signals.pre_delete, sender=SpeedRun)
+@receiver(signals.pre_delete, sender=Talent)
+def search_document_pre_delete(sender, instance, **kwargs):
+    if not settings.TRACKER_SEARCH_INDEX:
+        return
+    from .. import searchutil
+
+    searchutil.object_deleting(sender, instance)
+
+
+@receiver(signals.post_delete, sender=Bid)
+@receiver(signals.post_delete, sender=Donation)
+@receiver(signals.post_delete, sender=Prize)
+@receiver(signals.post_delete, sender=SpeedRun)
+@receiver(signals.post_delete, sender=Talent)
+def search_document_delete(sender, instance, **kwargs):
+    if not settings.TRACKER_SEARCH_INDEX:
+        return
+    from .. import searchutil
+
+    searchutil.object_deleted(sender, instance)
+
+
+@receiver(signals.m2m_changed)
+def search_document_relation(sender, instance, action, model, pk_set, **kwargs):
+    if not settings.TRACKER_SEARCH_INDEX or action not in (
+        'post_add',
+        'post_remove',
+        'post_clear',
+    ):
+        return
+    from .. import searchutil
+
+    searchutil.relation_changed(instance, model, pk_set)
@@ -0,0 +1,208 @@
+"""
+The event participation index, used by the event filters of the talent and donor API views when
+`TRACKER_PARTICIPATION_INDEX` is turned on. Every role a talent has in an event (running, hosting, commentating,
+interviewing, or being interviewed) gets a `TalentParticipation` row, and every event a donor has donated to gets a
+`DonorParticipation` row, so filtering a list down to one event is a single indexed lookup instead of a union across
+five m2m tables, or a distinct scan of that event's donations.
+
+The rows are kept current by model signals (see `tracker.models.participation`), and can be rebuilt from scratch with
+the `rebuild_participation_index` command.
+"""
+
+from django.db import transaction
+
+from tracker.models import (
+    Donation,
+    DonorParticipation,
+    Event,
+    Interview,
+    SpeedRun,
+    TalentParticipation,
+)
+
+# role -> the m2m field that it comes from
+ROLES = {
+    'runner': SpeedRun._meta.get_field('runners'),
+    'host': SpeedRun._meta.get_field('hosts'),
+    'commentator': SpeedRun._meta.get_field('commentators'),
+    'interviewer': Interview._meta.get_field('interviewers'),
+    'subject': Interview._meta.get_field('subjects'),
+}
+
+# the reverse relation name on Talent, e.g. `hosting` -> role
+RELATED_ROLES = {field.remote_field.related_name: role for role, field in ROLES.items()}
+
+_THROUGH = {field.remote_field.through: field for field in ROLES.values()}
+
+
+def talent_in_event(event, role=None):
+    """a subquery of the ids of the talent with any role in the event, or only the given one"""
+    rows = TalentParticipation.objects.filter(event=event)
+    if role:
+        rows = rows.filter(role=role)
+    return rows.values('talent_id')
+
+
+def donors_in_event(event):
+    """a subquery of the ids of the donors with at least one donation in the event"""
+    return DonorParticipation.objects.filter(event=event).values('donor_id')
+
+
+def _talent_rows(event_ids, talent_ids):
+    rows = set()
+    for role, field in ROLES.items():
+        source = field.m2m_field_name()
+        target = field.m2m_reverse_field_name()
+        relations = field.remote_field.through.objects.all()
+        if event_ids is not None:
+            relations = relations.filter(**{f'{source}__event__in': event_ids})
+        if talent_ids is not None:
+            relations = relations.filter(**{f'{target}__in': talent_ids})
+        rows |= {
+            (event_id, talent_id, role)
+            for event_id, talent_id in relations.order_by()
+            .values_list(f'{source}__event', target)
+            .distinct()
+        }
+    return rows
+
+
+def _donor_rows(event_ids, donor_ids):
+    donations = Donation.objects.exclude(donor=None)
+    if event_ids is not None:
+        donations = donations.filter(event__in=event_ids)
+    if donor_ids is not None:
+        donations = donations.filter(donor__in=donor_ids)
+    return set(donations.order_by().values_list('event_id', 'donor_id').distinct())
+
+
+def _sync(model, key_fields, existing, wanted, batch_size):
+    """deletes the rows in `existing` that are not `wanted`, and creates the ones that are missing"""
+    existing = {
+        tuple(row[1:]): row[0] for row in existing.values_list('id', *key_fields)
+    }
+    stale = [pk for key, pk in existing.items() if key not in wanted]
+    for start in range(0, len(stale), batch_size):
+        model.objects.filter(id__in=stale[start : start + batch_size]).delete()
+    missing = [model(**dict(zip(key_fields, key))) for key in wanted - existing.keys()]
+    # another save may have added the same row in the meantime
+    model.objects.bulk_create(missing, batch_size=batch_size, ignore_conflicts=True)
+    return len(stale) + len(missing)
+
+
+@transaction.atomic
+def sync_talent(*, event_ids=None, talent_ids=None, batch_size=1000):
+    """
+    brings the talent rows for the given events and/or talent (or everything, if neither is given) in line with the
+    runs and interviews, returns the number of rows written
+    """
+    existing = TalentParticipation.objects.all()
+    if event_ids is not None:
+        existing = existing.filter(event__in=event_ids)
+    if talent_ids is not None:
+        existing = existing.filter(talent__in=talent_ids)
+    return _sync(
+        TalentParticipation,
+        ('event_id', 'talent_id', 'role'),
+        existing,
+        _talent_rows(event_ids, talent_ids),
+        batch_size,
+    )
+
+
+@transaction.atomic
+def sync_donors(*, event_ids=None, donor_ids=None, batch_size=1000):
+    """
+    brings the donor rows for the given events and/or donors (or everything, if neither is given) in line with the
+    donations, returns the number of rows written
+    """
+    existing = DonorParticipation.objects.all()
+    if event_ids is not None:
+        existing = existing.filter(event__in=event_ids)
+    if donor_ids is not None:
+        existing = existing.filter(donor__in=donor_ids)
+    return _sync(
+        DonorParticipation,
+        ('event_id', 'donor_id'),
+        existing,
+        _donor_rows(event_ids, donor_ids),
+        batch_size,
+    )
+
+
+def donation_changed(instance, *, created=False):
+    # `_participation_key` is snapshotted when the donation is loaded, see `Donation.from_db`
+    old = None if created else getattr(instance, '_participation_key', None)
+    new = (instance.event_id, instance.donor_id)
+    instance._participation_key = new
+    if old == new:
+        return
+    if old is None:
+        # new, or loaded without those fields, so there is nothing known to remove
+        if instance.donor_id:
+            DonorParticipation.objects.bulk_create(
+                [DonorParticipation(event_id=new[0], donor_id=new[1])],
+                ignore_conflicts=True,
+            )
+        return
+    if donor_ids := {d for d in (old[1], new[1]) if d}:
+        sync_donors(event_ids={old[0], new[0]}, donor_ids=donor_ids)
+
+
+def donation_deleted(instance):
+    event_id, donor_id = getattr(
+        instance, '_participation_key', (instance.event_id, instance.donor_id)
+    )
+    if donor_id:
+        sync_donors(event_ids=[event_id], donor_ids=[donor_id])
+
+
+def remember_event(model, instance, update_fields=None):
+    """called before a run or interview is saved, to find out afterwards if it moved to another event"""
+    if instance.pk is None or (
+        update_fields is not None and 'event' not in update_fields
+    ):
+        instance._participation_event_id = instance.event_id
+    else:
+        instance._participation_event_id = (
+            model._base_manager.filter(pk=instance.pk)
+            .values_list('event_id', flat=True)
+            .first()
+        )
+
+
+def event_changed(instance):
+    old = getattr(instance, '_participation_event_id', instance.event_id)
+    if old != instance.event_id:
+        sync_talent(event_ids=[e for e in (old, instance.event_id) if e])
+
+
+def event_deleted(instance):
+    # the m2m rows are already gone, so everyone left in the event is recomputed
+    sync_talent(event_ids=[instance.event_id])
+
+
+def relation_changed(through, instance, pk_set):
+    if (field := _THROUGH.get(through)) is None:
+        return
+    if isinstance(instance, field.model):
+        # a run or interview gained or lost talent, pk_set is None when cleared
+        sync_talent(event_ids=[instance.event_id], talent_ids=pk_set)
+    else:
+        sync_talent(talent_ids=[instance.pk])
+
+
+def rebuild(*, event_ids=None, batch_size=1000, progress=None):
+    """
+    rebuilds the rows for every event, or only the given ones, one event at a time, returns the number of rows written
+
+    `progress` is an optional wrapper around an iterable, e.g. `tqdm`
+    """
+    progress = progress or (lambda iterable, **kwargs: iterable)
+    if event_ids is None:
+        event_ids = list(Event.objects.order_by('pk').values_list('pk', flat=True))
+    written = 0
+    for event_id in progress(event_ids, desc='events', unit='event'):
+        written += sync_talent(event_ids=[event_id], batch_size=batch_size)
+        written += sync_donors(event_ids=[event_id], batch_size=batch_size)
+    return written
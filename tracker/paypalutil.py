@@ -7,6 +7,8 @@ from typing import Optional
 
 import post_office
 from django.core.signing import BadSignature, Signer
+from django.db import transaction
+from django.db.models import Q
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from paypal.standard.ipn.models import PayPalIPN
@@ -216,6 +218,27 @@ def get_ipn_donation(
     return None
 
 
+def resolve_ipn_donation(ipn: PayPalIPN) -> Optional[Donation]:
+    """
+    `get_ipn_donation` with the default settings, but remembered on the IPN instance, so that the signature check, the
+    lookup, and the recipient check only happen once, no matter how many receivers handle the same IPN
+    """
+    # the gross is compared as a string, since that is what the signature is salted with, and `10` and `10.00` differ
+    key = (ipn.custom, str(_get_gross(ipn)), ipn.business, ipn.receiver_email)
+    resolved = getattr(ipn, '_tracker_resolved', None)
+    if resolved is None or resolved[0] != key:
+        resolved = ipn._tracker_resolved = (key, get_ipn_donation(ipn))
+    return resolved[1]
+
+
+def _is_deferred(ipn):
+    return (
+        settings.TRACKER_PAYPAL_ASYNC_IPN
+        and settings.TRACKER_HAS_CELERY
+        and not ipn.flag
+    )
+
+
 def _fill_donor_address(donor, ipn):
     if not donor.addressstreet:
         donor.addressstreet = ipn.address_street
@@ -232,13 +255,24 @@ def _fill_donor_address(donor, ipn):
         donor.addressstate = ipn.address_state
     if not donor.addresszip:
         donor.addresszip = ipn.address_zip
-    donor.save()
 
 
 @receiver(valid_ipn_received)
 def initialize_paypal_donation(sender, **kwargs):
     ipn = sender
-    donation = get_ipn_donation(ipn)
+    if _is_deferred(ipn):
+        # acknowledge PayPal right away, and do everything else in the background
+        transaction.on_commit(lambda: tasks.process_paypal_ipn.delay(ipn.id))
+        return
+    process_ipn(ipn)
+
+
+def process_ipn(ipn):
+    """
+    applies a valid IPN to its donation and donor, and sends out any emails, postbacks, and analytics that go with it,
+    either directly from the signal, or from the `process_paypal_ipn` task if `TRACKER_PAYPAL_ASYNC_IPN` is set
+    """
+    donation = resolve_ipn_donation(ipn)
 
     if donation is None:
         return
@@ -249,14 +283,17 @@ def initialize_paypal_donation(sender, **kwargs):
             'paypal', f'IPN on archived event, but processing anyway. #`{ipn.id}`.'
         )
 
-    defaults = {
-        'email': ipn.payer_email.lower(),
-        'firstname': ipn.first_name,
-        'lastname': ipn.last_name,
-        'visibility': 'ANON',
-    }
+    # a new payer's donor is inserted by get_or_create, so that two IPNs from them (e.g. processed by two task
+    #  workers at once) end up with the same donor instead of a duplicate or an IntegrityError, every other change to
+    #  the donor is collected here and written with a single save
     donor, created = Donor.objects.get_or_create(
-        paypalemail=ipn.payer_email.lower(), defaults=defaults
+        paypalemail=ipn.payer_email.lower(),
+        defaults={
+            'email': ipn.payer_email.lower(),
+            'firstname': ipn.first_name,
+            'lastname': ipn.last_name,
+            'visibility': 'ANON',
+        },
     )
 
     _fill_donor_address(donor, ipn)
@@ -375,7 +412,7 @@ def handle_ipn_error(*, sender, **kwargs):
     if 'Duplicate txn_id.' in ipn.flag_info:
         return
 
-    donation = get_ipn_donation(ipn)
+    donation = resolve_ipn_donation(ipn)
 
     if donation is None:
         return
@@ -435,7 +472,7 @@ def _get_pending_reason_details(pending_reason):
 
 
 def _log_ipn(ipn, message=''):
-    donation = get_ipn_donation(ipn)
+    donation = resolve_ipn_donation(ipn)
     message = '{message}\ntxn_id : {txn_id}\nstatus : {status}\nemail : {email}\namount : {amount}\ndate : {date}\ncustom : {custom}\ndonation : {donation}'.format(
         **{
             'message': message,
@@ -456,10 +493,37 @@ def _log_ipn(ipn, message=''):
     viewutil.tracker_log('paypal', message, event=donation.event if donation else None)
 
 
-@receiver(post_save, sender=PayPalIPN)
-def donation_ipns_update(sender, instance, created, raw, **kwargs):
+def claim_ipn(ipn):
+    """
+    locks the IPN's donation until the end of the current transaction, and returns False if this IPN, or another one
+    with the same transaction id and status, has already been linked to (and so applied to) that donation
+    """
+    donation = (
+        resolve_ipn_donation(ipn)
+        or Donation.objects.filter(domain='PAYPAL', domainId=ipn.txn_id).first()
+    )
+    if donation is None:
+        return True
+    Donation.objects.select_for_update().filter(pk=donation.pk).exists()
+    # resolved before the lock, so a worker that was waiting on it has to load the donation again
+    ipn.__dict__.pop('_tracker_resolved', None)
+    applied = Q(pk=ipn.pk)
+    if ipn.txn_id:
+        applied |= Q(txn_id=ipn.txn_id, payment_status=ipn.payment_status)
+    return not donation.ipns.filter(applied).exists()
+
+
+def link_ipn(ipn):
     if d := (
-        get_ipn_donation(instance)
-        or Donation.objects.filter(domain='PAYPAL', domainId=instance.txn_id).first()
+        resolve_ipn_donation(ipn)
+        or Donation.objects.filter(domain='PAYPAL', domainId=ipn.txn_id).first()
     ):
-        d.ipns.add(instance)
+        d.ipns.add(ipn)
+
+
+@receiver(post_save, sender=PayPalIPN)
+def donation_ipns_update(sender, instance, created, raw, **kwargs):
+    if created and _is_deferred(instance):
+        # the task links it once it has resolved the donation
+        return
+    link_ipn(instance)
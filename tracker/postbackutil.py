@@ -0,0 +1,195 @@
+"""
+Delivery of donation postbacks. Every Postback URL gets its own bounded, ordered queue of requests, and the queues are
+sent concurrently from a shared thread pool, so neither the caller nor the other consumers wait on a slow one. Each
+worker thread keeps its own keep-alive session, requests that fail with a connection error, a timeout, or a 5xx
+response are retried with an exponential backoff, and the results are recorded on the PostbackURL rows so they can be
+monitored from the admin.
+"""
+
+import collections
+import concurrent.futures
+import dataclasses
+import json
+import logging
+import threading
+import time
+import traceback
+
+import requests
+from django.core import serializers
+from django.db import connections
+from django.db.models import F
+
+from tracker import settings, util
+from tracker.models import Log, PostbackURL
+
+logger = logging.getLogger(__name__)
+
+TIMEOUT = 5
+# seconds before the first retry, doubles with each attempt after that
+RETRY_BACKOFF = 0.5
+
+_local = threading.local()
+_executor = None
+_executor_lock = threading.Lock()
+# postback id -> the requests waiting to be sent to it, a queue only exists while a worker is sending it
+_queues = {}
+_queues_lock = threading.Lock()
+_workers = set()
+
+
+@dataclasses.dataclass
+class _Queue:
+    pk: int
+    url: str
+    event_id: int
+    bodies: collections.deque = dataclasses.field(default_factory=collections.deque)
+
+
+@dataclasses.dataclass
+class DeliveryResult:
+    sent: int = 0
+    failed: int = 0
+    latency: float = 0
+    errors: list = dataclasses.field(default_factory=list)
+
+
+def _session():
+    session = getattr(_local, 'session', None)
+    if session is None:
+        session = _local.session = requests.Session()
+    return session
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=settings.TRACKER_POSTBACK_WORKERS,
+                thread_name_prefix='postback',
+            )
+        return _executor
+
+
+def _encode(data):
+    return json.dumps(
+        data, ensure_ascii=False, cls=serializers.json.DjangoJSONEncoder
+    ).encode('utf-8')
+
+
+def _bodies(postback, payloads):
+    if postback.batch:
+        return [_encode(payloads)]
+    return [_encode(payload) for payload in payloads]
+
+
+def _post(url, body, result):
+    for attempt in range(settings.TRACKER_POSTBACK_RETRIES + 1):
+        if attempt:
+            time.sleep(RETRY_BACKOFF * 2 ** (attempt - 1))
+        start = time.monotonic()
+        try:
+            response = _session().post(
+                url,
+                data=body,
+                headers={'Content-Type': 'application/json; charset=utf-8'},
+                timeout=TIMEOUT,
+            )
+            if response.status_code < 400:
+                result.sent += 1
+                result.latency += time.monotonic() - start
+                return
+            response.raise_for_status()
+        except requests.HTTPError as e:
+            error = traceback.format_exc()
+            if e.response.status_code < 500:
+                # the consumer rejected the request, sending it again will not change that
+                break
+        except Exception:
+            error = traceback.format_exc()
+    logger.error(f'Error sending postback to {url}\n{error}')
+    result.failed += 1
+    result.errors.append(error)
+
+
+def _record(queue, result):
+    PostbackURL.objects.filter(pk=queue.pk).update(
+        success_count=F('success_count') + result.sent,
+        failure_count=F('failure_count') + result.failed,
+        total_latency=F('total_latency') + result.latency,
+        **({'last_failure': util.utcnow()} if result.failed else {}),
+    )
+    for error in result.errors:
+        # the same entry `viewutil.tracker_log` writes, without loading the event
+        Log.objects.create(
+            category='postback_url',
+            message=f'{queue.pk}\n{error}',
+            event_id=queue.event_id,
+        )
+
+
+def _next_body(queue):
+    with _queues_lock:
+        if not queue.bodies:
+            # nothing left, the next delivery to this postback starts a new worker
+            del _queues[queue.pk]
+            return None
+        return queue.bodies.popleft()
+
+
+def _drain(queue):
+    try:
+        while (body := _next_body(queue)) is not None:
+            result = DeliveryResult()
+            _post(queue.url, body, result)
+            try:
+                _record(queue, result)
+            except Exception:
+                logger.exception(f'Error recording postback results for {queue.url}')
+    finally:
+        # worker threads get their own database connections, which would otherwise stay open
+        connections.close_all()
+
+
+def deliver(postbacks, payloads):
+    """
+    queues every payload for every postback and returns without waiting for any of them to be sent
+
+    every postback has its own queue, which is sent in order by a worker from the shared thread pool, so separate
+    postbacks are sent concurrently, and the results are recorded on the PostbackURL rows as each request finishes,
+    if a queue grows past TRACKER_POSTBACK_MAX_QUEUE requests, the oldest ones waiting in it are dropped
+    """
+    if not payloads:
+        return
+    max_queue = settings.TRACKER_POSTBACK_MAX_QUEUE
+    executor = _get_executor()
+    for postback in postbacks:
+        bodies = _bodies(postback, payloads)
+        with _queues_lock:
+            queue = _queues.get(postback.pk)
+            idle = queue is None
+            if idle:
+                queue = _queues[postback.pk] = _Queue(
+                    postback.pk, postback.url, postback.event_id
+                )
+            queue.bodies.extend(bodies)
+            dropped = max(len(queue.bodies) - max_queue, 0)
+            for _ in range(dropped):
+                queue.bodies.popleft()
+        if dropped:
+            logger.warning(
+                f'Dropping {dropped} postback request(s) for {postback.url}, queue is full'
+            )
+        if idle:
+            future = executor.submit(_drain, queue)
+            with _queues_lock:
+                _workers.add(future)
+            future.add_done_callback(_workers.discard)
+
+
+def flush(timeout=None):
+    """waits for every queued postback to be sent, returns False if some were still waiting after `timeout` seconds"""
+    with _queues_lock:
+        workers = list(_workers)
+    return not concurrent.futures.wait(workers, timeout=timeout).not_done
@@ -1,12 +1,29 @@
+import dataclasses
+import datetime
+import logging
 import os
+import urllib.parse
+from itertools import groupby
+from typing import Any, Callable, Collection, Iterable, Sequence
 
 import post_office.mail
+import post_office.models
+from django.contrib.admin.models import CHANGE, LogEntry
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AbstractUser
+from django.db import transaction
+from django.db.models import F, Q
+from django.urls import reverse
 
-from tracker import settings
+from tracker import mailutil, models, settings, util
 
 AuthUser = get_user_model()
 
+logger = logging.getLogger(__name__)
+
+# the number of recipients mailed per transaction by `run_job`
+CHUNK_SIZE = 100
+
 
 def _readtemplate(filename):
     with open(
@@ -126,3 +143,321 @@ prize_count -- the number of prizes in the list (use `claims|length` instead)
         subject='Prize{{ claims|pluralize }} {% if shipped %}Shipped{% endif %}{% if shipped and awarded %} or {% endif %}{% if awarded %}Awarded{% endif %}',
         html_content=_readtemplate('default_prize_shipping.html'),
     )
+
+
+def contributor_context(
+    request,
+    event: models.Event,
+    handler: AbstractUser,
+    prizes: Iterable[models.Prize],
+    reply_address: str,
+    /,
+):
+    return {
+        'user_index_url': util.build_public_url(reverse('tracker:user_index'), request),
+        'event': event,
+        'handler': handler,
+        'accepted_prizes': [prize for prize in prizes if prize.state == 'ACCEPTED'],
+        'denied_prizes': [prize for prize in prizes if prize.state == 'DENIED'],
+        'reply_address': reply_address,
+    }
+
+
+def winner_context(
+    event: models.Event,
+    winner: models.Donor,
+    claims: Collection[models.PrizeClaim],
+    reply_address: str,
+    accept_deadline: str | datetime.date | datetime.datetime | None,
+    /,
+):
+    if isinstance(accept_deadline, datetime.datetime):
+        accept_deadline = accept_deadline.date()
+    return {
+        'event': event,
+        'winner': winner,
+        'claims': claims,
+        'requires_shipping': any(c for c in claims if c.requiresshipping),
+        'reply_address': reply_address,
+        'accept_deadline': accept_deadline,
+        # deprecated
+        'prize_wins': claims,
+        'multi': len(claims) > 1,
+        'prize_count': len(claims),
+    }
+
+
+def accept_context(
+    request,
+    event: models.Event,
+    handler: AbstractUser,
+    claims: Sequence[models.PrizeClaim],
+    reply_address: str,
+    /,
+):
+    return {
+        'event': event,
+        'user_index_url': util.build_public_url(reverse('tracker:user_index'), request),
+        'claims': claims,
+        'handler': handler,
+        'reply_address': reply_address,
+        # deprecated
+        'prize_wins': claims,
+        'prize_count': len(claims),
+    }
+
+
+def shipped_context(
+    event: models.Event,
+    winner: models.Donor,
+    claims: Sequence[models.PrizeClaim],
+    reply_address: str,
+    /,
+):
+    return {
+        'event': event,
+        'claims': claims,
+        'winner': winner,
+        'reply_address': reply_address,
+        'shipped': any(c.requiresshipping for c in claims),
+        'awarded': any(not c.requiresshipping for c in claims),
+        # deprecated
+        'prize_wins': claims,
+        'prize_count': len(claims),
+    }
+
+
+class _Origin:
+    """stands in for the request that queued a job when `util.build_public_url` builds the links in its emails"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.scheme = urllib.parse.urlsplit(base_url).scheme or 'https'
+
+    def build_absolute_uri(self, location):
+        return urllib.parse.urljoin(self.base_url, location)
+
+
+def _mark_winner(job, claim):
+    claim.winneremailsent = True
+    if job.accept_deadline:
+        claim.acceptdeadline = job.accept_deadline
+
+
+def _winner_deadline(job, claims):
+    """the job's deadline, or if it was created without one, the earliest deadline the claims already have"""
+    deadline = job.accept_deadline or min(
+        (c.acceptdeadline for c in claims if c.acceptdeadline), default=None
+    )
+    return deadline and deadline.astimezone(util.anywhere_on_earth_tz())
+
+
+def _mark_contributor(job, prize):
+    prize.acceptemailsent = True
+
+
+def _mark_accept(job, claim):
+    claim.acceptemailsentcount = claim.acceptcount
+
+
+def _mark_shipping(job, claim):
+    claim.shippingemailsent = True
+
+
+@dataclasses.dataclass(frozen=True)
+class _Kind:
+    model: type
+    # what has not been mailed yet, anything else in a job is skipped when it gets to it
+    unsent: Q
+    # one email is sent per distinct value of this field
+    group_by: str
+    related: tuple[str, ...]
+    recipient: Callable[[Any], Any]
+    # (job, origin, recipient, objects)
+    context: Callable[..., dict]
+    mark: Callable[[models.PrizeMailJob, Any], None]
+    fields: tuple[str, ...]
+    log_message: str
+    message: Callable[[Any, int], str]
+    claim_urls: bool = False
+
+
+KINDS = {
+    'CONTRIBUTOR': _Kind(
+        model=models.Prize,
+        unsent=Q(acceptemailsent=False),
+        group_by='handler_id',
+        related=('handler',),
+        recipient=lambda p: p.handler,
+        context=lambda job, origin, handler, prizes: contributor_context(
+            origin, job.event, handler, prizes, job.reply_address
+        ),
+        mark=_mark_contributor,
+        fields=('acceptemailsent',),
+        log_message='Sent Accept/Deny email.',
+        message=lambda handler, n: f'Mailed prize handler {handler} for {n} prize(s)',
+    ),
+    'WINNER': _Kind(
+        model=models.PrizeClaim,
+        unsent=Q(winneremailsent=False),
+        group_by='winner_id',
+        related=('winner', 'prize'),
+        recipient=lambda c: c.winner,
+        context=lambda job, origin, winner, claims: winner_context(
+            job.event,
+            winner,
+            claims,
+            job.reply_address,
+            _winner_deadline(job, claims),
+        ),
+        mark=_mark_winner,
+        fields=('winneremailsent', 'acceptdeadline'),
+        log_message='Sent winner notification email.',
+        message=lambda winner, n: f'Mailed donor {winner.email} for {n} won prize claim(s)',
+        claim_urls=True,
+    ),
+    'ACCEPT': _Kind(
+        model=models.PrizeClaim,
+        unsent=Q(acceptcount__gt=F('acceptemailsentcount')),
+        group_by='prize__handler_id',
+        related=('winner', 'prize__handler'),
+        recipient=lambda c: c.prize.handler,
+        context=lambda job, origin, handler, claims: accept_context(
+            origin, job.event, handler, claims, job.reply_address
+        ),
+        mark=_mark_accept,
+        fields=('acceptemailsentcount',),
+        log_message='Sent accepted claim email.',
+        message=lambda handler, n: f'Mailed handler {handler} for {n} accepted prize claim(s)',
+    ),
+    'SHIPPING': _Kind(
+        model=models.PrizeClaim,
+        unsent=Q(shippingemailsent=False),
+        group_by='winner_id',
+        related=('winner', 'prize', 'prize_key'),
+        recipient=lambda c: c.winner,
+        context=lambda job, origin, winner, claims: shipped_context(
+            job.event, winner, claims, job.reply_address
+        ),
+        mark=_mark_shipping,
+        fields=('shippingemailsent',),
+        log_message='Shipping email sent.',
+        message=lambda winner, n: f'Mailed donor {winner.email} for {n} shipped prize(s)',
+        claim_urls=True,
+    ),
+}
+
+
+def create_job(
+    kind,
+    event,
+    objects,
+    *,
+    email_template,
+    from_address,
+    reply_address,
+    accept_deadline=None,
+    request=None,
+):
+    """
+    records a job that sends one email per recipient of `objects`, the prizes or claims that were picked for that kind
+    of email, the emails themselves are sent by `run_job`
+    """
+    spec = KINDS[kind]
+    rows = objects.order_by(spec.group_by, 'pk').values_list(spec.group_by, 'pk')
+    return models.PrizeMailJob.objects.create(
+        event=event,
+        kind=kind,
+        email_template=email_template,
+        from_address=from_address,
+        reply_address=reply_address,
+        accept_deadline=accept_deadline,
+        base_url=request.build_absolute_uri('/') if request else '',
+        user=request.user if request and request.user.is_authenticated else None,
+        groups=[
+            [pk for _, pk in group] for _, group in groupby(rows, key=lambda r: r[0])
+        ],
+    )
+
+
+def _send_chunk(job, groups, templates, origin, prefix):
+    spec = KINDS[job.kind]
+    objects = (
+        spec.model.objects.filter(spec.unsent)
+        .select_related(*spec.related)
+        .in_bulk([pk for group in groups for pk in group])
+    )
+    messages = []
+    changed = []
+    mailed = []
+    for group in groups:
+        group = [objects[pk] for pk in group if pk in objects]
+        if not group:
+            continue
+        recipient = spec.recipient(group[0])
+        if spec.claim_urls:
+            for claim in group:
+                claim.create_claim_url(origin, prefix=prefix)
+        messages.append(
+            ([recipient.email], spec.context(job, origin, recipient, group))
+        )
+        for obj in group:
+            spec.mark(job, obj)
+        changed += group
+        mailed.append(spec.message(recipient, len(group)))
+
+    emails = mailutil.queue_many(
+        job.email_template,
+        job.from_address,
+        messages,
+        headers={'Reply-to': job.reply_address},
+        compiled=templates,
+    )
+    spec.model.objects.bulk_update(changed, spec.fields)
+    if job.user_id and changed:
+        LogEntry.objects.log_actions(job.user_id, changed, CHANGE, spec.log_message)
+    job.emails_sent += len(emails)
+    return mailed
+
+
+def run_job(job, *, chunk_size=CHUNK_SIZE):
+    """
+    sends whatever is left of the job, `chunk_size` recipients at a time, each chunk queues its emails with a single
+    insert, marks its prizes or claims as mailed with a single update, and records the job's progress, all in one
+    transaction, so an interrupted job picks up where it left off without mailing anybody twice
+
+    returns a message for each email that was sent by this call
+    """
+    job = models.PrizeMailJob.objects.select_related('event', 'email_template').get(
+        pk=job.pk
+    )
+    if job.state == 'DONE':
+        return []
+    models.PrizeMailJob.objects.filter(pk=job.pk).update(state='RUNNING', error='')
+    templates = mailutil.compile_template(job.email_template)
+    origin = _Origin(job.base_url) if job.base_url else None
+    prefix = util.build_public_url('/', origin)
+    mailed = []
+    try:
+        while True:
+            with transaction.atomic():
+                # the lock keeps two workers from sending the same chunk
+                locked = models.PrizeMailJob.objects.select_for_update().get(pk=job.pk)
+                if locked.finished_sending:
+                    break
+                job.groups_done = locked.groups_done
+                job.emails_sent = locked.emails_sent
+                groups = job.groups[job.groups_done : job.groups_done + chunk_size]
+                mailed += _send_chunk(job, groups, templates, origin, prefix)
+                job.groups_done += len(groups)
+                job.save(update_fields=['groups_done', 'emails_sent'])
+    except Exception as e:
+        logger.exception(f'Prize mail job #{job.pk} failed')
+        models.PrizeMailJob.objects.filter(pk=job.pk).update(
+            state='FAILED', error=str(e)
+        )
+        raise
+    job.state = 'DONE'
+    job.finished = util.utcnow()
+    job.save(update_fields=['state', 'finished'])
+    return mailed
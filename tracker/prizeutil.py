@@ -1,16 +1,59 @@
+import contextlib
+import dataclasses
 import datetime
 import logging
 import random
+import threading
+import time
+from decimal import Decimal
 from typing import Hashable, Optional
 
-from django.db import transaction
+from django.db import IntegrityError, transaction
+from django.db.models import Max, Q, Sum
 
-from tracker.models import Prize, PrizeClaim, PrizeKey
+from tracker.models import Donation, Prize, PrizeClaim, PrizeKey
 
 from . import util
 
 logger = logging.getLogger(__name__)
 
+_local = threading.local()
+
+# how many keys are inserted, updated, or looked up per statement when handling key prizes in bulk
+KEY_BATCH_SIZE = 1000
+
+
+def _accept_deadline(event):
+    today = datetime.datetime.today()
+    delta = datetime.timedelta(days=event.prize_accept_deadline_delta)
+    return (
+        today.replace(tzinfo=util.anywhere_on_earth_tz(), hour=23, minute=59, second=59)
+        + delta
+    )
+
+
+def _draw_error(prize, eligible):
+    if prize.maxed_winners():
+        if prize.maxwinners == 1:
+            return 'Prize: ' + prize.name + ' already has a winner.'
+        else:
+            return (
+                'Prize: '
+                + prize.name
+                + ' already has the maximum number of winners allowed.'
+            )
+    if not eligible:
+        return 'Prize: ' + prize.name + ' has no eligible donors.'
+    return None
+
+
+def _pick_winners(prize, eligible, rand):
+    num_to_draw = prize.maxwinners - prize.current_win_count()
+    eligible = list(eligible)
+    if len(eligible) <= num_to_draw:
+        return eligible
+    return rand.sample(eligible, num_to_draw)
+
 
 @transaction.atomic()
 def draw_prize(prize, seed=None, rand=None):
@@ -20,41 +63,18 @@ def draw_prize(prize, seed=None, rand=None):
         return False, {'error': 'Seed parameter was unhashable', 'exc': e}
     if prize.key_code:
         return draw_keys(prize, seed, rand)
-    eligible = prize.eligible_donors()
-    if prize.maxed_winners():
-        if prize.maxwinners == 1:
-            return False, {'error': 'Prize: ' + prize.name + ' already has a winner.'}
-        else:
-            return (
-                False,
-                {
-                    'error': 'Prize: '
-                    + prize.name
-                    + ' already has the maximum number of winners allowed.'
-                },
-            )
-    today = datetime.datetime.today()
-    delta = datetime.timedelta(days=prize.event.prize_accept_deadline_delta)
-    accept_deadline = (
-        today.replace(tzinfo=util.anywhere_on_earth_tz(), hour=23, minute=59, second=59)
-        + delta
-    )
-    if not eligible:
-        return False, {'error': 'Prize: ' + prize.name + ' has no eligible donors.'}
+    eligible = eligible_donor_amounts(prize)
+    if error := _draw_error(prize, eligible):
+        return False, {'error': error}
     prize.claims.decline_expired()
-    num_to_draw = prize.maxwinners - prize.current_win_count()
-
-    if len(eligible) <= num_to_draw:
-        winners = eligible
-    else:
-        winners = rand.sample(list(eligible), num_to_draw)
+    winners = _pick_winners(prize, eligible, rand)
     try:
         PrizeClaim.objects.bulk_create(
             [
                 PrizeClaim(
                     prize=prize,
-                    winner=winner,
-                    acceptdeadline=accept_deadline,
+                    winner_id=winner,
+                    acceptdeadline=_accept_deadline(prize.event),
                 )
                 for winner in winners
             ]
@@ -65,7 +85,7 @@ def draw_prize(prize, seed=None, rand=None):
             False,
             {'error': 'Error drawing prize: ' + prize.name + ', ' + str(e), 'exc': e},
         )
-    return True, {'winners': [w.id for w in winners]}
+    return True, {'winners': winners}
 
 
 @transaction.atomic()
@@ -76,21 +96,288 @@ def draw_keys(prize: Prize, seed: Optional[Hashable] = None, rand=None):
         return False, {'error': 'Seed parameter was unhashable', 'exc': e}
     if not prize.key_code:
         return False, {'error': 'Attempted to draw keys for a non-key prize.'}
-    eligible = list(prize.eligible_donors())
+    eligible = list(eligible_donor_amounts(prize))
     if not eligible:
         return False, {'error': 'Prize: ' + prize.name + ' has no eligible donors.'}
-    unclaimed_keys = (
+    unclaimed_keys = list(
         PrizeKey.objects.select_for_update()
         .filter(prize=prize, prize_claim_id=None)
-        .order_by()
+        .order_by('id')
     )
-    if len(eligible) <= unclaimed_keys.count():
+    if len(eligible) <= len(unclaimed_keys):
         winners = eligible
     else:
-        winners = rand.sample(eligible, unclaimed_keys.count())
-    for key, winner in zip(unclaimed_keys, winners):
-        key.create_winner(winner)
-    return True, {'winners': [w.id for w in winners]}
+        winners = rand.sample(eligible, len(unclaimed_keys))
+    award_keys(prize, unclaimed_keys, winners)
+    return True, {'winners': winners}
+
+
+def award_keys(prize, keys, winners, *, batch_size=KEY_BATCH_SIZE):
+    """
+    creates a claim for each winner and attaches it to the matching key, with one insert and one update per batch
+    instead of a create and a save for every key, returns the new claims
+    """
+    keys = keys[: len(winners)]
+    claims = PrizeClaim.objects.bulk_create(
+        [
+            PrizeClaim(prize=prize, winner_id=winner, **PrizeClaim.KEY_CLAIM_DEFAULTS)
+            for winner in winners
+        ],
+        batch_size=batch_size,
+    )
+    if any(claim.pk is None for claim in claims):
+        # not every database hands back the primary keys from a bulk insert, but prize and winner are unique together
+        ids = dict(
+            PrizeClaim.objects.filter(prize=prize).values_list('winner_id', 'id')
+        )
+        for claim in claims:
+            claim.pk = ids[claim.winner_id]
+    for key, claim in zip(keys, claims):
+        key.prize_claim = claim
+    PrizeKey.objects.bulk_update(keys, ['prize_claim'], batch_size=batch_size)
+    return claims
+
+
+def existing_keys(keys, *, batch_size=KEY_BATCH_SIZE):
+    """the subset of `keys` that are already in the database, checked in batches to stay under parameter limits"""
+    keys = list(keys)
+    return {
+        key
+        for start in range(0, len(keys), batch_size)
+        for key in PrizeKey.objects.filter(
+            key__in=keys[start : start + batch_size]
+        ).values_list('key', flat=True)
+    }
+
+
+@transaction.atomic()
+def import_keys(prize, keys, *, batch_size=KEY_BATCH_SIZE):
+    """adds the keys to the prize in batches, and updates its number of winners once, returns the number added"""
+    created = PrizeKey.objects.bulk_create(
+        [PrizeKey(prize=prize, key=key) for key in keys], batch_size=batch_size
+    )
+    # bulk inserts skip the signal, so do it once for the whole import
+    prize.save()
+    return len(created)
+
+
+def _prize_filters(prize):
+    if prize.custom_country_filter:
+        countries = prize.allowed_prize_countries.all()
+        regions = prize.disallowed_prize_regions.all()
+    else:
+        countries = prize.event.allowed_prize_countries.all()
+        regions = prize.event.disallowed_prize_regions.all()
+    return (
+        frozenset(c.id for c in countries),
+        frozenset((r.country_id, r.name) for r in regions),
+    )
+
+
+def _grouped_amounts(prize):
+    """
+    donor id -> summed or maximum donation amount inside of the prize's window and country filters, as one grouped
+    query, shared with other prizes that have the same window and filters inside of `shared_eligibility`
+
+    claims, direct entries, and the minimum bid are applied afterwards, since those are specific to each prize
+
+    donors are in the order that they first show up in the donation list (newest first), the way the drawing has always
+    seen them, so that a given seed keeps drawing the same winners
+    """
+    countries, regions = _prize_filters(prize)
+    if prize.has_draw_time():
+        start, end = prize.start_draw_time(), prize.end_draw_time()
+    else:
+        start = end = None
+    key = (prize.event_id, start, end, countries, regions, prize.sumdonations)
+    shared = getattr(_local, 'amounts', None)
+    if shared is not None and key in shared:
+        return shared[key]
+
+    donations = Donation.objects.filter(
+        event_id=prize.event_id, transactionstate='COMPLETED'
+    ).exclude(donor=None)
+    if countries:
+        donations = donations.filter(donor__addresscountry__in=countries)
+    if regions:
+        donations = donations.filter(
+            *(
+                ~Q(donor__addresscountry=country_id, donor__addressstate__iexact=name)
+                for country_id, name in regions
+            )
+        )
+    if start:
+        donations = donations.filter(timereceived__gte=start, timereceived__lte=end)
+    amounts = dict(
+        donations.order_by()
+        .values('donor_id')
+        .annotate(
+            amount=Sum('amount') if prize.sumdonations else Max('amount'),
+            latest=Max('timereceived'),
+        )
+        .order_by('-latest', 'donor_id')
+        .values_list('donor_id', 'amount')
+    )
+    if shared is not None:
+        shared[key] = amounts
+    return amounts
+
+
+def eligible_donor_amounts(prize) -> dict[int, Decimal]:
+    """returns a dictionary of donor id -> qualifying amount for every donor that can currently win the prize"""
+    winners = {claim.winner_id for claim in prize.claims.all()}
+    donors = {
+        donor_id: amount
+        for donor_id, amount in _grouped_amounts(prize).items()
+        if donor_id not in winners
+    }
+    for entry in prize.donorprizeentry_set.all():
+        if entry.donor_id not in winners:
+            donors[entry.donor_id] = max(
+                prize.minimumbid, donors.get(entry.donor_id, Decimal('0.0'))
+            )
+    if not donors:
+        return {}
+    elif prize.randomdraw:
+        return {
+            donor_id: amount
+            for donor_id, amount in donors.items()
+            if prize.minimumbid <= amount
+        }
+    else:
+        donor_id, amount = max(donors.items(), key=lambda i: i[1])
+        return {donor_id: amount}
+
+
+@contextlib.contextmanager
+def shared_eligibility():
+    """
+    inside of this block, prizes with the same event, draw window, and filters share one grouped donation query,
+    e.g. when drawing or reporting on every prize of an event at once, nested blocks are folded into the outermost one
+    """
+    if getattr(_local, 'amounts', None) is not None:
+        yield
+        return
+    _local.amounts = {}
+    try:
+        yield
+    finally:
+        _local.amounts = None
+
+
+def eligible_donor_counts(prizes):
+    """
+    returns a dictionary of prize id -> (eligible donors, donors whose amount exactly matches the minimum bid)
+    """
+    counts = {}
+    with shared_eligibility():
+        for prize in prizes.select_related(
+            'event', 'startrun', 'endrun', 'prev_run', 'next_run'
+        ).prefetch_related(
+            'allowed_prize_countries',
+            'disallowed_prize_regions',
+            'event__allowed_prize_countries',
+            'event__disallowed_prize_regions',
+            'claims',
+            'donorprizeentry_set',
+        ):
+            amounts = eligible_donor_amounts(prize).values()
+            counts[prize.id] = (
+                len(amounts),
+                sum(1 for amount in amounts if amount == prize.minimumbid),
+            )
+    return counts
+
+
+@dataclasses.dataclass
+class DrawResult:
+    prize: Prize
+    winners: list = dataclasses.field(default_factory=list)
+    error: Optional[str] = None
+    # seconds spent computing eligibility and picking winners
+    elapsed: float = 0
+
+
+@transaction.atomic()
+def draw_prizes(prizes, seed=None):
+    """
+    draws every prize in the queryset as one batch, returns a list of DrawResult in prize id order
+
+    expired claims are declined with a single update, prizes that share a draw window share their eligibility rows,
+    and every new claim is written with a single `bulk_create`, each prize gets its own generator derived from the
+    seed, so the same seed always draws the same winners for a given prize no matter what else is in the batch
+
+    the prizes stay locked until the batch is done, and a prize whose new claims conflict with ones made some other way
+    gets an error result instead of failing the whole batch
+    """
+    # feeds like `to_draw` join against claims, so start over from a plain id list
+    ids = set(prizes.values_list('id', flat=True))
+    # a second batch with any of the same prizes waits here, and then sees the claims from this one
+    list(
+        Prize.objects.select_for_update()
+        .filter(id__in=ids)
+        .order_by('id')
+        .values_list('id', flat=True)
+    )
+    PrizeClaim.objects.filter(prize__in=ids).decline_expired()
+    prizes = (
+        Prize.objects.filter(id__in=ids)
+        .select_related('event', 'startrun', 'endrun', 'prev_run', 'next_run')
+        .prefetch_related(
+            'allowed_prize_countries',
+            'disallowed_prize_regions',
+            'event__allowed_prize_countries',
+            'event__disallowed_prize_regions',
+            'claims',
+            'donorprizeentry_set',
+        )
+        .order_by('id')
+    )
+    results = []
+    claims = []
+    with shared_eligibility():
+        for prize in prizes:
+            start = time.perf_counter()
+            rand = random.Random(f'{seed}:{prize.id}' if seed is not None else None)
+            if prize.key_code:
+                drawn, msg = draw_keys(prize, rand=rand)
+                result = DrawResult(
+                    prize,
+                    winners=msg.get('winners', []),
+                    error=None if drawn else msg['error'],
+                )
+            else:
+                eligible = eligible_donor_amounts(prize)
+                if error := _draw_error(prize, eligible):
+                    result = DrawResult(prize, error=error)
+                else:
+                    result = DrawResult(
+                        prize, winners=_pick_winners(prize, eligible, rand)
+                    )
+                    deadline = _accept_deadline(prize.event)
+                    group = [
+                        PrizeClaim(
+                            prize=prize, winner_id=winner, acceptdeadline=deadline
+                        )
+                        for winner in result.winners
+                    ]
+                    claims.append((result, group))
+            result.elapsed = time.perf_counter() - start
+            results.append(result)
+    try:
+        with transaction.atomic():
+            PrizeClaim.objects.bulk_create(c for _, group in claims for c in group)
+    except IntegrityError:
+        # a claim was made outside of the batch, so find out which prizes it affects and save the rest
+        for result, group in claims:
+            try:
+                with transaction.atomic():
+                    PrizeClaim.objects.bulk_create(group)
+            except IntegrityError as e:
+                logger.exception('Could not draw prize')
+                result.winners = []
+                result.error = f'Error drawing prize: {result.prize.name}, {e}'
+    return results
 
 
 def get_past_due_prize_claims(event):
@@ -0,0 +1,240 @@
+"""
+Event-wide recomputation of the denormalized SpeedRun schedule fields (order, start and end times, and the setup time
+of any run that is followed by an anchor). Every ordered run of the event is loaded with one query, the schedule is
+recomputed in memory in a single pass, and only the rows that actually changed are written back with one
+`bulk_update`.
+
+Inside of `deferred_recompute`, requests are collected instead, so that several run changes (e.g. the previous run and
+the current run in the admin `start_run` view) collapse into a single pass per event when the block exits.
+
+The cached previous and next runs of the prizes (which bound their draw windows) are maintained the same way, in one
+pass per event over the ordered runs, and inside of `deferred_prize_windows` they are only brought up to date once per
+event, either when the block exits or when the transaction commits.
+"""
+
+import bisect
+import contextlib
+import datetime
+import functools
+import threading
+
+from django.db import router, transaction
+from django.db.models import Q
+
+from tracker.models import Event, Prize, SpeedRun
+
+SCHEDULE_FIELDS = ('order', 'starttime', 'endtime', 'setup_time')
+
+_local = threading.local()
+
+
+def _snapshot(run):
+    return run.order, run.starttime, run.endtime, run.setup_time_ms
+
+
+def ordered_runs(event, *, exclude=None, using=None):
+    """every ordered run of the event, locked for the rest of the transaction, optionally leaving one run out"""
+    queryset = (
+        SpeedRun.objects.using(using)
+        .filter(event=event)
+        .exclude(order=None)
+        .order_by('order')
+    )
+    if exclude is not None and exclude.pk:
+        queryset = queryset.exclude(pk=exclude.pk)
+    if transaction.get_connection(using).in_atomic_block:
+        queryset = queryset.select_for_update()
+    return list(queryset)
+
+
+def insert(runs, run):
+    """slots `run` into `runs` (already in order) at its requested order, ahead of any run that already has it"""
+    runs.insert(bisect.bisect_left([r.order for r in runs], run.order), run)
+    return runs
+
+
+def compute(event, runs):
+    """
+    `runs` are in the desired order, updates them in place, and returns the ones whose schedule changed, along with
+    the ones whose order changed
+
+    orders are compacted to 1..n, every run starts when the previous one ends (or at its own anchor time, or at the
+    start of the event), and a run that is followed by an anchored run has its setup time stretched or shrunk to meet
+    the anchor exactly
+    """
+    setup_field = SpeedRun._meta.get_field('setup_time')
+    changed = []
+    reordered = []
+    starttime = event.datetime
+    for order, run in enumerate(runs, start=1):
+        original = _snapshot(run)
+        run.order = order
+        run.starttime = run.anchor_time or starttime
+        following = runs[order] if order < len(runs) else None
+        if following and following.anchor_time:
+            setup = (
+                following.anchor_time
+                - run.starttime
+                - datetime.timedelta(milliseconds=run.run_time_ms)
+            )
+            # not enough drift is reported by `SpeedRun.clean`, not here, so a save still goes through like it
+            #  always has
+            run.setup_time = setup_field.to_python(setup)
+        run.endtime = starttime = run.starttime + datetime.timedelta(
+            milliseconds=run.total_time_ms
+        )
+        if _snapshot(run) != original:
+            changed.append(run)
+            if run.order != original[0]:
+                reordered.append(run)
+    return changed, reordered
+
+
+def clear_order(runs, *, using=None):
+    """nulls out the stored order of `runs`, so that they can be shifted past each other without unique conflicts"""
+    ids = [run.pk for run in runs if run.pk]
+    if ids:
+        SpeedRun.objects.using(using).filter(pk__in=ids).update(order=None)
+
+
+def persist(runs, changed, reordered, *, using=None):
+    """
+    writes `changed` back in one `bulk_update`, and if anything in `reordered` moved, brings the prize windows of the
+    event up to date, since their cached previous and next runs might have moved
+    """
+    SpeedRun.objects.using(using).bulk_update(changed, SCHEDULE_FIELDS)
+    if reordered:
+        update_prize_windows(reordered[0].event_id, runs=runs, using=using)
+
+
+def recompute_schedule(event, *, using=None):
+    """
+    recomputes the schedule of the given event (either an instance or a primary key), returns the number of rows
+    written
+    """
+    if not isinstance(event, Event):
+        event = Event.objects.using(using).get(pk=event)
+    with transaction.atomic(using=using):
+        runs = ordered_runs(event, using=using)
+        changed, reordered = compute(event, runs)
+        clear_order(reordered, using=using)
+        persist(runs, changed, reordered, using=using)
+    return len(changed)
+
+
+def is_deferred(event, *, using=None):
+    """returns True, and remembers the event for later, if inside of `deferred_recompute`"""
+    pending = getattr(_local, 'pending', None)
+    if pending is None:
+        return False
+    pending.add((event.pk if isinstance(event, Event) else event, using))
+    return True
+
+
+@contextlib.contextmanager
+def deferred_recompute():
+    """
+    collects every schedule recompute made inside the block and runs them as one pass per event when it exits, nested
+    blocks are folded into the outermost one
+
+    runs saved inside the block will not have their schedule fields refreshed, and should not change their order
+    """
+    if getattr(_local, 'pending', None) is not None:
+        yield
+        return
+    pending = _local.pending = set()
+    with deferred_prize_windows():
+        try:
+            yield
+        finally:
+            _local.pending = None
+        for event, using in pending:
+            recompute_schedule(event, using=using)
+
+
+def prize_windows(runs, prizes):
+    """
+    sets the previous and next runs of each prize from `runs` (every ordered run of the event, in order) the same way
+    `Prize.save` does, and returns the prizes that changed
+    """
+    positions = {run.pk: i for i, run in enumerate(runs)}
+    changed = []
+    for prize in prizes:
+        start = positions.get(prize.startrun_id)
+        end = positions.get(prize.endrun_id)
+        if start is None or end is None:
+            window = (None, None)
+        else:
+            window = (
+                runs[start - 1].pk if start > 0 else None,
+                runs[end + 1].pk if end + 1 < len(runs) else None,
+            )
+        if (prize.prev_run_id, prize.next_run_id) != window:
+            prize.prev_run_id, prize.next_run_id = window
+            changed.append(prize)
+    return changed
+
+
+def recompute_prize_windows(event, *, runs=None, using=None):
+    """
+    brings the previous and next runs of every prize in the event (either an instance or a primary key) up to date, with
+    one query for the ordered runs (unless they are passed in, already in order) and one for the prizes, returns the
+    number of rows written
+    """
+    event_id = event.pk if isinstance(event, Event) else event
+    if runs is None:
+        runs = list(
+            SpeedRun.objects.using(using)
+            .filter(event=event_id)
+            .exclude(order=None)
+            .order_by('order')
+            .only('id')
+        )
+    prizes = (
+        Prize.objects.using(using)
+        .filter(
+            Q(startrun__isnull=False)
+            | Q(prev_run__isnull=False)
+            | Q(next_run__isnull=False),
+            event=event_id,
+        )
+        .only('id', 'startrun', 'endrun', 'prev_run', 'next_run')
+    )
+    changed = prize_windows(runs, prizes)
+    Prize.objects.using(using).bulk_update(changed, ['prev_run', 'next_run'])
+    return len(changed)
+
+
+def update_prize_windows(event, *, runs=None, using=None):
+    """recomputes the prize windows of the event now, or remembers it for later if inside of `deferred_prize_windows`"""
+    pending = getattr(_local, 'prize_windows', None)
+    if pending is None:
+        return recompute_prize_windows(event, runs=runs, using=using)
+    # signals always name the database, saves usually do not
+    using = using or router.db_for_write(Prize)
+    pending.add((event.pk if isinstance(event, Event) else event, using))
+    return 0
+
+
+@contextlib.contextmanager
+def deferred_prize_windows(*, on_commit=False):
+    """
+    collects every prize window update made inside the block and runs them as one pass per event when it exits, or
+    when the current transaction commits if `on_commit` is set, nested blocks are folded into the outermost one
+    """
+    if getattr(_local, 'prize_windows', None) is not None:
+        yield
+        return
+    pending = _local.prize_windows = set()
+    try:
+        yield
+    finally:
+        _local.prize_windows = None
+    for event, using in pending:
+        if on_commit:
+            transaction.on_commit(
+                functools.partial(recompute_prize_windows, event, using=using),
+                using=using,
+            )
+        else:
+            recompute_prize_windows(event, using=using)
@@ -2,6 +2,7 @@ from django.contrib.auth.models import AnonymousUser
 from django.core.exceptions import PermissionDenied
 from django.db.models import Q
 
+from tracker import searchutil, settings
 from tracker.models import (
     Bid,
     Donation,
@@ -50,26 +51,43 @@ _GeneralFields = {
     # There was a really weird bug when doing the full recursion on speedrun, where it would double-select the related bids in aggregate queries
     # it seems to be related to selecting the donor table as part of the 'runners' recurse thing
     # it only applied to challenges too for some reason.  I can't figure it out, and I don't really want to waste more time on it, so I'm just hard-coding it to do the specific speedrun fields only
-    'bid': ['event', 'speedrun', 'name', 'description', 'shortdescription'],
+    # the recursion only follows the first field of a related model, so the other related fields are spelled out
+    'bid': [
+        'event',
+        'event__name',
+        'speedrun',
+        'speedrun__description',
+        'name',
+        'description',
+        'shortdescription',
+    ],
     'allbids': [
         'event',
+        'event__name',
         'speedrun',
+        'speedrun__description',
         'name',
         'description',
         'shortdescription',
         'parent',
+        'parent__name',
     ],
     'bidtarget': [
         'event',
+        'event__name',
         'speedrun',
+        'speedrun__description',
         'name',
         'description',
         'shortdescription',
         'parent',
+        'parent__name',
     ],
     'bidsuggestion': ['name', 'bid'],
     'donationbid': ['donation', 'bid'],
-    'donation': ['donor', 'comment', 'modcomment'],
+    # `donor` is not here, `icontains` is not a valid lookup on the foreign key itself, and following it would let a
+    #  search find anonymous donors by their alias
+    'donation': ['comment', 'modcomment'],
     'event': ['short', 'name'],
     'headset': ['name'],
     'prize': ['name', 'description', 'shortdescription'],
@@ -217,6 +235,18 @@ _SpecificFields = {
     },
 }
 
+# the search index groups that stand in for the general fields above when `TRACKER_SEARCH_INDEX` is on
+_IndexedGroups = {
+    'bid': ('bid', 'event', 'run'),
+    'allbids': ('bid', 'event', 'run', 'parent'),
+    'bidtarget': ('bid', 'event', 'run', 'parent'),
+    'donation': ('comments',),
+    'headset': ('name',),
+    'prize': ('prize',),
+    'run': ('run',),
+    'runner': ('name', 'talent'),
+}
+
 _FKMap = {
     'speedrun': 'run',
     'startrun': 'run',
@@ -308,6 +338,11 @@ def model_general_filter(model, text, user):
     query = Q()
     for field in fields:
         query |= build_general_query_piece(model, field, text, user)
+    if text and settings.TRACKER_SEARCH_INDEX and model in _IndexedGroups:
+        # the permission checks above still apply, only the matching is done by the index
+        return Q(
+            pk__in=searchutil.matching(_ModelMap[model], text, _IndexedGroups[model])
+        )
     return query
 
 
@@ -0,0 +1,358 @@
+"""
+Indexed text search, used by the `q` parameter of the search views and by the admin changelist searches when
+`TRACKER_SEARCH_INDEX` is turned on. Every indexed object gets one `SearchDocument` per group of searchable fields,
+holding the flattened, lowercased text of those fields (including the ones reached through joins), so a search is a
+lookup against a single indexed table instead of an OR of `icontains` across several joined tables.
+
+The documents are kept current by model signals (see `tracker.models.search`), and can be rebuilt from scratch with
+the `rebuild_search_index` command. How the document table is matched depends on the database, see `get_backend`.
+"""
+
+import itertools
+from collections import defaultdict
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import connections, router, transaction
+from django.db.models import BooleanField
+from django.db.models.expressions import RawSQL
+
+from tracker.models import Bid, Donation, Prize, SearchDocument, SpeedRun, Talent
+
+# model -> group -> field paths, the groups are what the callers pick from, depending on which fields they are
+#  allowed to search
+INDEXES = {
+    Donation: {
+        'donor': ('donor__alias', 'requestedalias', 'amount'),
+        'comments': ('comment', 'modcomment'),
+        'emails': ('donor__email', 'donor__paypalemail'),
+        'full_names': ('donor__firstname', 'donor__lastname'),
+    },
+    Bid: {
+        'bid': ('name', 'description', 'shortdescription', 'speedrun__name'),
+        'event': ('event__short', 'event__name'),
+        'run': ('speedrun__description',),
+        'parent': ('parent__name',),
+    },
+    SpeedRun: {
+        'run': ('name', 'description'),
+        'talent': ('runners__name', 'hosts__name', 'commentators__name'),
+        'tags': ('priority_tag__name', 'tags__name'),
+    },
+    Prize: {
+        'prize': ('name', 'description', 'shortdescription'),
+    },
+    Talent: {
+        'name': ('name',),
+        'talent': ('stream', 'twitter', 'youtube', 'platform', 'pronouns'),
+        'donor': (
+            'donor__alias',
+            'donor__firstname',
+            'donor__lastname',
+            'donor__email',
+        ),
+    },
+}
+
+FTS_TABLE = 'tracker_searchdocument_fts'
+
+
+def _path_fields(model, path):
+    fields = []
+    for name in path.split('__'):
+        field = model._meta.get_field(name)
+        fields.append(field)
+        model = field.related_model
+    return fields
+
+
+def _is_multivalued(model, path):
+    return any(f.many_to_many or f.one_to_many for f in _path_fields(model, path))
+
+
+def _dependents():
+    """related model -> [(indexed model, path back to it)], for every join that an indexed field goes through"""
+    dependents = defaultdict(set)
+    for model, groups in INDEXES.items():
+        for path in itertools.chain.from_iterable(groups.values()):
+            if '__' in path:
+                head = path.split('__')[0]
+                dependents[_path_fields(model, head)[0].related_model].add(
+                    (model, head)
+                )
+    return dependents
+
+
+DEPENDENTS = _dependents()
+
+
+def _dependent_fields():
+    """related model -> the attnames of its fields that the documents of other models include"""
+    fields = defaultdict(set)
+    for model, groups in INDEXES.items():
+        for path in itertools.chain.from_iterable(groups.values()):
+            if '__' in path:
+                head, field = _path_fields(model, path)[:2]
+                fields[head.related_model].add(field.attname)
+    return {model: tuple(sorted(names)) for model, names in fields.items()}
+
+
+DEPENDENT_FIELDS = _dependent_fields()
+
+# a field that was deferred when the object was loaded, so whether it changed is unknown
+_UNKNOWN = object()
+
+
+def _snapshot(model, instance):
+    return tuple(instance.__dict__.get(f, _UNKNOWN) for f in DEPENDENT_FIELDS[model])
+
+
+def remember(model, instance):
+    """
+    called when an object is loaded or created, so that a later save only reindexes the objects that include its
+    fields if one of those fields actually changed
+    """
+    instance._search_snapshot = _snapshot(model, instance)
+
+
+def groups_for_fields(model, fields):
+    """
+    the groups that exactly cover the given field paths (e.g. an admin's `search_fields`), or None if they cannot
+    be searched with the index
+    """
+    fields = set(fields)
+    groups = [g for g, paths in INDEXES.get(model, {}).items() if fields & set(paths)]
+    covered = set(itertools.chain.from_iterable(INDEXES[model][g] for g in groups))
+    return groups if groups and covered == fields else None
+
+
+def build_documents(model, pks):
+    """returns a dictionary of (pk, group) -> document for every non-empty group of the given objects"""
+    queryset = model._base_manager.filter(pk__in=pks)
+    fields = [
+        (group, path) for group, paths in INDEXES[model].items() for path in paths
+    ]
+    values = defaultdict(dict)
+
+    def add(pk, group, value):
+        if value is not None and str(value).strip():
+            # a dict keeps the first-seen order while dropping repeats from multi-valued joins
+            values[pk, group][str(value).strip()] = None
+
+    single = [(g, p) for g, p in fields if not _is_multivalued(model, p)]
+    if single:
+        for pk, *row in queryset.values_list('pk', *(p for _, p in single)):
+            for (group, _), value in zip(single, row):
+                add(pk, group, value)
+    # each multi-valued path gets its own query, instead of a cross product of all of them
+    for group, path in fields:
+        if (group, path) not in single:
+            for pk, value in queryset.values_list('pk', path):
+                add(pk, group, value)
+    return {key: '\n'.join(parts).lower() for key, parts in values.items()}
+
+
+def index(model, pks):
+    """brings the documents of the given objects up to date, returns the number of rows written"""
+    pks = set(pks)
+    if not pks or model not in INDEXES:
+        return 0
+    content_type = ContentType.objects.get_for_model(model)
+    documents = build_documents(model, pks)
+    with transaction.atomic():
+        existing = {
+            (doc.object_id, doc.group): doc
+            for doc in SearchDocument.objects.filter(
+                content_type=content_type, object_id__in=pks
+            )
+        }
+        to_create = []
+        to_update = []
+        for (pk, group), document in documents.items():
+            doc = existing.pop((pk, group), None)
+            if doc is None:
+                to_create.append(
+                    SearchDocument(
+                        content_type=content_type,
+                        object_id=pk,
+                        group=group,
+                        document=document,
+                    )
+                )
+            elif doc.document != document:
+                doc.document = document
+                to_update.append(doc)
+        SearchDocument.objects.bulk_create(to_create)
+        SearchDocument.objects.bulk_update(to_update, ['document'])
+        if existing:
+            SearchDocument.objects.filter(
+                pk__in=[doc.pk for doc in existing.values()]
+            ).delete()
+    return len(to_create) + len(to_update) + len(existing)
+
+
+def remove(model, pks):
+    SearchDocument.objects.filter(
+        content_type=ContentType.objects.get_for_model(model), object_id__in=pks
+    ).delete()
+
+
+def _dependent_pks(model, instance):
+    """[(indexed model, pks)] of every indexed object that includes any of the object's fields"""
+    return [
+        (
+            dependent,
+            list(
+                dependent._base_manager.filter(**{path: instance.pk}).values_list(
+                    'pk', flat=True
+                )
+            ),
+        )
+        for dependent, path in DEPENDENTS.get(model, ())
+    ]
+
+
+def _dependents_changed(model, instance, created, update_fields):
+    if model not in DEPENDENT_FIELDS:
+        return False
+    fields = DEPENDENT_FIELDS[model]
+    old = getattr(instance, '_search_snapshot', None)
+    new = _snapshot(model, instance)
+    if update_fields is not None:
+        # the fields that were not saved may still hold unsaved changes, so their snapshot stays as it was
+        new = tuple(
+            value if field in update_fields else (old[i] if old else _UNKNOWN)
+            for i, (field, value) in enumerate(zip(fields, new))
+        )
+    instance._search_snapshot = new
+    if created or (update_fields is not None and not set(update_fields) & set(fields)):
+        # a new object is not included by anything yet, and neither are the fields of a partial save
+        return False
+    return old is None or _UNKNOWN in old or old != new
+
+
+def object_changed(model, instance, *, created=False, update_fields=None):
+    """
+    reindexes the object itself, and every indexed object that includes any of its fields, if any of those changed
+    """
+    if model in INDEXES:
+        index(model, [instance.pk])
+    if _dependents_changed(model, instance, created, update_fields):
+        for dependent, pks in _dependent_pks(model, instance):
+            index(dependent, pks)
+
+
+def object_deleting(model, instance):
+    """
+    remembers every indexed object that includes any of the object's fields, since the delete clears those relations
+    (e.g. the many-to-many rows of a talent's runs) without sending any signals for them
+    """
+    instance._search_dependents = _dependent_pks(model, instance)
+
+
+def object_deleted(model, instance):
+    """removes the object's documents, and reindexes whatever included it, see `object_deleting`"""
+    if model in INDEXES:
+        remove(model, [instance.pk])
+    for dependent, pks in getattr(instance, '_search_dependents', ()):
+        index(dependent, pks)
+
+
+def relation_changed(instance, model, pk_set):
+    """reindexes both sides of a many-to-many change, when they are indexed"""
+    if type(instance) in INDEXES:
+        index(type(instance), [instance.pk])
+    if model in INDEXES and pk_set:
+        index(model, pk_set)
+
+
+def rebuild(model, *, batch_size=1000, progress=None):
+    """
+    reindexes every object of the model in batches, and removes the documents of any objects that no longer exist,
+    returns the number of rows written
+
+    `progress` is an optional wrapper around an iterable, e.g. `tqdm`
+    """
+    progress = progress or (lambda iterable, **kwargs: iterable)
+    pks = list(model._base_manager.order_by('pk').values_list('pk', flat=True))
+    written = 0
+    for start in progress(
+        range(0, len(pks), batch_size), desc=model._meta.verbose_name, unit='batch'
+    ):
+        written += index(model, pks[start : start + batch_size])
+    written += (
+        SearchDocument.objects.filter(
+            content_type=ContentType.objects.get_for_model(model)
+        )
+        .exclude(object_id__in=model._base_manager.values('pk'))
+        .delete()[0]
+    )
+    return written
+
+
+class DatabaseBackend:
+    """plain substring matching on the document table, works everywhere and still avoids the joins"""
+
+    def filter(self, documents, text):
+        return documents.filter(document__contains=text)
+
+
+class SQLiteBackend(DatabaseBackend):
+    """an FTS5 table with the trigram tokenizer, which supports the same substring matches as `contains`"""
+
+    def filter(self, documents, text):
+        if len(text) < 3:
+            # the tokenizer cannot match anything shorter than a single trigram
+            return super().filter(documents, text)
+        return documents.filter(
+            pk__in=RawSQL(
+                f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+                ['"' + text.replace('"', '""') + '"'],
+            )
+        )
+
+
+class PostgresBackend(DatabaseBackend):
+    """
+    a `tsvector` match for whole words in any order, or a substring match, which uses the trigram index if the
+    `pg_trgm` extension could be installed
+    """
+
+    def filter(self, documents, text):
+        pattern = text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        return documents.filter(
+            RawSQL(
+                "to_tsvector('simple', document) @@ plainto_tsquery('simple', %s) "
+                'OR document LIKE %s',
+                [text, f'%{pattern}%'],
+                output_field=BooleanField(),
+            )
+        )
+
+
+_backends = {}
+
+
+def get_backend(using=None):
+    using = using or router.db_for_read(SearchDocument)
+    if using not in _backends:
+        connection = connections[using]
+        if connection.vendor == 'postgresql':
+            _backends[using] = PostgresBackend()
+        elif (
+            connection.vendor == 'sqlite'
+            and FTS_TABLE in connection.introspection.table_names()
+        ):
+            _backends[using] = SQLiteBackend()
+        else:
+            _backends[using] = DatabaseBackend()
+    return _backends[using]
+
+
+def matching(model, text, groups, *, using=None):
+    """a subquery of the primary keys of every object whose documents in `groups` contain `text`"""
+    documents = SearchDocument.objects.filter(
+        content_type=ContentType.objects.get_for_model(model), group__in=groups
+    )
+    return (
+        get_backend(using).filter(documents, text.strip().lower()).values('object_id')
+    )
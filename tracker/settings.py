@@ -77,6 +77,10 @@ class TrackerSettings(object):
         # https://www.paypal.com/us/brc/article/understanding-account-limitations
         return getattr(settings, 'TRACKER_PAYPAL_MAXIMUM_AMOUNT', 60000)
 
+    @property
+    def TRACKER_PAYPAL_ASYNC_IPN(self):
+        return getattr(settings, 'TRACKER_PAYPAL_ASYNC_IPN', False)
+
     @property
     def TRACKER_REGISTRATION_FROM_EMAIL(self):
         return getattr(
@@ -91,6 +95,42 @@ class TrackerSettings(object):
             self.TRACKER_REGISTRATION_FROM_EMAIL,
         )
 
+    @property
+    def TRACKER_INCREMENTAL_DONOR_CACHE(self):
+        return getattr(settings, 'TRACKER_INCREMENTAL_DONOR_CACHE', False)
+
+    @property
+    def TRACKER_SEARCH_INDEX(self):
+        return getattr(settings, 'TRACKER_SEARCH_INDEX', False)
+
+    @property
+    def TRACKER_PARTICIPATION_INDEX(self):
+        return getattr(settings, 'TRACKER_PARTICIPATION_INDEX', False)
+
+    @property
+    def TRACKER_SERVER_TIMING(self):
+        return getattr(settings, 'TRACKER_SERVER_TIMING', False)
+
+    @property
+    def TRACKER_QUERY_BUDGETS(self):
+        return getattr(settings, 'TRACKER_QUERY_BUDGETS', {})
+
+    @property
+    def TRACKER_QUERY_BUDGETS_STRICT(self):
+        return getattr(settings, 'TRACKER_QUERY_BUDGETS_STRICT', False)
+
+    @property
+    def TRACKER_POSTBACK_WORKERS(self):
+        return getattr(settings, 'TRACKER_POSTBACK_WORKERS', 8)
+
+    @property
+    def TRACKER_POSTBACK_RETRIES(self):
+        return getattr(settings, 'TRACKER_POSTBACK_RETRIES', 2)
+
+    @property
+    def TRACKER_POSTBACK_MAX_QUEUE(self):
+        return getattr(settings, 'TRACKER_POSTBACK_MAX_QUEUE', 100)
+
     @property
     def TRACKER_PUBLIC_SITE_ID(self):
         from django.apps import apps
@@ -239,6 +279,69 @@ def tracker_settings_checks(app_configs, **kwargs):
                     id='tracker.E114',
                 )
             )
+    if not isinstance(TrackerSettings().TRACKER_INCREMENTAL_DONOR_CACHE, bool):
+        messages.append(
+            Error('TRACKER_INCREMENTAL_DONOR_CACHE should be a bool', id='tracker.E119')
+        )
+    workers = TrackerSettings().TRACKER_POSTBACK_WORKERS
+    if not isinstance(workers, int) or workers < 1:
+        messages.append(
+            Error(
+                'TRACKER_POSTBACK_WORKERS should be a positive integer',
+                id='tracker.E120',
+            )
+        )
+    retries = TrackerSettings().TRACKER_POSTBACK_RETRIES
+    if not isinstance(retries, int) or retries < 0:
+        messages.append(
+            Error(
+                'TRACKER_POSTBACK_RETRIES should be a non-negative integer',
+                id='tracker.E121',
+            )
+        )
+    max_queue = TrackerSettings().TRACKER_POSTBACK_MAX_QUEUE
+    if not isinstance(max_queue, int) or max_queue < 1:
+        messages.append(
+            Error(
+                'TRACKER_POSTBACK_MAX_QUEUE should be a positive integer',
+                id='tracker.E122',
+            )
+        )
+    if not isinstance(TrackerSettings().TRACKER_PAYPAL_ASYNC_IPN, bool):
+        messages.append(
+            Error('TRACKER_PAYPAL_ASYNC_IPN should be a bool', id='tracker.E123')
+        )
+    if not isinstance(TrackerSettings().TRACKER_SEARCH_INDEX, bool):
+        messages.append(
+            Error('TRACKER_SEARCH_INDEX should be a bool', id='tracker.E124')
+        )
+    if not isinstance(TrackerSettings().TRACKER_SERVER_TIMING, bool):
+        messages.append(
+            Error('TRACKER_SERVER_TIMING should be a bool', id='tracker.E125')
+        )
+    budgets = TrackerSettings().TRACKER_QUERY_BUDGETS
+    if not isinstance(budgets, dict) or not all(
+        isinstance(k, str)
+        and isinstance(v, dict)
+        and v.keys() <= {'queries', 'db_time'}
+        and all(isinstance(n, (int, float)) and n >= 0 for n in v.values())
+        for k, v in budgets.items()
+    ):
+        messages.append(
+            Error(
+                'TRACKER_QUERY_BUDGETS should be a dict of view names to dicts with `queries` and/or `db_time` keys, '
+                'each a non-negative number',
+                id='tracker.E126',
+            )
+        )
+    if not isinstance(TrackerSettings().TRACKER_QUERY_BUDGETS_STRICT, bool):
+        messages.append(
+            Error('TRACKER_QUERY_BUDGETS_STRICT should be a bool', id='tracker.E127')
+        )
+    if not isinstance(TrackerSettings().TRACKER_PARTICIPATION_INDEX, bool):
+        messages.append(
+            Error('TRACKER_PARTICIPATION_INDEX should be a bool', id='tracker.E128')
+        )
     if apps.is_installed('django.contrib.sites'):
         site_id = TrackerSettings().TRACKER_PUBLIC_SITE_ID
         if isinstance(site_id, int):
@@ -16,6 +16,55 @@ def post_donation_to_postbacks(donation_id):
     eventutil.post_donation_to_postbacks(donation)
 
 
+@shared_task
+def post_donations_to_postbacks(donation_ids):
+    from . import eventutil, models
+
+    donations = models.Donation.objects.select_related(
+        'event', 'donor'
+    ).prefetch_related('bids', 'bids__bid')
+    eventutil.post_donations_to_postbacks(donations.filter(pk__in=donation_ids))
+
+
+@shared_task
+def process_paypal_ipn(ipn_id):
+    from django.core.cache import cache
+    from django.db import transaction
+    from paypal.standard.ipn.models import PayPalIPN
+
+    from . import paypalutil
+
+    ipn = PayPalIPN.objects.get(pk=ipn_id)
+    # a redelivered task, or a repeat of the same status for the same transaction, is only processed once, the cache
+    #  is only a fast path, the donation row lock is what keeps workers that do not share a cache from both applying it
+    key = f'tracker:paypal_ipn:{ipn.txn_id or ipn.id}:{ipn.payment_status.lower()}'
+    if not cache.add(key, ipn.id, 60 * 60 * 24):
+        logger.info(f'Skipping IPN #{ipn.id}, already processed')
+        return False
+    try:
+        with transaction.atomic():
+            if not paypalutil.claim_ipn(ipn):
+                logger.info(f'Skipping IPN #{ipn.id}, already processed')
+                return False
+            paypalutil.link_ipn(ipn)
+            paypalutil.process_ipn(ipn)
+    except Exception:
+        # let a retry have another go at it
+        cache.delete(key)
+        raise
+    return True
+
+
+@shared_task
+def reconcile_donor_cache():
+    from . import models
+
+    count = models.DonorCache.reconcile()
+    if count:
+        logger.info(f'Reconciled {count} stale DonorCache row(s)')
+    return count
+
+
 @shared_task
 def celery_test():
     from . import util
@@ -46,3 +95,35 @@ def draw_prize(self, prize_or_pk):
         if self.request.id:
             raise ValueError(msg['error']) from msg.get('exc', None)
     return drawn, msg
+
+
+@shared_task
+def draw_prizes(prize_ids, seed=None):
+    from . import models, prizeutil
+
+    results = prizeutil.draw_prizes(
+        models.Prize.objects.filter(pk__in=prize_ids), seed=seed
+    )
+    for result in results:
+        if result.error:
+            logger.error(
+                f'Could not draw winner(s) for Prize #{result.prize.pk}: {result.error}'
+            )
+        else:
+            logger.info(
+                f'Drew {len(result.winners)} winner(s) for Prize #{result.prize.pk} in {result.elapsed:.3f}s'
+            )
+    return {
+        result.prize.pk: {'winners': result.winners, 'error': result.error}
+        for result in results
+    }
+
+
+@shared_task
+def send_prize_mail(job_id):
+    from . import models, prizemail
+
+    job = models.PrizeMailJob.objects.get(pk=job_id)
+    mailed = prizemail.run_job(job)
+    logger.info(f'Sent {len(mailed)} email(s) for Prize Mail Job #{job_id}')
+    return len(mailed)
@@ -12,6 +12,7 @@ from django.views.decorators.csrf import csrf_protect
 from rest_framework.request import Request
 
 from tracker import settings, viewutil
+from tracker.analytics import instrumentation
 from tracker.api.pagination import TrackerPagination
 from tracker.api.serializers import BidSerializer, EventSerializer, PrizeSerializer
 from tracker.compat import reverse
@@ -79,6 +80,7 @@ def donate(request, event):
     event = viewutil.get_event(event)
 
     prefetch = cache.get(f'event_prefetch_{event.id}')
+    instrumentation.cache_lookup(prefetch is not None)
 
     if prefetch is None:
         drf_request = Request(request)
@@ -100,7 +100,9 @@ def random_num_replace(s, replacements, max_length=None):
 
 
 def median(queryset, column, *, count=None):
-    count = count or queryset.count()
+    """portable median using an OFFSET query, prefer `tracker.median.median` which uses the database when it can"""
+    if count is None:
+        count = queryset.count()
     if count == 0:
         return 0
     elif count % 2 == 0:
@@ -117,6 +119,31 @@ def median(queryset, column, *, count=None):
         return queryset.order_by(column).values(column)[count // 2][column]
 
 
+def grouped_median(queryset, group_fields, column, *, counts):
+    """
+    computes the median of `column` for every group in a single ordered pass, only keeping the middle
+    value(s) of each group in memory
+
+    `counts` must map every group key (a tuple of the `group_fields` values) to the number of rows in that
+    group, usually taken from an aggregate query that was already being made
+    """
+    medians = {}
+    rows = (
+        queryset.order_by(*group_fields, column)
+        .values_list(*group_fields, column)
+        .iterator(chunk_size=2000)
+    )
+    for key, group in itertools.groupby(rows, key=lambda r: r[:-1]):
+        count = counts.get(key, 0)
+        if count == 0:
+            continue
+        middle = [
+            r[-1] for r in itertools.islice(group, (count - 1) // 2, count // 2 + 1)
+        ]
+        medians[key] = sum(middle) / len(middle)
+    return medians
+
+
 def flatten(iterable):
     """
     taking a collection of possibly nested iterables, returns a generator that
@@ -7,8 +7,9 @@ from django.http import Http404, HttpResponse, HttpResponseRedirect
 from django.views.decorators.cache import cache_page
 
 from tracker import search_filters as filters
-from tracker import settings, util, viewutil
+from tracker import settings, viewutil
 from tracker.compat import reverse
+from tracker.median import median
 from tracker.models import (
     Bid,
     Donation,
@@ -319,7 +320,7 @@ def donorindex(request, event=None):
         max=Cast(Coalesce(Max('donation_total'), 0), output_field=FloatField()),
         avg=Cast(Coalesce(Avg('donation_total'), 0), output_field=FloatField()),
     )
-    agg['median'] = util.median(donors, 'donation_total')
+    agg['median'] = median(donors, 'donation_total')
 
     pages = paginator.Paginator(donors, 50)
 
@@ -1,12 +1,24 @@
+import dataclasses
 import operator
 import re
 from functools import reduce
+from typing import Any
 
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Case, Count, Q, When
 from django.http import Http404
 from django.urls import reverse
 
-from tracker.models import Event, Log
+from tracker.models import (
+    BidSuggestion,
+    Donation,
+    DonationBid,
+    Donor,
+    Event,
+    Log,
+    PrizeClaim,
+    Talent,
+)
 
 
 def admin_url(obj):
@@ -79,29 +91,115 @@ def tracker_log(category, message='', event=None, user=None):
     Log.objects.create(category=category, message=message, event=event, user=user)
 
 
+@dataclasses.dataclass
+class MergeResult:
+    root: Any
+    # the number of rows that were reassigned to the root, by relation
+    moved: dict = dataclasses.field(default_factory=dict)
+    # the number of merged objects that were deleted afterwards
+    deleted: int = 0
+
+    def __str__(self):
+        return ', '.join(
+            [f'{count} {name}' for name, count in self.moved.items()]
+            + [f'{self.deleted} merged']
+        )
+
+
 def merge_bids(rootBid, bids):
-    for bid in bids:
-        if bid != rootBid:
-            for donationBid in bid.bids.all():
-                donationBid.bid = rootBid
-                donationBid.save()
-            for suggestion in bid.suggestions.all():
-                suggestion.bid = rootBid
-                suggestion.save()
+    """
+    moves every donation bid and suggestion from `bids` onto `rootBid`, and deletes the rest of them, the trees of
+    the root and every old parent are recomputed once at the end
+
+    a donation that was split between several of the merged bids ends up with a single donation bid for the combined
+    amount
+    """
+    from tracker import bidutil
+
+    result = MergeResult(root=rootBid)
+    others = [bid for bid in bids if bid.pk != rootBid.pk]
+    if not others:
+        return result
+    ids = [bid.pk for bid in others]
+    with transaction.atomic(), bidutil.deferred_recompute():
+        donation_bids = DonationBid.objects.filter(bid_id__in=[rootBid.pk, *ids])
+        split = (
+            donation_bids.order_by()
+            .values('donation_id')
+            .annotate(rows=Count('id'))
+            .filter(rows__gt=1)
+            .values('donation_id')
+        )
+        combined = {}
+        extra = []
+        folded = 0
+        # the root's own donation bid sorts first, so it is the one that is kept
+        for donation_bid in donation_bids.filter(donation_id__in=split).order_by(
+            'donation_id', Case(When(bid_id=rootBid.pk, then=0), default=1), 'id'
+        ):
+            if donation_bid.bid_id != rootBid.pk:
+                folded += 1
+            kept = combined.get(donation_bid.donation_id)
+            if kept is None:
+                donation_bid.bid = rootBid
+                combined[donation_bid.donation_id] = donation_bid
+            else:
+                kept.amount += donation_bid.amount
+                extra.append(donation_bid.pk)
+        DonationBid.objects.filter(pk__in=extra).delete()
+        DonationBid.objects.bulk_update(combined.values(), ['bid', 'amount'])
+        result.moved['donation bids'] = folded + DonationBid.objects.filter(
+            bid_id__in=ids
+        ).update(bid=rootBid)
+        result.moved['suggestions'] = BidSuggestion.objects.filter(
+            bid_id__in=ids
+        ).update(bid=rootBid)
+        # the old parents' totals need to drop these options
+        bidutil.schedule_recompute({bid.parent_id for bid in others if bid.parent_id})
+        for bid in others:
             bid.delete()
-    rootBid.save()
-    return rootBid
+            result.deleted += 1
+        rootBid.save()
+    rootBid.refresh_from_db()
+    return result
 
 
 def merge_donors(rootDonor, donors):
-    for other in donors:
-        if other != rootDonor:
-            for donation in other.donation_set.all():
-                donation.donor = rootDonor
-                donation.save()
-            for claim in other.prizeclaims.all():
-                claim.winner = rootDonor
-                claim.save()
-            other.delete()
-    rootDonor.save()
-    return rootDonor
+    """
+    moves every donation and prize claim from `donors` onto `rootDonor`, and deletes the rest of them, the root's
+    DonorCache (and participation and search index) rows are recomputed once at the end
+    """
+    from tracker import cacheutil, participationutil, searchutil, settings
+
+    result = MergeResult(root=rootDonor)
+    ids = [donor.pk for donor in donors if donor.pk != rootDonor.pk]
+    with transaction.atomic():
+        if ids:
+            if settings.TRACKER_SEARCH_INDEX:
+                # neither the update nor the delete send post_save, so the documents of the moved donations, and of
+                #  any talent that loses its donor, are brought up to date explicitly
+                donation_ids = list(
+                    Donation.objects.filter(donor_id__in=ids).values_list(
+                        'pk', flat=True
+                    )
+                )
+                talent_ids = list(
+                    Talent.objects.filter(donor_id__in=ids).values_list('pk', flat=True)
+                )
+            result.moved['donations'] = Donation.objects.filter(
+                donor_id__in=ids
+            ).update(donor=rootDonor)
+            result.moved['prize claims'] = PrizeClaim.objects.filter(
+                winner_id__in=ids
+            ).update(winner=rootDonor)
+            result.deleted = (
+                Donor.objects.filter(pk__in=ids).delete()[1].get('tracker.Donor', 0)
+            )
+            cacheutil.recompute_donors([rootDonor.pk])
+            if settings.TRACKER_PARTICIPATION_INDEX:
+                participationutil.sync_donors(donor_ids=[rootDonor.pk])
+            if settings.TRACKER_SEARCH_INDEX:
+                searchutil.index(Donation, donation_ids)
+                searchutil.index(Talent, talent_ids)
+        rootDonor.save()
+    return result
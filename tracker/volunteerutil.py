@@ -0,0 +1,281 @@
+import csv
+import dataclasses
+from io import StringIO
+from typing import Optional
+
+from django.contrib.auth import models as auth
+from django.core.exceptions import ValidationError
+from django.core.validators import EmailValidator
+from django.db import transaction
+from django.db.models.functions import Lower
+from django.urls import reverse
+
+from tracker import mailutil
+from tracker.auth import registration_context
+
+# the groups that imported volunteers are sorted into, and the permissions each of them has
+GROUPS = {
+    'Bid Tracker': [
+        'change_donation',
+        'view_bid',
+        'view_donation',
+        'view_comments',
+        # bid assignment
+        'add_donationbid',
+        'change_donationbid',
+        'delete_donationbid',
+        'view_donationbid',
+        # milestones
+        'view_milestone',
+    ],
+    'Bid Admin': [
+        # bid assignment
+        'add_donationbid',
+        'change_donationbid',
+        'delete_donationbid',
+        'view_donationbid',
+        # bid screening/editing
+        'add_bid',
+        'change_bid',
+        'view_bid',
+        'top_level_bid',
+        # donations
+        'change_donation',
+        'view_donation',
+        'view_comments',
+        'view_pending_donation',
+        'send_to_reader',
+        # donors
+        'add_donor',
+        'change_donor',
+        'view_donor',
+        'view_emails',
+        'view_full_names',
+        # needed for 'Start Run'
+        'change_speedrun',
+        'view_speedrun',
+        'view_milestone',
+    ],
+    'Schedule Viewer': [
+        'view_ad',
+        'view_interview',
+    ],
+}
+
+
+@dataclasses.dataclass
+class VolunteerResult:
+    row: int
+    email: str
+    username: str = ''
+    first_name: str = ''
+    last_name: str = ''
+    is_head: bool = False
+    is_host: bool = False
+    is_schedule: bool = False
+    user: Optional[auth.User] = None
+    created: bool = False
+    error: Optional[str] = None
+
+    @property
+    def group(self):
+        if self.is_head:
+            return 'Bid Admin'
+        elif self.is_schedule:
+            return 'Schedule Viewer'
+        else:
+            return 'Bid Tracker'
+
+    @property
+    def message(self):
+        if self.error:
+            return f'Could not process row #{self.row}: {self.error}'
+        elif self.created:
+            return f'Created user {self.user.username} with email {self.email}'
+        else:
+            return f'Found existing user {self.user.username} with email {self.email}'
+
+
+def parse_volunteers(data):
+    """reads the CSV (as text), returns a result for every row, with `error` already set for the invalid ones"""
+    email_validator = EmailValidator()
+    results = []
+    seen = {}
+    for row, volunteer in enumerate(csv.DictReader(StringIO(data)), start=2):
+        volunteer = {k: (v or '').strip() for k, v in volunteer.items() if k}
+        email = volunteer.get('email', '')
+        position = volunteer.get('position', '').lower()
+        firstname, _, lastname = volunteer.get('name', '').partition(' ')
+        result = VolunteerResult(
+            row=row,
+            email=email,
+            username=volunteer.get('username', '') or email,
+            first_name=firstname.strip(),
+            last_name=lastname.strip(),
+            is_head='head' in position,
+            is_host='host' in position,
+            is_schedule='schedule' in position,
+        )
+        try:
+            email_validator(email)
+        except ValidationError as e:
+            result.error = repr(e)
+        else:
+            if (first := seen.setdefault(email.lower(), row)) != row:
+                result.error = f'{email} is already listed on row #{first}'
+        results.append(result)
+    return results
+
+
+def volunteer_groups():
+    """
+    returns the groups in `GROUPS` by name, creating them if need be, and only changes their permissions if they are
+    different from what is listed there
+    """
+    groups = {g.name: g for g in auth.Group.objects.filter(name__in=GROUPS)}
+    for name in GROUPS:
+        if name not in groups:
+            groups[name] = auth.Group.objects.create(name=name)
+    permissions = dict(
+        auth.Permission.objects.filter(
+            content_type__app_label='tracker',
+            codename__in={c for codenames in GROUPS.values() for c in codenames},
+        ).values_list('codename', 'id')
+    )
+    wanted = set()
+    for name, codenames in GROUPS.items():
+        missing = [c for c in codenames if c not in permissions]
+        assert (
+            not missing
+        ), f'some permissions were missing ({", ".join(missing)}), check GROUPS or that all migrations have run'
+        wanted |= {(groups[name].id, permissions[c]) for c in codenames}
+
+    through = auth.Group.permissions.through
+    existing = {
+        (group_id, permission_id): pk
+        for pk, group_id, permission_id in through.objects.filter(
+            group__in=groups.values()
+        ).values_list('id', 'group_id', 'permission_id')
+    }
+    stale = [pk for key, pk in existing.items() if key not in wanted]
+    if stale:
+        through.objects.filter(id__in=stale).delete()
+    through.objects.bulk_create(
+        [
+            through(group_id=group_id, permission_id=permission_id)
+            for group_id, permission_id in wanted - existing.keys()
+        ]
+    )
+    return groups
+
+
+def _resolve_users(results):
+    """finds the existing user for each row, or builds a new one, returns the new ones"""
+    existing = {}
+    for user in auth.User.objects.annotate(email_lower=Lower('email')).filter(
+        email_lower__in=[r.email.lower() for r in results]
+    ):
+        existing.setdefault(user.email_lower, []).append(user)
+
+    new = [r for r in results if r.email.lower() not in existing]
+    taken = set(
+        auth.User.objects.filter(username__in=[r.username for r in new]).values_list(
+            'username', flat=True
+        )
+    )
+    created = []
+    for result in results:
+        if users := existing.get(result.email.lower()):
+            if len(users) > 1:
+                result.error = f'more than one user has the email {result.email}'
+            else:
+                result.user = users[0]
+        elif result.username in taken:
+            result.error = f'the username {result.username} is already taken'
+        else:
+            taken.add(result.username)
+            result.user = auth.User(
+                username=result.username,
+                first_name=result.first_name,
+                last_name=result.last_name,
+                email=result.email,
+                is_active=False,
+                is_staff=True,
+            )
+            result.created = True
+            created.append(result.user)
+    return created
+
+
+@transaction.atomic
+def import_volunteers(request, event, data, *, template, sender):
+    """
+    creates or updates a staff account for every volunteer in the CSV, puts each of them in exactly one of the
+    volunteer groups, and queues their registration emails, using a fixed number of queries no matter how many rows
+    there are
+
+    returns a result for every row, in order
+    """
+    results = parse_volunteers(data)
+    valid = [r for r in results if not r.error]
+    created = _resolve_users(valid)
+    valid = [r for r in valid if not r.error]
+
+    auth.User.objects.bulk_create(created)
+    if any(user.pk is None for user in created):
+        # not every database hands back the primary keys from a bulk insert
+        ids = dict(
+            auth.User.objects.filter(
+                username__in=[u.username for u in created]
+            ).values_list('username', 'id')
+        )
+        for user in created:
+            user.pk = ids[user.username]
+    promoted = [r.user for r in valid if not r.created and not r.user.is_staff]
+    for user in promoted:
+        user.is_staff = True
+    auth.User.objects.bulk_update(promoted, ['is_staff'])
+
+    groups = volunteer_groups()
+    membership = auth.User.groups.through
+    wanted = {(r.user.pk, groups[r.group].pk) for r in valid}
+    existing = {
+        (user_id, group_id): pk
+        for pk, user_id, group_id in membership.objects.filter(
+            user_id__in=[r.user.pk for r in valid],
+            group__in=groups.values(),
+        ).values_list('id', 'user_id', 'group_id')
+    }
+    stale = [pk for key, pk in existing.items() if key not in wanted]
+    if stale:
+        membership.objects.filter(id__in=stale).delete()
+    membership.objects.bulk_create(
+        [
+            membership(user_id=user_id, group_id=group_id)
+            for user_id, group_id in wanted - existing.keys()
+        ]
+    )
+
+    admin_url = request.build_absolute_uri(reverse('admin:index'))
+    mailutil.queue_many(
+        template,
+        sender,
+        [
+            (
+                [r.user.email],
+                registration_context(
+                    request,
+                    r.user,
+                    extra_context=dict(
+                        event=event,
+                        is_head=r.is_head,
+                        is_host=r.is_host,
+                        is_schedule=r.is_schedule,
+                        admin_url=admin_url,
+                    ),
+                ),
+            )
+            for r in valid
+        ],
+    )
+    return results